@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Generator for multiple Tornado CNN networks that share the accelerator
+"""
+import signal
+import sys
+
+from izer.multinet import main
+
+
+def signal_handler(
+        _signal,
+        _frame,
+):
+    """
+    Ctrl+C handler
+    """
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    signal.signal(signal.SIGINT, signal_handler)
+    main()
@@ -7,6 +7,21 @@
 
 #include "weights.h"
 
+// Host builds (make host) time every layer, and can run the network CNN_RUNS times
+#ifdef CNN_HOST
+void cnn_host_layer(int layer);
+void cnn_host_report(int layers);
+#define CNN_LAYER_DONE(layer) cnn_host_layer(layer)
+#define CNN_REPORT(layers) cnn_host_report(layers)
+#else
+#define CNN_LAYER_DONE(layer)
+#define CNN_REPORT(layers)
+#endif
+
+#ifndef CNN_RUNS
+#define CNN_RUNS 1
+#endif
+
 arm_status
 arm_fully_connected_q7_q8p7_opt(const q7_t * pV,
                                 const q7_t * pM,
@@ -0,0 +1,69 @@
+/*******************************************************************************
+* Copyright (C) Maxim Integrated Products, Inc., All rights Reserved.
+*
+* This software is protected by copyright laws of the United States and
+* of foreign countries. This material may also be protected by patent laws
+* and technology transfer regulations of the United States and of foreign
+* countries. This software is furnished under a license agreement and/or a
+* nondisclosure agreement and may only be used or reproduced in accordance
+* with the terms of those agreements. Dissemination of this information to
+* any party or parties not specified in the license agreement and/or
+* nondisclosure agreement is expressly prohibited.
+*
+* The above copyright notice and this permission notice shall be included
+* in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+* OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+* IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+* OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+* ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+* OTHER DEALINGS IN THE SOFTWARE.
+*
+* Except as contained in this notice, the name of Maxim Integrated
+* Products, Inc. shall not be used except as stated in the Maxim Integrated
+* Products, Inc. Branding Policy.
+*
+* The mere transfer of this software does not imply any licenses
+* of trade secrets, proprietary technology, copyrights, patents,
+* trademarks, maskwork rights, or any other form of intellectual
+* property whatsoever. Maxim Integrated Products, Inc. retains all
+* ownership rights.
+*******************************************************************************/
+
+/*
+ * Host stand-in for the parts of CMSIS arm_math.h that the generated CMSIS-NN code uses.
+ * Used by `make host` to build and run networks on Linux without CMSIS or an Arm target.
+ */
+
+#ifndef ARM_MATH_HOST_H
+#define ARM_MATH_HOST_H
+
+#include <stdint.h>
+
+typedef int8_t q7_t;
+typedef int16_t q15_t;
+typedef int32_t q31_t;
+typedef int64_t q63_t;
+
+typedef enum {
+  ARM_MATH_SUCCESS = 0,
+  ARM_MATH_ARGUMENT_ERROR = -1,
+  ARM_MATH_LENGTH_ERROR = -2,
+  ARM_MATH_SIZE_MISMATCH = -3,
+  ARM_MATH_NANINF = -4,
+  ARM_MATH_SINGULAR = -5,
+  ARM_MATH_TEST_FAILURE = -6
+} arm_status;
+
+// Signed saturation to `sat` bits
+static inline int32_t __SSAT(int32_t val, uint32_t sat)
+{
+  const int32_t max = (int32_t) ((1U << (sat - 1)) - 1);
+  const int32_t min = -1 - max;
+
+  return val > max ? max : val < min ? min : val;
+}
+
+#endif
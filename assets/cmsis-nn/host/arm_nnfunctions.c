@@ -0,0 +1,432 @@
+/*******************************************************************************
+* Copyright (C) Maxim Integrated Products, Inc., All rights Reserved.
+*
+* This software is protected by copyright laws of the United States and
+* of foreign countries. This material may also be protected by patent laws
+* and technology transfer regulations of the United States and of foreign
+* countries. This software is furnished under a license agreement and/or a
+* nondisclosure agreement and may only be used or reproduced in accordance
+* with the terms of those agreements. Dissemination of this information to
+* any party or parties not specified in the license agreement and/or
+* nondisclosure agreement is expressly prohibited.
+*
+* The above copyright notice and this permission notice shall be included
+* in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+* OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+* IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+* OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+* ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+* OTHER DEALINGS IN THE SOFTWARE.
+*
+* Except as contained in this notice, the name of Maxim Integrated
+* Products, Inc. shall not be used except as stated in the Maxim Integrated
+* Products, Inc. Branding Policy.
+*
+* The mere transfer of this software does not imply any licenses
+* of trade secrets, proprietary technology, copyrights, patents,
+* trademarks, maskwork rights, or any other form of intellectual
+* property whatsoever. Maxim Integrated Products, Inc. retains all
+* ownership rights.
+*******************************************************************************/
+
+/*
+ * Portable reference implementations of the CMSIS-NN q7 routines that the CMSIS-NN code
+ * generator uses. They compute the same integer results as the Arm library, without SIMD,
+ * so that generated networks can be built and checked on the host (`make host`).
+ */
+
+#include "arm_nnfunctions.h"
+
+// Convolution with a full set of x/y parameters, optionally depthwise
+static arm_status convolve(const q7_t *Im_in, int dim_im_in_x, int dim_im_in_y, int ch_im_in,
+                           const q7_t *wt, int ch_im_out, int dim_kernel_x, int dim_kernel_y,
+                           int padding_x, int padding_y, int stride_x, int stride_y,
+                           const q7_t *bias, int bias_shift, int out_shift, q7_t *Im_out,
+                           int dim_im_out_x, int dim_im_out_y, int depthwise)
+{
+  int i_out_y, i_out_x, i_ch_out, i_ker_y, i_ker_x, i_ch_in;
+
+  if (depthwise && ch_im_in != ch_im_out)
+    return ARM_MATH_SIZE_MISMATCH;
+
+  for (i_out_y = 0; i_out_y < dim_im_out_y; i_out_y++) {
+    for (i_out_x = 0; i_out_x < dim_im_out_x; i_out_x++) {
+      for (i_ch_out = 0; i_ch_out < ch_im_out; i_ch_out++) {
+        q31_t conv_out = ((q31_t) bias[i_ch_out] << bias_shift) + NN_ROUND(out_shift);
+
+        for (i_ker_y = 0; i_ker_y < dim_kernel_y; i_ker_y++) {
+          for (i_ker_x = 0; i_ker_x < dim_kernel_x; i_ker_x++) {
+            int in_row = stride_y * i_out_y + i_ker_y - padding_y;
+            int in_col = stride_x * i_out_x + i_ker_x - padding_x;
+            const q7_t *in;
+
+            if (in_row < 0 || in_col < 0 || in_row >= dim_im_in_y || in_col >= dim_im_in_x)
+              continue;
+            in = &Im_in[(in_row * dim_im_in_x + in_col) * ch_im_in];
+            if (depthwise) {
+              // Weights are HWC, one channel per output channel
+              conv_out += in[i_ch_out]
+                          * wt[(i_ker_y * dim_kernel_x + i_ker_x) * ch_im_out + i_ch_out];
+            } else {
+              const q7_t *w = &wt[((i_ch_out * dim_kernel_y + i_ker_y) * dim_kernel_x
+                                   + i_ker_x) * ch_im_in];
+              for (i_ch_in = 0; i_ch_in < ch_im_in; i_ch_in++)
+                conv_out += in[i_ch_in] * w[i_ch_in];
+            }
+          }
+        }
+        Im_out[(i_out_y * dim_im_out_x + i_out_x) * ch_im_out + i_ch_out] =
+          (q7_t) __SSAT(conv_out >> out_shift, 8);
+      }
+    }
+  }
+
+  return ARM_MATH_SUCCESS;
+}
+
+arm_status arm_convolve_HWC_q7_basic(const q7_t *Im_in, const uint16_t dim_im_in,
+                                     const uint16_t ch_im_in, const q7_t *wt,
+                                     const uint16_t ch_im_out, const uint16_t dim_kernel,
+                                     const uint16_t padding, const uint16_t stride,
+                                     const q7_t *bias, const uint16_t bias_shift,
+                                     const uint16_t out_shift, q7_t *Im_out,
+                                     const uint16_t dim_im_out, q15_t *bufferA, q7_t *bufferB)
+{
+  return convolve(Im_in, dim_im_in, dim_im_in, ch_im_in, wt, ch_im_out, dim_kernel, dim_kernel,
+                  padding, padding, stride, stride, bias, bias_shift, out_shift, Im_out,
+                  dim_im_out, dim_im_out, 0);
+}
+
+arm_status arm_convolve_HWC_q7_fast(const q7_t *Im_in, const uint16_t dim_im_in,
+                                    const uint16_t ch_im_in, const q7_t *wt,
+                                    const uint16_t ch_im_out, const uint16_t dim_kernel,
+                                    const uint16_t padding, const uint16_t stride,
+                                    const q7_t *bias, const uint16_t bias_shift,
+                                    const uint16_t out_shift, q7_t *Im_out,
+                                    const uint16_t dim_im_out, q15_t *bufferA, q7_t *bufferB)
+{
+  if (ch_im_in % 4 != 0 || ch_im_out % 2 != 0)
+    return ARM_MATH_SIZE_MISMATCH;
+
+  return convolve(Im_in, dim_im_in, dim_im_in, ch_im_in, wt, ch_im_out, dim_kernel, dim_kernel,
+                  padding, padding, stride, stride, bias, bias_shift, out_shift, Im_out,
+                  dim_im_out, dim_im_out, 0);
+}
+
+arm_status arm_convolve_HWC_q7_RGB(const q7_t *Im_in, const uint16_t dim_im_in,
+                                   const uint16_t ch_im_in, const q7_t *wt,
+                                   const uint16_t ch_im_out, const uint16_t dim_kernel,
+                                   const uint16_t padding, const uint16_t stride,
+                                   const q7_t *bias, const uint16_t bias_shift,
+                                   const uint16_t out_shift, q7_t *Im_out,
+                                   const uint16_t dim_im_out, q15_t *bufferA, q7_t *bufferB)
+{
+  if (ch_im_in != 3)
+    return ARM_MATH_SIZE_MISMATCH;
+
+  return convolve(Im_in, dim_im_in, dim_im_in, ch_im_in, wt, ch_im_out, dim_kernel, dim_kernel,
+                  padding, padding, stride, stride, bias, bias_shift, out_shift, Im_out,
+                  dim_im_out, dim_im_out, 0);
+}
+
+arm_status arm_convolve_HWC_q7_basic_nonsquare(const q7_t *Im_in, const uint16_t dim_im_in_x,
+                                               const uint16_t dim_im_in_y,
+                                               const uint16_t ch_im_in, const q7_t *wt,
+                                               const uint16_t ch_im_out,
+                                               const uint16_t dim_kernel_x,
+                                               const uint16_t dim_kernel_y,
+                                               const uint16_t padding_x,
+                                               const uint16_t padding_y,
+                                               const uint16_t stride_x,
+                                               const uint16_t stride_y, const q7_t *bias,
+                                               const uint16_t bias_shift,
+                                               const uint16_t out_shift, q7_t *Im_out,
+                                               const uint16_t dim_im_out_x,
+                                               const uint16_t dim_im_out_y,
+                                               q15_t *bufferA, q7_t *bufferB)
+{
+  return convolve(Im_in, dim_im_in_x, dim_im_in_y, ch_im_in, wt, ch_im_out, dim_kernel_x,
+                  dim_kernel_y, padding_x, padding_y, stride_x, stride_y, bias, bias_shift,
+                  out_shift, Im_out, dim_im_out_x, dim_im_out_y, 0);
+}
+
+arm_status arm_convolve_HWC_q7_fast_nonsquare(const q7_t *Im_in, const uint16_t dim_im_in_x,
+                                              const uint16_t dim_im_in_y,
+                                              const uint16_t ch_im_in, const q7_t *wt,
+                                              const uint16_t ch_im_out,
+                                              const uint16_t dim_kernel_x,
+                                              const uint16_t dim_kernel_y,
+                                              const uint16_t padding_x,
+                                              const uint16_t padding_y,
+                                              const uint16_t stride_x,
+                                              const uint16_t stride_y, const q7_t *bias,
+                                              const uint16_t bias_shift,
+                                              const uint16_t out_shift, q7_t *Im_out,
+                                              const uint16_t dim_im_out_x,
+                                              const uint16_t dim_im_out_y,
+                                              q15_t *bufferA, q7_t *bufferB)
+{
+  if (ch_im_in % 4 != 0 || ch_im_out % 2 != 0)
+    return ARM_MATH_SIZE_MISMATCH;
+
+  return convolve(Im_in, dim_im_in_x, dim_im_in_y, ch_im_in, wt, ch_im_out, dim_kernel_x,
+                  dim_kernel_y, padding_x, padding_y, stride_x, stride_y, bias, bias_shift,
+                  out_shift, Im_out, dim_im_out_x, dim_im_out_y, 0);
+}
+
+arm_status arm_convolve_1x1_HWC_q7_fast_nonsquare(const q7_t *Im_in,
+                                                  const uint16_t dim_im_in_x,
+                                                  const uint16_t dim_im_in_y,
+                                                  const uint16_t ch_im_in, const q7_t *wt,
+                                                  const uint16_t ch_im_out,
+                                                  const uint16_t dim_kernel_x,
+                                                  const uint16_t dim_kernel_y,
+                                                  const uint16_t padding_x,
+                                                  const uint16_t padding_y,
+                                                  const uint16_t stride_x,
+                                                  const uint16_t stride_y, const q7_t *bias,
+                                                  const uint16_t bias_shift,
+                                                  const uint16_t out_shift, q7_t *Im_out,
+                                                  const uint16_t dim_im_out_x,
+                                                  const uint16_t dim_im_out_y,
+                                                  q15_t *bufferA, q7_t *bufferB)
+{
+  if (ch_im_in % 4 != 0 || ch_im_out % 2 != 0 || dim_kernel_x != 1 || dim_kernel_y != 1
+      || padding_x != 0 || padding_y != 0 || stride_x != 1 || stride_y != 1)
+    return ARM_MATH_SIZE_MISMATCH;
+
+  return convolve(Im_in, dim_im_in_x, dim_im_in_y, ch_im_in, wt, ch_im_out, dim_kernel_x,
+                  dim_kernel_y, padding_x, padding_y, stride_x, stride_y, bias, bias_shift,
+                  out_shift, Im_out, dim_im_out_x, dim_im_out_y, 0);
+}
+
+arm_status arm_depthwise_separable_conv_HWC_q7(const q7_t *Im_in, const uint16_t dim_im_in,
+                                               const uint16_t ch_im_in, const q7_t *wt,
+                                               const uint16_t ch_im_out,
+                                               const uint16_t dim_kernel,
+                                               const uint16_t padding, const uint16_t stride,
+                                               const q7_t *bias, const uint16_t bias_shift,
+                                               const uint16_t out_shift, q7_t *Im_out,
+                                               const uint16_t dim_im_out, q15_t *bufferA,
+                                               q7_t *bufferB)
+{
+  return convolve(Im_in, dim_im_in, dim_im_in, ch_im_in, wt, ch_im_out, dim_kernel, dim_kernel,
+                  padding, padding, stride, stride, bias, bias_shift, out_shift, Im_out,
+                  dim_im_out, dim_im_out, 1);
+}
+
+arm_status arm_depthwise_separable_conv_HWC_q7_nonsquare(const q7_t *Im_in,
+                                                         const uint16_t dim_im_in_x,
+                                                         const uint16_t dim_im_in_y,
+                                                         const uint16_t ch_im_in,
+                                                         const q7_t *wt,
+                                                         const uint16_t ch_im_out,
+                                                         const uint16_t dim_kernel_x,
+                                                         const uint16_t dim_kernel_y,
+                                                         const uint16_t padding_x,
+                                                         const uint16_t padding_y,
+                                                         const uint16_t stride_x,
+                                                         const uint16_t stride_y,
+                                                         const q7_t *bias,
+                                                         const uint16_t bias_shift,
+                                                         const uint16_t out_shift,
+                                                         q7_t *Im_out,
+                                                         const uint16_t dim_im_out_x,
+                                                         const uint16_t dim_im_out_y,
+                                                         q15_t *bufferA, q7_t *bufferB)
+{
+  return convolve(Im_in, dim_im_in_x, dim_im_in_y, ch_im_in, wt, ch_im_out, dim_kernel_x,
+                  dim_kernel_y, padding_x, padding_y, stride_x, stride_y, bias, bias_shift,
+                  out_shift, Im_out, dim_im_out_x, dim_im_out_y, 1);
+}
+
+arm_status arm_fully_connected_q7(const q7_t *pV, const q7_t *pM, const uint16_t dim_vec,
+                                  const uint16_t num_of_rows, const uint16_t bias_shift,
+                                  const uint16_t out_shift, const q7_t *bias, q7_t *pOut,
+                                  q15_t *vec_buffer)
+{
+  int row, col;
+
+  for (row = 0; row < num_of_rows; row++) {
+    q31_t ip_out = ((q31_t) bias[row] << bias_shift) + NN_ROUND(out_shift);
+
+    for (col = 0; col < dim_vec; col++)
+      ip_out += pV[col] * pM[row * dim_vec + col];
+    pOut[row] = (q7_t) __SSAT(ip_out >> out_shift, 8);
+  }
+
+  return ARM_MATH_SUCCESS;
+}
+
+arm_status arm_fully_connected_q7_opt(const q7_t *pV, const q7_t *pM, const uint16_t dim_vec,
+                                      const uint16_t num_of_rows, const uint16_t bias_shift,
+                                      const uint16_t out_shift, const q7_t *bias, q7_t *pOut,
+                                      q15_t *vec_buffer)
+{
+  // Interleaved weights for groups of four rows: first row and first column of each quad
+  static const int quad[4][2] = { { 0, 0 }, { 2, 0 }, { 0, 1 }, { 2, 1 } };
+  const q7_t *pB = pM;
+  int row, col, i;
+
+  for (row = 0; row + 4 <= num_of_rows; row += 4) {
+    q31_t ip_out[4];
+
+    for (i = 0; i < 4; i++)
+      ip_out[i] = ((q31_t) bias[row + i] << bias_shift) + NN_ROUND(out_shift);
+    for (col = 0; col + 4 <= dim_vec; col += 4) {
+      for (i = 0; i < 4; i++) {
+        const int r = quad[i][0];
+        const int c = col + quad[i][1];
+
+        ip_out[r] += pV[c] * pB[0] + pV[c + 2] * pB[2];
+        ip_out[r + 1] += pV[c] * pB[1] + pV[c + 2] * pB[3];
+        pB += 4;
+      }
+    }
+    for (; col < dim_vec; col++)
+      for (i = 0; i < 4; i++)
+        ip_out[i] += pV[col] * *pB++;
+    for (i = 0; i < 4; i++)
+      pOut[row + i] = (q7_t) __SSAT(ip_out[i] >> out_shift, 8);
+  }
+
+  // Remaining rows are stored in order
+  for (; row < num_of_rows; row++) {
+    q31_t ip_out = ((q31_t) bias[row] << bias_shift) + NN_ROUND(out_shift);
+
+    for (col = 0; col < dim_vec; col++)
+      ip_out += pV[col] * *pB++;
+    pOut[row] = (q7_t) __SSAT(ip_out >> out_shift, 8);
+  }
+
+  return ARM_MATH_SUCCESS;
+}
+
+// Pooling with a full set of x/y parameters, average pooling divides by the valid pixels
+static void pool(const q7_t *Im_in, int dim_im_in_x, int dim_im_in_y, int ch_im_in,
+                 int dim_kernel_x, int dim_kernel_y, int padding_x, int padding_y,
+                 int stride_x, int stride_y, int dim_im_out_x, int dim_im_out_y,
+                 q7_t *Im_out, int average)
+{
+  int i_ch_in, i_x, i_y, k_x, k_y;
+
+  for (i_ch_in = 0; i_ch_in < ch_im_in; i_ch_in++) {
+    for (i_y = 0; i_y < dim_im_out_y; i_y++) {
+      for (i_x = 0; i_x < dim_im_out_x; i_x++) {
+        int max = -129;
+        int sum = 0;
+        int count = 0;
+
+        for (k_y = i_y * stride_y - padding_y;
+             k_y < i_y * stride_y - padding_y + dim_kernel_y; k_y++) {
+          for (k_x = i_x * stride_x - padding_x;
+               k_x < i_x * stride_x - padding_x + dim_kernel_x; k_x++) {
+            if (k_y >= 0 && k_x >= 0 && k_y < dim_im_in_y && k_x < dim_im_in_x) {
+              int val = Im_in[i_ch_in + ch_im_in * (k_x + k_y * dim_im_in_x)];
+
+              if (val > max)
+                max = val;
+              sum += val;
+              count++;
+            }
+          }
+        }
+        Im_out[i_ch_in + ch_im_in * (i_x + i_y * dim_im_out_x)] =
+          (q7_t) (average ? sum / count : max);
+      }
+    }
+  }
+}
+
+void arm_maxpool_q7_HWC(q7_t *Im_in, const uint16_t dim_im_in, const uint16_t ch_im_in,
+                        const uint16_t dim_kernel, const uint16_t padding,
+                        const uint16_t stride, const uint16_t dim_im_out, q7_t *bufferA,
+                        q7_t *Im_out)
+{
+  pool(Im_in, dim_im_in, dim_im_in, ch_im_in, dim_kernel, dim_kernel, padding, padding,
+       stride, stride, dim_im_out, dim_im_out, Im_out, 0);
+}
+
+void arm_avepool_q7_HWC(q7_t *Im_in, const uint16_t dim_im_in, const uint16_t ch_im_in,
+                        const uint16_t dim_kernel, const uint16_t padding,
+                        const uint16_t stride, const uint16_t dim_im_out, q7_t *bufferA,
+                        q7_t *Im_out)
+{
+  pool(Im_in, dim_im_in, dim_im_in, ch_im_in, dim_kernel, dim_kernel, padding, padding,
+       stride, stride, dim_im_out, dim_im_out, Im_out, 1);
+}
+
+void arm_maxpool_q7_HWC_nonsquare(q7_t *Im_in, const uint16_t dim_im_in_x,
+                                  const uint16_t dim_im_in_y, const uint16_t ch_im_in,
+                                  const uint16_t dim_kernel, const uint16_t padding,
+                                  const uint16_t stride, const uint16_t dim_im_out_x,
+                                  const uint16_t dim_im_out_y, q7_t *bufferA, q7_t *Im_out)
+{
+  pool(Im_in, dim_im_in_x, dim_im_in_y, ch_im_in, dim_kernel, dim_kernel, padding, padding,
+       stride, stride, dim_im_out_x, dim_im_out_y, Im_out, 0);
+}
+
+void arm_avepool_q7_HWC_nonsquare(q7_t *Im_in, const uint16_t dim_im_in_x,
+                                  const uint16_t dim_im_in_y, const uint16_t ch_im_in,
+                                  const uint16_t dim_kernel, const uint16_t padding,
+                                  const uint16_t stride, const uint16_t dim_im_out_x,
+                                  const uint16_t dim_im_out_y, q7_t *bufferA, q7_t *Im_out)
+{
+  pool(Im_in, dim_im_in_x, dim_im_in_y, ch_im_in, dim_kernel, dim_kernel, padding, padding,
+       stride, stride, dim_im_out_x, dim_im_out_y, Im_out, 1);
+}
+
+void arm_maxpool_nonsquare_q7_HWC_nonsquare(q7_t *Im_in, const uint16_t dim_im_in_x,
+                                            const uint16_t dim_im_in_y,
+                                            const uint16_t ch_im_in,
+                                            const uint16_t dim_kernel_x,
+                                            const uint16_t dim_kernel_y,
+                                            const uint16_t padding_x,
+                                            const uint16_t padding_y,
+                                            const uint16_t stride_x,
+                                            const uint16_t stride_y,
+                                            const uint16_t dim_im_out_x,
+                                            const uint16_t dim_im_out_y,
+                                            q7_t *bufferA, q7_t *Im_out)
+{
+  pool(Im_in, dim_im_in_x, dim_im_in_y, ch_im_in, dim_kernel_x, dim_kernel_y, padding_x,
+       padding_y, stride_x, stride_y, dim_im_out_x, dim_im_out_y, Im_out, 0);
+}
+
+void arm_avepool_nonsquare_q7_HWC_nonsquare(q7_t *Im_in, const uint16_t dim_im_in_x,
+                                            const uint16_t dim_im_in_y,
+                                            const uint16_t ch_im_in,
+                                            const uint16_t dim_kernel_x,
+                                            const uint16_t dim_kernel_y,
+                                            const uint16_t padding_x,
+                                            const uint16_t padding_y,
+                                            const uint16_t stride_x,
+                                            const uint16_t stride_y,
+                                            const uint16_t dim_im_out_x,
+                                            const uint16_t dim_im_out_y,
+                                            q7_t *bufferA, q7_t *Im_out)
+{
+  pool(Im_in, dim_im_in_x, dim_im_in_y, ch_im_in, dim_kernel_x, dim_kernel_y, padding_x,
+       padding_y, stride_x, stride_y, dim_im_out_x, dim_im_out_y, Im_out, 1);
+}
+
+void arm_relu_q7(q7_t *data, uint16_t size)
+{
+  uint16_t i;
+
+  for (i = 0; i < size; i++)
+    if (data[i] < 0)
+      data[i] = 0;
+}
+
+void arm_relu32_q7(q7_t *data, uint32_t size)
+{
+  uint32_t i;
+
+  for (i = 0; i < size; i++)
+    if (data[i] < 0)
+      data[i] = 0;
+}
@@ -0,0 +1,198 @@
+/*******************************************************************************
+* Copyright (C) Maxim Integrated Products, Inc., All rights Reserved.
+*
+* This software is protected by copyright laws of the United States and
+* of foreign countries. This material may also be protected by patent laws
+* and technology transfer regulations of the United States and of foreign
+* countries. This software is furnished under a license agreement and/or a
+* nondisclosure agreement and may only be used or reproduced in accordance
+* with the terms of those agreements. Dissemination of this information to
+* any party or parties not specified in the license agreement and/or
+* nondisclosure agreement is expressly prohibited.
+*
+* The above copyright notice and this permission notice shall be included
+* in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+* OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+* IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+* OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+* ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+* OTHER DEALINGS IN THE SOFTWARE.
+*
+* Except as contained in this notice, the name of Maxim Integrated
+* Products, Inc. shall not be used except as stated in the Maxim Integrated
+* Products, Inc. Branding Policy.
+*
+* The mere transfer of this software does not imply any licenses
+* of trade secrets, proprietary technology, copyrights, patents,
+* trademarks, maskwork rights, or any other form of intellectual
+* property whatsoever. Maxim Integrated Products, Inc. retains all
+* ownership rights.
+*******************************************************************************/
+
+/*
+ * Host stand-in for CMSIS arm_nnfunctions.h. Declares the q7 routines that the CMSIS-NN code
+ * generator uses; host/arm_nnfunctions.c implements them in portable C.
+ */
+
+#ifndef ARM_NNFUNCTIONS_HOST_H
+#define ARM_NNFUNCTIONS_HOST_H
+
+#include "arm_math.h"
+
+#define NN_ROUND(out_shift) ((0x1u << (out_shift)) >> 1)
+
+arm_status arm_convolve_HWC_q7_basic(const q7_t *Im_in, const uint16_t dim_im_in,
+                                     const uint16_t ch_im_in, const q7_t *wt,
+                                     const uint16_t ch_im_out, const uint16_t dim_kernel,
+                                     const uint16_t padding, const uint16_t stride,
+                                     const q7_t *bias, const uint16_t bias_shift,
+                                     const uint16_t out_shift, q7_t *Im_out,
+                                     const uint16_t dim_im_out, q15_t *bufferA, q7_t *bufferB);
+
+arm_status arm_convolve_HWC_q7_fast(const q7_t *Im_in, const uint16_t dim_im_in,
+                                    const uint16_t ch_im_in, const q7_t *wt,
+                                    const uint16_t ch_im_out, const uint16_t dim_kernel,
+                                    const uint16_t padding, const uint16_t stride,
+                                    const q7_t *bias, const uint16_t bias_shift,
+                                    const uint16_t out_shift, q7_t *Im_out,
+                                    const uint16_t dim_im_out, q15_t *bufferA, q7_t *bufferB);
+
+arm_status arm_convolve_HWC_q7_RGB(const q7_t *Im_in, const uint16_t dim_im_in,
+                                   const uint16_t ch_im_in, const q7_t *wt,
+                                   const uint16_t ch_im_out, const uint16_t dim_kernel,
+                                   const uint16_t padding, const uint16_t stride,
+                                   const q7_t *bias, const uint16_t bias_shift,
+                                   const uint16_t out_shift, q7_t *Im_out,
+                                   const uint16_t dim_im_out, q15_t *bufferA, q7_t *bufferB);
+
+arm_status arm_convolve_HWC_q7_basic_nonsquare(const q7_t *Im_in, const uint16_t dim_im_in_x,
+                                               const uint16_t dim_im_in_y,
+                                               const uint16_t ch_im_in, const q7_t *wt,
+                                               const uint16_t ch_im_out,
+                                               const uint16_t dim_kernel_x,
+                                               const uint16_t dim_kernel_y,
+                                               const uint16_t padding_x,
+                                               const uint16_t padding_y,
+                                               const uint16_t stride_x,
+                                               const uint16_t stride_y, const q7_t *bias,
+                                               const uint16_t bias_shift,
+                                               const uint16_t out_shift, q7_t *Im_out,
+                                               const uint16_t dim_im_out_x,
+                                               const uint16_t dim_im_out_y,
+                                               q15_t *bufferA, q7_t *bufferB);
+
+arm_status arm_convolve_HWC_q7_fast_nonsquare(const q7_t *Im_in, const uint16_t dim_im_in_x,
+                                              const uint16_t dim_im_in_y,
+                                              const uint16_t ch_im_in, const q7_t *wt,
+                                              const uint16_t ch_im_out,
+                                              const uint16_t dim_kernel_x,
+                                              const uint16_t dim_kernel_y,
+                                              const uint16_t padding_x,
+                                              const uint16_t padding_y,
+                                              const uint16_t stride_x,
+                                              const uint16_t stride_y, const q7_t *bias,
+                                              const uint16_t bias_shift,
+                                              const uint16_t out_shift, q7_t *Im_out,
+                                              const uint16_t dim_im_out_x,
+                                              const uint16_t dim_im_out_y,
+                                              q15_t *bufferA, q7_t *bufferB);
+
+arm_status arm_convolve_1x1_HWC_q7_fast_nonsquare(const q7_t *Im_in,
+                                                  const uint16_t dim_im_in_x,
+                                                  const uint16_t dim_im_in_y,
+                                                  const uint16_t ch_im_in, const q7_t *wt,
+                                                  const uint16_t ch_im_out,
+                                                  const uint16_t dim_kernel_x,
+                                                  const uint16_t dim_kernel_y,
+                                                  const uint16_t padding_x,
+                                                  const uint16_t padding_y,
+                                                  const uint16_t stride_x,
+                                                  const uint16_t stride_y, const q7_t *bias,
+                                                  const uint16_t bias_shift,
+                                                  const uint16_t out_shift, q7_t *Im_out,
+                                                  const uint16_t dim_im_out_x,
+                                                  const uint16_t dim_im_out_y,
+                                                  q15_t *bufferA, q7_t *bufferB);
+
+arm_status arm_depthwise_separable_conv_HWC_q7(const q7_t *Im_in, const uint16_t dim_im_in,
+                                               const uint16_t ch_im_in, const q7_t *wt,
+                                               const uint16_t ch_im_out,
+                                               const uint16_t dim_kernel,
+                                               const uint16_t padding, const uint16_t stride,
+                                               const q7_t *bias, const uint16_t bias_shift,
+                                               const uint16_t out_shift, q7_t *Im_out,
+                                               const uint16_t dim_im_out, q15_t *bufferA,
+                                               q7_t *bufferB);
+
+arm_status arm_depthwise_separable_conv_HWC_q7_nonsquare(const q7_t *Im_in,
+                                                         const uint16_t dim_im_in_x,
+                                                         const uint16_t dim_im_in_y,
+                                                         const uint16_t ch_im_in,
+                                                         const q7_t *wt,
+                                                         const uint16_t ch_im_out,
+                                                         const uint16_t dim_kernel_x,
+                                                         const uint16_t dim_kernel_y,
+                                                         const uint16_t padding_x,
+                                                         const uint16_t padding_y,
+                                                         const uint16_t stride_x,
+                                                         const uint16_t stride_y,
+                                                         const q7_t *bias,
+                                                         const uint16_t bias_shift,
+                                                         const uint16_t out_shift,
+                                                         q7_t *Im_out,
+                                                         const uint16_t dim_im_out_x,
+                                                         const uint16_t dim_im_out_y,
+                                                         q15_t *bufferA, q7_t *bufferB);
+
+arm_status arm_fully_connected_q7(const q7_t *pV, const q7_t *pM, const uint16_t dim_vec,
+                                  const uint16_t num_of_rows, const uint16_t bias_shift,
+                                  const uint16_t out_shift, const q7_t *bias, q7_t *pOut,
+                                  q15_t *vec_buffer);
+
+arm_status arm_fully_connected_q7_opt(const q7_t *pV, const q7_t *pM, const uint16_t dim_vec,
+                                      const uint16_t num_of_rows, const uint16_t bias_shift,
+                                      const uint16_t out_shift, const q7_t *bias, q7_t *pOut,
+                                      q15_t *vec_buffer);
+
+void arm_maxpool_q7_HWC(q7_t *Im_in, const uint16_t dim_im_in, const uint16_t ch_im_in,
+                        const uint16_t dim_kernel, const uint16_t padding,
+                        const uint16_t stride, const uint16_t dim_im_out, q7_t *bufferA,
+                        q7_t *Im_out);
+
+void arm_avepool_q7_HWC(q7_t *Im_in, const uint16_t dim_im_in, const uint16_t ch_im_in,
+                        const uint16_t dim_kernel, const uint16_t padding,
+                        const uint16_t stride, const uint16_t dim_im_out, q7_t *bufferA,
+                        q7_t *Im_out);
+
+void arm_maxpool_nonsquare_q7_HWC_nonsquare(q7_t *Im_in, const uint16_t dim_im_in_x,
+                                            const uint16_t dim_im_in_y,
+                                            const uint16_t ch_im_in,
+                                            const uint16_t dim_kernel_x,
+                                            const uint16_t dim_kernel_y,
+                                            const uint16_t padding_x,
+                                            const uint16_t padding_y,
+                                            const uint16_t stride_x,
+                                            const uint16_t stride_y,
+                                            const uint16_t dim_im_out_x,
+                                            const uint16_t dim_im_out_y,
+                                            q7_t *bufferA, q7_t *Im_out);
+
+void arm_avepool_nonsquare_q7_HWC_nonsquare(q7_t *Im_in, const uint16_t dim_im_in_x,
+                                            const uint16_t dim_im_in_y,
+                                            const uint16_t ch_im_in,
+                                            const uint16_t dim_kernel_x,
+                                            const uint16_t dim_kernel_y,
+                                            const uint16_t padding_x,
+                                            const uint16_t padding_y,
+                                            const uint16_t stride_x,
+                                            const uint16_t stride_y,
+                                            const uint16_t dim_im_out_x,
+                                            const uint16_t dim_im_out_y,
+                                            q7_t *bufferA, q7_t *Im_out);
+
+void arm_relu_q7(q7_t *data, uint16_t size);
+
+#endif
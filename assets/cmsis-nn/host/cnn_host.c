@@ -0,0 +1,74 @@
+/*******************************************************************************
+* Copyright (C) Maxim Integrated Products, Inc., All rights Reserved.
+*
+* This software is protected by copyright laws of the United States and
+* of foreign countries. This material may also be protected by patent laws
+* and technology transfer regulations of the United States and of foreign
+* countries. This software is furnished under a license agreement and/or a
+* nondisclosure agreement and may only be used or reproduced in accordance
+* with the terms of those agreements. Dissemination of this information to
+* any party or parties not specified in the license agreement and/or
+* nondisclosure agreement is expressly prohibited.
+*
+* The above copyright notice and this permission notice shall be included
+* in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+* OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+* IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+* OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+* ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+* OTHER DEALINGS IN THE SOFTWARE.
+*
+* Except as contained in this notice, the name of Maxim Integrated
+* Products, Inc. shall not be used except as stated in the Maxim Integrated
+* Products, Inc. Branding Policy.
+*
+* The mere transfer of this software does not imply any licenses
+* of trade secrets, proprietary technology, copyrights, patents,
+* trademarks, maskwork rights, or any other form of intellectual
+* property whatsoever. Maxim Integrated Products, Inc. retains all
+* ownership rights.
+*******************************************************************************/
+
+/*
+ * Per-layer timing for host builds of the generated CMSIS-NN code (`make host`).
+ * cnn_run() calls cnn_host_layer(-1) when it starts and cnn_host_layer(l) after layer l.
+ */
+
+#include <stdio.h>
+#include <time.h>
+
+#define MAX_LAYERS 256
+
+static double layer_us[MAX_LAYERS];
+static struct timespec last;
+static int runs;
+
+void cnn_host_layer(int layer)
+{
+  struct timespec now;
+
+  clock_gettime(CLOCK_MONOTONIC, &now);
+  if (layer < 0)
+    runs++;
+  else if (layer < MAX_LAYERS)
+    layer_us[layer] += (now.tv_sec - last.tv_sec) * 1e6 + (now.tv_nsec - last.tv_nsec) / 1e3;
+  last = now;
+}
+
+void cnn_host_report(int layers)
+{
+  double total = 0.0;
+  int i;
+
+  if (runs == 0)
+    return;
+  printf("Host time per layer, average of %d run%s:\n", runs, runs > 1 ? "s" : "");
+  for (i = 0; i < layers && i < MAX_LAYERS; i++) {
+    printf("  Layer %3d: %12.3f us\n", i, layer_us[i] / runs);
+    total += layer_us[i];
+  }
+  printf("  Total:     %12.3f us\n", total / runs);
+}
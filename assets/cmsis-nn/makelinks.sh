@@ -6,3 +6,9 @@ ln -s ../../../CMSIS_5/CMSIS .
 ln -s CMSIS/NN/Source/PoolingFunctions/arm_pool_q7_HWC.c .
 ln -s CMSIS/NN/Source/ActivationFunctions/arm_relu_q7.c .
 ln -s CMSIS/NN/Source/FullyConnectedFunctions/arm_fully_connected_q7.c .
+ln -s CMSIS/NN/Source/FullyConnectedFunctions/arm_fully_connected_q7_opt.c .
+ln -s CMSIS/NN/Source/ConvolutionFunctions/arm_convolve_HWC_q7_RGB.c .
+ln -s CMSIS/NN/Source/ConvolutionFunctions/arm_convolve_HWC_q7_fast_nonsquare.c .
+ln -s CMSIS/NN/Source/ConvolutionFunctions/arm_convolve_1x1_HWC_q7_fast_nonsquare.c .
+ln -s CMSIS/NN/Source/ConvolutionFunctions/arm_depthwise_separable_conv_HWC_q7.c .
+ln -s CMSIS/NN/Source/ConvolutionFunctions/arm_depthwise_separable_conv_HWC_q7_nonsquare.c .
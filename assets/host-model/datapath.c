@@ -0,0 +1,818 @@
+/*******************************************************************************
+* Copyright (C) Maxim Integrated Products, Inc., All rights Reserved.
+*
+* This software is protected by copyright laws of the United States and
+* of foreign countries. This material may also be protected by patent laws
+* and technology transfer regulations of the United States and of foreign
+* countries. This software is furnished under a license agreement and/or a
+* nondisclosure agreement and may only be used or reproduced in accordance
+* with the terms of those agreements. Dissemination of this information to
+* any party or parties not specified in the license agreement and/or
+* nondisclosure agreement is expressly prohibited.
+*
+* The above copyright notice and this permission notice shall be included
+* in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+* OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+* IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+* OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+* ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+* OTHER DEALINGS IN THE SOFTWARE.
+*
+* Except as contained in this notice, the name of Maxim Integrated
+* Products, Inc. shall not be used except as stated in the Maxim Integrated
+* Products, Inc. Branding Policy.
+*
+* The mere transfer of this software does not imply any licenses
+* of trade secrets, proprietary technology, copyrights, patents,
+* trademarks, maskwork rights, or any other form of intellectual
+* property whatsoever. Maxim Integrated Products, Inc. retains all
+* ownership rights.
+*******************************************************************************/
+
+/*
+ * Datapath of the host model. Decodes the layer registers that the generated code has
+ * written and runs each layer on the kernel, bias and data memories at the programmed
+ * offsets, starting at the first layer in the layer count register and following the layer
+ * sequence. The arithmetic matches izer's simulator (izer/max7800x.py run_layer() and
+ * izer/simulate.py), so that the output matches the expected output in the generated
+ * check_output().
+ *
+ * Streaming layers read the FIFO data and the output of the prior layer from a linear shadow
+ * of the data memory instead of the circular buffers of the device.
+ */
+
+#include <math.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include "host.h"
+
+#define QUADS ((PROCS + 3) / 4)
+#define QUAD_WORDS (4 * MODEL_INSTANCE_SIZE)  // Data memory words of four processors
+#define SHADOW_WORDS (1U << 20)
+#define LREG_NONE (-1)
+
+// Decoded configuration of one layer
+typedef struct {
+  int layer;
+  uint32_t ena[MODEL_NUM_GROUPS];
+  uint32_t wptr[MODEL_NUM_GROUPS];
+  uint32_t post[MODEL_NUM_GROUPS];
+  uint32_t koffs[MODEL_NUM_GROUPS];  // Kernel memory byte of the first kernel
+  int kernels[MODEL_NUM_GROUPS];  // Number of kernels per processor
+  int group;  // First group with enabled processors
+  int chw;
+  int operands;
+  int eltwise;  // Element-wise operator encoding, if operands > 1
+  int pool_first;
+  int conv1d;
+  int transposed;
+  int depthwise;
+  int broadcast;  // Depthwise convolution that writes each output to its input processor
+  int bypass;
+  int passthrough;
+  int pooling;
+  int pool_avg;
+  int pool[2];
+  int pool_stride;
+  int conv_stride;
+  int pad[2];
+  int kernel[2];
+  int rows;  // Pooled input rows and columns
+  int cols;
+  int in_cols;  // Columns of the input in memory
+  int passes;  // Input passes (multi-pass)
+  int pixel_words;  // Input words per pixel
+  uint32_t rptr;
+  int out_rows;
+  int out_cols;
+  int out_bytes;
+  int out_passes;
+  int pixel_offs;  // Output words per pixel
+  uint32_t choffs;  // Output words per output pass
+  int slots;  // Output processors per output pass, counting gaps
+  int quant;
+  int shift;
+  int relu;
+  int abs;
+  int in_shadow;
+  int out_shadow;
+  int64_t *planes[PROCS];  // Pooled input of each processor, all passes
+} layer_t;
+
+static uint32_t *shadow[QUADS];  // Linear data memory for streaming layers
+static uint32_t ctl;  // Control register of the first enabled group
+
+static void unsupported(int layer, const char *what)
+{
+  fprintf(stderr, "Host model: Layer %d: %s is not modeled\n", layer, what);
+  exit(1);
+}
+
+static void *alloc(size_t n)
+{
+  void *p = calloc(n > 0 ? n : 1, 1);
+
+  if (p == NULL) {
+    fprintf(stderr, "Host model: Out of memory\n");
+    exit(1);
+  }
+  return p;
+}
+
+static int64_t clip(int64_t val, int64_t min, int64_t max)
+{
+  return val < min ? min : val > max ? max : val;
+}
+
+// Scale an accumulator by the output shift and round, like izer's floor(0.5 + x / scale)
+static int64_t scale(int64_t val, int shift)
+{
+  return clip((int64_t) floor(0.5 + (double) val / (128.0 / ldexp(1.0, shift))), -128, 127);
+}
+
+static int ffs16(uint32_t val)
+{
+  int i;
+
+  for (i = 0; i < 16 && !(val & (1U << i)); i++)
+    ;
+  return i;
+}
+
+static int fls16(uint32_t val)
+{
+  int i;
+
+  for (i = 15; i > 0 && !(val & (1U << i)); i--)
+    ;
+  return i;
+}
+
+// Layer register `reg` of layer `layer` in group `g`
+static uint32_t lreg(int g, int layer, int reg)
+{
+  if (reg == LREG_NONE)
+    return 0;
+  return *MEM32(LREG(g, layer, reg));
+}
+
+// Global register at byte offset `offs` in group `g`
+static uint32_t greg(int g, uint32_t offs)
+{
+  return *MEM32(GROUP_BASE(g) + MODEL_CNN_BASE + offs);
+}
+
+// Word `w` of the data memory of quad `q` (processors 4q to 4q + 3)
+static uint32_t *word(int shadowed, int q, uint32_t w)
+{
+  if (shadowed) {
+    if (q >= QUADS || w >= SHADOW_WORDS) {
+      fprintf(stderr, "Host model: Streaming data at word 0x%x of processors %d-%d exceeds "
+              "the model\n", w, 4 * q, 4 * q + 3);
+      exit(1);
+    }
+    if (shadow[q] == NULL)
+      shadow[q] = alloc(SHADOW_WORDS * sizeof(uint32_t));
+    return &shadow[q][w];
+  }
+  if (q >= QUADS || w >= QUAD_WORDS) {
+    fprintf(stderr, "Host model: Data memory word 0x%x of processors %d-%d does not exist\n",
+            w, 4 * q, 4 * q + 3);
+    exit(1);
+  }
+  return (uint32_t *) MEM32(MODEL_SRAM_BASE + GROUP_BASE(q / 4)
+                            + (uint32_t) (q % 4) * QUAD_WORDS * 4 + w * 4);
+}
+
+// Store `val` in lane `lane` of word `w` of quad `q`
+static void store(const layer_t *l, int q, uint32_t w, int lane, int64_t val)
+{
+  uint32_t *dst;
+
+  if (l->out_bytes == 4) {
+    *word(l->out_shadow, q, w + lane) = (uint32_t) val;
+  } else {
+    dst = word(l->out_shadow, q, w);
+    *dst = (*dst & ~(0xffU << 8 * lane)) | ((uint32_t) val & 0xff) << 8 * lane;
+  }
+}
+
+// Whether the layer reads its input from the shadow memory: the first layer reads the FIFOs,
+// and streaming layers read the output of the prior layer
+static int streaming(int g, int layer, int start)
+{
+  if (layer == start)
+    return (ctl & (1 << 15)) != 0;
+  if (!(ctl & (1 << 14)))
+    return 0;
+  return (lreg(g, layer, MODEL_LREG_STREAM1) | lreg(g, layer, MODEL_LREG_STREAM2)
+          | lreg(g, layer, MODEL_LREG_FMAX)) != 0;
+}
+
+// Decode the registers of layer `layer`
+static void decode(layer_t *l, int layer, int start)
+{
+  static const int quant[] = {8, 1, 2, 4};
+  uint32_t rcnt, ccnt, oned, stride, lctl, lctl2, post, masks = 0;
+  uint32_t cnt_mask = (1U << MODEL_MAX_CNT_BITS) - 1;
+  int g, shift, skip;
+
+  memset(l, 0, sizeof(*l));
+  l->layer = layer;
+  l->group = -1;
+  for (g = 0; g < MODEL_NUM_GROUPS; g++) {
+    l->ena[g] = lreg(g, layer, MODEL_LREG_ENA);
+    l->wptr[g] = lreg(g, layer, MODEL_LREG_WPTR_BASE);
+    l->post[g] = lreg(g, layer, MODEL_LREG_POST);
+    masks |= l->ena[g] >> 16;
+    if (l->group < 0 && (l->ena[g] & 0xffff))
+      l->group = g;
+  }
+  if (l->group < 0)
+    unsupported(layer, "A layer without enabled processors");
+  g = l->group;
+
+  rcnt = lreg(g, layer, MODEL_LREG_RCNT);
+  ccnt = lreg(g, layer, MODEL_LREG_CCNT);
+  oned = lreg(g, layer, MODEL_LREG_ONED);
+  stride = lreg(g, layer, MODEL_LREG_STRIDE);
+  lctl = lreg(g, layer, MODEL_LREG_LCTL);
+  lctl2 = lreg(g, layer, MODEL_LREG_LCTL2);
+  post = l->post[g];
+
+  if (!(lctl & (1 << 11)))
+    unsupported(layer, "Local output (per-group write pointers)");
+  if (post & (1 << 29))
+    unsupported(layer, "calcx4 kernel ordering");
+  l->chw = (lctl >> 6) & 1;
+  l->pooling = (lctl >> 7) & 1;
+  l->pool_avg = !((lctl >> 8) & 1);
+  l->relu = (lctl >> 9) & 1;
+  l->out_bytes = lctl & (1 << 16) ? 4 : 1;
+  l->bypass = (lctl >> 30) & 1;
+  l->broadcast = (lctl >> 29) & 1;
+  l->passthrough = masks == 0 && !l->bypass;
+
+  l->abs = (post >> 26) & 1;
+  l->transposed = (post >> 28) & 1;
+  l->depthwise = (post >> 30) & 1;
+  shift = (post >> 13) & 0x1f;
+  l->shift = shift & 0x10 ? -(shift & 0xf) : shift;
+  l->quant = l->bypass ? 8 : quant[(post >> 22) & 3];
+
+  l->conv1d = (oned >> 12) & 1;
+  l->operands = oned & (1 << 13) ? ((oned >> 18) & 0xf) + 1 : 1;
+  l->eltwise = (oned >> 14) & 3;
+  l->pool_first = (oned >> 16) & 1;
+
+  l->pool[0] = l->pooling ? (int) (lreg(g, layer, MODEL_LREG_PRCNT) & 0xf) + 1 : 1;
+  l->pool[1] = l->pooling ? (int) (lreg(g, layer, MODEL_LREG_PCCNT) & 0xf) + 1 : 1;
+  if (l->conv1d)
+    l->pool[1] = 1;
+  l->pool_stride = (stride & 0xf) + 1;
+  l->conv_stride = 1;
+  l->passes = ((post & (1 << 27) ? ((post >> 18) & 0xf) << 4 : 0) | (lctl2 & 0xf)) + 1;
+  l->rptr = lreg(g, layer, MODEL_LREG_RPTR_BASE);
+
+  // Kernel size
+  if (l->conv1d) {
+    l->kernel[0] = (oned >> 8) & 0xf;
+    l->kernel[1] = 1;
+#if MODEL_RPRIME_MAX_OFFS >= 0
+  } else {
+    l->kernel[0] = ((lctl >> MODEL_RPRIME_MAX_OFFS) & 0xf) + 1;
+    l->kernel[1] = ((lctl >> MODEL_CPRIME_MAX_OFFS) & 0xf) + 1;
+  }
+#else
+  } else if (oned & (1 << 8)) {
+    l->kernel[0] = l->kernel[1] = 1;
+  } else {
+    l->kernel[0] = l->kernel[1] = 3;
+  }
+#endif
+
+  // Input dimensions: pooled rows and columns, and words per pixel
+#if MODEL_CNT_DIFF_OFFS >= 0
+  l->pad[0] = rcnt & (1 << MODEL_PAD_ENA_OFFS) ? ((rcnt >> MODEL_PAD_CNT_OFFS) & 3) + 1 : 0;
+  l->pad[1] = ccnt & (1 << MODEL_PAD_ENA_OFFS) ? ((ccnt >> MODEL_PAD_CNT_OFFS) & 3) + 1 : 0;
+  l->pixel_words = stride >> MODEL_MP_STRIDE_OFFS;
+  if (l->conv1d && l->pool_stride > 1
+      && l->pixel_words == l->passes * l->operands) {  // Stride of the convolution
+    l->conv_stride = l->pool_stride;
+    l->pool_stride = 1;
+  }
+  l->pixel_words /= l->pool_stride;
+  l->in_cols = (ccnt & cnt_mask) + (ccnt >> MODEL_CNT_DIFF_OFFS);
+  if (l->transposed) {
+    l->rows = ((rcnt & cnt_mask) + 1) / 2;
+    l->cols = l->in_cols / 2;
+    l->in_cols = l->cols;
+  } else {
+    l->rows = (rcnt & cnt_mask) / l->pool_stride + 1;
+    l->cols = l->conv1d ? 1 : (ccnt & cnt_mask) / l->pool_stride + 1;
+  }
+#else
+  {
+    int in_rows, in_cols;
+
+    l->pad[0] = (rcnt >> MODEL_PAD_CNT_OFFS) & 3;
+    l->pad[1] = (ccnt >> MODEL_PAD_CNT_OFFS) & 3;
+    in_rows = (rcnt & cnt_mask) - 2 * l->pad[0] + 1;
+    in_cols = (ccnt & cnt_mask) - 2 * l->pad[1] + 1;
+    l->pixel_words = l->passes * l->operands;
+    if (l->conv1d && !l->pooling && l->pool_stride > 1) {  // Stride of the convolution
+      l->conv_stride = l->pool_stride;
+      l->pool_stride = 1;
+    }
+    if (l->transposed) {
+      in_rows /= 2;
+      in_cols /= 2;
+    }
+    l->in_cols = in_cols;
+    l->rows = (in_rows - l->pool[0]) / l->pool_stride + 1;
+    l->cols = l->conv1d ? 1 : (in_cols - l->pool[1]) / l->pool_stride + 1;
+  }
+#endif
+  if (l->chw && l->passes > 1)
+    unsupported(layer, "Multi-pass CHW input");
+
+  // Output dimensions
+  if (l->passthrough) {
+    l->out_rows = l->rows;
+    l->out_cols = l->cols;
+  } else if (l->conv1d) {
+    l->out_rows = (l->rows + 2 * l->pad[0] - l->kernel[0]) / l->conv_stride + 1;
+    l->out_cols = 1;
+  } else if (l->transposed) {
+    l->out_rows = 2 * l->rows + 2 * l->pad[0] - l->kernel[0] + 1;
+    l->out_cols = 2 * l->cols + 2 * l->pad[1] - l->kernel[1] + 1;
+  } else {
+    l->out_rows = l->rows + 2 * l->pad[0] - l->kernel[0] + 1;
+    l->out_cols = l->cols + 2 * l->pad[1] - l->kernel[1] + 1;
+  }
+
+  // Output layout
+  skip = (lctl2 >> 4) & ((1U << (MODEL_XPCH_MAX_OFFS - 4)) - 1);
+  l->slots = (int) (lctl2 >> MODEL_XPCH_MAX_OFFS) / l->quant + 1;
+  l->choffs = lreg(g, layer, MODEL_LREG_WPTR_CHOFFS);
+  l->pixel_offs = (skip + 1) * (l->out_bytes == 4 ? 4 : 1);
+  l->out_passes = l->choffs > 0 ? (int) (l->pixel_offs / l->choffs) : 1;
+
+  // Kernels
+  for (g = 0; g < MODEL_NUM_GROUPS; g++) {
+    uint32_t koffs, kmax;
+
+#if MODEL_LREG_MCNT >= 0
+    koffs = (lreg(g, layer, MODEL_LREG_MCNT) >> MODEL_MCNT_SAD_OFFS) & 0xffff;
+    kmax = (lreg(g, layer, MODEL_LREG_MCNT) >> MODEL_MCNT_MAX_OFFS) & 0xffff;
+#else
+    koffs = lreg(g, layer, MODEL_LREG_MCNT2);
+    kmax = lreg(g, layer, MODEL_LREG_MCNT1);
+#endif
+    l->kernels[g] = (int) (kmax - koffs) / l->quant + 1;
+    l->koffs[g] = koffs / 8 * l->kernel[0] * l->kernel[1] + ((oned >> 4) & 0xf);
+  }
+
+  l->in_shadow = streaming(l->group, layer, start);
+}
+
+// Input value of operand `o` of processor `p` in pass `t` at memory row `y` and column `x`
+static int64_t input(const layer_t *l, int p, int t, int o, int y, int x)
+{
+  uint32_t pix = (uint32_t) y * l->in_cols + x, b;
+
+  if (l->chw) {
+    b = l->rptr * 4 + pix;
+    return (int8_t) (*word(l->in_shadow, p / 4, b / 4) >> 8 * (b % 4));
+  }
+  return (int8_t) (*word(l->in_shadow, p / 4,
+                         l->rptr + pix * l->pixel_words + t * l->operands + o)
+                   >> 8 * (p % 4));
+}
+
+// Combine the operands `v` using the element-wise operator
+static int64_t eltwise(const layer_t *l, const int64_t *v)
+{
+  int64_t val = v[0];
+  int o;
+
+  for (o = 1; o < l->operands; o++) {
+    switch (l->eltwise) {
+    case 0: val -= v[o]; break;
+    case 1: val += v[o]; break;
+    case 2: val |= v[o]; break;
+    default: val ^= v[o]; break;
+    }
+  }
+  return l->passthrough && l->out_bytes == 4 ? val : clip(val, -128, 127);
+}
+
+// Input of operand `o`, or of all operands combined when `o` is negative
+static int64_t sample(const layer_t *l, int p, int t, int o, int y, int x)
+{
+  int64_t v[16];
+  int i;
+
+  if (o >= 0)
+    return input(l, p, t, o, y, x);
+  for (i = 0; i < l->operands; i++)
+    v[i] = input(l, p, t, i, y, x);
+  return eltwise(l, v);
+}
+
+// In-flight pooling, or subsampling with the pool stride when there is no pooling
+static int64_t pool(const layer_t *l, int p, int t, int o, int y, int x)
+{
+  int count = l->pool[0] * l->pool[1], h, w;
+  int64_t val;
+
+  y *= l->pool_stride;
+  x *= l->pool_stride;
+  if (!l->pooling)
+    return sample(l, p, t, o, y, x);
+  val = l->pool_avg ? 0 : sample(l, p, t, o, y, x);
+  for (h = 0; h < l->pool[0]; h++) {
+    for (w = 0; w < l->pool[1]; w++) {
+      int64_t e = sample(l, p, t, o, y + h, x + w);
+
+      if (l->pool_avg)
+        val += e;
+      else if (e > val)
+        val = e;
+    }
+  }
+  if (l->pool_avg) {
+    if (l->conv1d)
+      val = clip(val / count, -128, 127);
+    else if (ctl & (1 << 13))
+      val = (int64_t) rint((double) val / count);
+    else
+      val /= count;  // Truncates toward zero
+  }
+  return val;
+}
+
+// Read and pool the input of all passes of processor `p`
+static int64_t *plane(const layer_t *l, int p)
+{
+  int64_t *d = alloc((size_t) l->passes * l->rows * l->cols * sizeof(int64_t)), v[16];
+  int t, y, x, o;
+
+  for (t = 0; t < l->passes; t++) {
+    for (y = 0; y < l->rows; y++) {
+      for (x = 0; x < l->cols; x++) {
+        int64_t *val = &d[((int64_t) t * l->rows + y) * l->cols + x];
+
+        if (l->operands > 1 && l->pool_first) {
+          if (l->conv1d && l->pooling) {  // 1D pooling uses the first operand only
+            *val = pool(l, p, t, 0, y, x);
+          } else {
+            for (o = 0; o < l->operands; o++)
+              v[o] = pool(l, p, t, o, y, x);
+            *val = eltwise(l, v);
+          }
+        } else {
+          *val = pool(l, p, t, l->operands > 1 ? -1 : 0, y, x);
+        }
+      }
+    }
+  }
+  return d;
+}
+
+#define PLANE(l, p, t, y, x) \
+  ((l)->planes[p][(((int64_t) (t) * (l)->rows + (y)) * (l)->cols + (x))])
+
+// Weight `tap` of kernel `k` of processor `p`. Sub-byte kernels pack the weights of
+// consecutive passes, then outputs, into one byte, and `sub` selects the weight.
+static int64_t weight(const layer_t *l, int p, int k, int sub, int tap)
+{
+  int ksize = l->kernel[0] * l->kernel[1], val;
+  uint32_t b = l->koffs[p / MODEL_NUM_PROCS] + (uint32_t) k * ksize + ksize - 1 - tap;
+
+  if (l->bypass)
+    return 1;
+  if (b / 9 >= MRAM_COLS) {
+    fprintf(stderr, "Host model: Layer %d: Kernel of processor %d exceeds the kernel "
+            "memory\n", l->layer, p);
+    exit(1);
+  }
+  val = model_kernels[p][b / 9][8 - b % 9];
+  if (l->quant == 8)
+    return (int8_t) val;
+  val = (val >> sub * l->quant) & ((1 << l->quant) - 1);
+  if (ctl & (1 << 30))  // Binary weights
+    return val ? -1 : 1;
+  return val & (1 << (l->quant - 1)) ? val - (1 << l->quant) : val;
+}
+
+// Scale, bias and activation of the accumulator
+static int64_t output(const layer_t *l, int64_t acc)
+{
+  if (l->out_bytes != 4)
+    acc = scale(acc, l->shift);
+  if (l->relu)
+    acc = clip(acc, 0, 127);
+  else if (l->abs)
+    acc = clip(acc < 0 ? -acc : acc, 0, 127);
+  return acc;
+}
+
+// Accumulate the input of processor `p` for output pixel `y`, `x` using the weights `w`
+static int64_t convolve(const layer_t *l, int p, const int64_t *w, int y, int x)
+{
+  int kh = l->kernel[0], kw = l->kernel[1], t, h, c;
+  int64_t acc = 0;
+
+  for (t = 0; t < l->passes; t++) {
+    for (h = 0; h < kh; h++) {
+      int sy = y * l->conv_stride - l->pad[0] + h;
+
+      if (l->transposed) {
+        if (sy < 0 || sy % 2 != 0 || sy / 2 >= l->rows)
+          continue;
+        sy /= 2;
+      } else if (sy < 0 || sy >= l->rows) {
+        continue;
+      }
+      for (c = 0; c < kw; c++) {
+        int sx = x - l->pad[1] + c;
+
+        if (l->transposed) {
+          if (sx < 0 || sx % 2 != 0 || sx / 2 >= l->cols)
+            continue;
+          sx /= 2;
+        } else if (sx < 0 || sx >= l->cols) {
+          continue;
+        }
+        acc += w[(t * kh + h) * kw + c] * PLANE(l, p, t, sy, sx);
+      }
+    }
+  }
+  return acc;
+}
+
+// Output processor of input processor `p` when each processor computes its own output: the
+// enabled processors of each group write to consecutive processors
+static int out_proc(const layer_t *l, int p, int g)
+{
+  int q = (int) (l->wptr[g] >> MODEL_WRITE_PTR_SHIFT), first = ffs16(l->ena[g]), i, n = 0;
+
+  for (i = first; i < p % MODEL_NUM_PROCS; i++)
+    n += (l->ena[g] >> i) & 1;
+  return 4 * q + first % 4 + n;
+}
+
+static uint32_t out_base(const layer_t *l, int g)
+{
+  return l->wptr[g] & ((1U << MODEL_WRITE_PTR_SHIFT) - 1);
+}
+
+// Copy the (pooled) input to the output
+static void passthrough(const layer_t *l)
+{
+  int p, t, y, x;
+
+  for (p = 0; p < PROCS; p++) {
+    int g = p / MODEL_NUM_PROCS, q;
+
+    if (l->planes[p] == NULL)
+      continue;
+    q = out_proc(l, p, g);
+    for (t = 0; t < l->passes; t++) {
+      for (y = 0; y < l->rows; y++) {
+        for (x = 0; x < l->cols; x++) {
+          uint32_t w = out_base(l, g) + (uint32_t) (y * l->cols + x) * l->passes
+            * l->pixel_offs + t * l->choffs;
+
+          store(l, q / 4, w, q % 4, PLANE(l, p, t, y, x));
+        }
+      }
+    }
+  }
+}
+
+// Depthwise convolution: each processor convolves its own input. In broadcast mode, the
+// outputs stay in the input processors, and the bias memory of each group holds the bias
+// values of its four memory instances interleaved.
+static void depthwise(const layer_t *l)
+{
+  int ksize = l->kernel[0] * l->kernel[1], first = -1, last = -1, first_proc = -1;
+  int p, t, i, y, x;
+  int64_t *w = alloc((size_t) l->passes * ksize * sizeof(int64_t));
+
+  for (i = 0; i < MODEL_NUM_GROUPS; i++) {
+    if (l->ena[i] & 0xffff) {
+      last = i;
+      if (first < 0) {
+        first = i;
+        first_proc = i * MODEL_NUM_PROCS + ffs16(l->ena[i]);
+      }
+    }
+  }
+  for (p = 0; p < PROCS; p++) {
+    int g = p / MODEL_NUM_PROCS, q, lo, count, pos = p % MODEL_NUM_PROCS;
+    uint32_t bias_offs = l->post[g] & 0xfff;
+
+    if (l->planes[p] == NULL)
+      continue;
+    if (l->broadcast) {
+      q = 4 * (int) (l->wptr[g] >> MODEL_WRITE_PTR_SHIFT) + p - (first_proc & ~3);
+      lo = 0;
+      pos = (pos % 4) * 4 + pos / 4;
+      bias_offs *= 4;
+    } else {
+      q = out_proc(l, p, g);
+      lo = g == first ? ffs16(l->ena[g]) : 0;
+    }
+    count = g == last ? fls16(l->ena[g]) - lo + 1 : MODEL_NUM_PROCS;
+    for (t = 0; t < l->passes; t++) {
+      int64_t bias = 0;
+
+      memset(w, 0, (size_t) l->passes * ksize * sizeof(int64_t));
+      for (i = 0; i < ksize; i++)
+        w[t * ksize + i] = weight(l, p, l->kernels[g] - l->passes + t / (8 / l->quant),
+                                  t % (8 / l->quant), i);
+      if (l->post[g] & (1 << 12))
+        bias = (int8_t) *MEM8(GROUP_BASE(g) + MODEL_BRAM_BASE
+                              + 4 * (bias_offs + t * count + pos - lo)) * MODEL_BIAS_DIV;
+      for (y = 0; y < l->out_rows; y++) {
+        for (x = 0; x < l->out_cols; x++) {
+          uint32_t o = out_base(l, g) + (uint32_t) (y * l->out_cols + x) * l->pixel_offs
+            + t * l->choffs;
+
+          store(l, q / 4, o, q % 4, output(l, convolve(l, p, w, y, x) + bias));
+        }
+      }
+    }
+  }
+  free(w);
+}
+
+// Convolution: each output sums the input of all processors
+static void convolution(const layer_t *l)
+{
+  int ksize = l->kernel[0] * l->kernel[1], bias_group = -1, slots = l->slots, start = 0;
+  int n = l->kernels[l->group], q = (int) (l->wptr[l->group] >> MODEL_WRITE_PTR_SHIFT);
+  uint32_t base = out_base(l, l->group);
+  int64_t *w = alloc((size_t) PROCS * l->passes * ksize * sizeof(int64_t));
+  int64_t *acc = alloc((size_t) l->out_rows * l->out_cols * sizeof(int64_t));
+  int g, p, e, s, t, i, y, x;
+
+  for (g = 0; g < MODEL_NUM_GROUPS && bias_group < 0; g++) {
+    if (l->post[g] & (1 << 12))
+      bias_group = g;
+  }
+  // Kernels for outputs that are not used by the later output passes
+  if (l->out_passes > 1 && l->quant == 8 && n / (l->out_passes * l->passes) > slots)
+    start = n / (l->out_passes * l->passes) - slots;
+
+  for (e = 0; e < l->out_passes; e++) {
+    for (s = 0; s < slots; s++) {
+      int k = start + e * (slots - start) + s - start, qf = 8 / l->quant;
+      int64_t bias = 0;
+      for (p = 0; p < PROCS; p++) {
+        g = p / MODEL_NUM_PROCS;
+        if (l->planes[p] == NULL || (!l->bypass && !(l->ena[g] >> 16 & 1U << p % 16)))
+          continue;
+        for (t = 0; t < l->passes; t++) {
+          for (i = 0; i < ksize; i++)
+            w[(p * l->passes + t) * ksize + i] = l->quant == 8
+              ? weight(l, p, k * l->passes + t, 0, i)
+              : weight(l, p, k / qf * l->passes + (k % qf * l->passes + t) / qf,
+                       (k % qf * l->passes + t) % qf, i);
+        }
+      }
+      if (bias_group >= 0) {
+        uint32_t idx = (l->post[bias_group] & 0xfff) + start * l->out_passes
+          + e * (slots - start) + s - start;
+
+        if (l->layer == 0 && (ctl & (1 << 14))
+            && (!(ctl & (1 << 15)) || lreg(l->group, 0, MODEL_LREG_FMAX) != 0))
+          idx += MODEL_STREAM_BIAS_SKIP;  // Streaming first layer
+        bias = (int8_t) *MEM8(GROUP_BASE(bias_group) + MODEL_BRAM_BASE + 4 * idx)
+          * MODEL_BIAS_DIV;
+      }
+
+      memset(acc, 0, (size_t) l->out_rows * l->out_cols * sizeof(int64_t));
+      for (p = 0; p < PROCS; p++) {
+        g = p / MODEL_NUM_PROCS;
+        if (l->planes[p] == NULL || (!l->bypass && !(l->ena[g] >> 16 & 1U << p % 16)))
+          continue;
+        for (y = 0; y < l->out_rows; y++) {
+          for (x = 0; x < l->out_cols; x++)
+            acc[y * l->out_cols + x] += convolve(l, p, &w[p * l->passes * ksize], y, x);
+        }
+      }
+
+      for (y = 0; y < l->out_rows; y++) {
+        for (x = 0; x < l->out_cols; x++) {
+          uint32_t o = base + (uint32_t) (y * l->out_cols + x) * l->pixel_offs
+            + e * l->choffs;
+
+          store(l, q + s / 4, o, s % 4, output(l, acc[y * l->out_cols + x] + bias));
+          if (s == slots - 1 && l->out_bytes != 4) {  // Unused bytes of the word are zero
+            for (i = s % 4 + 1; i < 4; i++)
+              store(l, q + s / 4, o, i, 0);
+          }
+        }
+      }
+    }
+  }
+  free(acc);
+  free(w);
+}
+
+// Copy the FIFO data to the shadow memory that the first layer reads
+static void fifo_input(const layer_t *l)
+{
+  int f;
+  uint32_t i;
+
+  for (f = 0; f < NUM_FIFOS; f++) {
+    for (i = 0; i < model_fifos[f].count; i++)
+      *word(1, 4 * f, l->rptr + i) = model_fifos[f].data[i];
+  }
+}
+
+static void run_layer(layer_t *l, int next_streaming)
+{
+  int p;
+
+  l->out_shadow = next_streaming;
+  for (p = 0; p < PROCS; p++) {
+    if (l->ena[p / MODEL_NUM_PROCS] & (1U << p % MODEL_NUM_PROCS))
+      l->planes[p] = plane(l, p);
+  }
+  if (l->passthrough)
+    passthrough(l);
+  else if (l->depthwise)
+    depthwise(l);
+  else
+    convolution(l);
+  for (p = 0; p < PROCS; p++)
+    free(l->planes[p]);
+}
+
+// Next layer after layer `layer`, or -1 after the final layer
+static int next_layer(int g, int layer, int final)
+{
+#if MODEL_LREG_NXTLYR >= 0
+  uint32_t next = lreg(g, layer, MODEL_LREG_NXTLYR);
+
+  if (next & (1 << 8))
+    return -1;
+  if (next & (1 << 7))
+    return next & 0x7f;
+#else
+  (void) g;
+#endif
+  return layer == final ? -1 : layer + 1;
+}
+
+void model_run(void)
+{
+  layer_t *cur = alloc(sizeof(layer_t)), *next = alloc(sizeof(layer_t)), *tmp;
+  uint32_t lcnt;
+  int g, master = -1, layer, after, count = 0, start, final;
+
+  for (g = 0; g < MODEL_NUM_GROUPS && master < 0; g++) {
+    if (greg(g, MODEL_REG_CTL) & (1 << 3))
+      master = g;
+  }
+  if (master < 0) {
+    fprintf(stderr, "Host model: No group is enabled\n");
+    exit(1);
+  }
+  ctl = greg(master, MODEL_REG_CTL);
+  lcnt = greg(master, MODEL_REG_LCNT_MAX);
+  final = lcnt & 0xff;
+  start = (lcnt >> 8) & 0xff;
+
+  decode(cur, start, start);
+  if (cur->in_shadow)
+    fifo_input(cur);
+  for (layer = start; layer >= 0; layer = after) {
+    if (++count > MODEL_MAX_LAYERS) {
+      fprintf(stderr, "Host model: The layer sequence does not end\n");
+      exit(1);
+    }
+    after = next_layer(master, layer, final);
+    if (after >= 0)
+      decode(next, after, start);
+    run_layer(cur, after >= 0 && next->in_shadow);
+    tmp = cur;
+    cur = next;
+    next = tmp;
+  }
+  for (g = 0; g < QUADS; g++) {
+    free(shadow[g]);
+    shadow[g] = NULL;
+  }
+  free(cur);
+  free(next);
+}
@@ -0,0 +1,89 @@
+/*******************************************************************************
+* Copyright (C) Maxim Integrated Products, Inc., All rights Reserved.
+*
+* This software is protected by copyright laws of the United States and
+* of foreign countries. This material may also be protected by patent laws
+* and technology transfer regulations of the United States and of foreign
+* countries. This software is furnished under a license agreement and/or a
+* nondisclosure agreement and may only be used or reproduced in accordance
+* with the terms of those agreements. Dissemination of this information to
+* any party or parties not specified in the license agreement and/or
+* nondisclosure agreement is expressly prohibited.
+*
+* The above copyright notice and this permission notice shall be included
+* in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+* OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+* IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+* OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+* ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+* OTHER DEALINGS IN THE SOFTWARE.
+*
+* Except as contained in this notice, the name of Maxim Integrated
+* Products, Inc. shall not be used except as stated in the Maxim Integrated
+* Products, Inc. Branding Policy.
+*
+* The mere transfer of this software does not imply any licenses
+* of trade secrets, proprietary technology, copyrights, patents,
+* trademarks, maskwork rights, or any other form of intellectual
+* property whatsoever. Maxim Integrated Products, Inc. retains all
+* ownership rights.
+*******************************************************************************/
+
+/*
+ * Host model of the accelerator. model.c maps the accelerator address space at its device
+ * address and records the writes of the unmodified generated code to registers, kernel memory
+ * and the FIFOs. datapath.c decodes the captured layer registers and runs each layer on the
+ * captured kernel, bias and data memories. model.h describes the device.
+ */
+
+#ifndef HOST_H
+#define HOST_H
+
+#include <stdint.h>
+#include "model.h"
+
+// Address of offset `offs` in the accelerator address space
+#define MEM32(offs) ((volatile uint32_t *) ((uintptr_t) MODEL_APB_BASE + (offs)))
+#define MEM8(offs) ((volatile uint8_t *) ((uintptr_t) MODEL_APB_BASE + (offs)))
+
+#define GROUP_BASE(g) ((uint32_t) (g) * MODEL_GROUP_OFFS)
+#define CTL(g) (GROUP_BASE(g) + MODEL_CNN_BASE + MODEL_REG_CTL)
+// Offset of layer register `reg` of layer `layer` in group `g`
+#define LREG(g, layer, reg) \
+  (GROUP_BASE(g) + MODEL_LREG_BASE + (uint32_t) (reg) * MODEL_LREG_REG_STEP \
+   + (uint32_t) (layer) * ((reg) <= MODEL_MAX_LREG ? MODEL_LREG_LAYER_STEP : 4))
+#define MRAM_COLS (MODEL_MRAM_PROC_SIZE / 16)
+#define PROCS (MODEL_NUM_GROUPS * MODEL_NUM_PROCS)
+#define NUM_FIFOS 4
+
+// Address and value of a register or bias memory word
+typedef struct {
+  uint32_t addr;
+  uint32_t val;
+} model_reg_t;
+
+// Words written to a FIFO
+typedef struct {
+  uint32_t *data;
+  uint32_t count;
+  uint32_t size;
+} model_fifo_t;
+
+// Kernel memory as loaded, 9 bytes per column and processor
+extern uint8_t model_kernels[PROCS][MRAM_COLS][9];
+
+extern model_fifo_t model_fifos[NUM_FIFOS];
+
+// Run the layers configured in the registers. The memories must be unlocked.
+void model_run(void);
+
+// CNN interrupt handler, set by NVIC_SetVector()
+extern void (*model_cnn_isr)(void);
+
+// Called by __WFI(): run the network when the accelerator has been started
+void model_wfi(void);
+
+#endif
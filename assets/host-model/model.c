@@ -0,0 +1,432 @@
+/*******************************************************************************
+* Copyright (C) Maxim Integrated Products, Inc., All rights Reserved.
+*
+* This software is protected by copyright laws of the United States and
+* of foreign countries. This material may also be protected by patent laws
+* and technology transfer regulations of the United States and of foreign
+* countries. This software is furnished under a license agreement and/or a
+* nondisclosure agreement and may only be used or reproduced in accordance
+* with the terms of those agreements. Dissemination of this information to
+* any party or parties not specified in the license agreement and/or
+* nondisclosure agreement is expressly prohibited.
+*
+* The above copyright notice and this permission notice shall be included
+* in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+* OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+* IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+* OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+* ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+* OTHER DEALINGS IN THE SOFTWARE.
+*
+* Except as contained in this notice, the name of Maxim Integrated
+* Products, Inc. shall not be used except as stated in the Maxim Integrated
+* Products, Inc. Branding Policy.
+*
+* The mere transfer of this software does not imply any licenses
+* of trade secrets, proprietary technology, copyrights, patents,
+* trademarks, maskwork rights, or any other form of intellectual
+* property whatsoever. Maxim Integrated Products, Inc. retains all
+* ownership rights.
+*******************************************************************************/
+
+/*
+ * Memory map and register model of the accelerator for the host.
+ *
+ * The accelerator address space is mapped at its device address, so that the unmodified
+ * generated code can access it. Data, bias and TRAM memories are plain memory. The control
+ * and layer registers, the kernel memories and the FIFOs are mapped without access rights:
+ * each access faults, the page is opened for one single-stepped instruction, and the write
+ * is recorded. Once the accelerator has been started and all input has arrived, the model
+ * runs the layers configured in the captured registers (datapath.c), which store their
+ * output in data memory. It then checks the captured registers, kernels and bias values
+ * against the configuration ai8xize.py expects (expected.h), and calls the CNN interrupt
+ * handler.
+ */
+
+#define _GNU_SOURCE
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <ucontext.h>
+#include "mxc.h"
+#include "host.h"
+#include "expected.h"
+
+#ifndef MAP_FIXED_NOREPLACE
+#define MAP_FIXED_NOREPLACE 0x100000
+#endif
+
+#define HOST_PAGE 4096UL
+#define TRAP_FLAG 0x100  // x86 EFLAGS.TF, single-step
+
+// Address ranges (offsets) that fault on access: FIFOs, registers and kernel memory
+typedef struct {
+  uint32_t start;
+  uint32_t end;
+} range_t;
+
+static range_t ranges[1 + 2 * MODEL_NUM_GROUPS];
+static int num_ranges;
+
+// The access that is being single-stepped
+static volatile sig_atomic_t trap_active;
+static uint32_t trap_offs;
+static int trap_write;
+
+static uint32_t ctl[MODEL_NUM_GROUPS];  // Last value written to each group control register
+static int started;
+
+model_fifo_t model_fifos[NUM_FIFOS];
+
+// Decoded kernel memory, and the state of the express loader for each processor
+uint8_t model_kernels[PROCS][MRAM_COLS][9];
+static struct {
+  uint32_t col;
+  int count;
+  uint8_t bytes[9];
+} express[PROCS];
+
+static void protect(int prot)
+{
+  int i;
+
+  for (i = 0; i < num_ranges; i++) {
+    if (mprotect((void *) MEM32(ranges[i].start), ranges[i].end - ranges[i].start,
+                 prot) != 0) {
+      perror("Host model: mprotect");
+      exit(1);
+    }
+  }
+}
+
+// Allow direct access to all of the accelerator
+static void model_unlock(void)
+{
+  protect(PROT_READ | PROT_WRITE);
+}
+
+// Make the registers, kernel memory and FIFOs fault again
+static void model_lock(void)
+{
+  protect(PROT_NONE);
+}
+
+static int trapped(uint32_t offs)
+{
+  int i;
+
+  for (i = 0; i < num_ranges; i++) {
+    if (offs >= ranges[i].start && offs < ranges[i].end)
+      return 1;
+  }
+  return 0;
+}
+
+static void clear(uint32_t offs, uint32_t len)
+{
+  memset((void *) MEM8(offs), 0, len);
+}
+
+// Compare the captured configuration with the expected configuration
+static void check_configuration(void)
+{
+  int i, errors = 0;
+
+  for (i = 0; i < MODEL_REGS; i++) {
+    uint32_t val = *MEM32(model_regs[i].addr);
+
+    if (val != model_regs[i].val && errors++ < 10)
+      fprintf(stderr, "Host model: Register 0x%08x is 0x%08x, expected 0x%08x\n",
+              MODEL_APB_BASE + model_regs[i].addr, val, model_regs[i].val);
+  }
+  for (i = 0; i < MODEL_KERNELS; i++) {
+    uint32_t p = model_kernel_cols[i] >> 16, col = model_kernel_cols[i] & 0xffff;
+
+    if (memcmp(model_kernels[p][col], &model_kernel_data[9 * i], 9) != 0 && errors++ < 10)
+      fprintf(stderr, "Host model: Kernel memory of processor %u, column %u does not "
+              "match\n", p, col);
+  }
+  for (i = 0; i < MODEL_BIAS; i++) {
+    uint32_t val = *MEM32(model_bias[i].addr);
+
+    if (val != model_bias[i].val && errors++ < 10)
+      fprintf(stderr, "Host model: Bias at 0x%08x is 0x%08x, expected 0x%08x\n",
+              MODEL_APB_BASE + model_bias[i].addr, val, model_bias[i].val);
+  }
+  if (errors > 0) {
+    fprintf(stderr, "Host model: %d configuration error%s\n", errors, errors > 1 ? "s" : "");
+    exit(1);
+  }
+}
+
+// Run the network on the captured configuration and input, and signal completion
+static void model_complete(void)
+{
+  int c, g;
+
+  model_unlock();
+  model_run();
+  check_configuration();
+
+  started = 0;
+  for (c = 0; c < NUM_FIFOS; c++)
+    model_fifos[c].count = 0;
+  for (g = 0; g < MODEL_NUM_GROUPS; g++)
+    *MEM32(CTL(g)) |= 1 << 12;  // Interrupt pending
+
+  if (model_cnn_isr == NULL) {
+    fprintf(stderr, "Host model: No CNN interrupt handler\n");
+    exit(1);
+  }
+  model_cnn_isr();
+  for (g = 0; g < MODEL_NUM_GROUPS; g++)
+    ctl[g] = *MEM32(CTL(g));
+  model_lock();
+}
+
+// First group with its clock enabled
+static int first_group(void)
+{
+  int g;
+
+  for (g = 0; g < MODEL_NUM_GROUPS; g++) {
+    if (ctl[g] & (1 << 3))
+      return g;
+  }
+  return 0;
+}
+
+// Without FIFOs, the input is in data memory. Otherwise, each FIFO that feeds the first
+// layer must have received as many words as the input frame register specifies.
+static int input_complete(void)
+{
+  uint32_t words, chw;
+  int c, g = first_group(), start, done = 1;
+
+  if (!(ctl[g] & (1 << 15)))
+    return 1;
+  model_unlock();
+  words = *MEM32(GROUP_BASE(g) + MODEL_CNN_BASE + MODEL_REG_IFRM);
+  start = (*MEM32(GROUP_BASE(g) + MODEL_CNN_BASE + MODEL_REG_LCNT_MAX) >> 8) & 0xff;
+  chw = *MEM32(LREG(g, start, MODEL_LREG_LCTL)) & (1 << 6);
+  for (c = 0; c < NUM_FIFOS && c < MODEL_NUM_GROUPS; c++) {
+    if ((*MEM32(LREG(c, start, MODEL_LREG_ENA)) & (chw ? 1 : 0xf))
+        && model_fifos[c].count < words)
+      done = 0;
+  }
+  model_lock();
+  return done;
+}
+
+// All groups that have their clock enabled have been started
+static int all_started(void)
+{
+  int g;
+
+  for (g = 0; g < MODEL_NUM_GROUPS; g++) {
+    if ((ctl[g] & (1 << 3)) && !(ctl[g] & 1))
+      return 0;
+  }
+  return 1;
+}
+
+// Memory BIST requests complete at once and clear the memory
+static void bist(int g, uint32_t offs, uint32_t val)
+{
+  uint32_t done = 0;
+  int p;
+
+  model_unlock();
+  if (val & (1 << 7)) {  // Clear registers
+    clear(GROUP_BASE(g) + MODEL_LREG_BASE, MODEL_BRAM_BASE - MODEL_LREG_BASE);
+    done |= 1 << 25;
+  }
+  if (val & (1 << 0)) {  // Data memory
+    clear(GROUP_BASE(g) + MODEL_SRAM_BASE, MODEL_SRAM_SIZE);
+    done |= 1 << 27 | 1 << 18;
+  }
+  if (val & (1 << 2)) {  // Kernel memory
+    clear(GROUP_BASE(g) + MODEL_MRAM_BASE, MODEL_NUM_PROCS * MODEL_MRAM_PROC_SIZE);
+    for (p = 0; p < MODEL_NUM_PROCS; p++)
+      memset(model_kernels[g * MODEL_NUM_PROCS + p], 0, sizeof(model_kernels[0]));
+    done |= 1 << 27 | 1 << 19;
+  }
+  if (val & (1 << 4)) {  // TRAM
+    clear(GROUP_BASE(g) + MODEL_TRAM_BASE, MODEL_TRAM_SIZE);
+    done |= 1 << 27 | 1 << 20;
+  }
+  if (val & (1 << 6)) {  // Bias memory
+    clear(GROUP_BASE(g) + MODEL_BRAM_BASE, MODEL_BRAM_SIZE);
+    done |= 1 << 27 | 1 << 21;
+  }
+  *MEM32(offs) = val | done;
+  model_lock();
+}
+
+// Kernel memory write, either using the express loader or 72-bit kernels in 128-bit words
+static void kernel_write(int g, uint32_t local, uint32_t val)
+{
+  uint32_t p = g * MODEL_NUM_PROCS + local / MODEL_MRAM_PROC_SIZE;
+  uint32_t offs = local % MODEL_MRAM_PROC_SIZE;
+  uint8_t *k;
+  int i;
+
+  if (ctl[g] & (1 << 20)) {  // Express
+    if ((offs & 3) == 1) {  // Byte write sets the column
+      express[p].col = offs >> 2;
+      express[p].count = 0;
+      return;
+    }
+    for (i = 24; i >= 0; i -= 8) {
+      express[p].bytes[express[p].count++] = val >> i;
+      if (express[p].count == 9) {
+        if (express[p].col < MRAM_COLS)
+          memcpy(model_kernels[p][express[p].col], express[p].bytes, 9);
+        express[p].col++;
+        express[p].count = 0;
+      }
+    }
+  } else if ((offs & 15) == 12) {  // The write to the fourth word stores the kernel
+    volatile uint32_t *w = MEM32(GROUP_BASE(g) + MODEL_MRAM_BASE + (local & ~15U));
+
+    k = model_kernels[p][offs / 16];
+    k[0] = w[0];
+    for (i = 0; i < 4; i++) {
+      k[1 + i] = w[1] >> (24 - 8 * i);
+      k[5 + i] = w[2] >> (24 - 8 * i);
+    }
+  }
+}
+
+// Record a write to a register, kernel memory or a FIFO
+static void model_write(uint32_t offs)
+{
+  uint32_t val = *MEM32(offs & ~3U), local;
+  int g;
+
+  if (offs >= MODEL_FIFO_REG && offs < MODEL_FIFO_REG + 4 * NUM_FIFOS) {
+    model_fifo_t *fifo = &model_fifos[(offs - MODEL_FIFO_REG) / 4];
+
+    if (fifo->count == fifo->size) {
+      fifo->size = fifo->size > 0 ? 2 * fifo->size : 4096;
+      fifo->data = realloc(fifo->data, fifo->size * sizeof(uint32_t));
+      if (fifo->data == NULL) {
+        fprintf(stderr, "Host model: Out of memory\n");
+        exit(1);
+      }
+    }
+    fifo->data[fifo->count++] = val;
+    if (started && input_complete())
+      model_complete();
+    return;
+  }
+  if (offs < MODEL_CNN_BASE)
+    return;
+  g = (offs - MODEL_CNN_BASE) / MODEL_GROUP_OFFS;
+  local = offs - GROUP_BASE(g);
+  if (g >= MODEL_NUM_GROUPS)
+    return;
+
+  if (local == MODEL_CNN_BASE + MODEL_REG_CTL) {
+    ctl[g] = val;
+    if ((val & 1) && !started && all_started()) {
+      started = 1;
+      if (input_complete())
+        model_complete();
+    }
+  } else if (local == MODEL_CNN_BASE + MODEL_REG_SRAM_TEST) {
+    bist(g, offs, val);
+  } else if (local >= MODEL_MRAM_BASE
+             && local < MODEL_MRAM_BASE + MODEL_NUM_PROCS * MODEL_MRAM_PROC_SIZE) {
+    kernel_write(g, local - MODEL_MRAM_BASE, val);
+  }
+}
+
+// Fault on a protected page: open the page and single-step the access
+static void segv_handler(int sig, siginfo_t *info, void *context)
+{
+  ucontext_t *uc = context;
+  uintptr_t addr = (uintptr_t) info->si_addr;
+
+  (void) sig;
+  if (trap_active || addr < MODEL_APB_BASE || addr >= MODEL_APB_BASE + MODEL_SIZE
+      || !trapped(addr - MODEL_APB_BASE)) {
+    signal(SIGSEGV, SIG_DFL);  // A real fault
+    return;
+  }
+  trap_offs = addr - MODEL_APB_BASE;
+  trap_write = (uc->uc_mcontext.gregs[REG_ERR] & 2) != 0;
+  mprotect((void *) (addr & ~(HOST_PAGE - 1)), HOST_PAGE, PROT_READ | PROT_WRITE);
+  trap_active = 1;
+  uc->uc_mcontext.gregs[REG_EFL] |= TRAP_FLAG;
+}
+
+// The access has completed: record it and close the page again
+static void trap_handler(int sig, siginfo_t *info, void *context)
+{
+  ucontext_t *uc = context;
+
+  (void) sig;
+  (void) info;
+  if (!trap_active) {
+    signal(SIGTRAP, SIG_DFL);
+    raise(SIGTRAP);
+    return;
+  }
+  uc->uc_mcontext.gregs[REG_EFL] &= ~TRAP_FLAG;
+  if (trap_write)
+    model_write(trap_offs);
+  mprotect((void *) MEM8(trap_offs & ~(HOST_PAGE - 1)), HOST_PAGE, PROT_NONE);
+  trap_active = 0;
+}
+
+static void add_range(uint32_t start, uint32_t end)
+{
+  ranges[num_ranges].start = start;
+  ranges[num_ranges].end = end;
+  num_ranges++;
+}
+
+__attribute__((constructor)) static void model_init(void)
+{
+  struct sigaction sa;
+  void *mem;
+  int g;
+
+  setvbuf(stdout, NULL, _IOLBF, 0);  // Keep the output in order with the model's messages
+  mem = mmap((void *) MEM8(0), MODEL_SIZE, PROT_READ | PROT_WRITE,
+             MAP_PRIVATE | MAP_ANONYMOUS | MAP_FIXED_NOREPLACE | MAP_NORESERVE, -1, 0);
+  if (mem != (void *) MEM8(0)) {
+    fprintf(stderr, "Host model: Cannot map the accelerator at 0x%08x\n", MODEL_APB_BASE);
+    exit(1);
+  }
+
+  add_range(MODEL_FIFO_BASE, MODEL_FIFO_BASE + HOST_PAGE);
+  for (g = 0; g < MODEL_NUM_GROUPS; g++) {
+    add_range(GROUP_BASE(g) + MODEL_CNN_BASE, GROUP_BASE(g) + MODEL_BRAM_BASE);
+    add_range(GROUP_BASE(g) + MODEL_MRAM_BASE,
+              GROUP_BASE(g) + MODEL_MRAM_BASE + MODEL_NUM_PROCS * MODEL_MRAM_PROC_SIZE);
+  }
+
+  memset(&sa, 0, sizeof(sa));
+  sa.sa_flags = SA_SIGINFO;
+  sa.sa_sigaction = segv_handler;
+  sigemptyset(&sa.sa_mask);
+  sigaction(SIGSEGV, &sa, NULL);
+  sa.sa_sigaction = trap_handler;
+  sigaction(SIGTRAP, &sa, NULL);
+
+  model_lock();
+}
+
+void model_wfi(void)
+{
+  fprintf(stderr, "Host model: __WFI() while the accelerator is %s\n",
+          started ? "waiting for FIFO data" : "not running");
+  exit(1);
+}
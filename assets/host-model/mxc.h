@@ -0,0 +1,243 @@
+/*******************************************************************************
+* Copyright (C) Maxim Integrated Products, Inc., All rights Reserved.
+*
+* This software is protected by copyright laws of the United States and
+* of foreign countries. This material may also be protected by patent laws
+* and technology transfer regulations of the United States and of foreign
+* countries. This software is furnished under a license agreement and/or a
+* nondisclosure agreement and may only be used or reproduced in accordance
+* with the terms of those agreements. Dissemination of this information to
+* any party or parties not specified in the license agreement and/or
+* nondisclosure agreement is expressly prohibited.
+*
+* The above copyright notice and this permission notice shall be included
+* in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+* OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+* IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+* OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+* ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+* OTHER DEALINGS IN THE SOFTWARE.
+*
+* Except as contained in this notice, the name of Maxim Integrated
+* Products, Inc. shall not be used except as stated in the Maxim Integrated
+* Products, Inc. Branding Policy.
+*
+* The mere transfer of this software does not imply any licenses
+* of trade secrets, proprietary technology, copyrights, patents,
+* trademarks, maskwork rights, or any other form of intellectual
+* property whatsoever. Maxim Integrated Products, Inc. retains all
+* ownership rights.
+*******************************************************************************/
+
+/*
+ * Host stand-in for the parts of the MAX7800x SDK that the generated main.c and cnn.c use.
+ * The peripherals are plain variables, delays return at once, and the timer measures host
+ * time. The accelerator itself is modeled by model.c (see host.h).
+ */
+
+#ifndef MXC_HOST_H
+#define MXC_HOST_H
+
+#include <stdint.h>
+#include <stdio.h>
+
+#if !defined(__x86_64__) || !defined(__linux__)
+#error "The host model of the accelerator requires Linux on x86-64"
+#endif
+
+// Console output, also used to detect "*** FAIL ***"
+int host_printf(const char *format, ...) __attribute__((format(printf, 1, 2)));
+#define printf host_printf
+
+// Global control registers
+typedef struct {
+  volatile uint32_t pclkdiv;
+  volatile uint32_t pclkdis0;
+  volatile uint32_t clkctrl;
+  volatile uint32_t clkcn;
+  volatile uint32_t ito_ctrl;
+  volatile uint32_t ipll_ctrl;
+  volatile uint32_t perckcn;
+  volatile uint32_t perckcn1;
+} mxc_gcr_regs_t;
+extern mxc_gcr_regs_t host_gcr;
+#define MXC_GCR (&host_gcr)
+
+#define MXC_F_GCR_PCLKDIV_CNNCLKDIV (0x7U << 14)
+#define MXC_S_GCR_PCLKDIV_CNNCLKDIV_DIV2 (0x0U << 14)
+#define MXC_S_GCR_PCLKDIV_CNNCLKDIV_DIV4 (0x1U << 14)
+#define MXC_S_GCR_PCLKDIV_CNNCLKDIV_DIV8 (0x2U << 14)
+#define MXC_S_GCR_PCLKDIV_CNNCLKDIV_DIV16 (0x3U << 14)
+#define MXC_S_GCR_PCLKDIV_CNNCLKDIV_DIV1 (0x4U << 14)
+#define MXC_F_GCR_PCLKDIV_CNNCLKSEL (0x3U << 17)
+#define MXC_S_GCR_PCLKDIV_CNNCLKSEL_PCLK (0x0U << 17)
+#define MXC_S_GCR_PCLKDIV_CNNCLKSEL_ITO (0x1U << 17)
+#define MXC_F_GCR_PCLKDIV_CNNCLKSEL_ITO MXC_S_GCR_PCLKDIV_CNNCLKSEL_ITO
+#define MXC_F_GCR_PCLKDIS0_CNN (0x1U << 25)
+#define MXC_F_GCR_CLKCTRL_IPO_EN (0x1U << 19)
+#define MXC_F_GCR_CLKCTRL_IPO_RDY (0x1U << 27)
+#define MXC_S_GCR_CLKCTRL_SYSCLK_SEL_IPO (0x4U << 9)
+#define MXC_F_GCR_CLKCN_HIRC96M_EN (0x1U << 19)
+#define MXC_F_GCR_CLKCN_HIRC96M_RDY (0x1U << 27)
+#define MXC_S_GCR_CLKCN_CLKSEL_HIRC96 (0x4U << 9)
+#define MXC_F_GCR_ITO_CTRL_EN (0x1U << 0)
+#define MXC_F_GCR_ITO_CTRL_RDY (0x1U << 29)
+
+// Accelerator power domain control (MAX78000: GCFR, MAX78002: BBFC)
+typedef struct {
+  volatile uint32_t reg0;
+  volatile uint32_t reg1;
+  volatile uint32_t reg2;
+  volatile uint32_t reg3;
+  volatile uint32_t reg4;
+  volatile uint32_t reg5;
+} mxc_gcfr_regs_t;
+extern mxc_gcfr_regs_t host_gcfr;
+#define MXC_GCFR (&host_gcfr)
+#define MXC_BBFC (&host_gcfr)
+
+// Power sequencer and low power control
+typedef struct {
+  volatile uint32_t lpwkst0;
+  volatile uint32_t lpwkst1;
+  volatile uint32_t lppwst;
+  volatile uint32_t lppwen;
+} mxc_pwrseq_regs_t;
+extern mxc_pwrseq_regs_t host_pwrseq;
+#define MXC_PWRSEQ (&host_pwrseq)
+void MXC_LP_ClearWakeStatus(void);
+
+typedef struct {
+  volatile uint32_t SCR;
+} host_scb_t;
+extern host_scb_t host_scb;
+#define SCB (&host_scb)
+#define SCB_SCR_SLEEPDEEP_Msk (0x1U << 2)
+
+// System clocks and caches
+typedef enum {
+  MXC_SYS_PERIPH_CLOCK_CNN,
+  MXC_SYS_PERIPH_CLOCK_SMPHR,
+  MXC_SYS_PERIPH_CLOCK_CPU1,
+  MXC_SYS_PERIPH_CLOCK_DMA,
+} mxc_sys_periph_clock_t;
+
+typedef enum {
+  MXC_SYS_CLOCK_IPO,
+  MXC_SYS_CLOCK_ISO,
+  MXC_SYS_CLOCK_IBRO,
+} mxc_sys_system_clock_t;
+
+extern uint32_t SystemCoreClock;
+void SystemCoreClockUpdate(void);
+void MXC_SYS_ClockEnable(mxc_sys_periph_clock_t clock);
+void MXC_SYS_ClockDisable(mxc_sys_periph_clock_t clock);
+int MXC_SYS_Clock_Select(mxc_sys_system_clock_t clock);
+int MXC_SYS_ClockSourceEnable(mxc_sys_system_clock_t clock);
+
+#define MXC_ICC0 ((void *) 0)
+#define MXC_ICC1 ((void *) 1)
+void MXC_ICC_Enable(void *icc);
+
+// Delays do not wait on the host
+#define SEC(s) ((s) * 1000000UL)
+#define MSEC(ms) ((ms) * 1000UL)
+#define USEC(us) (us)
+void MXC_Delay(unsigned long us);
+
+// Timers measure host time in microseconds
+typedef struct {
+  uint64_t start;
+} mxc_tmr_regs_t;
+extern mxc_tmr_regs_t host_tmr[6];
+#define MXC_TMR0 (&host_tmr[0])
+#define MXC_TMR1 (&host_tmr[1])
+#define MXC_TMR2 (&host_tmr[2])
+#define MXC_TMR3 (&host_tmr[3])
+#define MXC_TMR4 (&host_tmr[4])
+#define MXC_TMR5 (&host_tmr[5])
+void MXC_TMR_SW_Start(mxc_tmr_regs_t *tmr);
+unsigned int MXC_TMR_SW_Stop(mxc_tmr_regs_t *tmr);
+void MXC_TMR_Delay(mxc_tmr_regs_t *tmr, unsigned long us);
+
+// LEDs and GPIO do nothing
+void LED_On(unsigned int idx);
+void LED_Off(unsigned int idx);
+
+typedef struct {
+  volatile uint32_t out;
+} mxc_gpio_regs_t;
+extern mxc_gpio_regs_t host_gpio[4];
+#define MXC_GPIO0 (&host_gpio[0])
+#define MXC_GPIO1 (&host_gpio[1])
+#define MXC_GPIO2 (&host_gpio[2])
+#define MXC_GPIO3 (&host_gpio[3])
+
+#define MXC_GPIO_PIN_0 (0x1U << 0)
+#define MXC_GPIO_PIN_1 (0x1U << 1)
+#define MXC_GPIO_PIN_2 (0x1U << 2)
+#define MXC_GPIO_PIN_3 (0x1U << 3)
+#define MXC_GPIO_PIN_4 (0x1U << 4)
+#define MXC_GPIO_PIN_5 (0x1U << 5)
+#define MXC_GPIO_PIN_6 (0x1U << 6)
+#define MXC_GPIO_PIN_7 (0x1U << 7)
+#define MXC_GPIO_PIN_8 (0x1U << 8)
+#define MXC_GPIO_PIN_9 (0x1U << 9)
+#define MXC_GPIO_PIN_10 (0x1U << 10)
+#define MXC_GPIO_PIN_11 (0x1U << 11)
+#define MXC_GPIO_PIN_12 (0x1U << 12)
+#define MXC_GPIO_PIN_13 (0x1U << 13)
+#define MXC_GPIO_PIN_14 (0x1U << 14)
+#define MXC_GPIO_PIN_15 (0x1U << 15)
+#define MXC_GPIO_PIN_16 (0x1U << 16)
+#define MXC_GPIO_PIN_17 (0x1U << 17)
+#define MXC_GPIO_PIN_18 (0x1U << 18)
+#define MXC_GPIO_PIN_19 (0x1U << 19)
+#define MXC_GPIO_PIN_20 (0x1U << 20)
+#define MXC_GPIO_PIN_21 (0x1U << 21)
+#define MXC_GPIO_PIN_22 (0x1U << 22)
+#define MXC_GPIO_PIN_23 (0x1U << 23)
+#define MXC_GPIO_PIN_24 (0x1U << 24)
+#define MXC_GPIO_PIN_25 (0x1U << 25)
+#define MXC_GPIO_PIN_26 (0x1U << 26)
+#define MXC_GPIO_PIN_27 (0x1U << 27)
+#define MXC_GPIO_PIN_28 (0x1U << 28)
+#define MXC_GPIO_PIN_29 (0x1U << 29)
+#define MXC_GPIO_PIN_30 (0x1U << 30)
+#define MXC_GPIO_PIN_31 (0x1U << 31)
+
+typedef enum {
+  MXC_GPIO_PAD_NONE,
+  MXC_GPIO_PAD_PULL_UP,
+  MXC_GPIO_PAD_PULL_DOWN,
+} mxc_gpio_pad_t;
+
+typedef enum {
+  MXC_GPIO_FUNC_IN,
+  MXC_GPIO_FUNC_OUT,
+} mxc_gpio_func_t;
+
+typedef struct {
+  mxc_gpio_regs_t *port;
+  uint32_t mask;
+  mxc_gpio_pad_t pad;
+  mxc_gpio_func_t func;
+} mxc_gpio_cfg_t;
+
+int MXC_GPIO_Config(const mxc_gpio_cfg_t *cfg);
+void MXC_GPIO_OutSet(mxc_gpio_regs_t *port, uint32_t mask);
+void MXC_GPIO_OutClr(mxc_gpio_regs_t *port, uint32_t mask);
+
+// Interrupts. __WFI() lets the model run the accelerator and call the CNN interrupt handler.
+typedef enum {
+  CNN_IRQn = 84,
+} IRQn_Type;
+
+void NVIC_SetVector(IRQn_Type irq, void (*vector)(void));
+void NVIC_EnableIRQ(IRQn_Type irq);
+void __WFI(void);
+
+#endif
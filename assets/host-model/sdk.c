@@ -0,0 +1,192 @@
+/*******************************************************************************
+* Copyright (C) Maxim Integrated Products, Inc., All rights Reserved.
+*
+* This software is protected by copyright laws of the United States and
+* of foreign countries. This material may also be protected by patent laws
+* and technology transfer regulations of the United States and of foreign
+* countries. This software is furnished under a license agreement and/or a
+* nondisclosure agreement and may only be used or reproduced in accordance
+* with the terms of those agreements. Dissemination of this information to
+* any party or parties not specified in the license agreement and/or
+* nondisclosure agreement is expressly prohibited.
+*
+* The above copyright notice and this permission notice shall be included
+* in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+* OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+* IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+* OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+* ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+* OTHER DEALINGS IN THE SOFTWARE.
+*
+* Except as contained in this notice, the name of Maxim Integrated
+* Products, Inc. shall not be used except as stated in the Maxim Integrated
+* Products, Inc. Branding Policy.
+*
+* The mere transfer of this software does not imply any licenses
+* of trade secrets, proprietary technology, copyrights, patents,
+* trademarks, maskwork rights, or any other form of intellectual
+* property whatsoever. Maxim Integrated Products, Inc. retains all
+* ownership rights.
+*******************************************************************************/
+
+/*
+ * Host implementation of the SDK stand-ins declared in mxc.h.
+ */
+
+#include <stdarg.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include "mxc.h"
+#include "host.h"
+
+// Clocks and oscillators report that they are ready
+mxc_gcr_regs_t host_gcr = {
+  .clkctrl = MXC_F_GCR_CLKCTRL_IPO_RDY,
+  .clkcn = MXC_F_GCR_CLKCN_HIRC96M_RDY,
+  .ito_ctrl = MXC_F_GCR_ITO_CTRL_RDY,
+};
+mxc_gcfr_regs_t host_gcfr;
+mxc_pwrseq_regs_t host_pwrseq;
+host_scb_t host_scb;
+mxc_tmr_regs_t host_tmr[6];
+mxc_gpio_regs_t host_gpio[4];
+uint32_t SystemCoreClock = 100000000;
+
+void (*model_cnn_isr)(void);
+
+#undef printf
+
+int host_printf(const char *format, ...)
+{
+  char buf[1024];
+  va_list args;
+  int n;
+
+  va_start(args, format);
+  n = vsnprintf(buf, sizeof(buf), format, args);
+  va_end(args);
+  fputs(buf, stdout);
+
+  // fail() loops forever after printing this, so exit instead
+  if (strstr(buf, "*** FAIL ***") != NULL) {
+    fflush(stdout);
+    exit(1);
+  }
+  return n;
+}
+
+void MXC_LP_ClearWakeStatus(void)
+{
+  MXC_PWRSEQ->lpwkst0 = 0xffffffff;
+  MXC_PWRSEQ->lpwkst1 = 0xffffffff;
+  MXC_PWRSEQ->lppwst = 0xffffffff;
+}
+
+void SystemCoreClockUpdate(void)
+{
+}
+
+void MXC_SYS_ClockEnable(mxc_sys_periph_clock_t clock)
+{
+  (void) clock;
+}
+
+void MXC_SYS_ClockDisable(mxc_sys_periph_clock_t clock)
+{
+  (void) clock;
+}
+
+int MXC_SYS_Clock_Select(mxc_sys_system_clock_t clock)
+{
+  (void) clock;
+  return 0;
+}
+
+int MXC_SYS_ClockSourceEnable(mxc_sys_system_clock_t clock)
+{
+  (void) clock;
+  return 0;
+}
+
+void MXC_ICC_Enable(void *icc)
+{
+  (void) icc;
+}
+
+void MXC_Delay(unsigned long us)
+{
+  (void) us;
+}
+
+static uint64_t now_us(void)
+{
+  struct timespec now;
+
+  clock_gettime(CLOCK_MONOTONIC, &now);
+  return (uint64_t) now.tv_sec * 1000000 + now.tv_nsec / 1000;
+}
+
+void MXC_TMR_SW_Start(mxc_tmr_regs_t *tmr)
+{
+  tmr->start = now_us();
+}
+
+// Returns at least 1 so that `cnn_time` signals completion
+unsigned int MXC_TMR_SW_Stop(mxc_tmr_regs_t *tmr)
+{
+  uint64_t elapsed = now_us() - tmr->start;
+
+  return elapsed > 0 ? (unsigned int) elapsed : 1;
+}
+
+void MXC_TMR_Delay(mxc_tmr_regs_t *tmr, unsigned long us)
+{
+  (void) tmr;
+  (void) us;
+}
+
+void LED_On(unsigned int idx)
+{
+  (void) idx;
+}
+
+void LED_Off(unsigned int idx)
+{
+  (void) idx;
+}
+
+int MXC_GPIO_Config(const mxc_gpio_cfg_t *cfg)
+{
+  (void) cfg;
+  return 0;
+}
+
+void MXC_GPIO_OutSet(mxc_gpio_regs_t *port, uint32_t mask)
+{
+  port->out |= mask;
+}
+
+void MXC_GPIO_OutClr(mxc_gpio_regs_t *port, uint32_t mask)
+{
+  port->out &= ~mask;
+}
+
+void NVIC_SetVector(IRQn_Type irq, void (*vector)(void))
+{
+  if (irq == CNN_IRQn)
+    model_cnn_isr = vector;
+}
+
+void NVIC_EnableIRQ(IRQn_Type irq)
+{
+  (void) irq;
+}
+
+void __WFI(void)
+{
+  model_wfi();
+}
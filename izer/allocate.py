@@ -0,0 +1,722 @@
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Automatic allocation of processor maps, output processor maps, and data memory offsets
+"""
+import copy
+
+import yaml
+
+from . import op
+from . import tornadocnn as tc
+from .eprint import eprint, wprint
+from .utils import popcount
+
+
+def expansion(
+        chan,
+):
+    """
+    Return the multi-pass expansion and the number of processors used for `chan` channels.
+    """
+    expand = (chan + tc.dev.MAX_PROC-1) // tc.dev.MAX_PROC
+    thresh = (chan + expand-1) // expand
+    if chan > tc.dev.MAX_PROC:
+        thresh = min((thresh + tc.dev.P_SHARED-1) & ~(tc.dev.P_SHARED-1), tc.dev.MAX_PROC)
+    return expand, thresh
+
+
+def candidates(
+        count,
+        big_data=False,
+        fifo=False,
+):
+    """
+    Return all processor maps that can hold `count` input channels. With `big_data` (CHW),
+    each channel uses a separate memory instance. `fifo` restricts the map to the processors
+    that are connected to the FIFOs.
+    """
+    if fifo:
+        if big_data:
+            return [sum(1 << i * tc.dev.P_NUMPRO for i in range(count))]
+        return [sum(1 << (i // tc.dev.P_SHARED) * tc.dev.P_NUMPRO + i % tc.dev.P_SHARED
+                    for i in range(count))]
+    if big_data:
+        span = (count - 1) * tc.dev.P_SHARED
+        return [sum(1 << start + i * tc.dev.P_SHARED for i in range(count))
+                for start in range(tc.dev.MAX_PROC - span)]
+    return [(2**count - 1) << start
+            for start in range(0, tc.dev.MAX_PROC - count + 1, tc.dev.P_SHARED)]
+
+
+def groups(
+        pmap,
+):
+    """
+    Return a bit map of the processor groups used by processor map `pmap`.
+    """
+    g = 0
+    for group in range(tc.dev.P_NUMGROUPS):
+        if (pmap >> group * tc.dev.P_NUMPRO) % 2**tc.dev.P_NUMPRO:
+            g |= 1 << group
+    return g
+
+
+def dataflow(
+        layers,
+        start_layer,
+        next_sequence,
+        prev_sequence,
+        in_sequences,
+        eltwise,
+):
+    """
+    Return the layers in execution order starting at `start_layer`, the layers each layer
+    reads its input from (-1 for the input data), and whether each layer concatenates its
+    inputs.
+    """
+    order = []
+    ll = start_layer
+    while ll != -1 and ll < layers and ll not in order:
+        order.append(ll)
+        ll = next_sequence[ll]
+
+    sources = [[] for _ in range(layers)]
+    concat = [False] * layers
+    for ll in order:
+        if in_sequences[ll] is None:
+            sources[ll] = [prev_sequence[ll]] \
+                if ll != start_layer and prev_sequence[ll] != -1 else [-1]
+        elif isinstance(in_sequences[ll], list):
+            sources[ll] = list(in_sequences[ll])
+            concat[ll] = eltwise[ll] == op.NONE and len(sources[ll]) > 1
+        else:
+            sources[ll] = [in_sequences[ll]]
+    return order, sources, concat
+
+
+def processors(
+        layers,
+        order,
+        sources,
+        concat,
+        processor_map,
+        output_processor_map,
+        input_chan,
+        output_chan,
+        operator,
+        conv_groups,
+        big_data,
+        kernel_size,
+        quantization,
+        flatten,
+        pooled_dim,
+        bypass,
+        streaming,
+        next_sequence,
+        fifo=False,
+        verbose=False,
+):
+    """
+    Fill in the processor maps and output processor maps that are `None` for the `layers`
+    visited in `order`. `sources` lists the layers each layer reads its input from (-1 or empty
+    for the network input), and `concat` is True for layers that concatenate their sources.
+    Existing maps are kept, and maps are chosen so that each layer reads its input from where
+    its sources wrote it. While streaming, the inputs of the streaming layers are still needed,
+    so new maps avoid the processors holding these inputs where possible.
+
+    New maps use as few processor groups as possible. When the estimated kernel memory does
+    not fit, the maps are instead chosen to balance kernel memory across processors.
+    Returns the completed processor maps and output processor maps.
+    """
+    def kernel_length(ll):
+        """
+        Return the estimated number of kernel memory words per processor for layer `ll`.
+        """
+        if operator[ll] == op.NONE or bypass[ll]:
+            return 0
+        in_expand, _ = expansion(input_chan[ll])
+        out_expand, out_thresh = expansion(output_chan[ll])
+        if conv_groups[ll] > 1:
+            kc = in_expand
+        else:
+            kc = out_thresh * out_expand * in_expand
+            if flatten[ll] and pooled_dim[ll] is not None:
+                kc *= pooled_dim[ll][0] * pooled_dim[ll][1]
+        bits = abs(quantization[ll]) if quantization[ll] is not None else 8
+        ksize = kernel_size[ll][0] * kernel_size[ll][1]
+        qfactor = 8 // bits
+        res = (kc % qfactor) * ksize * (qfactor - 1)
+        return (kc * ksize * bits + res + 71) // 72
+
+    def allocate(balance):
+        """
+        Run the allocation, preferring kernel memory balance over fewer groups when `balance`
+        is set. Returns maps, output maps, and whether the kernels are expected to fit.
+        """
+        pmap = processor_map.copy()
+        omap = output_processor_map.copy()
+        kern_max = [0] * tc.dev.MAX_PROC
+        groups_used = 0
+        fits = True
+        live = 0  # Input processors of the current run of streaming layers
+        avoid = [0] * layers  # Processors that the output of each layer should not use
+
+        for ll in order:
+            _, count = expansion(input_chan[ll])
+            length = kernel_length(ll)
+
+            inputs = [s for s in sources[ll] if s >= 0]
+            if pmap[ll] is None:
+                known = [omap[s] for s in inputs if omap[s] is not None]
+                if -1 in sources[ll] and ll != order[0] and pmap[order[0]] is not None:
+                    known.append(pmap[order[0]])  # The input data
+                if concat[ll] and known:
+                    if len(known) != len(sources[ll]):
+                        eprint(f'Layer {ll}: Cannot allocate processors when only some of the '
+                               'concatenated inputs have output processors. Configure '
+                               '`processors` for this layer.')
+                    for m in known:
+                        pmap[ll] = (pmap[ll] or 0) | m
+                elif known:
+                    if any(m != known[0] for m in known):
+                        eprint(f'Layer {ll}: The inputs of this layer use different output '
+                               'processors. Configure `processors` for this layer.')
+                    pmap[ll] = known[0]
+                elif len(sources[ll]) == 1 and inputs and pmap[inputs[0]] is not None \
+                        and (operator[inputs[0]] == op.NONE or conv_groups[inputs[0]] > 1) \
+                        and popcount(pmap[inputs[0]]) == count:
+                    # Passthrough and depth-wise layers are best kept on the same processors
+                    pmap[ll] = pmap[inputs[0]]
+                else:
+                    best = None
+                    busy = 0
+                    for s in inputs:
+                        busy |= avoid[s]
+                    for m in candidates(count, big_data[ll], fifo and ll == order[0]):
+                        offs = max(kern_max[p] for p in range(tc.dev.MAX_PROC) if m >> p & 1)
+                        offs = (offs + tc.dev.P_SHARED-1) & ~(tc.dev.P_SHARED-1)
+                        end = offs + length
+                        ok = all(end <= tc.dev.mask_width(p)
+                                 for p in range(tc.dev.MAX_PROC) if m >> p & 1)
+                        used = popcount(groups_used | groups(m))
+                        key = (m & busy != 0, not ok, end, used) if balance \
+                            else (m & busy != 0, not ok, used, end)
+                        if best is None or key < best[0]:
+                            best = key, m
+                    pmap[ll] = best[1]
+
+            # The sources write their output to this layer's input processors
+            if concat[ll]:
+                remaining = pmap[ll]
+                for s in sources[ll]:
+                    _, n = expansion(output_chan[s] if s >= 0 else input_chan[order[0]])
+                    m = 0
+                    for p in range(tc.dev.MAX_PROC):
+                        if popcount(m) == n:
+                            break
+                        if remaining >> p & 1:
+                            m |= 1 << p
+                    remaining &= ~m
+                    if s >= 0 and omap[s] is None:
+                        omap[s] = m
+            else:
+                for s in inputs:
+                    if omap[s] is None:
+                        omap[s] = pmap[ll]
+
+            # Account for kernel memory
+            procs = [p for p in range(tc.dev.MAX_PROC) if pmap[ll] >> p & 1]
+            if length > 0:
+                offs = max(kern_max[p] for p in procs)
+                offs = (offs + tc.dev.P_SHARED-1) & ~(tc.dev.P_SHARED-1)
+                for p in procs:
+                    kern_max[p] = offs + length
+                    if kern_max[p] > tc.dev.mask_width(p):
+                        fits = False
+            groups_used |= groups(pmap[ll])
+
+            # Streaming data may extend past its memory instance, so avoid whole groups
+            if streaming[ll]:
+                live |= pmap[ll]
+            avoid[ll] = 0
+            for group in range(tc.dev.P_NUMGROUPS):
+                if groups(live) >> group & 1:
+                    avoid[ll] |= (2**tc.dev.P_NUMPRO - 1) << group * tc.dev.P_NUMPRO
+            if not streaming[ll]:
+                live = 0
+
+        # Layers whose output is not read by another layer default to the next layer
+        for ll in order:
+            if omap[ll] is None and next_sequence[ll] != -1 and next_sequence[ll] < layers:
+                omap[ll] = pmap[next_sequence[ll]]
+
+        return pmap, omap, fits
+
+    pmap, omap, fits = allocate(False)
+    if not fits:
+        pmap, omap, fits = allocate(True)
+        if not fits:
+            wprint('The automatically allocated processor maps may exceed kernel memory.')
+
+    if verbose:
+        print('Allocated processor maps:')
+        for ll in order:
+            if processor_map[ll] is None or output_processor_map[ll] is None:
+                print(f'Layer {ll:<3} processors 0x{pmap[ll]:016x}, '
+                      f'output processors 0x{omap[ll]:016x}')
+        print('')
+
+    return pmap, omap
+
+
+def _buffers(
+        layers,
+        order,
+        sources,
+        concat,
+        processor_map,
+        output_processor_map,
+        input_offset,
+        output_offset,
+        input_chan,
+        output_chan,
+        input_dim,
+        output_dim,
+        pooled_dim,
+        kernel_size,
+        padding,
+        pool,
+        pool_stride,
+        stride,
+        big_data,
+        operands,
+        output_width,
+        write_gap,
+        streaming,
+        fifo=False,
+        increase_start=0,
+):
+    """
+    Return the data memory buffers of the network as a list of blocks, a function that
+    returns the space block `a` needs next to block `b` (0 if they do not conflict), and the
+    sources of each layer (see `offsets()`).
+    """
+    pos = {ll: i for i, ll in enumerate(order)}
+    pos[-1] = -1
+    start = order[0]
+    srcs = {ll: sources[ll] or [-1] for ll in order}
+    consumers = {p: [] for p in [-1] + order}
+    for ll in order:
+        for s in srcs[ll]:
+            if s in consumers:
+                consumers[s].append(ll)
+
+    def full_size(p):
+        """
+        Return the number of bytes per memory instance used by the output of `p`.
+        """
+        if p == -1:
+            in_expand, _ = expansion(input_chan[start])
+            return input_dim[start][0] * input_dim[start][1] * in_expand * operands[start] \
+                * (1 if big_data[start] else 4)
+        out_expand, _ = expansion(output_chan[p])
+        return output_dim[p][0] * output_dim[p][1] * out_expand * 4 * output_width[p] // 8 \
+            * (write_gap[p] + 1)
+
+    def window_size(p, ll):
+        """
+        Return the number of bytes of the rolling input buffer when layer `ll` streams the
+        output of `p` from the FIFO, following the rollover computation of the network code.
+        """
+        if big_data[ll]:
+            val = 12
+        else:
+            if p == -1:
+                stream_start = (pool[ll][0] - 1) * input_dim[ll][1] + pool[ll][1]
+            else:
+                stream_start = (pooled_dim[p][1] + 2 * padding[p][1]) \
+                    * (kernel_size[p][0] - 1 + pool[ll][0] - 1) \
+                    + kernel_size[p][1] - 1 + pool[ll][1] + increase_start
+            val = stream_start + (pool[ll][0] - 1) * input_dim[ll][1] \
+                + max(stride[ll][1], pool_stride[ll][1], pool[ll][1])
+        in_expand, _ = expansion(input_chan[ll])
+        val += -val % in_expand
+        return 4 * val + 4
+
+    def instances(pmap):
+        """
+        Return a bit map of the memory instances used by processor map `pmap`.
+        """
+        if pmap is None:
+            return 2**(tc.dev.MAX_PROC // tc.dev.P_SHARED) - 1
+        inst = 0
+        for p in range(tc.dev.MAX_PROC):
+            if pmap >> p & 1:
+                inst |= 1 << p // tc.dev.P_SHARED
+        return inst
+
+    # Group outputs that must be placed together into blocks with relative offsets
+    block = {p: {p: 0} for p in [-1] + order}
+    for ll in order:
+        if len(srcs[ll]) < 2:
+            continue
+        first = block[srcs[ll][0]]
+        for k, s in enumerate(srcs[ll]):
+            rel = 0 if concat[ll] else 4 * k  # Element-wise operands are interleaved
+            other = block[s]
+            if other is first:
+                if first[s] != rel:
+                    eprint(f'Layer {ll}: Cannot plan data memory offsets since the output of '
+                           f'layer {s} is used at different offsets. Configure `out_offset`.')
+                continue
+            delta = rel - first[srcs[ll][0]] - other[s]
+            for m, r in other.items():
+                first[m] = r + delta
+                block[m] = first
+    for b in block.values():
+        low = min(b.values())
+        if low < 0:
+            for m in b:
+                b[m] -= low
+
+    # Size, live interval, memory instances, and fixed offset of each block
+    runs = []
+    for i, ll in enumerate(order):
+        if streaming[ll]:
+            if runs and runs[-1][1] == i - 1:
+                runs[-1][1] = i
+            else:
+                runs.append([i, i])
+    blocks = []
+    for b in {id(b): b for b in block.values()}.values():
+        size = full = inst = 0
+        end = -1
+        keep = set()
+        base = None
+        for p, rel in b.items():
+            used = consumers[p]
+            rolling = fifo and used and all(streaming[c] for c in used)
+            if rolling:
+                size = max(size, rel + max(window_size(p, c) for c in used))
+            else:
+                size = max(size, rel + full_size(p))
+            full = max(full, rel + full_size(p))
+            last = max([pos[p]] + [pos[c] for c in used])
+            if p == order[-1]:
+                last = len(order)  # The output is unloaded after the last layer
+            for first, final in runs:
+                if any(first <= pos[c] <= final for c in used):
+                    if not rolling:
+                        last = max(last, final + 1)
+                    elif p >= 0:
+                        # Rolling buffers are consumed while they are written, but the
+                        # network code checks the output of the layer after the run against
+                        # the full output of each streaming layer
+                        keep.add(final + 1)
+            end = max(end, last)
+            inst |= instances(processor_map[start] if p == -1 else output_processor_map[p])
+            if p == -1 and input_offset[start] is not None:
+                base = input_offset[start] - rel
+            elif p >= 0 and output_offset[p] is not None:
+                base = output_offset[p] - rel
+            for c in used:
+                if base is None and c != start and input_offset[c] is not None \
+                   and srcs[c][0] == p:
+                    base = input_offset[c] - rel
+        blocks.append({'members': b, 'size': (size + 3) & ~3, 'full': (full + 3) & ~3,
+                       'begin': min(pos[p] for p in b), 'end': end, 'keep': keep,
+                       'inst': inst, 'base': base, 'fixed': base is not None})
+
+    # When streaming from the FIFO, the rolling input buffer of a layer and its output must
+    # be apart by the rollover in all memory instances
+    apart = {}
+    if fifo:
+        for ll in order:
+            if streaming[ll]:
+                a, b = [next(b for b in blocks if p in b['members']) for p in [srcs[ll][0], ll]]
+                apart[frozenset([id(a), id(b)])] = window_size(srcs[ll][0], ll)
+
+    def extent(a, b):
+        """
+        Return the size of block `a` when placing it next to block `b`, or 0 if they do not
+        conflict since they are live at different times or in different instances.
+        """
+        gap = apart.get(frozenset([id(a), id(b)]), 0)
+        size = a['size']
+        live = not (a['end'] < b['begin'] or b['end'] < a['begin'])
+        if not live and b['begin'] in a['keep']:
+            live, size = True, a['full']
+        elif not live and a['begin'] in b['keep']:
+            live = True
+        if gap == 0 and (a['inst'] & b['inst'] == 0 or not live):
+            return 0
+        return max(size, gap)
+
+    return blocks, extent, srcs
+
+
+def offsets(
+        layers,
+        order,
+        sources,
+        concat,
+        processor_map,
+        output_processor_map,
+        input_offset,
+        output_offset,
+        input_chan,
+        output_chan,
+        input_dim,
+        output_dim,
+        pooled_dim,
+        kernel_size,
+        padding,
+        pool,
+        pool_stride,
+        stride,
+        big_data,
+        operands,
+        output_width,
+        write_gap,
+        streaming,
+        fifo=False,
+        increase_start=0,
+        verbose=False,
+):
+    """
+    Fill in the output offsets that are `None` for the `layers` visited in `order`, using the
+    data flow described by `sources` and `concat` (see `processors()`). `input_offset` holds
+    the configured input offsets only.
+
+    The output of each layer (and the input data, source -1) is live from the layer that
+    writes it until the last layer that reads it. When streaming, the inputs of all layers in
+    a run of streaming layers stay live until the run ends. Rolling buffers filled from the
+    FIFO are only kept apart from the output of the layer after the run. Outputs that must
+    be placed together (concatenated inputs, interleaved element-wise operands) form a single
+    block. Blocks that share a memory instance and are live at the same time must not
+    overlap; blocks without a configured offset are placed at the lowest free offset, trying
+    several orders and keeping the one with the lowest peak memory use.
+    Returns the completed output offsets and the planned input offsets (`None` for layers
+    whose input offset is not planned).
+    """
+    output_offset = output_offset.copy()
+    blocks, extent, srcs = _buffers(
+        layers,
+        order,
+        sources,
+        concat,
+        processor_map,
+        output_processor_map,
+        input_offset,
+        output_offset,
+        input_chan,
+        output_chan,
+        input_dim,
+        output_dim,
+        pooled_dim,
+        kernel_size,
+        padding,
+        pool,
+        pool_stride,
+        stride,
+        big_data,
+        operands,
+        output_width,
+        write_gap,
+        streaming,
+        fifo=fifo,
+        increase_start=increase_start,
+    )
+
+    def place(ordered):
+        """
+        Place the blocks in `ordered` at the lowest free offset. Returns the offsets and the
+        peak memory use.
+        """
+        base = {id(b): b['base'] for b in blocks if b['fixed']}
+        for b in ordered:
+            others = [o for o in blocks if id(o) in base and extent(o, b) > 0]
+            for offs in sorted({0} | {base[id(o)] + extent(o, b) for o in others}):
+                if all(offs + extent(b, o) <= base[id(o)] or base[id(o)] + extent(o, b) <= offs
+                       for o in others):
+                    base[id(b)] = offs
+                    break
+        return base, max(base[id(b)] + b['size'] for b in blocks)
+
+    free = [b for b in blocks if not b['fixed']]
+    best = None
+    for key in [
+            lambda b: (-b['size'], b['begin']),
+            lambda b: (b['begin'], -b['size']),
+            lambda b: (b['begin'] - b['end'], -b['size']),
+    ]:
+        base, peak = place(sorted(free, key=key))
+        if best is None or peak < best[1]:
+            best = base, peak
+    base, peak = best
+
+    planned = [None] * layers
+    for b in free:
+        b['base'] = base[id(b)]
+        for p, rel in b['members'].items():
+            if p >= 0:
+                output_offset[p] = b['base'] + rel
+    for ll in order:
+        src = next(b for b in blocks if srcs[ll][0] in b['members'])
+        if input_offset[ll] is None and not src['fixed']:
+            planned[ll] = src['base'] + src['members'][srcs[ll][0]]
+
+    if peak > tc.dev.INSTANCE_WIDTH * 16:
+        wprint(f'The planned data memory offsets need {peak} bytes per memory instance, which '
+               f'exceeds the data memory instance size of {tc.dev.INSTANCE_WIDTH * 16}.')
+    print(f'Planned data memory offsets for {len(free)} buffers, peak use {peak} of '
+          f'{tc.dev.INSTANCE_WIDTH * 16} bytes per memory instance.')
+    if verbose:
+        for b in sorted(blocks, key=lambda b: (b['base'], b['begin'])):
+            names = ', '.join('input' if p == -1 else f'layer {p}' for p in b['members'])
+            print(f'0x{b["base"]:04x}-0x{b["base"] + b["size"] - 1:04x} {names} '
+                  f'({"configured" if b["fixed"] else "planned"}, live in layers '
+                  f'{order[max(b["begin"], 0)]}-{order[min(b["end"], len(order) - 1)]})')
+        print('')
+
+    return output_offset, planned
+
+
+def overlaps(
+        *args,
+        **kwargs,
+):
+    """
+    Return the pairs of configured blocks that overlap while they are live, for the same
+    arguments as `offsets()`.
+    """
+    kwargs.pop('verbose', None)
+    blocks, extent, _ = _buffers(*args, **kwargs)
+    result = []
+    for i, a in enumerate(blocks):
+        for b in blocks[i+1:]:
+            if a['fixed'] and b['fixed'] and extent(a, b) > 0 \
+               and a['base'] < b['base'] + extent(b, a) and b['base'] < a['base'] + extent(a, b):
+                result.append((a, b))
+    return result
+
+
+def peak(
+        *args,
+        **kwargs,
+):
+    """
+    Return the data memory use per memory instance in bytes, for the same arguments as
+    `offsets()` with all offsets configured.
+    """
+    kwargs.pop('verbose', None)
+    blocks, _, _ = _buffers(*args, **kwargs)
+    return max(b['base'] + b['size'] for b in blocks if b['base'] is not None)
+
+
+class _Hex(int):
+    """
+    Integer that is written to YAML in hexadecimal notation with `digits` digits.
+    """
+    def __new__(cls, value, digits):
+        obj = super().__new__(cls, value)
+        obj.digits = digits
+        return obj
+
+
+class _Dumper(yaml.SafeDumper):
+    """
+    YAML dumper that writes processor maps and offsets in hexadecimal notation.
+    """
+
+
+_Dumper.add_representer(
+    _Hex,
+    lambda dumper, data: dumper.represent_scalar('tag:yaml.org,2002:int',
+                                                 f'0x{data:0{data.digits}x}'),
+)
+# Write short lists such as `in_dim: [16, 16]` inline
+_Dumper.add_representer(
+    list,
+    lambda dumper, data: dumper.represent_sequence(
+        'tag:yaml.org,2002:seq', data,
+        flow_style=not any(isinstance(e, (dict, list)) for e in data),
+    ),
+)
+
+
+def layer_numbers(
+        cfg,
+):
+    """
+    Return the layer number of each entry in `cfg['layers']`, the same way the parser assigns
+    them (`sequence` may leave holes that are contracted).
+    """
+    sequence = 0
+    sequences = []
+    for e in cfg['layers']:
+        if 'sequence' in e:
+            sequence = e['sequence']
+        sequences.append(sequence)
+        sequence += 1
+    ordered = sorted(sequences)
+    return [ordered.index(e) for e in sequences]
+
+
+def save(
+        cfg,
+        filename,
+        processor_map,
+        output_processor_map,
+        output_offset=None,
+        input_offset=None,
+):
+    """
+    Write the YAML configuration `cfg` (as returned by `yamlcfg.parse()`) to `filename`, with
+    the `processors` and `output_processors` of every layer set to `processor_map` and
+    `output_processor_map`. The optional `output_offset` sets `out_offset` for every layer,
+    and `input_offset` sets `in_offset` where it is not `None`.
+    """
+    cfg = copy.deepcopy(cfg)
+    numbers = layer_numbers(cfg)
+
+    digits = tc.dev.MAX_PROC // 4
+    for i, e in enumerate(cfg['layers']):
+        ll = numbers[i]
+        for key in ['in_offset', 'out_offset']:
+            if isinstance(e.get(key), int):
+                e[key] = _Hex(e[key], 4)
+        if ll >= len(processor_map):
+            continue
+        values = {}
+        if input_offset is not None and input_offset[ll] is not None:
+            values['in_offset'] = _Hex(input_offset[ll], 4)
+        if output_offset is not None and output_offset[ll] is not None:
+            values['out_offset'] = _Hex(output_offset[ll], 4)
+        if processor_map[ll] is not None:
+            values['processors'] = _Hex(processor_map[ll], digits)
+        if output_processor_map[ll] is not None:
+            values['output_processors'] = _Hex(output_processor_map[ll], digits)
+        # Replace existing keys in place, and insert missing keys after the closest preceding
+        # key in `keys`
+        items = list(e.items())
+        keys = ['sequence', 'in_offset', 'out_offset', 'processors', 'output_processors']
+        for key, value in values.items():
+            existing = [k for k, _ in items]
+            if key in existing:
+                items[existing.index(key)] = (key, value)
+            else:
+                prior = [existing.index(k) for k in keys[:keys.index(key)] if k in existing]
+                items.insert(max(prior) + 1 if prior else 0, (key, value))
+        cfg['layers'][i] = dict(items)
+    if isinstance(cfg.get('output_map'), int):
+        cfg['output_map'] = _Hex(cfg['output_map'], digits)
+
+    with open(filename, 'w') as f:
+        yaml.dump(cfg, f, Dumper=_Dumper, sort_keys=False, default_flow_style=False)
+    print(f'Wrote network configuration with processor maps to {filename}.')
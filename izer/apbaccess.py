@@ -48,6 +48,7 @@ class APB():
             fast_fifo=False,
             input_csv=None,
             input_csv_format=888,
+            input_csv_frames=1,
             input_chan=None,
             sleep=False,
             blocklevel=False,
@@ -72,6 +73,9 @@ class APB():
             output_width=8,
             bias=False,
             wfi=True,
+            dma=None,
+            fps_frames=0,
+            top_k=0,
     ):
         """
         Create an APB class object that writes to memfile.
@@ -100,6 +104,7 @@ class APB():
         self.fast_fifo = fast_fifo
         self.input_csv = input_csv
         self.input_csv_format = input_csv_format
+        self.input_csv_frames = input_csv_frames
         self.input_chan = input_chan
         self.sleep = sleep
         self.blocklevel = blocklevel
@@ -121,11 +126,20 @@ class APB():
         self.output_width = output_width
         self.bias = bias
         self.wfi = wfi
+        self.dma = dma
+        self.fps_frames = fps_frames
+        self.top_k = top_k
+        self.test_samples = False  # Set when the test loop for several samples is written
+        self.unload_overlap = False  # Set when the memory plan allows unloading during inference
+        self.layer_regs = {}  # Final value of every layer register by address (host model)
+        self.kernel_image = None  # Used kernel memory columns and their kernels (host model)
+        self.bias_image = None  # Bias memory bytes by address (host model)
+        self.dev = tc.dev  # Device selected when the writer was created
 
         self.data = 0
         self.num = 0
         self.data_offs = 0
-        self.mem = [None] * tc.dev.C_GROUP_OFFS * tc.dev.P_NUMGROUPS
+        self.mem = [None] * self.dev.C_GROUP_OFFS * self.dev.P_NUMGROUPS
         self.writes = 0
         self.reads = 0
 
@@ -134,20 +148,20 @@ class APB():
         if embedded_arm or embedded_code:
             return
 
-        procs = (tc.dev.P_NUMPRO + tc.dev.P_SHARED - 1) // tc.dev.P_SHARED
+        procs = (self.dev.P_NUMPRO + self.dev.P_SHARED - 1) // self.dev.P_SHARED
         if mem_output:
             if not (compact_data or fifo or fast_fifo):
-                self.data_mem = [[[[] for mem in range(tc.dev.INSTANCE_COUNT)]
+                self.data_mem = [[[[] for mem in range(self.dev.INSTANCE_COUNT)]
                                   for proc in range(procs)]
-                                 for group in range(tc.dev.P_NUMGROUPS)]
+                                 for group in range(self.dev.P_NUMGROUPS)]
             if not (compact_weights or mexpress or verify_kernels):
-                self.kernel_mem = [[[[] for mem in range(tc.dev.MASK_INSTANCES)]
-                                    for proc in range(tc.dev.P_NUMPRO)]
-                                   for group in range(tc.dev.P_NUMGROUPS)]
+                self.kernel_mem = [[[[] for mem in range(self.dev.MASK_INSTANCES)]
+                                    for proc in range(self.dev.P_NUMPRO)]
+                                   for group in range(self.dev.P_NUMGROUPS)]
         if mem_output_final:
-            self.output_data_mem = [[[[] for mem in range(tc.dev.INSTANCE_COUNT)]
+            self.output_data_mem = [[[[] for mem in range(self.dev.INSTANCE_COUNT)]
                                      for proc in range(procs)]
-                                    for group in range(tc.dev.P_NUMGROUPS)]
+                                    for group in range(self.dev.P_NUMGROUPS)]
 
     def write_mem(
             self,
@@ -157,13 +171,13 @@ class APB():
         """
         Write used kernel memories and data memories to disk
         """
-        procs = (tc.dev.P_NUMPRO + tc.dev.P_SHARED - 1) // tc.dev.P_SHARED
+        procs = (self.dev.P_NUMPRO + self.dev.P_SHARED - 1) // self.dev.P_SHARED
         if self.data_mem is not None:
             target_dir = os.path.join(base_directory, test_name, 'data')
             os.makedirs(target_dir, exist_ok=True)
-            for group in range(tc.dev.P_NUMGROUPS):
+            for group in range(self.dev.P_NUMGROUPS):
                 for proc in range(procs):
-                    for mem in range(tc.dev.INSTANCE_COUNT):
+                    for mem in range(self.dev.INSTANCE_COUNT):
                         if self.data_mem[group][proc][mem]:
                             self.data_mem[group][proc][mem].sort()
                             with open(
@@ -180,9 +194,9 @@ class APB():
                 os.makedirs(target_dir, exist_ok=False)
             except OSError:
                 wprint(target_dir, 'exists')
-            for group in range(tc.dev.P_NUMGROUPS):
-                for proc in range(tc.dev.P_NUMPRO):
-                    for mem in range(tc.dev.MASK_INSTANCES):
+            for group in range(self.dev.P_NUMGROUPS):
+                for proc in range(self.dev.P_NUMPRO):
+                    for mem in range(self.dev.MASK_INSTANCES):
                         if self.kernel_mem[group][proc][mem]:
                             self.kernel_mem[group][proc][mem].sort()
                             with open(
@@ -201,9 +215,9 @@ class APB():
                 os.makedirs(target_dir, exist_ok=False)
             except OSError:
                 wprint(target_dir, 'exists')
-            for group in range(tc.dev.P_NUMGROUPS):
+            for group in range(self.dev.P_NUMGROUPS):
                 for proc in range(procs):
-                    for mem in range(tc.dev.INSTANCE_COUNT):
+                    for mem in range(self.dev.INSTANCE_COUNT):
                         if self.output_data_mem[group][proc][mem]:
                             self.output_data_mem[group][proc][mem].sort()
                             with open(
@@ -312,7 +326,7 @@ class APB():
             comment = f' // fifo ctl {reg}'
         if val == 0 and not force_write:
             comment += ' *'
-        addr = tc.dev.C_FIFO_BASE + reg*4
+        addr = self.dev.C_FIFO_BASE + reg*4
         if force_write or val != 0 or self.write_zero_regs:
             self.write(addr, val, comment)
         if debug:
@@ -335,7 +349,7 @@ class APB():
             comment = f' // fast fifo ctl {reg}'
         if val == 0 and not force_write:
             comment += ' *'
-        addr = tc.dev.FAST_FIFO_BASE + reg*4
+        addr = self.dev.FAST_FIFO_BASE + reg*4
         if force_write or val != 0 or self.write_zero_regs:
             self.write(addr, val, comment, base=0)
         if debug:
@@ -414,6 +428,7 @@ class APB():
         if val == 0 and not force_write:
             comment += ' *'
         addr = tc.lreg_addr(group, reg, layer)
+        self.layer_regs[addr] = val
         if force_write or val != 0 or self.write_zero_regs:
             self.write(addr, val, comment)
         if debug:
@@ -428,7 +443,7 @@ class APB():
         """
         Write bias value `bias` to offset `offs` in bias memory #`group`.
         """
-        addr = tc.dev.C_GROUP_OFFS*group + tc.dev.C_BRAM_BASE + offs * 4
+        addr = self.dev.C_GROUP_OFFS*group + self.dev.C_BRAM_BASE + offs * 4
         self.write(addr, bias & 0xff, ' // Bias')
 
     def write_tram(
@@ -442,8 +457,8 @@ class APB():
         """
         Write value `d` to TRAM in group `group` and processor `proc` to offset `offs`.
         """
-        addr = tc.dev.C_GROUP_OFFS*group + tc.dev.C_TRAM_BASE \
-            + proc * tc.dev.TRAM_OFFS * 4 + offs * 4
+        addr = self.dev.C_GROUP_OFFS*group + self.dev.C_TRAM_BASE \
+            + proc * self.dev.TRAM_OFFS * 4 + offs * 4
         self.write(addr, d, f' // {comment}TRAM G{group} P{proc} #{offs}')
 
     def write_kern(
@@ -460,43 +475,43 @@ class APB():
         Write single kernel `k` of length `size` for layer `ll`, processor `p` to index `idx` in
         weight memory.
         """
-        assert p < tc.dev.MAX_PROC
-        assert idx < tc.dev.mask_width(p)
+        assert p < self.dev.MAX_PROC
+        assert idx < self.dev.mask_width(p)
         if not calcx4:
-            addr = tc.dev.C_GROUP_OFFS * (p // tc.dev.P_NUMPRO) \
-                + tc.dev.C_MRAM_BASE \
-                + (p % tc.dev.P_NUMPRO) * tc.dev.MASK_OFFS * 16 + idx * 16
+            addr = self.dev.C_GROUP_OFFS * (p // self.dev.P_NUMPRO) \
+                + self.dev.C_MRAM_BASE \
+                + (p % self.dev.P_NUMPRO) * self.dev.MASK_OFFS * 16 + idx * 16
             idx_x4 = idx
         else:
-            if idx < tc.dev.MASK_WIDTH_SMALL:
-                idx_x4 = (idx % 4) * (tc.dev.MASK_WIDTH_SMALL // 4) + idx // 4
+            if idx < self.dev.MASK_WIDTH_SMALL:
+                idx_x4 = (idx % 4) * (self.dev.MASK_WIDTH_SMALL // 4) + idx // 4
             else:
-                idx -= tc.dev.MASK_WIDTH_SMALL
-                idx_x4 = (idx % 4) * ((tc.dev.MASK_WIDTH_LARGE - tc.dev.MASK_WIDTH_SMALL) // 4) \
-                    + idx // 4
-                idx += tc.dev.MASK_WIDTH_SMALL
-            addr = tc.dev.C_GROUP_OFFS * (p // tc.dev.P_NUMPRO) \
-                + tc.dev.C_MRAM_BASE \
-                + (p % tc.dev.P_NUMPRO) * tc.dev.MASK_OFFS * 16 + idx_x4 * 16
+                idx -= self.dev.MASK_WIDTH_SMALL
+                idx_x4 = (idx % 4) \
+                    * ((self.dev.MASK_WIDTH_LARGE - self.dev.MASK_WIDTH_SMALL) // 4) + idx // 4
+                idx += self.dev.MASK_WIDTH_SMALL
+            addr = self.dev.C_GROUP_OFFS * (p // self.dev.P_NUMPRO) \
+                + self.dev.C_MRAM_BASE \
+                + (p % self.dev.P_NUMPRO) * self.dev.MASK_OFFS * 16 + idx_x4 * 16
 
         if not verify_only:
             if self.kernel_mem is not None:
-                if idx_x4 < tc.dev.MASK_WIDTH_SMALL:
+                if idx_x4 < self.dev.MASK_WIDTH_SMALL:
                     mem, offs = divmod(idx_x4,
-                                       tc.dev.MASK_WIDTH_SMALL // tc.dev.MASK_INSTANCES_EACH)
+                                       self.dev.MASK_WIDTH_SMALL // self.dev.MASK_INSTANCES_EACH)
                 else:
-                    idx_x4 -= tc.dev.MASK_WIDTH_SMALL
+                    idx_x4 -= self.dev.MASK_WIDTH_SMALL
                     mem, offs = divmod(idx_x4,
-                                       (tc.dev.MASK_WIDTH_LARGE - tc.dev.MASK_WIDTH_SMALL)
-                                       // tc.dev.MASK_INSTANCES_EACH)
-                    mem += tc.dev.MASK_INSTANCES_EACH
+                                       (self.dev.MASK_WIDTH_LARGE - self.dev.MASK_WIDTH_SMALL)
+                                       // self.dev.MASK_INSTANCES_EACH)
+                    mem += self.dev.MASK_INSTANCES_EACH
                 if size != 1:
                     val = f'{k[0] & 0xff:02x}_{k[1] & 0xff:02x}{k[2] & 0xff:02x}' \
                           f'{k[3] & 0xff:02x}{k[4] & 0xff:02x}_{k[5] & 0xff:02x}' \
                           f'{k[6] & 0xff:02x}{k[7] & 0xff:02x}{k[8] & 0xff:02x}'
                 else:
                     val = f'{k[0] & 0xff:02x}_00000000_00000000'
-                self.kernel_mem[p // tc.dev.P_NUMPRO][p % tc.dev.P_NUMPRO][mem]. \
+                self.kernel_mem[p // self.dev.P_NUMPRO][p % self.dev.P_NUMPRO][mem]. \
                     append((offs, val))
             else:
                 self.write(addr, k[0] & 0xff, no_verify=True,
@@ -576,6 +591,47 @@ class APB():
         if self.num == 4:
             self.write_byte_flush(offs+1, comment, fifo=fifo)
 
+    def write_data_block(
+            self,
+            addrs,
+            vals,
+            tags=None,
+            write=True,
+    ):
+        """
+        Write the 32-bit words `vals` to the data memory addresses `addrs` (both NumPy arrays).
+        Like `write_byte_flush()`, this function detects whether previous information is being
+        overwritten, and it records the `tags` (default: `True`) for all written addresses.
+        When `write` is `False`, only the memory map is updated (for embedded code that copies
+        the data itself).
+        """
+        addrs = addrs.tolist()
+        if tags is None:
+            tags = [True] * len(addrs)
+        if any(self.mem[offs >> 2] for offs in addrs):
+            for offs in addrs:
+                self.check_overwrite(offs)
+        for offs, tag in zip(addrs, tags):
+            self.mem[offs >> 2] = tag
+        if write:
+            for offs, val in zip(addrs, vals.tolist()):
+                self.write_data(offs, val)
+
+    def write_fifo_block(
+            self,
+            vals,
+            fifos,
+            slowdown=0,
+    ):
+        """
+        Write the 32-bit words `vals` to the FIFOs `fifos` (both NumPy arrays) in order,
+        waiting `slowdown` instructions after each write.
+        """
+        for val, fifo in zip(vals.tolist(), fifos.tolist()):
+            self.write(0, val, '', fifo=fifo)
+            for _ in range(slowdown):
+                self.output('  asm volatile("nop");\n')
+
     def get_mem(
             self,
     ):
@@ -640,6 +696,27 @@ class APB():
         """
         return
 
+    def dma_functions(  # pylint: disable=no-self-use
+            self,
+    ):
+        """
+        Write the DMA transfer functions.
+        The base class does nothing.
+        """
+        return
+
+    def dma_table(  # pylint: disable=no-self-use
+            self,
+            name,  # pylint: disable=unused-argument
+            transfers,  # pylint: disable=unused-argument
+            dest='api',  # pylint: disable=unused-argument
+    ):
+        """
+        Write a table of DMA transfers and the call that performs them.
+        The base class does nothing.
+        """
+        return
+
     def main(  # pylint: disable=no-self-use
             self,
     ):
@@ -671,6 +748,8 @@ class APB():
             output_width=8,
             mlator=False,
             write_gap=0,
+            channels=None,
+            window=None,
     ):  # pylint: disable=unused-argument
         """
         Write the unload function. The layer to unload has the shape `input_shape`,
@@ -679,6 +758,37 @@ class APB():
         """
         return
 
+    def top_k_layer(  # pylint: disable=no-self-use
+            self,
+            processor_map,
+            input_shape,
+            output_offset=0,
+            out_expand=1,
+            out_expand_thresh=64,
+            output_width=8,
+            write_gap=0,
+            channels=None,
+            window=None,
+    ):  # pylint: disable=unused-argument
+        """
+        Write the function that returns the largest outputs of the layer with the shape
+        `input_shape`. The base class does nothing.
+        """
+        return
+
+    def test_loop(  # pylint: disable=no-self-use
+            self,
+            layout,
+            inputs,
+            outputs,
+            argmax=False,
+    ):  # pylint: disable=unused-argument
+        """
+        Write the test loop for several sample inputs and their expected outputs.
+        The base class does nothing.
+        """
+        return
+
     def verify_unload(
             self,
             ll,
@@ -697,10 +807,13 @@ class APB():
             max_count=None,
             write_gap=0,
             final_layer=0,
+            channels=None,
+            window=None,
     ):
         """
         Write a verification function. The layer to unload has the shape `input_shape`,
-        and the optional `output_offset` argument can shift the output.
+        and the optional `output_offset` argument can shift the output. Optionally, only the
+        output `channels` in the `window` are verified.
         """
         unload.verify(
             self.verify,
@@ -722,6 +835,8 @@ class APB():
             max_count=max_count,
             write_gap=write_gap,
             final_layer=final_layer,
+            channels=channels,
+            window=window,
         )
 
     def output_define(  # pylint: disable=no-self-use
@@ -767,6 +882,7 @@ class APBBlockLevel(APB):
             fast_fifo=False,
             input_csv=None,
             input_csv_format=None,
+            input_csv_frames=None,
             input_chan=None,
             sleep=False,
             apifile=None,
@@ -939,20 +1055,20 @@ class APBTopLevel(APB):
                 self.reads += 1
         else:
             if not self.fast_fifo:
-                addr = self.apb_base + tc.dev.C_FIFO_BASE
+                addr = self.apb_base + self.dev.C_FIFO_BASE
                 self.memfile.write(f'{indent}while (((*((volatile uint32_t *) '
-                                   f'0x{addr + tc.dev.FIFO_STAT*4:08x})'
+                                   f'0x{addr + self.dev.FIFO_STAT*4:08x})'
                                    f' & {1 << fifo})) != 0); // Wait for FIFO {fifo}\n')
                 self.memfile.write(f'{indent}*((volatile uint32_t *) '
-                                   f'0x{addr + tc.dev.FIFO_REG*4 + fifo*4:08x}) = '
+                                   f'0x{addr + self.dev.FIFO_REG*4 + fifo*4:08x}) = '
                                    f'{val};{comment}\n')
             else:
-                addr = tc.dev.FAST_FIFO_BASE
+                addr = self.dev.FAST_FIFO_BASE
                 self.memfile.write(f'{indent}while (((*((volatile uint32_t *) '
-                                   f'0x{addr + tc.dev.FAST_FIFO_SR*4:08x})'
+                                   f'0x{addr + self.dev.FAST_FIFO_SR*4:08x})'
                                    f' & 2)) != 0); // Wait for FIFO\n')
                 self.memfile.write(f'{indent}*((volatile uint32_t *) '
-                                   f'0x{addr + tc.dev.FAST_FIFO_DR*4:08x}) = '
+                                   f'0x{addr + self.dev.FAST_FIFO_DR*4:08x}) = '
                                    f'{val};{comment}\n')
             self.writes += 1
 
@@ -975,7 +1091,7 @@ class APBTopLevel(APB):
         in RTL simulation. For normal cases, it is equivalent to `write()`.
         """
         if self.data_mem is not None and fifo is None:
-            group, proc, mem, offs = tc.dev.datainstance_from_addr(addr)
+            group, proc, mem, offs = self.dev.datainstance_from_addr(addr)
             self.data_mem[group][proc][mem].append((offs, f'{val:08x}'))
             return
 
@@ -1024,7 +1140,7 @@ class APBTopLevel(APB):
                 for i, e in enumerate(f'{mask:08x}'):
                     w += 'X' if e != 'f' else val[i]
                 val = w
-            group, proc, mem, offs = tc.dev.datainstance_from_addr(addr)
+            group, proc, mem, offs = self.dev.datainstance_from_addr(addr)
             self.output_data_mem[group][proc][mem].append((offs, val))
             return
 
@@ -1078,12 +1194,13 @@ class APBTopLevel(APB):
         assert addr >= 0
         addr += self.apb_base
 
-        if self.memfile is None:
+        mfile = self.apifile or self.memfile
+        if mfile is None:
             return
 
-        self.memfile.write(f'  while ((*((volatile uint32_t *) 0x{addr:08x}) & 0x{mask:0x})'
-                           f' != 0x{val:0x});'
-                           f'{comment}\n')
+        mfile.write(f'  while ((*((volatile uint32_t *) 0x{addr:08x}) & 0x{mask:0x})'
+                    f' != 0x{val:0x});'
+                    f'{comment}\n')
 
     def copyright_header(
             self,
@@ -1171,6 +1288,32 @@ class APBTopLevel(APB):
             **kwargs,
         )
 
+    def dma_functions(
+            self,
+    ):
+        """
+        Write the DMA transfer functions.
+        """
+        toplevel.dma_functions(
+            self.apifile or self.memfile,
+            interrupt=self.dma == 'interrupt',
+        )
+
+    def dma_table(
+            self,
+            name,
+            transfers,
+            dest='api',
+    ):
+        """
+        Write the table `name` of DMA `transfers` and the call that performs them.
+        """
+        toplevel.dma_table(
+            self.apifile or self.memfile if dest == 'api' else self.memfile,
+            name,
+            transfers,
+        )
+
     def main(
             self,
     ):
@@ -1188,6 +1331,7 @@ class APBTopLevel(APB):
             debugwait=self.debugwait,
             camera=self.input_csv is not None,
             camera_format=self.input_csv_format,
+            camera_frames=self.input_csv_frames,
             channels=self.input_chan,
             sleep=self.sleep,
             unload=self.embedded_code,
@@ -1207,6 +1351,10 @@ class APBTopLevel(APB):
             bias=self.bias,
             verify_kernels=self.verify_kernels,
             wfi=self.wfi,
+            fps_frames=self.fps_frames,
+            unload_overlap=self.unload_overlap,
+            top_k=self.top_k,
+            test_samples=self.test_samples,
         )
 
     def softmax_layer(
@@ -1229,14 +1377,59 @@ class APBTopLevel(APB):
             output_width=8,
             mlator=False,
             write_gap=0,
+            channels=None,
+            window=None,
     ):
         """
         Write the unload function. The layer to unload has the shape `input_shape`,
-        and the optional `output_offset` argument can shift the output.
+        and the optional `output_offset` argument can shift the output. Optionally, only the
+        output `channels` in the `window` are unloaded.
         """
         unload.unload(self.apifile or self.memfile, self.apb_base, processor_map, input_shape,
                       output_offset, out_expand, out_expand_thresh, output_width,
-                      mlator=mlator, blocklevel=self.blocklevel)
+                      mlator=mlator, blocklevel=self.blocklevel, write_gap=write_gap,
+                      channels=channels, window=window)
+
+    def top_k_layer(
+            self,
+            processor_map,
+            input_shape,
+            output_offset=0,
+            out_expand=1,
+            out_expand_thresh=64,
+            output_width=8,
+            write_gap=0,
+            channels=None,
+            window=None,
+    ):
+        """
+        Write the function that returns the largest outputs of the layer with the shape
+        `input_shape`, optionally only for the output `channels` in the `window`.
+        """
+        unload.top_k(self.apifile or self.memfile, self.apb_base, processor_map, input_shape,
+                     output_offset, out_expand, out_expand_thresh, output_width,
+                     write_gap=write_gap, channels=channels, window=window)
+
+    def test_loop(
+            self,
+            layout,
+            inputs,
+            outputs,
+            argmax=False,
+    ):
+        """
+        Write the test loop for the sample `inputs` (one row of 32-bit words per sample that
+        are copied to the data memory addresses and word counts in `layout`) and the expected
+        `outputs` (one row per sample, or the index of the largest output with `argmax`).
+        """
+        self.output_define(inputs.reshape(-1), 'TEST_INPUT', '0x%08x', 8, weights=False)
+        if argmax:
+            self.output_define(outputs, 'TEST_CLASS', '%d', 16, weights=False)
+        else:
+            self.output_define(outputs.reshape(-1), 'TEST_OUTPUT', '%d', 16, weights=False)
+        toplevel.test_samples(self.memfile, [(self.apb_base + addr, n) for addr, n in layout],
+                              len(inputs), self.output_width, argmax, self.top_k, self.wfi)
+        self.test_samples = True
 
     def output_define(
             self,
@@ -1268,6 +1461,7 @@ class APBTopLevel(APB):
         toplevel.select_clock(self.apifile or self.memfile, source, divider, comment)
 
 
+@tc.device_scope
 def apbwriter(
         *args,
         block_level=False,
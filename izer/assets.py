@@ -21,12 +21,13 @@ def copy(
         test_name,
 ):
     """
-    Copy all files from `base`/`source` to `target`/`test_name`.
+    Copy all files from `base`/`source` to `target`/`test_name`, including subdirectories.
     """
-    dst = os.path.join(target, test_name)
-    for _, _, files in sorted(os.walk(os.path.join(base, source))):
+    for root, _, files in sorted(os.walk(os.path.join(base, source))):
+        dst = os.path.join(target, test_name, os.path.relpath(root, os.path.join(base, source)))
+        os.makedirs(dst, exist_ok=True)
         for name in sorted(files):
-            shutil.copy(os.path.join(base, source, name), dst)
+            shutil.copy(os.path.join(root, name), dst)
 
 
 def from_template(
@@ -7,6 +7,9 @@
 """
 Simulated camera data
 """
+import io
+
+import numpy as np
 
 
 VSYNC_LEADIN = 10
@@ -34,7 +37,13 @@ def header(f, leader=VSYNC_LEADIN, high=VSYNC_HIGH, low=VSYNC_LOW):
     Write header (VSYNC low/high/low) to CSV file `f`.
     """
     f.write('vsync,href,pclk,d\n')
+    vsync(f, leader, high, low)
+
 
+def vsync(f, leader=VSYNC_LEADIN, high=VSYNC_HIGH, low=VSYNC_LOW):
+    """
+    Write the start of a frame (VSYNC low/high/low) to CSV file `f`.
+    """
     # Lead-in VSYNC low
     for _ in range(leader):
         write(f, 0, 0, 0)
@@ -69,3 +78,57 @@ def pixel(f, val):
     Write pixel data `val` (HREF high) to CSV file `f`.
     """
     write(f, 0, 1, val, stretch=1)
+
+
+def pixel_bytes(data, camera_format=888):
+    """
+    Return the bytes that the camera sends for the CHW image `data`, as an array with one
+    row of bytes per image row. The `camera_format` is 888 (one byte per channel), or 555 or 565
+    (two bytes per pixel for three channels).
+    """
+    data = np.asarray(data, dtype=np.int64) & 0xff
+    if camera_format == 888:
+        return data.transpose(1, 2, 0).reshape(data.shape[1], -1)
+    if camera_format == 555:
+        w = (data[0] & 0xf8) << 7 | (data[1] & 0xf8) << 2 | (data[2] & 0xf8) >> 3
+    elif camera_format == 565:
+        w = (data[0] & 0xf8) << 8 | (data[1] & 0xfc) << 3 | (data[2] & 0xf8) >> 3
+    else:
+        raise RuntimeError(f'Unknown camera format {camera_format}')
+    return np.stack((w >> 8 & 0xff, w & 0xff), axis=-1).reshape(data.shape[1], -1)
+
+
+def lines(func, *args, **kwargs):
+    """
+    Return the CSV lines that `func(f, *args, **kwargs)` writes.
+    """
+    f = io.StringIO()
+    func(f, *args, **kwargs)
+    return f.getvalue()
+
+
+PIXELS = [lines(pixel, val) for val in range(256)]
+
+
+def frame(f, data, camera_format=888, retrace=RETRACE):
+    """
+    Write the CHW image `data` in `camera_format` to CSV file `f`, finishing each row with
+    `retrace`.
+    """
+    row_end = lines(finish_row, retrace=retrace)
+    for row in pixel_bytes(data, camera_format).tolist():
+        f.write(''.join([PIXELS[val] for val in row]))
+        f.write(row_end)
+
+
+def stimulus(f, frames, camera_format=888, retrace=RETRACE):
+    """
+    Write the CHW images `frames` in `camera_format` to CSV file `f`, with a VSYNC pulse
+    before each image and `retrace` after each row.
+    """
+    header(f)
+    for i, data in enumerate(frames):
+        if i > 0:
+            vsync(f)
+        frame(f, data, camera_format, retrace)
+    finish_image(f)
@@ -0,0 +1,160 @@
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Static resource checks that only need the network configuration and the weight shapes
+"""
+import numpy as np
+
+from . import kbias, kernels, op
+from . import tornadocnn as tc
+from .eprint import eprint
+from .utils import ffs
+
+
+def kernel_memory(
+        start_layer,
+        layers,
+        operator,
+        kernel,
+        kernel_size,
+        quantization,
+        processor_map,
+        output_processor_map,
+        input_chan,
+        output_chan,
+        out_expand,
+        in_expand,
+        conv_groups,
+        flatten,
+        quad=False,
+        legacy_kernels=False,
+        start_offs=0,
+        bypass=None,
+        placement='greedy',
+        reserved=None,
+        deduplicate=False,
+):
+    """
+    Check that the kernels fit into kernel memory, stacking them the same way as
+    `kernels.load()` but using only the shape of `kernel`, above the `reserved` columns of each
+    processor. Reports every layer that does not fit, and returns the kernel memory used by
+    each processor. With `placement` set to `'optimized'`, the layers are placed using
+    `kernels.place()` when stacking them in layer order does not fit or uses more memory.
+    With `deduplicate`, layers with the same kernels and configuration as a prior layer do not
+    use additional kernel memory.
+    """
+    proc_kern_max = list(reserved or [0] * tc.dev.MAX_PROC)
+    footprint = {}
+    overflow = []
+    images = set()
+    for ll in range(start_layer, layers):
+        if operator[ll] == op.NONE or bypass is not None and bypass[ll]:
+            continue
+        if deduplicate:
+            image = (processor_map[ll], output_processor_map[ll], tuple(kernel_size[ll]),
+                     quantization[ll], input_chan[ll], output_chan[ll], out_expand[ll],
+                     in_expand[ll], conv_groups[ll], flatten[ll], np.shape(kernel[ll]),
+                     np.asarray(kernel[ll]).tobytes())
+            if image in images:
+                continue
+            images.add(image)
+
+        proc_map = processor_map[ll]
+        if ll == 0 and quad:
+            proc_map &= 2**tc.dev.P_NUMPRO - 1
+        procs = [p for p in range(tc.dev.MAX_PROC) if proc_map >> p & 1]
+        if not procs:
+            continue
+        kern_offs = max([start_offs] + [proc_kern_max[p] for p in procs])
+
+        if not legacy_kernels and flatten[ll]:
+            # Number of kernels per input channel and output channel
+            area = np.prod(np.shape(kernel[ll])) \
+                // (output_chan[ll] * input_chan[ll] * kernel_size[ll][0] * kernel_size[ll][1])
+        else:
+            area = None
+        _, kern_len = kernels.layout(output_processor_map[ll], kernel_size[ll],
+                                     quantization[ll], out_expand[ll], in_expand[ll],
+                                     conv_groups[ll], output_chan[ll], area, ll == 0 and quad)
+        kern_offs = kernels.align_offset(kern_offs, output_processor_map[ll], quantization[ll])
+
+        if ll == 0 and quad:
+            procs += [p + q * tc.dev.P_NUMPRO for p in procs for q in range(1, 4)]
+        footprint[ll] = np.zeros((tc.dev.MAX_PROC, tc.dev.MASK_WIDTH_LARGE), dtype=bool)
+        footprint[ll][procs, :kern_len] = True
+
+        width = min(tc.dev.mask_width(p) for p in procs)
+        if kern_offs + kern_len > width:
+            overflow.append(f'Layer {ll}: Kernel memory exceeded; offset: {kern_offs}, needed: '
+                            f'{kern_len}, available: {width}.')
+        for p in procs:
+            proc_kern_max[p] = kern_offs + kern_len
+
+    if placement == 'optimized' and footprint:
+        planned = kernels.place(footprint, start_offs, reserved)
+        if planned is not None:
+            top = list(reserved or [0] * tc.dev.MAX_PROC)
+            for ll, offs in planned.items():
+                for p in np.nonzero(np.any(footprint[ll], axis=1))[0]:
+                    top[p] = max(top[p], offs + int(np.sum(footprint[ll][p])))
+            if overflow or max(top) < max(proc_kern_max):
+                return top
+    for message in overflow:
+        eprint(message)
+
+    return proc_kern_max
+
+
+def bias_memory(
+        start_layer,
+        layers,
+        bias,
+        group_map,
+        output_chan,
+        streaming,
+        conv_groups,
+        broadcast_mode,
+        processor_map,
+        output_processor_map,
+        out_expand,
+        reserved=None,
+):
+    """
+    Check that the bias values fit into bias memory, assigning groups the same way as
+    `kbias.load()` using `kbias.plan()`, above the `reserved` bytes of each group. Reports
+    every layer that does not fit, and returns the bias memory used in each group.
+    """
+    for ll in range(start_layer, layers):
+        if bias[ll] is not None and group_map[ll] is not None and np.any(bias[ll] != 0) \
+           and len(bias[ll]) != output_chan[ll]:
+            eprint(f'Layer {ll}: output channel count {output_chan[ll]} does not match the number '
+                   f'of bias values {len(bias[ll])}.')
+
+    order, groups = kbias.plan(start_layer, layers, bias, group_map, output_chan, streaming,
+                               conv_groups, broadcast_mode, processor_map, output_processor_map,
+                               out_expand, reserved)
+    group_bias_max = list(reserved or [0] * tc.dev.P_NUMGROUPS)
+    for ll in order:
+        if groups[ll] is not None:
+            group = groups[ll]
+            bias_len = output_chan[ll] \
+                + ffs(output_processor_map[ll]) % tc.dev.P_SHARED * out_expand[ll]
+            if ll == 0 and streaming[ll] and not tc.dev.SUPPORT_STREAM_BIAS:
+                bias_len += 1  # Work around a problem on AI85
+            if group_bias_max[group] + bias_len > tc.dev.BIAS_SIZE:
+                eprint(f'Layer {ll}: bias memory capacity exceeded - available groups: '
+                       f'{group_map[ll]}, used so far: {group_bias_max}, needed: {bias_len}.')
+            group_bias_max[group] += bias_len
+        else:
+            kbias.depthwise_use(ll, group_bias_max, bias, processor_map, broadcast_mode,
+                                out_expand)
+            for group in range(tc.dev.P_NUMGROUPS):
+                if group_bias_max[group] > tc.dev.BIAS_SIZE:
+                    eprint(f'Layer {ll}: bias memory capacity for group {group} exceeded, '
+                           f'needed: {group_bias_max[group]}.')
+
+    return group_bias_max
@@ -12,13 +12,61 @@ import sys
 
 import numpy as np
 
-from . import assets, op, toplevel
+from . import assets, op, stats, toplevel
 from . import tornadocnn as tc
 from .eprint import eprint, wprint
 from .simulate import (conv1d_layer, conv2d_layer, convtranspose2d_layer, eltwise_layer,
                        passthrough_layer, pooling_layer, show_data)
 
 
+def arena_plan(
+        tensors,
+        align=4,
+):
+    """
+    Assign offsets in a single memory arena to `tensors`, a list of (size, first, last) tuples
+    where `first` and `last` are the first and last step during which a tensor is live. Tensors
+    whose lifetimes overlap never share memory. Larger tensors are placed first, each at the
+    lowest offset (a multiple of `align`) that fits. Returns the offsets and the arena size.
+    """
+    offsets = [0] * len(tensors)
+    placed = []
+    arena_size = 0
+    for i in sorted(range(len(tensors)), key=lambda i: (-tensors[i][0], tensors[i][1], i)):
+        size, first, last = tensors[i]
+        offs = 0
+        for o, s in sorted((offsets[j], tensors[j][0]) for j in placed
+                           if tensors[j][1] <= last and first <= tensors[j][2]):
+            if offs + size <= o:
+                break
+            offs = max(offs, (o + s + align - 1) // align * align)
+        offsets[i] = offs
+        placed.append(i)
+        arena_size = max(arena_size, offs + size)
+    return offsets, arena_size
+
+
+def fully_connected_opt_weights(
+        w,
+):
+    """
+    Reorder the weight matrix `w` (rows x columns) of a fully connected layer for
+    `arm_fully_connected_q7_opt()`, which multiplies four rows at a time and interleaves
+    their columns. Returns the flattened weights.
+    """
+    rows, cols = w.shape
+    wopt = []
+    for r in range(0, rows - rows % 4, 4):
+        for c in range(0, cols - cols % 4, 4):
+            for c0, r0 in ((c, r), (c, r + 2), (c + 1, r), (c + 1, r + 2)):
+                wopt += [w[r0][c0], w[r0 + 1][c0], w[r0][c0 + 2], w[r0 + 1][c0 + 2]]
+        for c in range(cols - cols % 4, cols):
+            wopt += list(w[r:r + 4, c])
+    wopt += list(w[rows - rows % 4:].flatten())
+    return np.array(wopt, dtype=w.dtype)
+
+
+@tc.device_scope
 def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-branches
         prefix,
         verbose,
@@ -108,6 +156,72 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         if input_chan[ll] % conv_groups[ll] != 0 or output_chan[ll] % conv_groups[ll] != 0:
             eprint(f'Layer {ll}: convolution groups {conv_groups[ll]} does not divide'
                    f' the input channels {input_chan[ll]} or output channels {output_chan[ll]}.')
+        if conv_groups[ll] > 1 and (conv_groups[ll] != input_chan[ll]
+                                    or conv_groups[ll] != output_chan[ll]
+                                    or input_chan[ll] % 2 != 0):
+            eprint(f'Layer {ll}: CMSIS-NN supports convolution groups > 1 only for depthwise '
+                   'convolutions with an even number of channels.')
+        if operator[ll] != op.NONE and dilation[ll] != [1, 1]:
+            eprint(f'Layer {ll}: CMSIS-NN does not support dilation.')
+
+    def sources(ll):
+        """
+        Return the list of layers whose output is the input of layer `ll` (-1 is the input)
+        """
+        if in_sequences[ll] is None:
+            return [ll - 1]
+        if isinstance(in_sequences[ll], list):
+            return in_sequences[ll]
+        return [in_sequences[ll]]
+
+    def pooling(ll):
+        """
+        Return the CMSIS-NN pooling routine for layer `ll`, or `None` when not pooling
+        """
+        if pool[ll][0] <= 1 and pool[ll][1] <= 1:
+            return None
+        pool_type = 'ave' if pool_average[ll] else 'max'
+        if pool[ll][0] != pool[ll][1]:
+            return f'arm_{pool_type}pool_nonsquare_q7_HWC_nonsquare'
+        if input_dim[ll][0] == input_dim[ll][1]:
+            return f'arm_{pool_type}pool_q7_HWC'
+        return f'arm_{pool_type}pool_q7_HWC_nonsquare'
+
+    def conv_kernel(ll):
+        """
+        Return the fastest CMSIS-NN routine that can run the convolution in layer `ll`, its
+        input channels and dimensions, and the size of its `col_buffer` in bytes
+        """
+        in_chan = input_chan[ll]
+        in_dim = pooled_dim[ll]
+        if flatten[ll]:
+            in_chan *= pooled_dim[ll][0] * pooled_dim[ll][1]
+            in_dim = [1, 1]
+        k = kernel_size[ll][0] * kernel_size[ll][1]
+
+        # Check for squareness
+        square = kernel_size[ll][0] == kernel_size[ll][1] \
+            and in_dim[0] == in_dim[1] \
+            and output_dim[ll][0] == output_dim[ll][1] \
+            and padding[ll][0] == padding[ll][1] \
+            and stride[ll][0] == stride[ll][1]
+
+        # The buffer sizes are documented in q15_t for all routines
+        if conv_groups[ll] > 1:
+            fn = 'arm_depthwise_separable_conv_HWC_q7'
+            return fn if square else fn + '_nonsquare', in_chan, in_dim, 4 * in_chan * k
+        if in_dim == [1, 1] and output_dim[ll] == [1, 1] and kernel_size[ll] == [1, 1]:
+            # Fully connected layers use reordered weights
+            return 'arm_fully_connected_q7_opt', in_chan, in_dim, 2 * in_chan
+        if in_chan % 4 == 0 and output_chan[ll] % 2 == 0:
+            if kernel_size[ll] == [1, 1] and padding[ll] == [0, 0] and stride[ll] == [1, 1]:
+                return 'arm_convolve_1x1_HWC_q7_fast_nonsquare', in_chan, in_dim, 4 * in_chan
+            fn = 'arm_convolve_HWC_q7_fast'
+            return fn if square else fn + '_nonsquare', in_chan, in_dim, 4 * in_chan * k
+        if in_chan == 3 and square:
+            return 'arm_convolve_HWC_q7_RGB', in_chan, in_dim, 4 * in_chan * k
+        fn = 'arm_convolve_HWC_q7_basic'
+        return fn if square else fn + '_nonsquare', in_chan, in_dim, 4 * in_chan * k
 
     test_name = prefix
     print(f'{test_name}...')
@@ -165,12 +279,20 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                                 kernel_size[ll][0], kernel_size[ll][1])). \
                         transpose((0, 4, 5, 2, 3, 1)). \
                         flatten()
+                elif conv_groups[ll] > 1:
+                    # Depthwise weights are stored HWC, with one channel per output channel
+                    w = kernel[ll]. \
+                        reshape((output_chan[ll], kernel_size[ll][0], kernel_size[ll][1])). \
+                        transpose((1, 2, 0)). \
+                        flatten()
                 else:
                     w = kernel[ll]. \
                         reshape((output_chan[ll], input_chan[ll],
                                 kernel_size[ll][0], kernel_size[ll][1])). \
                         transpose((0, 2, 3, 1)). \
                         flatten()
+                if conv_kernel(ll)[0] == 'arm_fully_connected_q7_opt':
+                    w = fully_connected_opt_weights(w.reshape(output_chan[ll], -1))
                 toplevel.c_define(weight_header, w, f'WEIGHTS_{ll}', '%d', 16)
                 if bias[ll] is not None:
                     b = bias[ll].flatten()
@@ -187,7 +309,84 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 c_file.write(f'static const q7_t bias_{ll}[] = BIAS_{ll};\n')
         c_file.write('\n')
 
-        # Compute buffer sizes
+        # Plan the activation memory. Every layer takes two steps, 2*ll to concatenate and pool
+        # its input and 2*ll+1 to convolve. A tensor may share arena space with any tensor that
+        # is not live during the same steps. Passthrough layers alias their input tensor.
+        root = []  # Layer that produced the output tensor of each layer (-1 for the input)
+        last_read = {}  # Last layer that reads the output tensor of a layer
+        for ll in range(layers):
+            srcs = [root[i] if i >= 0 else -1 for i in sources(ll)]
+            for i in srcs:
+                last_read[i] = ll
+            if operator[ll] == op.NONE and pooling(ll) is None and len(srcs) == 1:
+                root.append(srcs[0])
+            else:
+                root.append(ll)
+        last_read[root[-1]] = layers
+
+        tensors = []  # Size, first and last live step
+        plan = [{} for _ in range(layers)]
+        layer_tensor = []
+
+        def new_tensor(size, step):
+            """
+            Create a tensor of `size` bytes that is written in `step`
+            """
+            tensors.append([size, step, step])
+            return len(tensors) - 1
+
+        def use(t, step):
+            """
+            Keep tensor `t` alive until `step`
+            """
+            if t is not None:
+                tensors[t][2] = max(tensors[t][2], step)
+
+        for ll in range(layers):
+            step = 2 * ll
+            srcs = [layer_tensor[i] if i >= 0 else None for i in sources(ll)]
+            for t in srcs:
+                use(t, step)
+            src = srcs[0]
+            if len(srcs) > 1 and operands[ll] == 1:
+                src = new_tensor(input_chan[ll] * input_dim[ll][0] * input_dim[ll][1], step)
+                plan[ll]['concat'] = src, srcs
+
+            pool_fn = pooling(ll)
+            if pool_fn is not None:
+                if pool_fn.endswith('pool_q7_HWC'):
+                    # Arm's square pooling routines overwrite their input
+                    i = sources(ll)[0]
+                    if 'concat' not in plan[ll] \
+                       and (i < 0 or last_read[root[i]] > ll):
+                        plan[ll]['copy'] = src
+                        src = new_tensor(input_chan[ll] * input_dim[ll][0] * input_dim[ll][1],
+                                         step)
+                plan[ll]['pool_in'] = src
+                plan[ll]['pool_buffer'] = new_tensor(2 * pooled_dim[ll][0] * input_chan[ll],
+                                                     step) \
+                    if pool_fn == 'arm_avepool_q7_HWC' else None
+                src = new_tensor(input_chan[ll] * pooled_dim[ll][0] * pooled_dim[ll][1], step)
+                plan[ll]['pool_out'] = src
+
+            if operator[ll] != op.NONE:
+                use(src, step + 1)
+                plan[ll]['conv_in'] = src
+                plan[ll]['col_buffer'] = new_tensor(conv_kernel(ll)[3], step + 1)
+                src = new_tensor(output_chan[ll] * output_dim[ll][0] * output_dim[ll][1],
+                                 step + 1)
+            layer_tensor.append(src)
+        use(layer_tensor[-1], 2 * layers)
+
+        offsets, arena_size = arena_plan([tuple(t) for t in tensors])
+
+        def buf(t):
+            """
+            Return the C expression for tensor `t`
+            """
+            return 'input' if t is None else f'&arena[{offsets[t]}]'
+
+        # Compare with two ping-pong buffers and a shared column buffer
         col_buffer_size = 0
         img_buffer_size = 0
         for ll in range(layers):
@@ -199,16 +398,19 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
             img_buffer_size = max(img_buffer_size,
                                   input_chan[ll]*input_dim[ll][0]*input_dim[ll][1],
                                   output_chan[ll]*output_dim[ll][0]*output_dim[ll][1])
+        ping_pong_size = max(img_buffer_size, input_size) + img_buffer_size + 2*col_buffer_size
+        print(f'CMSIS-NN arena: {arena_size} bytes peak RAM for activations and scratch buffers '
+              f'({ping_pong_size} bytes with ping-pong buffers)')
 
-        c_file.write(f'static q7_t buffer0[{max(img_buffer_size, input_size)}];\n')
-        c_file.write(f'static q7_t buffer1[{img_buffer_size}];\n')
-        c_file.write(f'static q15_t col_buffer[{col_buffer_size}];\n\n')
+        c_file.write(f'// Activations and scratch buffers, {arena_size} bytes peak RAM\n'
+                     f'static uint32_t arena32[{(arena_size + 3) // 4}];\n\n')
 
         c_file.write('int cnn_run(const q7_t *input, int input_size, '
-                     'q7_t **output, int *output_size)\n{\n')
-
-        # Compute layer-by-layer output and chain results into input
-        buffer0, buffer1 = 'buffer0', 'buffer1'
+                     'q7_t **output, int *output_size)\n{\n'
+                     '  q7_t *arena = (q7_t *) arena32;\n')
+        if any('concat' in p for p in plan):
+            c_file.write('  int i;\n')
+        c_file.write('\n  CNN_LAYER_DONE(-1); // Start\n\n')
 
         def run_eltwise(
                 data,
@@ -244,6 +446,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         data_buf = [data]
         # Compute layer-by-layer output and chain results into input
         for ll in range(layers):
+            stats.begin_layer(ll)
             # Concatenate input data if needed
             if in_sequences[ll] is not None:
                 if isinstance(in_sequences[ll], list):
@@ -356,7 +559,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                     activation[ll],
                     kernel[ll].reshape(
                         output_chan[ll],
-                        in_chan,
+                        in_chan // conv_groups[ll],
                         kernel_size[ll][0],
                         kernel_size[ll][1]
                     ),
@@ -382,7 +585,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                     activation[ll],
                     kernel[ll].reshape(
                         output_chan[ll],
-                        in_chan,
+                        in_chan // conv_groups[ll],
                         kernel_size[ll][0],
                         kernel_size[ll][1],
                     ),
@@ -407,7 +610,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                     activation[ll],
                     kernel[ll].reshape(
                         output_chan[ll],
-                        input_chan[ll],
+                        input_chan[ll] // conv_groups[ll],
                         kernel_size[ll][0],
                     ),
                     bias[ll],
@@ -457,87 +660,94 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
             if flatten[ll]:
                 c_file.write(f' -> [{input_chan[ll]*pooled_dim[ll][0]*pooled_dim[ll][1]}, 1, 1]')
             if operator[ll] != op.NONE:
-                c_file.write(f' -> {out_size}\n')
+                # Multiply-accumulate operations, counting those in the padding
+                macs = output_chan[ll] * output_dim[ll][0] * output_dim[ll][1] \
+                    * conv_kernel(ll)[1] // conv_groups[ll] \
+                    * kernel_size[ll][0] * kernel_size[ll][1]
+                c_file.write(f' -> {out_size}, {macs:,} MACs\n')
             else:
                 c_file.write('\n')
 
-            source = 'input_data' if ll == 0 else buffer0
-
-            if pool[ll][0] > 1 or pool[ll][1] > 1:
-                if ll == 0:
-                    c_file.write('  memcpy(buffer0, input, input_size);'
-                                 ' // Pooling may destroy input\n')
-                pool_type = 'ave' if pool_average[ll] else 'max'
+            p = plan[ll]
+            if 'concat' in p:
+                # Interleave the channels of all inputs, pixel by pixel (HWC)
+                out, srcs = p['concat']
+                chans = [output_chan[i] if i >= 0 else data_buf[0].shape[0]
+                         for i in sources(ll)]
+                c_file.write(f'  for (i = 0; i < {input_dim[ll][0] * input_dim[ll][1]}; i++) {{\n')
+                offs = 0
+                for t, c in zip(srcs, chans):
+                    c_file.write(f'    memcpy({buf(out)} + i * {input_chan[ll]}'
+                                 f'{" + " + str(offs) if offs > 0 else ""}, '
+                                 f'{buf(t)} + i * {c}, {c});\n')
+                    offs += c
+                c_file.write('  }\n')
+
+            pool_fn = pooling(ll)
+            if pool_fn is not None:
+                source = buf(p['pool_in'])
+                if 'copy' in p:
+                    size = input_chan[ll] * input_dim[ll][0] * input_dim[ll][1]
+                    c_file.write(f'  memcpy({source}, {buf(p["copy"])}, {size});'
+                                 ' // Pooling destroys its input\n')
+                pool_buffer = buf(p['pool_buffer']) if p['pool_buffer'] is not None else 'NULL'
                 if pool[ll][0] != pool[ll][1]:
-                    c_file.write(f'  arm_{pool_type}pool_nonsquare_q7_HWC_nonsquare({buffer0}, '
+                    c_file.write(f'  {pool_fn}({source}, '
                                  f'{input_dim[ll][1]}, {input_dim[ll][0]}, '
                                  f'{input_chan[ll]}, {pool[ll][1]}, {pool[ll][0]}, 0, 0, '
                                  f'{pool_stride[ll][1]}, {pool_stride[ll][0]}, '
                                  f'{pooled_dim[ll][1]}, {pooled_dim[ll][0]}, '
-                                 f'(q7_t *) col_buffer, {buffer1});\n')
+                                 f'{pool_buffer}, {buf(p["pool_out"])});\n')
+                elif input_dim[ll][0] == input_dim[ll][1]:
+                    c_file.write(f'  {pool_fn}({source}, '
+                                 f'{input_dim[ll][0]}, {input_chan[ll]}, '
+                                 f'{pool[ll][0]}, 0, {pool_stride[ll][0]}, '
+                                 f'{pooled_dim[ll][0]}, {pool_buffer}, '
+                                 f'{buf(p["pool_out"])});\n')
                 else:
-                    if input_dim[ll][0] == input_dim[ll][1]:
-                        c_file.write(f'  arm_{pool_type}pool_q7_HWC({buffer0}, '
-                                     f'{input_dim[ll][0]}, {input_chan[ll]}, '
-                                     f'{pool[ll][0]}, 0, {pool_stride[ll][0]}, '
-                                     f'{pooled_dim[ll][0]}, (q7_t *) col_buffer, {buffer1});\n')
-                    else:
-                        c_file.write(f'  arm_{pool_type}pool_q7_HWC_nonsquare({buffer0}, '
-                                     f'{input_dim[ll][1]}, {input_dim[ll][0]}, '
-                                     f'{input_chan[ll]}, {pool[ll][0]}, 0, {pool_stride[ll][0]}, '
-                                     f'{pooled_dim[ll][1]}, {pooled_dim[ll][0]}, '
-                                     f'(q7_t *) col_buffer, {buffer1});\n')
-                source = buffer1
-                buffer0, buffer1 = buffer1, buffer0
+                    c_file.write(f'  {pool_fn}({source}, '
+                                 f'{input_dim[ll][1]}, {input_dim[ll][0]}, '
+                                 f'{input_chan[ll]}, {pool[ll][0]}, 0, {pool_stride[ll][0]}, '
+                                 f'{pooled_dim[ll][1]}, {pooled_dim[ll][0]}, '
+                                 f'{pool_buffer}, {buf(p["pool_out"])});\n')
 
             if operator[ll] != op.NONE:
-                in_chan = input_chan[ll]
-                in_dim = pooled_dim[ll]
-                if flatten[ll]:
-                    in_chan *= pooled_dim[ll][0] * pooled_dim[ll][1]
-                    in_dim = [1, 1]
-
                 if operator[ll] in [op.CONVTRANSPOSE2D]:  # FIXME: Support ConvTranspose2d
                     eprint("CMSIS-NN generator does not currently support the operator "
                            f"`{op.string(operator[ll])}` in layer {ll}")
 
                 # FIXME: First check that everything is [-128, +127] and use s8 function otherwise
 
-                # Check for squareness
-                if kernel_size[ll][0] == kernel_size[ll][1] \
-                   and in_dim[0] == in_dim[1] \
-                   and output_dim[ll][0] == output_dim[ll][1] \
-                   and padding[ll][0] == padding[ll][1] \
-                   and stride[ll][0] == stride[ll][1]:
-                    # Detect fully connected layers
-                    if in_dim == [1, 1] and output_dim[ll] == [1, 1]:
-                        c_file.write(f'  arm_fully_connected_q7({source}, '
-                                     f'weights_{ll}, {in_chan}, {output_chan[ll]}, 7, '
-                                     f'{7 - output_shift[ll]}, bias_{ll}, {buffer1}, '
-                                     'col_buffer);\n')
-                    else:
-                        fn = 'fast' if in_chan % 4 == 0 and output_chan[ll] % 2 == 0 \
-                            else 'basic'
-                        c_file.write(f'  arm_convolve_HWC_q7_{fn}({source}, '
-                                     f'{in_dim[0]}, '
-                                     f'{in_chan}, weights_{ll}, {output_chan[ll]}, '
-                                     f'{kernel_size[ll][0]}, '
-                                     f'{padding[ll][0]}, '
-                                     f'{stride[ll][0]}, '
-                                     f'bias_{ll}, 7,  {7 - output_shift[ll]}, {buffer1}, '
-                                     f'{output_dim[ll][0]}, '
-                                     'col_buffer, NULL);\n')
+                fn, in_chan, in_dim, _ = conv_kernel(ll)
+                source = buf(p['conv_in'])
+                target = buf(layer_tensor[ll])
+                col_buffer = f'(q15_t *) {buf(p["col_buffer"])}'
+                if fn.startswith('arm_fully_connected'):
+                    c_file.write(f'  {fn}({source}, '
+                                 f'weights_{ll}, {in_chan}, {output_chan[ll]}, 7, '
+                                 f'{7 - output_shift[ll]}, bias_{ll}, {target}, '
+                                 f'{col_buffer});\n')
+                elif not fn.endswith('_nonsquare'):
+                    c_file.write(f'  {fn}({source}, '
+                                 f'{in_dim[0]}, '
+                                 f'{in_chan}, weights_{ll}, {output_chan[ll]}, '
+                                 f'{kernel_size[ll][0]}, '
+                                 f'{padding[ll][0]}, '
+                                 f'{stride[ll][0]}, '
+                                 f'bias_{ll}, 7,  {7 - output_shift[ll]}, {target}, '
+                                 f'{output_dim[ll][0]}, '
+                                 f'{col_buffer}, NULL);\n')
                 else:
-                    c_file.write(f'  arm_convolve_HWC_q7_basic_nonsquare({source}, '
+                    c_file.write(f'  {fn}({source}, '
                                  f'{in_dim[1]}, {in_dim[0]}, '
                                  f'{in_chan}, weights_{ll}, {output_chan[ll]}, '
                                  f'{kernel_size[ll][1]}, {kernel_size[ll][0]}, '
                                  f'{padding[ll][1]}, {padding[ll][0]}, '
                                  f'{stride[ll][1]}, {stride[ll][0]},\n'
-                                 '                                      '
-                                 f'bias_{ll}, 7, {7 - output_shift[ll]}, {buffer1}, '
+                                 f'{" " * (len(fn) + 3)}'
+                                 f'bias_{ll}, 7, {7 - output_shift[ll]}, {target}, '
                                  f'{output_dim[ll][1]}, {output_dim[ll][0]}, '
-                                 'col_buffer, NULL);\n')
+                                 f'{col_buffer}, NULL);\n')
 
                 assert out_size[0] == output_chan[ll] \
                     and out_size[1] == output_dim[ll][0] and out_size[2] == output_dim[ll][1]
@@ -545,15 +755,14 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 if activation[ll] == op.ACT_RELU:
                     size = output_dim[ll][0] * output_dim[ll][1] * output_chan[ll]
                     if size < 65536:
-                        c_file.write(f'  arm_relu_q7({buffer1}, {size});\n')
+                        c_file.write(f'  arm_relu_q7({target}, {size});\n')
                     else:
-                        c_file.write(f'  arm_relu32_q7({buffer1}, {size});\n')
+                        c_file.write(f'  arm_relu32_q7({target}, {size});\n')
                 elif activation[ll] is not None:  # FIXME: Support abs() activation
                     eprint("CMSIS-NN generator implements ReLU only.")
-                buffer0, buffer1 = buffer1, buffer0
 
             data_buf.append(out_buf.reshape(out_size))
-            c_file.write('\n')
+            c_file.write(f'  CNN_LAYER_DONE({ll});\n\n')
             data_cmsis = data_buf[-1].transpose((1, 2, 0)).flatten()
             if verbose:
                 print('TRANSPOSED (HWC) AND FLATTENED:')
@@ -562,18 +771,20 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
 
         data = data_buf[-1]
 
-        c_file.write(f'  *output = {buffer0};\n'
+        c_file.write(f'  *output = {buf(layer_tensor[-1])};\n'
                      f'  *output_size = {data_cmsis.size};\n\n'
                      '  return 1;\n}\n\n')
 
         c_file.write('int main(void)\n{\n'
-                     '  int i;\n'
+                     '  int i, fail;\n'
                      '  q7_t *output;\n'
                      '  int output_size;\n\n'
-                     f'  cnn_run(input_data, {input_size}, &output, &output_size);\n\n')
+                     '  for (i = 0; i < CNN_RUNS; i++)\n'
+                     f'    cnn_run(input_data, {input_size}, &output, &output_size);\n\n')
 
         toplevel.c_define(sampledata_header, data_cmsis, 'OUTPUT_DATA', '%d', 16)
-        c_file.write('  if (memcmp(output_data, output, output_size) == 0)\n'
+        c_file.write('  fail = memcmp(output_data, output, output_size) != 0;\n'
+                     '  if (!fail)\n'
                      '    printf("*** PASS ***\\n\\n");\n'
                      '  else\n'
                      '    printf("!!! FAIL !!!\\n\\n");\n\n')
@@ -587,7 +798,8 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                      '  printf("\\n");\n'
                      '\n')
 
-        c_file.write('  return 0;\n}\n\n')
+        c_file.write(f'  CNN_REPORT({layers});\n\n'
+                     '  return fail;\n}\n\n')
 
     # Close header files
     sampledata_header.close()
@@ -9,14 +9,16 @@ Command line parser for Tornado CNN
 """
 import argparse
 
-from . import camera
+from . import camera, trace
 from .devices import device
 from .eprint import wprint
 
 
-def get_parser():
+def get_parser(
+        argv=None,
+):
     """
-    Return an argparse parser.
+    Return the parsed command line arguments, from `argv` (default: `sys.argv`).
     """
 
     parser = argparse.ArgumentParser(description="MAX7800X CNN Generator")
@@ -59,6 +61,13 @@ def get_parser():
                        help="YAML configuration file containing layer configuration")
     group.add_argument('--checkpoint-file', metavar='S',
                        help="checkpoint file containing quantized weights")
+    group.add_argument('--save-config', metavar='S',
+                       help="save the YAML configuration including all processor maps, "
+                            "such as automatically allocated maps, to file S")
+    group.add_argument('--check-only', action='store_true', default=False,
+                       help="check the configuration and the resources it needs from the "
+                            "configuration and weight shapes, report all violations, "
+                            "and do not generate any code")
     group.add_argument('--board-name', metavar='S', default='EvKit_V1',
                        help="set board name (default: EvKit_V1)")
     group.add_argument('--display-checkpoint', action='store_true', default=False,
@@ -76,10 +85,23 @@ def get_parser():
                        help="use memcpy() to load weights in order to save code space")
     group.add_argument('--mexpress', action='store_true', default=False,
                        help="use express kernel loading (default: false)")
+    group.add_argument('--dma', choices=['poll', 'interrupt'], default=None,
+                       help="use DMA to load the kernels and the input, and wait for each "
+                            "transfer by polling or by sleeping until the DMA interrupt "
+                            "(default: load using the CPU)")
     group.add_argument('--mlator', action='store_true', default=False,
                        help="use hardware to swap output bytes (default: false)")
     group.add_argument('--softmax', action='store_true', default=False,
                        help="add software softmax function (default: false)")
+    group.add_argument('--unload-channels', metavar='LIST',
+                       help="comma-separated list of the output channels or ranges to unload "
+                            "and check (default: all)")
+    group.add_argument('--unload-window', metavar='LIST',
+                       help="output window to unload and check as row,col[,height,width] "
+                            "(default: all)")
+    group.add_argument('--top-k', type=int, metavar='N', default=0,
+                       help="add a function that returns the N largest outputs and their "
+                            "indices, reading them directly from the accelerator (default: 0)")
     group.add_argument('--unload', action='store_true', default=None,
                        help="legacy argument - ignored")
     group.add_argument('--boost', metavar='S', default=None,
@@ -94,6 +116,20 @@ def get_parser():
                         help="use timer to time the inference (default: off, supply timer number)")
     mgroup.add_argument('--energy', action='store_true', default=False,
                         help="insert instrumentation code for energy measurement")
+    group.add_argument('--fps-frames', type=int, metavar='N', default=0,
+                       help="after the checked inference, run N inferences back to back, "
+                            "receiving the next input and unloading the results while the CNN "
+                            "is busy, and print the frames per second (requires --timer)")
+    group.add_argument('--test-samples', metavar='S',
+                       help="add a test loop that runs the sample inputs in S (a .npy file "
+                            "with several inputs or a directory of .npy files) and checks "
+                            "their simulated outputs (requires --timer)")
+    group.add_argument('--test-argmax', action='store_true', default=False,
+                       help="check only the index of the largest output of each of the "
+                            "--test-samples")
+    group.add_argument('--host-model', action='store_true', default=False,
+                       help="add a model of the accelerator to host/ so the generated code "
+                            "builds and checks itself on a Linux x86-64 host")
 
     # File names
     group = parser.add_argument_group('File names')
@@ -108,6 +144,9 @@ def get_parser():
                        help="sample data header file name (default: 'sampledata.h')")
     group.add_argument('--sample-input', metavar='S', default=None,
                        help="sample data input file name (default: 'tests/sample_dataset.npy')")
+    group.add_argument('--energy-json', metavar='S', default=None,
+                       help="write the energy estimate to this JSON file in the test directory "
+                            "(default: None)")
 
     # Streaming and FIFOs
     group = parser.add_argument_group('Streaming and FIFOs')
@@ -161,6 +200,18 @@ def get_parser():
                        help="debug mode (default: false)")
     group.add_argument('--debug-computation', action='store_true', default=False,
                        help="debug computation -- SLOW (default: false)")
+    group.add_argument('--debug-computation-format', choices=['csv', 'binary'], default='csv',
+                       help="computation log format; use izer/trace.py to convert binary "
+                            "logs to CSV (default: csv)")
+    group.add_argument('--debug-computation-layers', metavar='LIST',
+                       help="comma-separated list of layers or ranges to log (implies "
+                            "--debug-computation; default: all)")
+    group.add_argument('--debug-computation-channels', metavar='LIST',
+                       help="comma-separated list of output channels or ranges to log "
+                            "(implies --debug-computation; default: all)")
+    group.add_argument('--debug-computation-window', metavar='LIST',
+                       help="output window to log as row,col[,height,width] "
+                            "(implies --debug-computation; default: all)")
     group.add_argument('--debug-latency', action='store_true', default=False,
                        help="debug latency calculations (default: false)")
     group.add_argument('--no-error-stop', action='store_true', default=False,
@@ -194,6 +245,20 @@ def get_parser():
                        help="set ext_rdy bit (default: false)")
     group.add_argument('--weight-start', type=int, metavar='N', default=0,
                        help="specify start offset for weights (debug, default: 0)")
+    group.add_argument('--kernel-placement', choices=['greedy', 'optimized'], default='greedy',
+                       help="place kernels in layer order, or reorder them to reduce unused "
+                            "kernel memory (default: greedy)")
+    group.add_argument('--deduplicate-kernels', action='store_true', default=False,
+                       help="let layers with identical kernels share kernel memory "
+                            "(default: false)")
+    group.add_argument('--skip-zero-kernels', action='store_true', default=False,
+                       help="do not load all-zero kernels, requires --zero-sram (default: false)")
+    group.add_argument('--kernel-reserved', metavar='LIST',
+                       help="comma-separated list of the kernel memory columns at the start of "
+                            "each processor that are used by other networks (default: none)")
+    group.add_argument('--bias-reserved', metavar='LIST',
+                       help="comma-separated list of the bias memory bytes at the start of each "
+                            "group that are used by other networks (default: none)")
 
     # RTL sim
     group = parser.add_argument_group('RTL simulation')
@@ -207,6 +272,9 @@ def get_parser():
                             f"(default: {camera.RETRACE})")
     group.add_argument('--input-csv-period', metavar='N', default=80,
                        help="period for .csv input data (default: 80)")
+    group.add_argument('--input-csv-frames', metavar='S',
+                       help="additional images that the camera sim sends before the sample "
+                            "input, as an NCHW .npy file or a directory of .npy files")
     group.add_argument('--input-sync', action='store_true', default=False,
                        help="use synchronous camera input (default: false)")
     group.add_argument('--input-fifo', action='store_true', default=False,
@@ -309,7 +377,7 @@ def get_parser():
     group.add_argument('--synthesize-input', type=int, metavar='N',
                        help="synthesize input data from first 8 lines (default: false)")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.rtl_preload:
         args.embedded_code = False
@@ -328,6 +396,19 @@ def get_parser():
             raise ValueError('ERROR: Argument `--no-bias` must be a comma-separated '
                              'list of integers only') from exc
 
+    for name in ('kernel_reserved', 'bias_reserved'):
+        if getattr(args, name) is not None:
+            try:
+                setattr(args, name, [int(s) for s in getattr(args, name).split(',')])
+            except ValueError as exc:
+                raise ValueError(f'ERROR: Argument `--{name.replace("_", "-")}` must be a '
+                                 'comma-separated list of integers only') from exc
+
+    if args.input_csv_frames is not None and args.input_csv is None:
+        raise ValueError('ERROR: Argument `--input-csv-frames` requires `--input-csv`')
+    if args.test_argmax and args.test_samples is None:
+        raise ValueError('ERROR: Argument `--test-argmax` requires `--test-samples`')
+
     if args.clock_trim is not None:
         clock_trim_error = False
         try:
@@ -358,6 +439,24 @@ def get_parser():
             raise ValueError('ERROR: Argument `--streaming-layers` must be a comma-separated '
                              'list of integers only') from exc
 
+    try:
+        args.debug_computation_layers = trace.parse_list(args.debug_computation_layers)
+        args.debug_computation_channels = trace.parse_list(args.debug_computation_channels)
+    except ValueError as exc:
+        raise ValueError('ERROR: Arguments `--debug-computation-layers` and '
+                         '`--debug-computation-channels` must be comma-separated lists of '
+                         'integers or integer ranges') from exc
+    args.debug_computation_window = trace.parse_window(args.debug_computation_window)
+    try:
+        args.unload_channels = trace.parse_list(args.unload_channels)
+    except ValueError as exc:
+        raise ValueError('ERROR: Argument `--unload-channels` must be a comma-separated list of '
+                         'integers or integer ranges') from exc
+    args.unload_window = trace.parse_window(args.unload_window)
+    if args.debug_computation_layers is not None or args.debug_computation_channels is not None \
+       or args.debug_computation_window is not None:
+        args.debug_computation = True
+
     if args.top_level == 'None':
         args.top_level = None
 
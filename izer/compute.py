@@ -15,10 +15,35 @@ import os
 import numpy as np
 from numpy.lib.stride_tricks import as_strided
 
-from . import op, stats
+from . import op, stats, trace
 from .eprint import eprint
 
 debug_log = None
+debug_trace = None
+debug_active = True
+
+trace_format = 'csv'  # 'csv' or 'binary'
+trace_layers = None  # Set of layers to trace, None for all
+trace_channels = None  # Set of output channels to trace, None for all
+trace_window = None  # Output window (row_start, col_start, row_end, col_end), None for all
+
+
+def debug_configure(
+        fmt='csv',
+        layers=None,
+        channels=None,
+        window=None,
+):
+    """
+    Configure the computation log format `fmt` ('csv' or 'binary') and optionally restrict it
+    to `layers`, output `channels` and the output `window` (see `trace.select()`).
+    """
+    global trace_format, trace_layers  # pylint: disable=global-statement
+    global trace_channels, trace_window  # pylint: disable=global-statement
+    trace_format = fmt
+    trace_layers = layers
+    trace_channels = channels
+    trace_window = window
 
 
 def debug_open(
@@ -30,27 +55,57 @@ def debug_open(
     """
     Create debug log for a layer
     """
-    global debug_log  # pylint: disable=global-statement
-    debug_log = open(os.path.join(base_directory, test_name,
-                                  f'compute-{layer}.csv'), 'w')
+    global debug_log, debug_trace, debug_active  # pylint: disable=global-statement
+    debug_active = trace_layers is None or layer in trace_layers
+    if not debug_active:
+        return
+    if trace_format == 'binary':
+        debug_trace = trace.TraceWriter(os.path.join(base_directory, test_name,
+                                                     f'compute-{layer}.trace'))
+    else:
+        debug_log = open(os.path.join(base_directory, test_name,
+                                      f'compute-{layer}.csv'), 'w')
+
+
+def debug_match(
+        k,
+        row=None,
+        col=None,
+):
+    """
+    Return whether output channel `k` (at output position `row`, `col`, if given) should be
+    logged
+    """
+    return debug_active \
+        and (trace_channels is None or k in trace_channels) \
+        and (trace_window is None or row is None
+             or trace_window[0] <= row <= trace_window[2]
+             and trace_window[1] <= col <= trace_window[3])
 
 
-def debug_print(
-        t,
+def debug_record(
+        r,
 ):
     """
-    Print to the compute debug log
+    Add the `trace.RECORD` tuple `r` to the compute debug log, if one is open for the layer
     """
-    global debug_log  # pylint: disable=global-statement
-    print(t, file=debug_log)
+    if debug_trace is not None:
+        debug_trace.append(r)
+    elif debug_log is not None:
+        print(trace.format_record(r), file=debug_log)
 
 
 def debug_close():
     """
     Close the compute debug log
     """
-    global debug_log  # pylint: disable=global-statement
-    debug_log.close()
+    global debug_log, debug_trace  # pylint: disable=global-statement
+    if debug_trace is not None:
+        debug_trace.close()
+        debug_trace = None
+    if debug_log is not None:
+        debug_log.close()
+        debug_log = None
 
 
 def conv2d(
@@ -80,17 +135,26 @@ def conv2d(
     if debug:
         # Slow route using pure Python
         ref = np.full(shape=output_size, fill_value=np.nan, dtype=np.int64)
-        debug_print('k,c,x,y,weight,data,prod,cacc,acc')
+        traced = np.zeros(shape=output_size, dtype=bool)
+        true_macc = 0
+        if debug_active:
+            debug_record((trace.CONV2D, trace.HEADER, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
 
         for k in range(out_channels):
+            if not debug_match(k):
+                continue
             for y in range(-pad[0],
                            input_size[1] - dilation[0] * (kernel_size[0] - 1) + pad[0],
                            stride[0]):
                 for y_frac in range(fractional_stride[0]):
+                    row = ((y + pad[0])*fractional_stride[0] + y_frac) // stride[0]
                     for x in range(-pad[1],
                                    input_size[2] - dilation[1] * (kernel_size[1] - 1) + pad[1],
                                    stride[1]):
                         for x_frac in range(fractional_stride[1]):
+                            col = ((x + pad[1])*fractional_stride[1] + x_frac) // stride[1]
+                            if not debug_match(k, row, col):
+                                continue
                             val = np.int64(0)
                             c = 0
                             while True:
@@ -109,11 +173,12 @@ def conv2d(
                                             prod = weight[k][c][h][w] * data[dc][yd][xd]
                                             sval += prod
                                             val += prod
-                                            stats.true_macc += 1
-                                            debug_print(
-                                                f'{k},{c},{x},{y},{weight[k][c][h][w]},'
-                                                f'{data[dc][yd][xd]},{prod},{sval},{val}'
-                                            )
+                                            true_macc += 1
+                                            debug_record((
+                                                trace.CONV2D, trace.MAC, row, col, k, c, x, y,
+                                                0, weight[k][c][h][w], data[dc][yd][xd], prod,
+                                                sval, val,
+                                            ))
                                 c += 16
                                 if c >= in_channels // groups:
                                     c = (c + 1) % 16
@@ -122,15 +187,15 @@ def conv2d(
 
                             if bias is not None:
                                 val += bias[k]
-                                debug_print(
-                                    f'     adding bias: {bias[k]} -> result: {val}'
-                                )
+                                debug_record((
+                                    trace.CONV2D, trace.BIAS, row, col, k, 0, x, y, 0,
+                                    bias[k], 0, 0, 0, val,
+                                ))
 
-                            ref[k][
-                                ((y + pad[0])*fractional_stride[0] + y_frac) // stride[0]
-                            ][
-                                ((x + pad[1])*fractional_stride[1] + x_frac) // stride[1]
-                            ] = val
+                            ref[k][row][col] = val
+                            traced[k][row][col] = True
+
+        stats.account(true_macc=true_macc)
 
     # Fast computation using NumPy
 
@@ -183,7 +248,7 @@ def conv2d(
             output[k] += bias[k]
 
     if debug:
-        if not (ref == output).all():
+        if not (ref[traced] == output[traced]).all():
             eprint('NumPy <-> Python mismatch in compute.conv2d')
 
     assert output.shape == tuple(output_size), f'Shape mismatch: {output.shape} vs {output_size}'
@@ -217,13 +282,15 @@ def conv1d(
 
     output = np.full(shape=(output_size[0], output_size[1]),
                      fill_value=np.nan, dtype=np.int64)
+    true_macc = 0
 
     # Compute 1D convolution
-    if debug:
-        debug_print('k,c,x,src_offs,wt_offs,weight,data,acc')
+    if debug and debug_active:
+        debug_record((trace.CONV1D, trace.HEADER, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
     for k in range(out_channels):
         out_offs = 0
         for x in range(-pad, input_size[1] - dilation * (kernel_size - 1) + pad, stride):
+            log = debug and debug_match(k, 0, out_offs)
             val = np.int64(0)
             for c in range(in_channels // groups):
                 dc = c if groups == 1 else c + k * (in_channels // groups)
@@ -231,22 +298,25 @@ def conv1d(
                     src_offs = x + w * dilation
                     if 0 <= src_offs < input_size[1]:
                         val += weight[k][c][w] * data[dc][src_offs]
-                        stats.true_macc += 1
-                        if debug:
-                            debug_print(
-                                f'{k},{c},{x},{src_offs},{w},{weight[k][c][w]},'
-                                f'{data[dc][src_offs]},{val}'
-                            )
+                        true_macc += 1
+                        if log:
+                            debug_record((
+                                trace.CONV1D, trace.MAC, 0, out_offs, k, c, x, src_offs, w,
+                                weight[k][c][w], data[dc][src_offs], 0, 0, val,
+                            ))
 
             if bias is not None:
                 val += bias[k]
-                if debug:
-                    debug_print(
-                        f'+bias {bias[k]} --> output[{k}][{out_offs}] = {val}',
-                    )
+                if log:
+                    debug_record((
+                        trace.CONV1D, trace.BIAS, 0, out_offs, k, 0, x, 0, 0,
+                        bias[k], 0, 0, 0, val,
+                    ))
             output[k][out_offs] = val
             out_offs += 1
 
+    stats.account(true_macc=true_macc)
+
     return output.reshape((output_size))
 
 
@@ -264,21 +334,26 @@ def linear(
     output = np.empty(out_features, dtype=np.int64)
 
     for w in range(out_features):
+        log = debug and debug_match(w)
         val = np.int64(0)
         for n in range(in_features):
             val += data[n] * weight[w][n]
-            stats.true_sw_macc += 1
-            if debug:
-                debug_print(
-                    f'w={w}, n={n}, weight={weight[w][n]}, data={data[n]} '
-                    f'-> accumulator = {val} '
-                )
+            if log:
+                debug_record((
+                    trace.LINEAR, trace.MAC, 0, 0, w, n, 0, 0, 0,
+                    weight[w][n], data[n], 0, 0, val,
+                ))
         if bias is not None:
             val += bias[w]
-            if debug:
-                debug_print(f'+bias {bias[w]} --> output[{w}] = {val}')
+            if log:
+                debug_record((
+                    trace.LINEAR, trace.BIAS, 0, 0, w, 0, 0, 0, 0,
+                    bias[w], 0, 0, 0, val,
+                ))
         output[w] = val
 
+    stats.account(true_sw_macc=in_features * out_features)
+
     return output
 
 
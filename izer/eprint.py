@@ -7,10 +7,23 @@
 """
 Print error message to stderr, and stdout as well if needed
 """
+import contextvars
 import sys
 
 import colorama
 
+_errors = contextvars.ContextVar('errors', default=None)
+
+
+def collect():
+    """
+    Collect error messages in the current context instead of exiting on the first error.
+    Returns the list that receives the messages.
+    """
+    errors = []
+    _errors.set(errors)
+    return errors
+
 
 def eprint(*args, error=True, prefix=True, exit_code=1, **kwargs):
     """
@@ -34,6 +47,10 @@ def eprint(*args, error=True, prefix=True, exit_code=1, **kwargs):
         print(*args, file=sys.stderr, **kwargs)
 
     if error and exit_code is not None:
+        errors = _errors.get()
+        if errors is not None:
+            errors.append(' '.join(str(a) for a in args))
+            return
         sys.exit(error)
 
 
@@ -0,0 +1,258 @@
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Design-space exploration: score variants of a network configuration and keep the Pareto front
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import copy
+import io
+import itertools
+import os
+import tempfile
+
+import yaml
+
+from . import allocate, commandline, izer, yamlcfg
+from . import tornadocnn as tc
+from .eprint import collect, wprint
+
+# Values that are minimized, as returned by `izer.generate()` with `--check-only`
+OBJECTIVES = ('time_us', 'weight_bytes', 'bias_bytes', 'data_bytes', 'groups')
+KNOBS = ('processors', 'offsets', 'streaming', 'output_width', 'pool_first', 'calcx4', 'pipeline')
+
+
+def variants(
+        cfg,
+        params,
+        args,
+        vary=KNOBS,
+        max_streaming=4,
+):
+    """
+    Return the variants of the YAML configuration `cfg` (with the parsed settings `params`)
+    for the command line `args`, changing the settings named in `vary`. Each variant is a tuple
+    of a dictionary with the chosen settings, the changed configuration, and the additional
+    command line arguments. Up to `max_streaming` layers are tried for streaming.
+    """
+    numbers = allocate.layer_numbers(cfg)
+    layers = len(numbers)
+    next_sequence = params['next_sequence'][:layers]
+    fifo = args.fifo or args.fast_fifo or args.fast_fifo_quad
+
+    choices = {}
+    if 'processors' in vary \
+       and any('processors' in e or 'output_processors' in e for e in cfg['layers']):
+        choices['processors'] = ['configured', 'auto']
+    if 'offsets' in vary and any('out_offset' in e or 'in_offset' in e for e in cfg['layers']):
+        choices['offsets'] = ['configured', 'planned']
+    if 'streaming' in vary:
+        # Streaming must start in the first layer and continue in the next layers
+        n = 0
+        while n < min(max_streaming, tc.dev.MAX_STREAM_LAYERS, layers - 1) \
+                and next_sequence[n] in (None, n + 1):
+            n += 1
+        if n > 0:
+            choices['streaming'] = list(range(n + 1))
+    final = [ll for ll in range(layers) if next_sequence[ll] == -1] or [layers - 1]
+    if 'output_width' in vary and all(params['activation'][ll] is None for ll in final):
+        choices['output_width'] = [8, 32]
+    pool_first = [ll for ll in range(layers) if params['operands'][ll] > 1
+                  and params['pool'][ll][0] * params['pool'][ll][1] > 1]
+    if 'pool_first' in vary and pool_first:
+        choices['pool_first'] = list(itertools.product([True, False], repeat=len(pool_first)))
+    if 'calcx4' in vary and tc.dev.SUPPORT_CALCX4 and not args.calcx4 \
+       and not args.embedded_code and not args.mexpress:
+        choices['calcx4'] = [False, True]
+    if 'pipeline' in vary and tc.dev.SUPPORT_PIPELINE and args.pipeline is None:
+        choices['pipeline'] = [True, False]
+
+    result = []
+    for values in itertools.product(*choices.values()):
+        settings = dict(zip(choices, values))
+        c = copy.deepcopy(cfg)
+        entry = dict(zip(numbers, c['layers']))
+        argv = []
+        if settings.get('processors') == 'auto':
+            for e in c['layers']:
+                e.pop('processors', None)
+                e.pop('output_processors', None)
+        if settings.get('offsets') == 'planned':
+            for e in c['layers']:
+                e.pop('in_offset', None)
+                e.pop('out_offset', None)
+        if 'streaming' in settings:
+            for ll, e in entry.items():
+                if ll < settings['streaming']:
+                    e['streaming'] = True
+                else:
+                    e.pop('streaming', None)
+            if settings['streaming'] > 0 and not fifo:
+                argv.append('--fifo')
+        if 'output_width' in settings:
+            for ll in final:
+                entry[ll]['output_width'] = settings['output_width']
+        if 'pool_first' in settings:
+            for ll, first in zip(pool_first, settings['pool_first']):
+                entry[ll]['pool_first'] = first
+        if settings.get('calcx4'):
+            argv.append('--calcx4')
+        if 'pipeline' in settings:
+            argv.append('--pipeline' if settings['pipeline'] else '--no-pipeline')
+        result.append((settings, c, argv))
+
+    return result
+
+
+def score(
+        job,
+):
+    """
+    Check one variant in a worker process. `job` holds the configuration and the command line
+    arguments. Returns the estimated cycles and resource use (`None` when the variant does not
+    fit), the list of errors, and the configuration with all processor maps and offsets filled
+    in.
+    """
+    cfg, argv = job
+    with tempfile.TemporaryDirectory() as d:
+        config_file = os.path.join(d, 'in.yaml')
+        saved_file = os.path.join(d, 'out.yaml')
+        with open(config_file, 'w') as f:
+            yaml.safe_dump(cfg, f, sort_keys=False)
+
+        result, saved = None, None
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            errors = collect()
+            try:
+                result = izer.generate(commandline.get_parser(
+                    argv + ['--check-only', '--config-file', config_file,
+                            '--save-config', saved_file, '--test-dir', d]
+                ))
+            except (Exception, SystemExit) as exc:  # pylint: disable=broad-except
+                if not errors:
+                    errors.append(f'{type(exc).__name__}: {exc}')
+        if errors or result is None:
+            return None, errors, None
+        with open(saved_file) as f:
+            saved = f.read()
+
+    return result, errors, saved
+
+
+def pareto(
+        scores,
+):
+    """
+    Return the indices of the `scores` (tuples of values to minimize) that are not dominated
+    by any other score. Of several equal scores, only the first is returned.
+    """
+    front = []
+    for i, s in enumerate(scores):
+        if any(o != s and all(a <= b for a, b in zip(o, s)) for o in scores):
+            continue
+        if any(scores[j] == s for j in front):
+            continue
+        front.append(i)
+    return front
+
+
+def describe(
+        settings,
+):
+    """
+    Return a short description of the variant `settings`.
+    """
+    return ', '.join(f'{k}={v}' for k, v in settings.items()) or 'as configured'
+
+
+def main(
+        argv=None,
+):
+    """
+    Command line wrapper. All arguments that are not used by the explorer are passed to the
+    network loader.
+    """
+    parser = argparse.ArgumentParser(
+        description="MAX7800X CNN design-space explorer. Arguments that are not listed here "
+                    "are passed to the network loader.",
+    )
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), metavar='N',
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--output-dir', metavar='S',
+                        help="directory for the Pareto-optimal configurations "
+                             "(default: test-dir/prefix-pareto)")
+    parser.add_argument('--vary', default=','.join(k for k in KNOBS if k != 'pool_first'),
+                        metavar='LIST',
+                        help="comma-separated list of settings to vary, from "
+                             f"{', '.join(KNOBS)} (default: all but pool_first)")
+    parser.add_argument('--max-streaming', type=int, default=4, metavar='N',
+                        help="maximum number of streaming layers to try (default: 4)")
+    parser.add_argument('--max-variants', type=int, default=256, metavar='N',
+                        help="maximum number of variants to score (default: 256)")
+    explore_args, loader_argv = parser.parse_known_args(argv)
+    vary = explore_args.vary.split(',')
+    for k in vary:
+        if k not in KNOBS:
+            parser.error(f'unknown setting `{k}` in --vary')
+
+    args = commandline.get_parser(loader_argv)
+    if args.save_config is not None or args.check_only:
+        wprint('`--save-config` and `--check-only` are ignored when exploring.')
+    output_dir = explore_args.output_dir \
+        or os.path.join(args.test_dir, f'{args.prefix}-pareto')
+
+    with tc.using(tc.get_device(args.device)):
+        cfg, _, params = yamlcfg.parse(args.config_file)
+        candidates = variants(cfg, params, args, vary, explore_args.max_streaming)
+    if len(candidates) > explore_args.max_variants:
+        wprint(f'Scoring only {explore_args.max_variants} of {len(candidates)} variants.')
+        candidates = candidates[:explore_args.max_variants]
+
+    jobs = [(c, loader_argv + argv) for _, c, argv in candidates]
+    print(f'Scoring {len(jobs)} variants using {explore_args.jobs} worker processes...')
+    if explore_args.jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=explore_args.jobs) as executor:
+            results = list(executor.map(score, jobs))
+    else:
+        results = [score(job) for job in jobs]
+
+    feasible = [i for i, (result, _, _) in enumerate(results) if result is not None]
+    for i, (_, errors, _) in enumerate(results):
+        if errors:
+            print(f'Variant {i} ({describe(candidates[i][0])}): {errors[0]}')
+    if not feasible:
+        wprint('None of the variants fit.')
+        return []
+    scores = [tuple(results[i][0][k] or 0 for k in OBJECTIVES) for i in feasible]
+    front = sorted((feasible[j] for j in pareto(scores)), key=lambda i: results[i][0]['time_us'])
+
+    os.makedirs(output_dir, exist_ok=True)
+    print(f'\n{len(front)} Pareto-optimal of {len(feasible)} feasible variants:')
+    print('File                       Time [us]     Cycles  Weights    Bias    Data  Groups  '
+          'Arguments / Settings')
+    filenames = []
+    for rank, i in enumerate(front):
+        settings, _, argv = candidates[i]
+        result, _, saved = results[i]
+        filename = os.path.join(output_dir, f'{args.prefix}-{rank}.yaml')
+        with open(filename, 'w') as f:
+            f.write(f'# Pareto-optimal variant {i} of {len(candidates)}: {describe(settings)}\n'
+                    f'# Estimated {result["cycles"]:,} cycles ({result["time_us"]:,.1f} us), '
+                    f'{result["weight_bytes"]:,} bytes of weights, {result["bias_bytes"]:,} '
+                    f'bytes of bias, {result["data_bytes"] or 0:,} bytes of data per memory '
+                    f'instance, {result["groups"]} groups\n'
+                    f'# Additional network loader arguments: {" ".join(argv) or "none"}\n')
+            f.write(saved)
+        filenames.append(filename)
+        print(f'{os.path.basename(filename):<24}{result["time_us"]:12,.1f}'
+              f'{result["cycles"]:11,}{result["weight_bytes"]:9,}{result["bias_bytes"]:8,}'
+              f'{result["data_bytes"] or 0:8,}{result["groups"]:8}  '
+              f'{" ".join(argv + [describe(settings)])}')
+    print(f'\nWrote the Pareto front to {output_dir}.')
+
+    return filenames
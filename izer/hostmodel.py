@@ -0,0 +1,141 @@
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Describe the device and the expected configuration for the host model of the accelerator
+(--host-model)
+"""
+import os
+
+import numpy as np
+
+from . import tornadocnn as tc
+
+NO_REGISTER = -1  # Register index of a layer register that the device does not have
+
+# Layer registers the model decodes
+LAYER_REGISTERS = ('NXTLYR', 'RCNT', 'CCNT', 'ONED', 'PRCNT', 'PCCNT', 'STRIDE', 'WPTR_BASE',
+                   'WPTR_CHOFFS', 'RPTR_BASE', 'LCTL', 'LCTL2', 'MCNT', 'MCNT1', 'MCNT2', 'TPTR',
+                   'ENA', 'POST', 'STREAM1', 'STREAM2', 'FMAX')
+
+# Fields of the layer registers that differ between devices
+FIELDS = ('PAD_CNT_OFFS', 'PAD_ENA_OFFS', 'CNT_DIFF_OFFS', 'MAX_CNT_BITS', 'MP_STRIDE_OFFS',
+          'XPCH_MAX_OFFS', 'WRITE_PTR_SHIFT', 'MCNT_SAD_OFFS', 'MCNT_MAX_OFFS',
+          'RPRIME_MAX_OFFS', 'CPRIME_MAX_OFFS')
+
+
+def constants(
+        dev,
+):
+    """
+    Return the names and values of the constants of device `dev` that the host model needs:
+    the memory map, the address and field layout of the layer registers, and the global
+    registers. Layer registers and fields the device does not have are `NO_REGISTER`.
+    """
+    lreg_base = dev.C_CNN_BASE + dev.C_CNN * 4
+    if hasattr(dev, 'LREG_OFFS'):
+        reg_step, layer_step = 4, dev.LREG_OFFS
+    else:
+        reg_step, layer_step = 4 * dev.MAX_LAYERS, 4
+
+    values = [
+        ('APB_BASE', dev.APB_BASE),
+        ('GROUP_OFFS', dev.C_GROUP_OFFS),
+        ('NUM_GROUPS', dev.P_NUMGROUPS),
+        ('NUM_PROCS', dev.P_NUMPRO),
+        ('CNN_BASE', dev.C_CNN_BASE),
+        ('LREG_BASE', lreg_base),
+        ('LREG_REG_STEP', reg_step),
+        ('LREG_LAYER_STEP', layer_step),
+        ('MAX_LREG', dev.MAX_LREG),
+        ('MAX_LAYERS', dev.MAX_LAYERS),
+        ('BRAM_BASE', dev.C_BRAM_BASE),
+        ('BRAM_SIZE', dev.BIAS_SIZE * 4),
+        ('TRAM_BASE', dev.C_TRAM_BASE),
+        ('TRAM_SIZE', dev.P_NUMPRO * dev.TRAM_OFFS * 4),
+        ('MRAM_BASE', dev.C_MRAM_BASE),
+        ('MRAM_PROC_SIZE', dev.MASK_OFFS * 16),
+        ('SRAM_BASE', dev.C_SRAM_BASE),
+        ('SRAM_SIZE', dev.P_NUMPRO * dev.INSTANCE_SIZE * 4),
+        ('INSTANCE_SIZE', dev.INSTANCE_SIZE),
+        ('FIFO_BASE', dev.C_FIFO_BASE),
+        ('FIFO_REG', dev.C_FIFO_BASE + dev.FIFO_REG * 4),
+        ('REG_CTL', dev.REG_CTL * 4),
+        ('REG_LCNT_MAX', dev.REG_LCNT_MAX * 4),
+        ('REG_SRAM_TEST', dev.REG_SRAM_TEST * 4),
+        ('REG_IFRM', dev.REG_IFRM * 4),
+        ('BIAS_DIV', dev.BIAS_DIV),
+        ('STREAM_BIAS_SKIP', 0 if dev.SUPPORT_STREAM_BIAS else 1),
+    ]
+    values += [(f'LREG_{name}', getattr(dev, f'LREG_{name}', NO_REGISTER))
+               for name in LAYER_REGISTERS]
+    values += [(name, getattr(dev, name, NO_REGISTER)) for name in FIELDS]
+    return values
+
+
+def c_array(
+        f,
+        ctype,
+        name,
+        values,
+        fmt='{}',
+        per_line=16,
+):
+    """
+    Write the C array `name` of type `ctype` with `values` to file `f`. Values that are
+    lists are written as structures.
+    """
+    if len(values) > 0 and isinstance(values[0], (list, tuple)):
+        values = ['{' + ', '.join(fmt.format(int(e)) for e in v) + '}' for v in values]
+    else:
+        values = [fmt.format(int(e)) for e in np.asarray(values).reshape(-1)]
+    f.write(f'static const {ctype} {name}[] = {{')
+    for i in range(0, len(values), per_line):
+        f.write('\n  ' + ', '.join(values[i:i+per_line]) + ',')
+    f.write('\n};\n\n')
+
+
+def write(
+        directory,
+        apb,
+):
+    """
+    Write `model.h` and `expected.h` to `directory`. `model.h` describes the device. The
+    model decodes the layers from the registers and memories the generated code loads.
+    `expected.h` lists the layer registers, kernels and bias values that `apb` expects the
+    generated code to load, which the model checks after running the network.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'model.h'), mode='w') as f:
+        f.write('// Device description for the host model, created by ai8xize.py\n'
+                '// DO NOT EDIT - regenerate this file instead!\n\n'
+                '#ifndef MODEL_H\n#define MODEL_H\n\n')
+        for name, val in constants(tc.dev):
+            f.write(f'#define MODEL_{name} ' + (f'0x{val:x}\n' if val >= 0 else f'({val})\n'))
+        f.write('#define MODEL_SIZE (MODEL_SRAM_BASE + (MODEL_NUM_GROUPS - 1) * MODEL_GROUP_OFFS'
+                ' + MODEL_SRAM_SIZE)\n\n#endif\n')
+
+    with open(os.path.join(directory, 'expected.h'), mode='w') as f:
+        f.write('// Configuration that ai8xize.py expects the generated code to load, created by '
+                'ai8xize.py\n'
+                '// DO NOT EDIT - regenerate this file instead!\n\n')
+        regs = sorted(apb.layer_regs.items())
+        c_array(f, 'model_reg_t', 'model_regs', regs or [(0xffffffff, 0)], '0x{:08x}', 4)
+        f.write(f'#define MODEL_REGS {len(regs)}\n\n')
+
+        cols, kernels = [], []
+        if apb.kernel_image is not None:
+            used, kernel_data = apb.kernel_image
+            for p, col in zip(*np.nonzero(used)):
+                cols.append(p << 16 | col)
+                kernels.append(kernel_data[p][col].astype(np.int64) & 0xff)
+        c_array(f, 'uint32_t', 'model_kernel_cols', cols or [0], '0x{:06x}', 8)
+        c_array(f, 'uint8_t', 'model_kernel_data', kernels or [0], '0x{:02x}', 18)
+        f.write(f'#define MODEL_KERNELS {len(cols)}\n\n')
+
+        bias = sorted((apb.bias_image or {}).items())
+        c_array(f, 'model_reg_t', 'model_bias', bias or [(0xffffffff, 0)], '0x{:08x}', 4)
+        f.write(f'#define MODEL_BIAS {len(bias)}\n')
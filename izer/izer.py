@@ -8,14 +8,15 @@
 Embedded network and simulation test generator program for Tornado CNN
 """
 import os
+import sys
 
 import numpy as np
 
-from . import (checkpoint, cmsisnn, commandline, devices, max7800x, onnxcp, op, rtlsim, sampledata,
-               sampleweight, stats)
+from . import (allocate, checkpoint, cmsisnn, commandline, compute, devices, max7800x, onnxcp,
+               op, rtlsim, sampledata, sampleweight, stats)
 from . import tornadocnn as tc
 from . import yamlcfg
-from .eprint import eprint, wprint
+from .eprint import collect, eprint, wprint
 
 
 def main():
@@ -25,24 +26,48 @@ def main():
     np.set_printoptions(threshold=np.inf, linewidth=190)
 
     args = commandline.get_parser()
-
+    if not args.check_only:
+        generate(args)
+        return
+
+    # Report all violations instead of stopping at the first one
+    errors = collect()
+    try:
+        generate(args)
+    except Exception:  # pylint: disable=broad-except
+        if not errors:
+            raise
+        errors.append('Remaining checks skipped.')
+    if errors:
+        eprint(f'{len(errors)} configuration error(s) found.', exit_code=None)
+        sys.exit(1)
+    print('Configuration check passed.')
+
+
+def generate(
+        args,
+):
+    """
+    Create the network code and simulation for the parsed command line `args`.
+    With `--check-only`, return the estimated cycles and resource use instead.
+    """
     # Configure device
-    tc.dev = tc.get_device(args.device)
+    dev = tc.get_device(args.device)
+    stats.new()  # Start with fresh op counters for this run
 
     if args.apb_base:
         apb_base = args.apb_base
     else:
-        apb_base = tc.dev.APB_BASE
+        apb_base = dev.APB_BASE
     if args.max_proc:
-        tc.dev.MAX_PROC = args.max_proc
-        tc.dev.P_NUMPRO = args.max_proc
-        tc.dev.P_NUMGROUPS = 1
+        dev = dev.replace(MAX_PROC=args.max_proc, P_NUMPRO=args.max_proc, P_NUMGROUPS=1)
     if args.ready_sel:
-        tc.dev.READY_SEL = args.ready_sel
+        dev = dev.replace(READY_SEL=args.ready_sel)
     if args.ready_sel_fifo:
-        tc.dev.FIFO_READY_SEL = args.ready_sel_fifo
+        dev = dev.replace(FIFO_READY_SEL=args.ready_sel_fifo)
     if args.ready_sel_aon:
-        tc.dev.AON_READY_SEL = args.ready_sel_aon
+        dev = dev.replace(AON_READY_SEL=args.ready_sel_aon)
+    tc.dev = dev
 
     # Load configuration file
     cfg, cfg_layers, params = yamlcfg.parse(args.config_file)
@@ -122,7 +147,7 @@ def main():
         eprint(f"Number of layers in the YAML configuration file ({cfg_layers}) "
                f"does not match the checkpoint file ({layers}).")
 
-    if any(p < 0 or p > 4*tc.dev.MEM_SIZE for p in params['output_offset']):
+    if any(p is not None and (p < 0 or p > 4*tc.dev.MEM_SIZE) for p in params['output_offset']):
         eprint('Unsupported value for `out_offset` in YAML configuration.')
 
     if any(q != 8 for q in params['bias_quantization']):
@@ -254,6 +279,7 @@ def main():
     # Command line override
     if args.input_offset is not None:
         input_offset[args.start_layer] = args.input_offset
+    conf_input_offset = input_offset.copy()
 
     # Derived configuration options
     pool_average = [bool(x) for x in params['average']]
@@ -266,6 +292,7 @@ def main():
     data = sampledata.get(sampledata_file)
     if np.max(data) > 127 or np.min(data) < -128:
         raise ValueError(f'Input data {sampledata_file} contains values that exceed 8-bit!')
+    sample_ndim = data.ndim
     # Work with 1D input data
     if len(data.shape) < 3:
         data = np.expand_dims(data, axis=2)
@@ -281,6 +308,28 @@ def main():
         data[1] = data[1] & ~0x3
         data[2] = data[2] & ~0x7
 
+    csv_frames = None
+    if args.input_csv_frames is not None:
+        csv_frames = sampledata.get_frames(args.input_csv_frames)
+        if list(csv_frames.shape[1:]) != input_size:
+            raise ValueError(f'Input images {args.input_csv_frames} must have the same shape '
+                             f'as the sample input, {input_size}!')
+        if np.max(csv_frames) > 127 or np.min(csv_frames) < -128:
+            raise ValueError(f'Input images {args.input_csv_frames} contain values that '
+                             'exceed 8-bit!')
+
+    test_samples = None
+    if args.test_samples is not None:
+        test_samples = sampledata.get_frames(args.test_samples, ndim=sample_ndim)
+        if test_samples.ndim < 4:
+            test_samples = np.expand_dims(test_samples, axis=3)
+        if list(test_samples.shape[1:]) != input_size:
+            raise ValueError(f'Test samples {args.test_samples} must have the same shape '
+                             f'as the sample input, {input_size}!')
+        if np.max(test_samples) > 127 or np.min(test_samples) < -128:
+            raise ValueError(f'Test samples {args.test_samples} contain values that '
+                             'exceed 8-bit!')
+
     # Trace output sizes of the network
     auto_input_dim = [None] * layers
     input_dim = [None] * layers
@@ -445,11 +494,133 @@ def main():
         if ll == -1:
             break
 
+    # Allocate processor maps and data memory offsets that were not configured
+    order, sources, concat = allocate.dataflow(
+        layers,
+        args.start_layer,
+        next_sequence,
+        prev_sequence,
+        in_sequences,
+        eltwise,
+    )
+    if tc.dev.USE_PROCESSORS \
+       and any(processor_map[ll] is None for ll in range(args.start_layer, layers)):
+        for ll in range(args.start_layer, layers):
+            if processor_map[ll] is None and ll not in order:
+                eprint(f'Layer {ll} is not part of the layer sequence, so its `processors` '
+                       'cannot be allocated automatically.')
+        processor_map, output_processor_map = allocate.processors(
+            layers,
+            order,
+            sources,
+            concat,
+            processor_map,
+            output_processor_map,
+            input_channels,
+            output_channels,
+            operator,
+            conv_groups,
+            big_data,
+            kernel_size,
+            quantization,
+            flatten,
+            pooled_dim,
+            bypass,
+            streaming,
+            next_sequence,
+            fifo=args.fifo or args.fast_fifo or args.fast_fifo_quad,
+            verbose=args.verbose,
+        )
+    planned_offset = [None] * layers
+    if any(output_offset[ll] is None for ll in order):
+        if tc.dev.USE_PROCESSORS:
+            output_offset, planned_offset = allocate.offsets(
+                layers,
+                order,
+                sources,
+                concat,
+                processor_map,
+                output_processor_map,
+                conf_input_offset,
+                output_offset,
+                input_channels,
+                output_channels,
+                input_dim,
+                output_dim,
+                pooled_dim,
+                kernel_size,
+                padding,
+                pool,
+                pool_stride,
+                stride,
+                big_data,
+                operands,
+                output_width,
+                write_gap,
+                streaming,
+                fifo=args.fifo or args.fast_fifo or args.fast_fifo_quad,
+                increase_start=args.increase_start,
+                verbose=args.verbose,
+            )
+        output_offset = [0 if offs is None else offs for offs in output_offset]
+        for ll in order:
+            if planned_offset[ll] is not None:
+                input_offset[ll] = planned_offset[ll]
+            elif input_offset[ll] is None:
+                input_offset[ll] = output_offset[prev_sequence[ll]]
+    if args.save_config is not None:
+        allocate.save(cfg, args.save_config, processor_map, output_processor_map,
+                      output_offset, planned_offset)
+
+    data_bytes = None
+    if args.check_only and tc.dev.USE_PROCESSORS:
+        buffers = (
+            layers,
+            order,
+            sources,
+            concat,
+            processor_map,
+            output_processor_map,
+            input_offset,
+            output_offset,
+            input_channels,
+            output_channels,
+            input_dim,
+            output_dim,
+            pooled_dim,
+            kernel_size,
+            padding,
+            pool,
+            pool_stride,
+            stride,
+            big_data,
+            operands,
+            output_width,
+            write_gap,
+            streaming,
+        )
+        fifo = args.fifo or args.fast_fifo or args.fast_fifo_quad
+        # Check that outputs do not overwrite data that is still needed
+        for a, b in allocate.overlaps(*buffers, fifo=fifo, increase_start=args.increase_start):
+            names = [' and '.join('the input data' if p == -1 else f'the output of layer {p}'
+                                  for p in block['members']) for block in [a, b]]
+            eprint(f'{names[0].capitalize()} at offset 0x{a["base"]:04x} overlaps {names[1]} at '
+                   f'offset 0x{b["base"]:04x} while both are needed.')
+        data_bytes = allocate.peak(*buffers, fifo=fifo, increase_start=args.increase_start)
+
     if args.riscv and not args.riscv_cache and args.embedded_code:
         eprint("Embedded code on RISC-V requires --riscv-cache.")
 
+    if args.debug_computation:
+        compute.debug_configure(
+            args.debug_computation_format,
+            args.debug_computation_layers,
+            args.debug_computation_channels,
+            args.debug_computation_window,
+        )
+
     if tc.dev.device != devices.CMSISNN:
-        tn = max7800x.create_net(
+        result = max7800x.create_net(
             args.prefix,
             args.verbose,
             args.verbose_all,
@@ -527,6 +698,7 @@ def main():
             ext_rdy=args.ext_rdy,
             stopstart=args.stop_start,
             mexpress=args.mexpress,
+            dma=args.dma,
             riscv=args.riscv,
             riscv_exclusive=args.riscv_exclusive,
             riscv_flash=args.riscv_flash,
@@ -547,6 +719,7 @@ def main():
             input_csv_period=args.input_csv_period,
             input_csv_format=args.input_csv_format,
             input_csv_retrace=args.input_csv_retrace,
+            input_csv_frames=csv_frames,
             input_fifo=args.input_fifo,
             input_sync=args.input_sync,
             sleep=args.deepsleep,
@@ -581,16 +754,36 @@ def main():
             result_output=args.result_output,
             weight_start=args.weight_start,
             wfi=args.wfi,
+            fps_frames=args.fps_frames,
+            unload_channels=args.unload_channels,
+            unload_window=args.unload_window,
+            top_k=args.top_k,
+            test_samples=test_samples,
+            test_argmax=args.test_argmax,
             bypass=bypass,
+            energy_json=args.energy_json,
+            check_only=args.check_only,
+            kernel_placement=args.kernel_placement,
+            kernel_reserved=args.kernel_reserved,
+            bias_reserved=args.bias_reserved,
+            kernel_deduplicate=args.deduplicate_kernels,
+            skip_zero_kernels=args.skip_zero_kernels,
+            host_model=args.host_model,
+            dev=dev,
         )
+        if args.check_only:
+            result['data_bytes'] = data_bytes
+            return result
         if not args.embedded_code and args.autogen.lower() != 'none':
             rtlsim.append_regression(
                 args.top_level,
-                tn,
+                result,
                 args.queue_name,
                 args.autogen,
             )
     else:
+        if args.check_only:
+            return None
         wprint('CMSIS-NN code generation is unsupported.')
 
         cmsisnn.create_net(
@@ -634,6 +827,10 @@ def main():
             args.sample_filename,
             args.avg_pool_rounding,
             args.legacy_test,
+            dev=dev,
         )
 
-        print(stats.summary(debug=args.debug, weights=weights, w_size=quantization, bias=bias))
+        print(stats.summary(debug=args.debug, weights=weights, w_size=quantization, bias=bias,
+                            per_layer=args.verbose))
+
+    return None
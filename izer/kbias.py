@@ -16,6 +16,155 @@ from .utils import argmin, ffs, fls, popcount
 _INVALID_VALUE = -(2**63)
 
 
+def depthwise_use(
+        ll,
+        group_bias_max,
+        bias,
+        processor_map,
+        broadcast_mode,
+        out_expand,
+):
+    """
+    Add the bias memory used by the depth-wise convolution in layer `ll`, which uses the bias
+    memory of each of its groups, to `group_bias_max`.
+    """
+    for group in range(tc.dev.P_NUMGROUPS):
+        if processor_map[ll] >> group * tc.dev.P_NUMPRO & (2**tc.dev.P_NUMPRO - 1) \
+           and broadcast_mode[ll]:
+            group_bias_max[group] = (group_bias_max[group] + 3) & ~3
+    used_groups = sum(1 for group in range(tc.dev.P_NUMGROUPS)
+                      if processor_map[ll] >> group * tc.dev.P_NUMPRO & (2**tc.dev.P_NUMPRO - 1))
+    map_used = processor_map[ll]
+    if not broadcast_mode[ll]:
+        start_proc = ffs(map_used)
+        first_group = start_proc // tc.dev.P_NUMPRO
+        map_used &= ~((2**tc.dev.P_NUMPRO - 1) << first_group * tc.dev.P_NUMPRO)
+        map_used |= (processor_map[ll] & (((2**tc.dev.P_NUMPRO - 1) <<
+                     (first_group * tc.dev.P_NUMPRO)))) >> start_proc % tc.dev.P_NUMPRO
+    start_proc = ffs(map_used)
+    if broadcast_mode[ll] or used_groups > 1:
+        start_proc &= ~(2**tc.dev.P_NUMPRO - 1)
+    last_proc = fls(map_used)
+    leftover = (out_expand[ll] - len(bias[ll]) % out_expand[ll]) % out_expand[ll]
+    for expand in range(out_expand[ll]):
+        for p in range(start_proc, last_proc + 1):
+            if expand < out_expand[ll] - 1 or p <= last_proc - leftover:
+                group_bias_max[p // tc.dev.P_NUMPRO] += 1
+
+
+def pack(
+        sizes,
+        group_map,
+        group_bias_max,
+        max_steps=100000,
+):
+    """
+    Assign each layer in `sizes` (a dictionary of bias lengths) to one of the groups in its
+    `group_map`, on top of the bias memory `group_bias_max` already used in each group.
+    The layers are assigned first-fit decreasing, each to the least used group where it fits.
+    When that does not fit, a depth-first search tries up to `max_steps` assignments.
+    Returns a dictionary of groups in the order of assignment, or `None` when none fits.
+    """
+    layers = sorted(sizes, key=lambda ll: (-sizes[ll], len(group_map[ll]), ll))
+
+    used = list(group_bias_max)
+    result = {}
+    for ll in layers:
+        fits = [g for g in group_map[ll] if used[g] + sizes[ll] <= tc.dev.BIAS_SIZE]
+        if not fits:
+            break
+        result[ll] = min(fits, key=lambda g: (used[g], g))
+        used[result[ll]] += sizes[ll]
+    else:
+        return result
+
+    used = list(group_bias_max)
+    result = {}
+    failed = set()
+    steps = 0
+
+    def search(i):
+        """
+        Assign layers `i` and up, returning `True` when they fit.
+        """
+        nonlocal steps
+        if i == len(layers):
+            return True
+        if (i, tuple(used)) in failed or steps >= max_steps:
+            return False
+        steps += 1
+        ll = layers[i]
+        for g in sorted(set(group_map[ll]), key=lambda g: (used[g], g)):
+            if used[g] + sizes[ll] <= tc.dev.BIAS_SIZE:
+                used[g] += sizes[ll]
+                result[ll] = g
+                if search(i + 1):
+                    return True
+                used[g] -= sizes[ll]
+        failed.add((i, tuple(used)))
+        return False
+
+    return result if search(0) else None
+
+
+def plan(
+        start_layer,
+        layers,
+        bias,
+        group_map,
+        output_chan,
+        streaming,
+        conv_groups,
+        broadcast_mode,
+        processor_map,
+        output_processor_map,
+        out_expand,
+        reserved=None,
+):
+    """
+    Plan the bias memory, above the `reserved` bytes of each group. Returns the order in which
+    the layers are loaded and the group used by each layer (`None` for depth-wise convolutions).
+    In layer order, each layer uses the least used group in its `group_map`. When this exceeds
+    the bias memory, the depth-wise convolutions are loaded first and the other layers are
+    packed into the remaining memory using `pack()`.
+    """
+    sizes = {}
+    depthwise = []
+    for ll in range(start_layer, layers):
+        if bias[ll] is None or group_map[ll] is None or not np.any(bias[ll] != 0):
+            continue
+        if conv_groups[ll] == 1:
+            sizes[ll] = output_chan[ll] \
+                + ffs(output_processor_map[ll]) % tc.dev.P_SHARED * out_expand[ll]
+            if ll == 0 and streaming[ll] and not tc.dev.SUPPORT_STREAM_BIAS:
+                sizes[ll] += 1  # Work around a problem on AI85
+        else:
+            depthwise.append(ll)
+
+    order = sorted(sizes.keys() | set(depthwise))
+    groups = [None] * layers
+    group_bias_max = list(reserved or [0] * tc.dev.P_NUMGROUPS)
+    for ll in order:
+        if ll in sizes:
+            groups[ll] = group_map[ll][argmin(group_bias_max[t] for t in group_map[ll])]
+            group_bias_max[groups[ll]] += sizes[ll]
+        else:
+            depthwise_use(ll, group_bias_max, bias, processor_map, broadcast_mode, out_expand)
+    if max(group_bias_max) <= tc.dev.BIAS_SIZE:
+        return order, groups
+
+    group_bias_max = list(reserved or [0] * tc.dev.P_NUMGROUPS)
+    for ll in depthwise:
+        depthwise_use(ll, group_bias_max, bias, processor_map, broadcast_mode, out_expand)
+    packed = pack(sizes, group_map, group_bias_max)
+    if packed is None:
+        return order, groups
+    for ll, group in packed.items():
+        groups[ll] = group
+    return depthwise + list(packed), groups
+
+
+@tc.device_scope
 def load(
         verbose,  # pylint: disable=unused-argument
         embedded_code,
@@ -32,9 +181,11 @@ def load(
         output_processor_map,
         out_expand,
         debug,  # pylint: disable=unused-argument
+        reserved=None,
 ):
     """
-    Write `bias` values for the network to C code.
+    Write `bias` values for the network to C code. `reserved` lists the bytes at the start of
+    the bias memory in each group that are used by other networks and must not be overwritten.
     """
     # Bias: Each group has one bias memory (size BIAS_SIZE bytes). Use only the bias memory in
     # one selected group for the layer, and only if the layer uses a bias. Keep track of the
@@ -46,9 +197,6 @@ def load(
     if not embedded_code:
         apb.function_header(function='load_bias')
 
-    group_bias_max = [0] * tc.dev.P_NUMGROUPS
-    bias_offs = [[None] * tc.dev.P_NUMGROUPS for _ in range(layers)]
-    bias_group = [None] * layers
     for ll in range(start_layer, layers):
         if bias[ll] is None or group_map[ll] is None:
             continue
@@ -57,8 +205,18 @@ def load(
                    f'of bias values {len(bias[ll])}.')
         if not np.any(bias[ll] != 0):
             wprint(f'Layer {ll}: All bias values are zero. Ignoring the input.')
-            continue
 
+    order, groups = plan(start_layer, layers, bias, group_map, output_chan, streaming,
+                         conv_groups, broadcast_mode, processor_map, output_processor_map,
+                         out_expand, reserved)
+    if order != sorted(order):
+        print('Bias values do not fit in layer order, packing them into the groups.')
+
+    first = list(reserved or [0] * tc.dev.P_NUMGROUPS)
+    group_bias_max = list(first)
+    bias_offs = [[None] * tc.dev.P_NUMGROUPS for _ in range(layers)]
+    bias_group = [None] * layers
+    for ll in order:
         # Round up the divided length of bias values
         target_offs = ffs(output_processor_map[ll]) % tc.dev.P_SHARED * out_expand[ll]
         bias_len = output_chan[ll] + target_offs
@@ -71,8 +229,8 @@ def load(
                    'THIS COMBINATION MIGHT NOT BE FUNCTIONING CORRECTLY!!!')
 
         if conv_groups[ll] == 1:
-            # Pick the group with the least amount of data in it
-            group = argmin(group_bias_max[t] for t in group_map[ll])
+            # The planned group, in layer order the group with the least amount of data in it
+            group = groups[ll]
             if group_bias_max[group] + bias_len > tc.dev.BIAS_SIZE:
                 eprint(f'Layer {ll}: bias memory capacity exceeded - available groups: '
                        f'{group_map[ll]}, used so far: {group_bias_max}, needed: {bias_len}.')
@@ -177,16 +335,20 @@ def load(
                         bias_add_byte(ll, group, val)
 
     if embedded_code:
-        if max(group_bias_max) > 0:
+        apb.bias_image = {tc.dev.C_GROUP_OFFS*group + tc.dev.C_BRAM_BASE + offs * 4:
+                          int(bias_values[group][offs])
+                          for group in range(tc.dev.P_NUMGROUPS)
+                          for offs in range(first[group], group_bias_max[group])}
+        if group_bias_max != first:
             # At least one bias value exists, output defines
             for group in range(tc.dev.P_NUMGROUPS):
-                if group_bias_max[group] == 0:
+                if group_bias_max[group] == first[group]:
                     continue  # but not for this group
-                apb.output_define(bias_values[group][:group_bias_max[group]], f'BIAS_{group}',
-                                  '0x%02x', 16)
+                apb.output_define(bias_values[group][first[group]:group_bias_max[group]],
+                                  f'BIAS_{group}', '0x%02x', 16)
             # Output variables
             for group in range(tc.dev.P_NUMGROUPS):
-                if group_bias_max[group] == 0:
+                if group_bias_max[group] == first[group]:
                     continue
                 apb.output(f'static const uint8_t bias_{group}[] = BIAS_{group};\n', embedded_code)
             apb.output('\n', embedded_code)
@@ -199,11 +361,13 @@ def load(
 
             apb.function_header(function='load_bias')
             for group in range(tc.dev.P_NUMGROUPS):
-                if group_bias_max[group] == 0:
+                if group_bias_max[group] == first[group]:
                     continue
-                addr = apb.apb_base + tc.dev.C_GROUP_OFFS*group + tc.dev.C_BRAM_BASE
+                addr = apb.apb_base + tc.dev.C_GROUP_OFFS*group + tc.dev.C_BRAM_BASE \
+                    + first[group] * 4
                 apb.output(f'  memcpy_8to32((uint32_t *) 0x{addr:08x}, bias_{group}, '
-                           f'sizeof(uint8_t) * {group_bias_max[group]});\n', embedded_code)
+                           f'sizeof(uint8_t) * {group_bias_max[group] - first[group]});\n',
+                           embedded_code)
         else:
             apb.function_header(function='load_bias')
             apb.output('  // Not used in this network', embedded_code)
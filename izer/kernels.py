@@ -12,13 +12,14 @@ import sys
 
 import numpy as np
 
-from . import op, rv
+from . import op, rv, stats
 from . import tornadocnn as tc
 from .eprint import eprint, eprint_noprefix, wprint
 from .utils import ffs, fls, popcount
 
 _INVALID_VALUE = -(2**63)
 _WORDS_PER_KERNEL = 3
+_MIN_ZERO_RUN = 4  # Shorter runs of zero kernels are loaded instead of starting another memcpy()
 
 
 def print_map(
@@ -48,6 +49,194 @@ def print_map(
     print_fn('-' * tc.dev.MASK_WIDTH_LARGE * width)
 
 
+class _Overflow(Exception):
+    """
+    Kernel memory exceeded while trying a placement.
+    """
+
+
+def fragmentation(
+        used,
+        start_offs=0,
+):
+    """
+    Return the highest used column plus one, and the fraction of the kernel memory below the
+    highest used column of each processor (starting at `start_offs`) that is not used, for the
+    boolean map `used` (processors by columns).
+    """
+    cols = np.arange(1, used.shape[1] + 1)
+    top = np.max(np.where(used, cols, 0), axis=1)
+    span = np.sum(np.maximum(top - start_offs, 0))
+    return int(np.max(top)), (1.0 - np.sum(used[:, start_offs:]) / span) if span else 0.0
+
+
+def _describe(
+        used,
+        start_offs=0,
+):
+    """
+    Describe the kernel memory use in the boolean map `used` (`None` if it does not fit).
+    """
+    if used is None:
+        return 'does not fit'
+    top, frag = fragmentation(used, start_offs)
+    return f'uses {top} columns ({frag:.1%} fragmented)'
+
+
+def reserved_map(
+        reserved=None,
+):
+    """
+    Return a boolean map (processors by columns) of the `reserved` kernel memory columns at the
+    start of each processor.
+    """
+    used = np.zeros((tc.dev.MAX_PROC, tc.dev.MASK_WIDTH_LARGE), dtype=bool)
+    for p, cols in enumerate(reserved or []):
+        used[p, :cols] = True
+    return used
+
+
+def place(
+        footprint,
+        start_offs=0,
+        reserved=None,
+):
+    """
+    Place the kernels of the layers in `footprint`, a dictionary of boolean maps (processors
+    by columns) of the kernel memory used by each layer when placed at offset 0, so that they
+    do not overlap and fit the kernel memory of each processor. Several layer orders are
+    placed first-fit at multiples of `tc.dev.P_SHARED` starting at `start_offs`, above the
+    `reserved` columns of each processor. Returns the offsets of the order with the lowest peak
+    as a dictionary, or `None` when none fits.
+    """
+    width = np.array([tc.dev.mask_width(p) for p in range(tc.dev.MAX_PROC)])
+    cols = np.arange(1, tc.dev.MASK_WIDTH_LARGE + 1)
+    shape, limit = {}, {}
+    for ll, fp in footprint.items():
+        top = np.max(np.where(fp, cols, 0), axis=1)  # Last used column plus one per processor
+        shape[ll] = fp[:, :np.max(top)]
+        limit[ll] = np.min((width - top)[top > 0]) if np.any(top) else width[0]
+    first = (start_offs + tc.dev.P_SHARED - 1) & ~(tc.dev.P_SHARED - 1)
+
+    def first_fit(order):
+        """
+        Place the layers in `order` at the lowest free offset. Returns the offsets and the
+        peak, or `None` when a layer does not fit.
+        """
+        used = reserved_map(reserved)
+        offs = {}
+        for ll in order:
+            n = shape[ll].shape[1]
+            o = first
+            while o <= limit[ll] and np.any(used[:, o:o + n] & shape[ll]):
+                o += tc.dev.P_SHARED
+            if o > limit[ll]:
+                return None
+            used[:, o:o + n] |= shape[ll]
+            offs[ll] = o
+        return offs, fragmentation(used)[0]
+
+    best = None
+    for key in [
+            None,  # Layer order
+            lambda ll: -np.sum(shape[ll]),  # Largest area first
+            lambda ll: (-np.sum(np.any(shape[ll], axis=1)), -shape[ll].shape[1]),  # Widest
+            lambda ll: -shape[ll].shape[1],  # Longest first
+    ]:
+        result = first_fit(sorted(footprint, key=key))
+        if result is not None and (best is None or result[1] < best[1]):
+            best = result
+    return best[0] if best is not None else None
+
+
+def layout(
+        output_processor_map,
+        kernel_size,
+        quantization,
+        out_expand,
+        in_expand,
+        conv_groups,
+        output_chan,
+        flatten_area=None,
+        quad=False,
+):
+    """
+    Return the number of kernels and the number of kernel memory columns (72-bit words) that a
+    layer with `output_processor_map`, `kernel_size`, `quantization`, `out_expand`, `in_expand`,
+    `conv_groups` and `output_chan` uses in each processor. `flatten_area` is the number of
+    kernels per input and output channel of a flattened layer (`None` when not flattened or
+    using legacy kernels). With `quad`, the kernels are spread across the four quadrants.
+    """
+    qfactor = 8 // abs(quantization)
+    first_output_proc = ffs(output_processor_map)
+    if out_expand > 1:
+        # This extends the kernels to the right for output expansion
+        first_output_proc -= first_output_proc % tc.dev.P_SHARED
+
+    # MAX7800X devices currently support only groups=1 and groups equal to input channels
+    # equal to output channels.
+    if conv_groups == 1:
+        kc = (1 + fls(output_processor_map) - first_output_proc) * out_expand * in_expand
+    else:
+        kc = in_expand
+    if flatten_area is not None:
+        kc = (kc - out_expand * popcount(output_processor_map) + output_chan) * flatten_area
+
+    # Pack kernels to 72-bit words, while ensuring there is enough space when using 1/2/4
+    # bit kernels where the kernel count requires padding.
+    ksize = kernel_size[0] * kernel_size[1]
+    res = (kc % qfactor) * ksize * (qfactor - 1)
+    kern_len = (kc * ksize * abs(quantization) + res + 71) // 72
+    if quad:
+        kern_len = (kern_len + 3) // 4
+    return kc, kern_len
+
+
+def align_offset(
+        offs,
+        output_processor_map,
+        quantization,
+):
+    """
+    Return the kernel offset for a layer with `output_processor_map` and `quantization` whose
+    kernels can start at `offs`.
+    """
+    # We don't have to use dummy columns if there's space available on the left
+    qfactor = 8 // abs(quantization)
+    offs = max(0, offs - (((ffs(output_processor_map) % tc.dev.P_SHARED) + qfactor - 1)
+                          // qfactor))
+
+    # The kernel offset needs to start at a multiple of 4 since we use start_col to
+    # adjust within the group of 4 processors.
+    return (offs + tc.dev.P_SHARED-1) & ~(tc.dev.P_SHARED-1)
+
+
+def load_runs(
+        needed,
+        legacy_kernels=False,
+        min_gap=None,
+):
+    """
+    Return the runs of kernel memory columns to load for one processor as a list of tuples of
+    the first and the last column, for the boolean array `needed`. Without `min_gap`, a single
+    run spans all needed columns. Otherwise, runs of at least `min_gap` columns that are not
+    needed are skipped. With `legacy_kernels`, the first run starts at column 0.
+    """
+    cols = np.flatnonzero(needed)
+    if len(cols) == 0:
+        return []
+    if min_gap is None:
+        runs = [(int(cols[0]), int(cols[-1]))]
+    else:
+        split = np.flatnonzero(np.diff(cols) > min_gap)
+        runs = list(zip([int(cols[0])] + [int(c) for c in cols[split + 1]],
+                        [int(c) for c in cols[split]] + [int(cols[-1])]))
+    if legacy_kernels:
+        runs[0] = (0, runs[0][1])
+    return runs
+
+
+@tc.device_scope
 def load(  # pylint: disable=too-many-branches,too-many-statements
         verbose,
         embedded_code,
@@ -79,6 +268,11 @@ def load(  # pylint: disable=too-many-branches,too-many-statements
         api=False,
         start_offs=0,
         bypass=None,
+        placement='greedy',
+        reserved=None,
+        deduplicate=False,
+        skip_zero=False,
+        dma=False,
 ):
     """
     Stack `kernel` values and write them to C code (for `embedded_code` if `True` or
@@ -88,6 +282,16 @@ def load(  # pylint: disable=too-many-branches,too-many-statements
     When `mexpress` is `True`, the function uses the memcpy()-friendly hardware functionality to
     reduce the number of transfers. When `verify` is also true (mexpress mode only), kernels are
     read back and compared.
+    With `placement` set to `'optimized'`, the layers are placed to reduce unused holes in kernel
+    memory (see `place()`), falling back to stacking them in layer order when that does not
+    use less memory.
+    `reserved` lists the kernel memory columns at the start of each processor that are used by
+    other networks and must not be overwritten.
+    With `deduplicate`, layers whose kernels are identical to those of a prior layer (using the
+    same processors) use the kernel offset of that layer instead of a copy.
+    With `skip_zero`, the kernel memory must have been cleared, and all-zero kernels are not
+    written (see `load_runs()`).
+    With `dma` (mexpress mode only), the kernel blocks are loaded using one DMA transfer each.
     This function returns the kernel offsets and the kernel lengths for all layers.
     """
     # Kernels: Stack kernels; write only the kernels needed
@@ -112,267 +316,331 @@ def load(  # pylint: disable=too-many-branches,too-many-statements
         eprint('--calcx4 is not supported on this device.')
     assert not ((embedded_code or mexpress) and calcx4)  # FIXME Add support later
 
-    for ll in range(start_layer, layers):
-        if operator[ll] == op.NONE or bypass[ll]:
-            assert kern_len[ll] == 0
-            assert kern_offs[ll] == start_offs
-            continue
-
-        if flatten[ll]:
-            kernel_reshaped = kernel[ll].reshape(
-                output_chan[ll] * input_chan[ll],
-                -1,
-                kernel_size[ll][0],
-                kernel_size[ll][1],
-            )
-        else:
-            kernel_reshaped = kernel[ll]
+    def stack(
+            planned=None,
+            only=None,
+            dry=False,
+    ):
+        """
+        Stack the kernels of all layers (or of layer `only`) into the kernel map, on top of
+        the kernels of the prior layers or at the `planned` offsets. With `dry`, raise
+        `_Overflow` instead of exiting when kernel memory is exceeded.
+        """
+        proc_kern_max[:] = reserved or [0] * tc.dev.MAX_PROC
+        kern_offs[:] = [start_offs] * layers
+        kern_len[:] = [0] * layers
+        kern_count[:] = [0] * layers
+        kern_ochan[:] = [0] * layers
+        kernel_map.fill(_INVALID_VALUE)
+        kernels_used.fill(0)
+        kernel_data.fill(0)
+
+        for ll in range(start_layer, layers):
+            if operator[ll] == op.NONE or bypass[ll]:
+                assert kern_len[ll] == 0
+                assert kern_offs[ll] == start_offs
+                continue
+            if only is not None and ll != only:
+                continue
+            if ll in shared:
+                kern_offs[ll] = kern_offs[shared[ll]]
+                kern_len[ll] = kern_len[shared[ll]]
+                kern_count[ll] = kern_count[shared[ll]]
+                kern_ochan[ll] = kern_ochan[shared[ll]]
+                continue
 
-        if quantization[ll] == -1:
-            kernel_reshaped = kernel_reshaped.copy().clip(-1, 0)
+            if flatten[ll]:
+                kernel_reshaped = kernel[ll].reshape(
+                    output_chan[ll] * input_chan[ll],
+                    -1,
+                    kernel_size[ll][0],
+                    kernel_size[ll][1],
+                )
+            else:
+                kernel_reshaped = kernel[ll]
 
-        if np.ndim(kernel_reshaped) > 2:
-            if kernel_reshaped.shape[-2] != kernel_size[ll][0] \
-               or kernel_reshaped.shape[-1] != kernel_size[ll][1]:
-                eprint(f'The configured kernel dimensions ({kernel_size[ll][0]}x'
-                       f'{kernel_size[ll][1]}) for layer {ll} do not match the binary weights '
-                       f'({kernel_reshaped.shape[-2]}x{kernel_reshaped.shape[-1]})!')
-        else:
-            if kernel_reshaped.shape[-1] != kernel_size[ll][0]:
-                eprint(f'The configured kernel dimensions ({kernel_size[ll][0]}) '
-                       f'for layer {ll} do not match the binary weights '
-                       f'({kernel_reshaped.shape[-1]})!')
-
-        proc_map = processor_map[ll]
-        if ll == 0 and quad:
-            proc_map &= 2**tc.dev.P_NUMPRO - 1
-        first_proc = ffs(proc_map)
-        last_proc = fls(proc_map)
-        ch = 0
-        m = 0
-        for p in range(first_proc, last_proc+1):
-            if (proc_map >> p) & 1 == 0:
-                # Unused processor
-                continue
-            # Get highest offset for all used processors
-            kern_offs[ll] = max(proc_kern_max[p], kern_offs[ll])
-
-        ksize = kernel_size[ll][0] * kernel_size[ll][1]
-        qfactor = 8 // abs(quantization[ll])
-        next_layer_map = output_processor_map[ll]
-        first_output_proc = ffs(next_layer_map)
-        start_col = first_output_proc % tc.dev.P_SHARED  # First target column out of 4 shared
-        if start_col > 0 and quantization[ll] != 8:
-            wprint(f'Warning: Layer {ll} with {quantization[ll]}-bit quantization uses unaligned '
-                   'output processors, this may cause issues')
-
-        # Determine the number of kernels that need to be programmed. Since each instance
-        # spans 4 processors, kernels for all instances that have a single processor enabled
-        # need to be written, i.e. round down the first. The last does not need to be rounded
-        # up because hardware takes care of it.
-        # When using kernels smaller than 8 bit, round up to the next 8-bit boundary
-        # Gaps are accounted for like any other kernel.
+            if quantization[ll] == -1:
+                kernel_reshaped = kernel_reshaped.copy().clip(-1, 0)
 
-        # This extends the kernels to the right for output expansion
-        if out_expand[ll] > 1:
-            first_output_proc -= start_col
-
-        # MAX7800X devices currently support only groups=1 and groups equal to input channels
-        # equal to output channels.
-        if conv_groups[ll] == 1:
-            kc = (1 + fls(next_layer_map) - first_output_proc) \
-                * out_expand[ll] * in_expand[ll]
-            kern_ochan[ll] = kern_count[ll] = kc + start_col * out_expand[ll] * in_expand[ll]
-        else:
-            kc = in_expand[ll]
-            kern_count[ll] = kc + start_col * in_expand[ll]
-            kern_ochan[ll] = (1 + fls(next_layer_map) - first_output_proc) \
-                * in_expand[ll] + start_col * in_expand[ll]
-
-        if not legacy_kernels and flatten[ll]:
-            kc *= kernel_reshaped.shape[1]
-            kern_count[ll] *= kernel_reshaped.shape[1]  # FIXME
-            kc -= (out_expand[ll] * popcount(next_layer_map) - output_chan[ll]) \
-                * kernel_reshaped.shape[1]
-            kern_count[ll] -= (out_expand[ll] * popcount(next_layer_map) - output_chan[ll]) \
-                * kernel_reshaped.shape[1]
-            kern_ochan[ll] = kern_count[ll]
-
-        # Pack kernels to 72-bit words, while ensuring there is enough space when using 1/2/4
-        # bit kernels where the kernel count requires padding.
-        res = (kc % qfactor) * ksize * (qfactor - 1)
-        kern_len[ll] = (kc * ksize * abs(quantization[ll]) + res + 71) // 72
-
-        if ll == 0 and quad:
-            kern_len[0] = (kern_len[0] + 3) // 4
-            kern_count[0] = (kern_count[0] + 3) // 4
-            kern_ochan[0] = (kern_ochan[0] + 3) // 4
-
-        # We don't have to use dummy columns if there's space available on the left
-        kern_offs[ll] = \
-            max(0, kern_offs[ll] - (((ffs(next_layer_map) % tc.dev.P_SHARED)
-                                     + qfactor - 1) // qfactor))
-
-        # The kernel offset needs to start at a multiple of 4 since we use start_col to
-        # adjust within the group of 4 processors.
-        kern_offs[ll] = (kern_offs[ll] + tc.dev.P_SHARED-1) & ~(tc.dev.P_SHARED-1)
-
-        # Check for overflow
-        if kern_offs[ll] + kern_len[ll] > tc.dev.mask_width(p):
-            eprint(f'\nKernel memory exceeded at layer {ll}; offset: {kern_offs[ll]}, '
-                   f'needed: {kern_len[ll]}.'
-                   '\n\nKernel map so far:', exit_code=None)
-            print_map(layers, kernel_map, print_fn=eprint_noprefix)
-            sys.exit(1)
-
-        proc_mask = 2**qfactor - 1
-
-        # Start at the first used instance
-        this_map_init = next_layer_map >> ffs(next_layer_map)
-
-        def add_kernel_data(ll, p, col_target, b):
-            ct = col_target
-            if ll == 0 and quad:
-                ct //= 4
-                p += col_target % 4 * tc.dev.P_NUMPRO
-            col = kern_offs[ll] + ct
-            if col >= tc.dev.mask_width(p):
-                eprint(f'\nKernel memory exceeded in layer {ll}.'
-                       '\n\nKernel map so far:', exit_code=None)
-                print_map(layers, kernel_map, print_fn=eprint_noprefix)
-                sys.exit(1)
+            if np.ndim(kernel_reshaped) > 2:
+                if kernel_reshaped.shape[-2] != kernel_size[ll][0] \
+                   or kernel_reshaped.shape[-1] != kernel_size[ll][1]:
+                    eprint(f'The configured kernel dimensions ({kernel_size[ll][0]}x'
+                           f'{kernel_size[ll][1]}) for layer {ll} do not match the binary weights '
+                           f'({kernel_reshaped.shape[-2]}x{kernel_reshaped.shape[-1]})!')
+            else:
+                if kernel_reshaped.shape[-1] != kernel_size[ll][0]:
+                    eprint(f'The configured kernel dimensions ({kernel_size[ll][0]}) '
+                           f'for layer {ll} do not match the binary weights '
+                           f'({kernel_reshaped.shape[-1]})!')
 
-            if kernels_used[p][col] == 0:  # Update kernel map
-                assert kernel_map[p][col] == _INVALID_VALUE
-                kernel_map[p][col] = ll
+            proc_map = processor_map[ll]
+            if ll == 0 and quad:
+                proc_map &= 2**tc.dev.P_NUMPRO - 1
+            first_proc = ffs(proc_map)
+            last_proc = fls(proc_map)
+            ch = 0
+            m = 0
+            if planned is not None:
+                kern_offs[ll] = planned[ll]
+            for p in range(first_proc, last_proc+1):
+                if (proc_map >> p) & 1 == 0 or planned is not None:
+                    # Unused processor
+                    continue
+                # Get highest offset for all used processors
+                kern_offs[ll] = max(proc_kern_max[p], kern_offs[ll])
+
+            ksize = kernel_size[ll][0] * kernel_size[ll][1]
+            qfactor = 8 // abs(quantization[ll])
+            next_layer_map = output_processor_map[ll]
+            start_col = ffs(next_layer_map) % tc.dev.P_SHARED  # First of 4 shared columns
+            if start_col > 0 and quantization[ll] != 8 and not dry:
+                wprint(f'Warning: Layer {ll} with {quantization[ll]}-bit quantization uses '
+                       'unaligned output processors, this may cause issues')
+
+            # Determine the number of kernels that need to be programmed. Since each instance
+            # spans 4 processors, kernels for all instances that have a single processor enabled
+            # need to be written, i.e. round down the first. The last does not need to be rounded
+            # up because hardware takes care of it.
+            # When using kernels smaller than 8 bit, round up to the next 8-bit boundary
+            # Gaps are accounted for like any other kernel.
+
+            flatten_area = kernel_reshaped.shape[1] \
+                if not legacy_kernels and flatten[ll] else None
+            kc, kern_len[ll] = layout(next_layer_map, kernel_size[ll], quantization[ll],
+                                      out_expand[ll], in_expand[ll], conv_groups[ll],
+                                      output_chan[ll], flatten_area, ll == 0 and quad)
+
+            # Kernels for the start_col processors that are skipped
+            skipped = start_col * in_expand[ll] * (out_expand[ll] if conv_groups[ll] == 1 else 1)
+            if flatten_area is not None:
+                kern_ochan[ll] = kern_count[ll] = kc + skipped * flatten_area
+            elif conv_groups[ll] == 1:
+                kern_ochan[ll] = kern_count[ll] = kc + skipped
+            else:
+                kern_count[ll] = kc + skipped
+                first_output_proc = ffs(next_layer_map)
+                if out_expand[ll] > 1:
+                    first_output_proc -= start_col
+                kern_ochan[ll] = (1 + fls(next_layer_map) - first_output_proc) * in_expand[ll] \
+                    + skipped
 
-            assert kernels_used[p][col] <= 8
-            kernel_data[p][col][8 - kernels_used[p][col]] = b & 0xff
-            kernels_used[p][col] += 1
+            if ll == 0 and quad:
+                kern_count[0] = (kern_count[0] + 3) // 4
+                kern_ochan[0] = (kern_ochan[0] + 3) // 4
 
-            if kernels_used[p][col] == 9:  # Flush
-                col_target += 1  # Write 1
+            kern_offs[ll] = align_offset(kern_offs[ll], next_layer_map, quantization[ll])
 
-            return col_target
+            # Check for overflow
+            if kern_offs[ll] + kern_len[ll] > tc.dev.mask_width(p):
+                if dry:
+                    raise _Overflow(ll)
+                eprint(f'\nKernel memory exceeded at layer {ll}; offset: {kern_offs[ll]}, '
+                       f'needed: {kern_len[ll]}.'
+                       '\n\nKernel map so far:', exit_code=None)
+                print_map(layers, kernel_map, print_fn=eprint_noprefix)
+                sys.exit(1)
 
-        for p in range(first_proc, last_proc + 1):
-            if (proc_map >> p) & 1 == 0:
-                # Unused source processor
-                continue
-            # Skip start_col processors. Each takes up ksize bytes, or ksize // 9 full
-            # kernel words. There are col_bytes leftover bytes.
-            col_target, col_bytes = divmod(start_col * ksize * in_expand[ll], 9)
-            # Pad out the leftovers
-            for _ in range(col_bytes // qfactor):  # FIXME for quantization
-                col_target = add_kernel_data(ll, p, col_target, 0)
-
-            out_range = out_expand[ll] if conv_groups[ll] == 1 else 1
-            for expand in range(out_range):
-                this_map = this_map_init
-                if conv_groups[ll] == 1:
-                    col = expand * out_expand_thresh[ll]
-                    stop_col = col + out_expand_thresh[ll]
+            proc_mask = 2**qfactor - 1
+
+            # Start at the first used instance
+            this_map_init = next_layer_map >> ffs(next_layer_map)
+
+            def add_kernel_data(ll, p, col_target, b):
+                ct = col_target
+                if ll == 0 and quad:
+                    ct //= 4
+                    p += col_target % 4 * tc.dev.P_NUMPRO
+                col = kern_offs[ll] + ct
+                if col >= tc.dev.mask_width(p):
+                    if dry:
+                        raise _Overflow(ll)
+                    eprint(f'\nKernel memory exceeded in layer {ll}.'
+                           '\n\nKernel map so far:', exit_code=None)
+                    print_map(layers, kernel_map, print_fn=eprint_noprefix)
+                    sys.exit(1)
+
+                if kernels_used[p][col] == 0:  # Update kernel map
+                    assert kernel_map[p][col] == _INVALID_VALUE
+                    kernel_map[p][col] = ll
+
+                assert kernels_used[p][col] <= 8
+                kernel_data[p][col][8 - kernels_used[p][col]] = b & 0xff
+                kernels_used[p][col] += 1
+
+                if kernels_used[p][col] == 9:  # Flush
+                    col_target += 1  # Write 1
+
+                return col_target
+
+            for p in range(first_proc, last_proc + 1):
+                if (proc_map >> p) & 1 == 0:
+                    # Unused source processor
+                    continue
+                # Skip start_col processors. Each takes up ksize bytes, or ksize // 9 full
+                # kernel words. There are col_bytes leftover bytes.
+                col_target, col_bytes = divmod(start_col * ksize * in_expand[ll], 9)
+                # Pad out the leftovers
+                for _ in range(col_bytes // qfactor):  # FIXME for quantization
+                    col_target = add_kernel_data(ll, p, col_target, 0)
+
+                out_range = out_expand[ll] if conv_groups[ll] == 1 else 1
+                for expand in range(out_range):
+                    this_map = this_map_init
+                    if conv_groups[ll] == 1:
+                        col = expand * out_expand_thresh[ll]
+                        stop_col = col + out_expand_thresh[ll]
+                    else:
+                        col = expand
+                        stop_col = expand + 1
+
+                    while col < stop_col:
+                        # Skip over unused bits in the target processor map
+                        # (unused means 1 bit for 8-bit weights, 2 for 4-bit weights, etc.)
+                        if this_map != 0:
+                            while this_map & proc_mask == 0:
+                                assert this_map != 0
+                                col_target += 1  # Completely skip
+                                this_map >>= qfactor  # and slide forward
+                        this_mask = this_map & proc_mask
+                        this_map >>= qfactor
+
+                        in_ch = input_chan[ll]
+                        if flatten[ll]:
+                            in_ch *= qfactor
+                        src_offs = ch + m * in_ch
+
+                        for ie in range(in_expand[ll]):
+                            mask = this_mask
+
+                            n = 0
+                            if ie * in_expand_thresh[ll] + ch < in_ch \
+                               and src_offs < len(kernel_reshaped):
+                                if not flatten[ll]:
+                                    k = np.zeros_like(kernel_reshaped[src_offs].flatten())
+                                else:
+                                    k = np.empty((0), dtype=np.int64)
+                                for i in range(qfactor):
+                                    if m < output_chan[ll]:
+                                        # Cycle through phases
+                                        idx = n + ie * qfactor
+                                        koffs = src_offs + (idx % in_expand[ll]) \
+                                            * in_expand_thresh[ll] \
+                                            + (idx // in_expand[ll]) \
+                                            * input_chan[ll]
+                                        if koffs < len(kernel_reshaped):
+                                            this_kern = kernel_reshaped[koffs].flatten() \
+                                                & (2**abs(quantization[ll])-1)
+                                            if not flatten[ll]:
+                                                k |= this_kern << (i * abs(quantization[ll]))
+                                            else:
+                                                k = np.append(k, this_kern)
+                                        n += 1
+                                    mask >>= 1
+                                if debug and not dry:
+                                    with np.printoptions(formatter={'int': '{0:02x}'.format}):
+                                        print(f'Layer {ll} processor {p} channel '
+                                              f'{ch + ie * in_expand_thresh[ll]} m[{m}..{m+n-1}] '
+                                              f'of {output_chan[ll]}: {k}')
+                                if flatten[ll]:
+                                    if len(k) % qfactor != 0:
+                                        k = np.append(
+                                            k,
+                                            np.zeros(
+                                                qfactor - len(k) % qfactor,
+                                                dtype=np.int64,
+                                            ),
+                                        )
+                                    for i in range(0, len(k) // qfactor):
+                                        e = 0
+                                        for j in range(qfactor):
+                                            e |= k[i * qfactor + j] << (j * abs(quantization[ll]))
+                                        col_target = add_kernel_data(ll, p, col_target, e)
+                                else:
+                                    for i in range(ksize):
+                                        col_target = add_kernel_data(ll, p, col_target,
+                                                                     k[ksize - i - 1])
+
+                            else:  # When expanding, need to pad with zero kernels if needed
+                                for _ in range(ksize // qfactor):
+                                    col_target = add_kernel_data(ll, p, col_target, 0)
+
+                        # Consume kernels
+                        if not flatten[ll]:
+                            col += qfactor
+                            m += qfactor
+                        else:
+                            col += 1
+                            m += 1
+
+                if ll == 0 and quad:
+                    col_target = (col_target - start_col + 3) // 4 + start_col
+                if kern_offs[ll] + col_target < tc.dev.mask_width(p) \
+                   and kernels_used[p][kern_offs[ll] + col_target] > 0 \
+                   and kernel_map[p][kern_offs[ll] + col_target] == ll:  # Partials
+                    col_target += 1
+                while col_target - start_col < kern_len[ll]:
+                    col_target = add_kernel_data(ll, p, col_target, 0)
+                if flatten[ll]:
+                    kern_len[ll] = col_target
                 else:
-                    col = expand
-                    stop_col = expand + 1
-
-                while col < stop_col:
-                    # Skip over unused bits in the target processor map
-                    # (unused means 1 bit for 8-bit weights, 2 for 4-bit weights, etc.)
-                    if this_map != 0:
-                        while this_map & proc_mask == 0:
-                            assert this_map != 0
-                            col_target += 1  # Completely skip
-                            this_map >>= qfactor  # and slide forward
-                    this_mask = this_map & proc_mask
-                    this_map >>= qfactor
-
-                    in_ch = input_chan[ll]
-                    if flatten[ll]:
-                        in_ch *= qfactor
-                    src_offs = ch + m * in_ch
-
-                    for ie in range(in_expand[ll]):
-                        mask = this_mask
-
-                        n = 0
-                        if ie * in_expand_thresh[ll] + ch < in_ch \
-                           and src_offs < len(kernel_reshaped):
-                            if not flatten[ll]:
-                                k = np.zeros_like(kernel_reshaped[src_offs].flatten())
-                            else:
-                                k = np.empty((0), dtype=np.int64)
-                            for i in range(qfactor):
-                                if m < output_chan[ll]:
-                                    # Cycle through phases
-                                    idx = n + ie * qfactor
-                                    koffs = src_offs + (idx % in_expand[ll]) \
-                                        * in_expand_thresh[ll] \
-                                        + (idx // in_expand[ll]) \
-                                        * input_chan[ll]
-                                    if koffs < len(kernel_reshaped):
-                                        this_kern = kernel_reshaped[koffs].flatten() \
-                                            & (2**abs(quantization[ll])-1)
-                                        if not flatten[ll]:
-                                            k |= this_kern << (i * abs(quantization[ll]))
-                                        else:
-                                            k = np.append(k, this_kern)
-                                    n += 1
-                                mask >>= 1
-                            if debug:
-                                with np.printoptions(formatter={'int': '{0:02x}'.format}):
-                                    print(f'Layer {ll} processor {p} channel '
-                                          f'{ch + ie * in_expand_thresh[ll]} m[{m}..{m+n-1}] '
-                                          f'of {output_chan[ll]}: {k}')
-                            if flatten[ll]:
-                                if len(k) % qfactor != 0:
-                                    k = np.append(
-                                        k,
-                                        np.zeros(
-                                            qfactor - len(k) % qfactor,
-                                            dtype=np.int64,
-                                        ),
-                                    )
-                                for i in range(0, len(k) // qfactor):
-                                    e = 0
-                                    for j in range(qfactor):
-                                        e |= k[i * qfactor + j] << (j * abs(quantization[ll]))
-                                    col_target = add_kernel_data(ll, p, col_target, e)
-                            else:
-                                for i in range(ksize):
-                                    col_target = add_kernel_data(ll, p, col_target,
-                                                                 k[ksize - i - 1])
-
-                        else:  # When expanding, need to pad with zero kernels if needed
-                            for _ in range(ksize // qfactor):
-                                col_target = add_kernel_data(ll, p, col_target, 0)
-
-                    # Consume kernels
-                    if not flatten[ll]:
-                        col += qfactor
-                        m += qfactor
+                    kern_len[ll] = col_target - start_col
+                proc_kern_max[p] = kern_offs[ll] + kern_len[ll]
+                if ll == 0 and quad:
+                    proc_kern_max[p + tc.dev.P_NUMPRO] = \
+                        proc_kern_max[p + 2 * tc.dev.P_NUMPRO] = \
+                        proc_kern_max[p + 3 * tc.dev.P_NUMPRO] = proc_kern_max[p]
+                ch += 1
+                m = 0
+
+    planned = None
+    shared = {}  # Layers that use the kernels of a prior layer
+    footprint = None
+    if placement == 'optimized' or deduplicate:
+        try:
+            # Measure the kernel memory used by each layer on its own
+            footprint = {}
+            images = {}
+            for ll in range(start_layer, layers):
+                if operator[ll] != op.NONE and not bypass[ll]:
+                    stack({ll: 0}, only=ll, dry=True)
+                    used = kernel_map != _INVALID_VALUE
+                    image = (used.tobytes(), kernel_data[used].tobytes(), kern_len[ll],
+                             kern_count[ll], kern_ochan[ll])
+                    if deduplicate and image in images:
+                        shared[ll] = images[image]
                     else:
-                        col += 1
-                        m += 1
-
-            if ll == 0 and quad:
-                col_target = (col_target - start_col + 3) // 4 + start_col
-            if kern_offs[ll] + col_target < tc.dev.mask_width(p) \
-               and kernels_used[p][kern_offs[ll] + col_target] > 0:  # Partials
-                col_target += 1
-            while col_target - start_col < kern_len[ll]:
-                col_target = add_kernel_data(ll, p, col_target, 0)
-            if flatten[ll]:
-                kern_len[ll] = col_target
-            else:
-                kern_len[ll] = col_target - start_col
-            proc_kern_max[p] = kern_offs[ll] + kern_len[ll]
-            if ll == 0 and quad:
-                proc_kern_max[p + tc.dev.P_NUMPRO] = \
-                    proc_kern_max[p + 2 * tc.dev.P_NUMPRO] = \
-                    proc_kern_max[p + 3 * tc.dev.P_NUMPRO] = proc_kern_max[p]
-            ch += 1
-            m = 0
+                        images[image] = ll
+                        footprint[ll] = used
+        except _Overflow:
+            footprint = None
+            shared = {}
+        if shared:
+            saved = sum(int(np.sum(footprint[ll])) for ll in shared.values()) * 9
+            print('Kernel deduplication:', ', '.join(f'layer {ll} uses the kernels of layer {ls}'
+                                                     for ll, ls in shared.items()),
+                  f'- saving {saved:,} bytes of kernel memory.')
+        stats.get().shared_kernels = shared
+        if placement == 'optimized' and footprint is not None:
+            try:
+                stack(dry=True)
+                greedy = (kernel_map != _INVALID_VALUE) | reserved_map(reserved)
+            except _Overflow:
+                greedy = None
+            planned = place(footprint, start_offs, reserved)
+            optimized = None
+            if planned is not None:
+                optimized = reserved_map(reserved)
+                for ll, offs in planned.items():
+                    optimized[:, offs:] |= footprint[ll][:, :tc.dev.MASK_WIDTH_LARGE - offs]
+                if greedy is not None \
+                   and fragmentation(optimized)[0] >= fragmentation(greedy)[0]:
+                    planned = None  # Not better than the greedy placement
+            print('Kernel placement: greedy', _describe(greedy, start_offs), '- optimized',
+                  _describe(optimized, start_offs), '- using',
+                  'optimized' if planned is not None else 'greedy', 'placement.')
+
+    stack(planned)
 
     if verbose:
         print('\nKernel map:')
@@ -389,13 +657,22 @@ def load(  # pylint: disable=too-many-branches,too-many-statements
                     apb.write_kern(ll, p, col, k, verify_only=verify, calcx4=calcx4)
         apb.function_footer()  # verify_weights()
 
+    # Kernel memory columns that need to be loaded. When the kernel memory is cleared before
+    # loading, all-zero kernels are skipped.
+    needed = kernel_map != _INVALID_VALUE
+    if skip_zero:
+        needed &= np.any(kernel_data != 0, axis=2)
+    spans = [load_runs(needed[p], legacy_kernels, _MIN_ZERO_RUN if skip_zero else None)
+             for p in range(tc.dev.MAX_PROC)]
+    apb.kernel_image = kernel_map != _INVALID_VALUE, kernel_data
+
     if not (embedded_code or mexpress):
         apb.function_header(function='load_weights')
         # Write in-line
         for p in range(tc.dev.MAX_PROC):
             for col in range(0, tc.dev.mask_width(p)):
                 ll = kernel_map[p][col]
-                if ll != _INVALID_VALUE:
+                if ll != _INVALID_VALUE and needed[p][col]:
                     k = kernel_data[p][col]
                     apb.write_kern(ll, p, col, k, calcx4=calcx4)
         apb.function_footer()  # load_weights()
@@ -418,67 +695,36 @@ def load(  # pylint: disable=too-many-branches,too-many-statements
                         kernel_values[p][offs + 2] = (k[5] & 0xff) << 24 \
                             | (k[6] & 0xff) << 16 | (k[7] & 0xff) << 8 | k[8] & 0xff
 
-            # First, define the weights (will move to header file)
             # Combining memcopy() requires stacked memories
-            max_col = [-1] * tc.dev.MAX_PROC
-            min_col = [tc.dev.MASK_WIDTH_LARGE if not legacy_kernels else 0] * tc.dev.MAX_PROC
+            chains = []
             for p in range(0, tc.dev.MAX_PROC):
-                for col in range(0, tc.dev.mask_width(p)):
-                    ll = kernel_map[p][col]
-                    if ll != _INVALID_VALUE:
-                        max_col[p] = col
-                        min_col[p] = min(min_col[p], col)
-            p = 0
-            while p < tc.dev.MAX_PROC:
-                if max_col[p] >= 0:
-                    start = p
-                    while (
-                            max_col[p] == tc.dev.MASK_OFFS and
-                            p+1 < tc.dev.MAX_PROC and
-                            max_col[p+1] >= 0 and
-                            min_col[p+1] == 0 and
-                            (start & ~(tc.dev.P_NUMPRO-1)) == (p+1 & ~(tc.dev.P_NUMPRO-1))
-                    ):
-                        p += 1
-                    # Combine multiple channels into one define
-                    k = None
-                    for i in range(start, p + 1):
-                        if k is None:
-                            k = kernel_values[i][
-                                min_col[i] * _WORDS_PER_KERNEL:
-                                (max_col[i] + 1) * _WORDS_PER_KERNEL
-                            ]
-                        else:
-                            k = np.concatenate(
-                                (k, kernel_values[i][
-                                        min_col[i] * _WORDS_PER_KERNEL:
-                                        (max_col[i] + 1) * _WORDS_PER_KERNEL
-                                    ])
-                            )
+                for first, last in spans[p]:
+                    if chains and chains[-1][-1][2] == tc.dev.MASK_OFFS \
+                       and chains[-1][-1][0] + 1 == p and first == 0 \
+                       and (chains[-1][0][0] & ~(tc.dev.P_NUMPRO-1)) \
+                       == (p & ~(tc.dev.P_NUMPRO-1)):
+                        chains[-1].append((p, first, last))
+                    else:
+                        chains.append([(p, first, last)])
+            names = []
+            for chain in chains:
+                start = chain[0][0]
+                n = sum(c[0][0] == start for c in chains[:len(names)])
+                names.append(f'{start}_{n}' if n > 0 else f'{start}')
 
-                    apb.output_define(k, f'KERNELS_{start}', '0x%08x', 8)
-                p += 1
+            # First, define the weights (will move to header file)
+            for name, chain in zip(names, chains):
+                # Combine multiple channels into one define
+                k = np.concatenate([kernel_values[i][first * _WORDS_PER_KERNEL:
+                                                     (last + 1) * _WORDS_PER_KERNEL]
+                                    for i, first, last in chain])
+                apb.output_define(k, f'KERNELS_{name}', '0x%08x', 8)
 
             # Second, initialize static const variables as source for memcpy
-            p = 0
-            while p < tc.dev.MAX_PROC:
-                if max_col[p] >= 0:
-                    span = max_col[p] + 1 - min_col[p]
-                    start = p
-                    while (
-                            max_col[p] == tc.dev.MASK_OFFS and
-                            p+1 < tc.dev.MAX_PROC and
-                            max_col[p+1] >= 0 and
-                            min_col[p+1] == 0 and
-                            (start & ~(tc.dev.P_NUMPRO-1)) == (p+1 & ~(tc.dev.P_NUMPRO-1))
-                    ):
-                        p += 1
-                        span += max_col[p] + 1 - min_col[p]
-                    if riscv_flash:
-                        apb.output(rv.RISCV_FLASH, api)
-                    apb.output(f'static const uint32_t kernels_{start}[] = KERNELS_{start};\n',
-                               api)
-                p += 1
+            for name in names:
+                if riscv_flash:
+                    apb.output(rv.RISCV_FLASH, api)
+                apb.output(f'static const uint32_t kernels_{name}[] = KERNELS_{name};\n', api)
             apb.output('\n', api)
 
             # Generate code to load the weights using memcpy
@@ -495,39 +741,28 @@ def load(  # pylint: disable=too-many-branches,too-many-statements
             # When using the express loader, gather all consecutive kernels for each processor
             # and pack them.
             zero_kernel = np.array([0] * 9, dtype=np.uint8)
-            k = None
+            chains = []
+            names = []
 
             for p in range(tc.dev.MAX_PROC):
-                # Find min/max from kernel_map
-                max_col = -1
-                min_col = tc.dev.mask_width(p) if not legacy_kernels else 0
-                for col in range(0, tc.dev.mask_width(p)):
-                    ll = kernel_map[p][col]
-                    if ll != _INVALID_VALUE:
-                        max_col = col
-                        min_col = min(min_col, col)
-                if max_col >= 0:
-                    for col in range(min_col, max_col + 1):
-                        ll = kernel_map[p][col]
-                        if ll != _INVALID_VALUE:
-                            new_k = (kernel_data[p][col] & 0xff).astype(np.uint8)
-                        else:
-                            new_k = zero_kernel
-                        if k is None:
-                            k = new_k
-                        else:
-                            k = np.concatenate((k, new_k))
+                for n, (first, last) in enumerate(spans[p]):
+                    name = f'{p}_{n}' if n > 0 else f'{p}'
+                    chains.append([(p, first, last)])
+                    names.append(name)
+                    k = np.concatenate([(kernel_data[p][col] & 0xff).astype(np.uint8)
+                                        if kernel_map[p][col] != _INVALID_VALUE
+                                        else zero_kernel for col in range(first, last + 1)])
 
                     # Round up to multiple of 4
                     if len(k) % 4 != 0:
                         k = np.concatenate((k, zero_kernel[:4 - len(k) % 4]))
                     # '>u4' swaps endianness to what the hardware needs, `view` packs into 32-bit
                     if not blocklevel:
-                        apb.output_define(k.view(dtype='>u4'), f'KERNELS_{p}', '0x%08x', 8)
+                        apb.output_define(k.view(dtype='>u4'), f'KERNELS_{name}', '0x%08x', 8)
                     else:
                         addr = tc.dev.C_GROUP_OFFS * (p // tc.dev.P_NUMPRO) \
                             + tc.dev.C_MRAM_BASE + (p % tc.dev.P_NUMPRO) * tc.dev.MASK_OFFS * 16
-                        apb.write(addr + min_col * 4 | 0x01, 0x01)
+                        apb.write(addr + first * 4 | 0x01, 0x01)
                         kb = k.view(dtype=">u4")
                         for _, e in enumerate(kb):
                             apb.write(addr, e)
@@ -535,49 +770,55 @@ def load(  # pylint: disable=too-many-branches,too-many-statements
 
                     if riscv_flash:
                         apb.output(rv.RISCV_FLASH, api)
-                    apb.output(f'static const uint32_t kernels_{p}[] = KERNELS_{p};\n', api)
-                    k = None
+                    apb.output(f'static const uint32_t kernels_{name}[] = KERNELS_{name};\n',
+                               api)
             apb.output('\n', api)
 
         if not blocklevel:
             apb.function_header(function='load_weights')
-            max_col = [-1] * tc.dev.MAX_PROC
-            min_col = [tc.dev.MASK_WIDTH_LARGE if not legacy_kernels else 0] * tc.dev.MAX_PROC
-            for p in range(0, tc.dev.MAX_PROC):
-                for col in range(0, tc.dev.mask_width(p)):
-                    ll = kernel_map[p][col]
-                    if ll != _INVALID_VALUE:
-                        max_col[p] = col
-                        min_col[p] = min(min_col[p], col)
-            p = 0
-            while p < tc.dev.MAX_PROC:
-                if max_col[p] >= 0:
-                    span = max_col[p] + 1 - min_col[p]
-                    start = p
-                    addr = apb.apb_base + tc.dev.C_GROUP_OFFS * (p // tc.dev.P_NUMPRO) \
-                        + tc.dev.C_MRAM_BASE + (p % tc.dev.P_NUMPRO) * tc.dev.MASK_OFFS * 16
-                    while (
-                            max_col[p] == tc.dev.MASK_OFFS and
-                            p+1 < tc.dev.MAX_PROC and
-                            max_col[p+1] >= 0 and
-                            min_col[p+1] == 0 and
-                            (start & ~(tc.dev.P_NUMPRO-1)) == (p+1 & ~(tc.dev.P_NUMPRO-1))
-                    ):
-                        p += 1
-                        span += max_col[p] + 1 - min_col[p]
-                    assert addr % 16 == 0
-                    if not mexpress:
-                        apb.output('  memcpy_96to128((uint32_t *)'
-                                   f' 0x{addr + min_col[start] * 16:08x},'
-                                   f' kernels_{start}, {span});\n', api)
-                    else:
-                        apb.output('  *((volatile uint8_t *)'
-                                   f' 0x{addr + min_col[start] * 4 | 0x01:08x}) = 0x01; '
-                                   '// Set address\n', api)
-                        apb.output(f'  memcpy32((uint32_t *) 0x{addr:08x}, '
-                                   f'kernels_{start}, {(span * 9 + 3) // 4});\n', api)
-                p += 1
+            transfers = []
+            for name, chain in zip(names, chains):
+                start, first, _ = chain[0]
+                span = sum(last + 1 - first for _, first, last in chain)
+                addr = apb.apb_base + tc.dev.C_GROUP_OFFS * (start // tc.dev.P_NUMPRO) \
+                    + tc.dev.C_MRAM_BASE + (start % tc.dev.P_NUMPRO) * tc.dev.MASK_OFFS * 16
+                assert addr % 16 == 0
+                if not mexpress:
+                    apb.output('  memcpy_96to128((uint32_t *)'
+                               f' 0x{addr + first * 16:08x},'
+                               f' kernels_{name}, {span});\n', api)
+                elif dma:
+                    transfers.append((addr + first * 4 | 0x01, 0x01, addr, f'kernels_{name}',
+                                      (span * 9 + 3) // 4))
+                else:
+                    apb.output('  *((volatile uint8_t *)'
+                               f' 0x{addr + first * 4 | 0x01:08x}) = 0x01; '
+                               '// Set address\n', api)
+                    apb.output(f'  memcpy32((uint32_t *) 0x{addr:08x}, '
+                               f'kernels_{name}, {(span * 9 + 3) // 4});\n', api)
+            if transfers:
+                apb.dma_table('kernels_dma', transfers)
 
             apb.function_footer()  # load_weights()
 
+    if skip_zero:
+        # Compare with loading all columns from the first to the last used column
+        full = [load_runs(kernel_map[p] != _INVALID_VALUE, legacy_kernels)
+                for p in range(tc.dev.MAX_PROC)]
+        before = sum(last + 1 - first for runs in full for first, last in runs)
+        after = sum(last + 1 - first for runs in spans for first, last in runs)
+        if mexpress:
+            writes = sum(((last + 1 - first) * 9 + 3) // 4 + 1 for runs in full
+                         for first, last in runs) \
+                - sum(((last + 1 - first) * 9 + 3) // 4 + 1 for runs in spans
+                      for first, last in runs)
+        elif embedded_code:
+            writes = (before - after) * 4
+        else:
+            writes = int(np.sum((kernel_map != _INVALID_VALUE) & ~needed)) * 4
+            before = int(np.sum(kernel_map != _INVALID_VALUE))
+            after = int(np.sum(needed))
+        print(f'Zero kernels: loading {after:,} of {before:,} kernels, skipping '
+              f'{(before - after) * 9:,} bytes and {writes:,} writes.')
+
     return kern_offs, kern_len, kern_count, kern_ochan
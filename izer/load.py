@@ -12,9 +12,38 @@ import numpy as np
 from . import camera, rv
 from . import tornadocnn as tc
 from .eprint import eprint
-from .utils import popcount, s2u
+from .utils import popcount
 
 
+def pack_words(
+        data,
+):
+    """
+    Pack the bytes along the last axis of `data` into little endian 32-bit words, padding the
+    last word with zeros.
+    """
+    data = np.asarray(data, dtype=np.int64) & 0xff
+    pad = -data.shape[-1] % 4
+    if pad:
+        data = np.pad(data, [(0, 0)] * (data.ndim - 1) + [(0, pad)])
+    data = data.reshape(data.shape[:-1] + (-1, 4))
+    return data[..., 0] | data[..., 1] << 8 | data[..., 2] << 16 | data[..., 3] << 24
+
+
+def write_bytes(
+        apb,
+        addr,
+        pieces,
+):
+    """
+    Write the concatenated byte arrays `pieces` to data memory address `addr` using `apb`.
+    """
+    if pieces:
+        words = pack_words(np.concatenate(pieces))
+        apb.write_data_block(addr + 4 * np.arange(len(words)), words)
+
+
+@tc.device_scope
 def load(
         embedded_code,
         apb,
@@ -35,7 +64,9 @@ def load(
         csv_file=None,
         camera_format=888,
         camera_retrace=0,
+        csv_frames=None,
         fixed_input=False,
+        dma=False,
         debug=False,
 ):
     """
@@ -46,7 +77,10 @@ def load(
     The code performs optional `padding`, can `split` the input into more than one chunk
     and has optional `debug` output.
     The code is target for simulation (`embedded_code` == `False`) or embedded hardware (`True`).
+    With `dma`, the embedded code copies the input to data memory using DMA transfers.
     Output is written to the `apb` object.
+    Returns the list of the data memory address, the buffer number and the 32-bit words of
+    each buffer that the embedded code copies (empty when the data is written directly).
     """
 
     if fixed_input and not embedded_code:
@@ -63,6 +97,7 @@ def load(
             csv_file,
             camera_format,
             camera_retrace,
+            csv_frames,
             debug,
         )
     # else:
@@ -83,7 +118,6 @@ def load(
 
     input_list = []
     chan = input_size[0]
-    out_map = apb.get_mem()
 
     if not embedded_code:
         apb.output('\n\n  ')
@@ -101,6 +135,7 @@ def load(
     assert operands == data.shape[0] // input_size[0]
 
     buffer_list = [[] for i in range(tc.dev.MAX_PROC)]
+    in_bytes = np.asarray(data, dtype=np.int64) & 0xff
 
     for ch in range(0, tc.dev.MAX_CHANNELS, step):
         instance_map = (processor_map >> (ch % tc.dev.MAX_PROC)) % 2**step
@@ -139,30 +174,19 @@ def load(
             if embedded_code and split == 1:
                 # Create optimized code when we're not splitting the input
                 apb.output(f'// CHW {input_size[1]}x{input_size[2]}, channel {c}\n')
-                offs = 0
-                code_buffer = np.zeros(input_size[1] * input_size[2] // 4, dtype=np.int64)
                 addr = data_offs
-
-                val = 0
-                for row in range(input_size[1]):
-                    for col in range(input_size[2]):
-                        shift = (row * input_size[2] + col) % 4
-                        val |= (s2u(data[c][row][col]) & 0xff) << (shift * 8)
-                        if shift == 3:
-                            apb.check_overwrite(data_offs & ~3)
-                            out_map[(data_offs & ~3) >> 2] = (-1, c, row, col, val)
-                            code_buffer[offs] = val
-                            offs += 1
-                            val = 0
-                        data_offs += 1
-                        if data_offs & ~3 == 0:
-                            data_offs += 4 * (in_expand - 1)
-
-                if shift != 3:
-                    apb.check_overwrite(data_offs & ~3)
-                    out_map[(data_offs & ~3) >> 2] = (-1, c, row, col, val)
-                    code_buffer[offs] = val
-                    offs += 1
+                size = input_size[1] * input_size[2]
+                code_buffer = pack_words(data[c].reshape(-1))
+                offs = len(code_buffer)
+
+                # Record each word with the position of its last byte
+                rows, cols = np.divmod(np.minimum(np.arange(3, 4 * offs, 4), size - 1),
+                                       input_size[2])
+                apb.write_data_block(addr + 4 * np.arange(offs), code_buffer,
+                                     [(-1, c, row, col, val) for row, col, val
+                                      in zip(rows.tolist(), cols.tolist(), code_buffer.tolist())],
+                                     write=False)
+                data_offs += size
 
                 if not fixed_input:
                     apb.output_define(code_buffer, f'SAMPLE_INPUT_{ch}', '0x%08x', 8,
@@ -171,7 +195,7 @@ def load(
                     apb.output(rv.RISCV_FLASH)
                 if not fixed_input:
                     apb.output(f'static const uint32_t input_{ch}[] = SAMPLE_INPUT_{ch};\n\n')
-                input_list.append((addr, ch, offs))
+                input_list.append((addr, ch, code_buffer))
 
                 apb.data_offs = data_offs  # For mixed HWC/CHW operation
             else:
@@ -183,46 +207,36 @@ def load(
 
                 apb.output(f'  // CHW {input_size[1]}x{input_size[2]}, channel {c}\n')
 
+                # The bytes of each channel are contiguous, also for multi-pass input
                 chunk = input_size[1] // split
-                # (Note: We do not need to flush here, since that is done at the
-                # end of each channel's output below)
+                start, pieces = data_offs, []
                 if split > 1:
                     # Add top pad
-                    for _ in range(padding[0]):
-                        for _ in range(input_size[2]):
-                            apb.write_byte(data_offs, 0)
-                            data_offs += 1
-                            if data_offs & ~3 == 0:
-                                data_offs += 4 * (in_expand - 1)
+                    pieces.append(np.zeros(padding[0] * input_size[2], dtype=np.int64))
+                    data_offs += len(pieces[-1])
                 row = 0
                 for s in range(split):
                     if split > 1 and s + 1 < split:
                         overlap = padding[0]
                     else:
                         overlap = 0
-                    while row < (s + 1) * chunk + overlap:
-                        for col in range(input_size[2]):
-                            apb.write_byte(data_offs, s2u(data[c][row][col]))
-                            data_offs += 1
-                            if data_offs & ~3 == 0:
-                                data_offs += 4 * (in_expand - 1)
-                        row += 1
-                    row -= 2*overlap  # Rewind
+                    end = max(row, (s + 1) * chunk + overlap)
+                    pieces.append(data[c][row:end].reshape(-1))
+                    data_offs += len(pieces[-1])
+                    row = end - 2*overlap  # Rewind
                     # Switch to next memory instance
                     if split > 1 and s + 1 < split:
                         new_data_offs = ((data_offs + tc.dev.INSTANCE_SIZE - 1) //
                                          tc.dev.INSTANCE_SIZE) * tc.dev.INSTANCE_SIZE
                         if new_data_offs != data_offs:
-                            apb.write_byte_flush(0)
+                            write_bytes(apb, start, pieces)
+                            start, pieces = new_data_offs, []
                         data_offs = new_data_offs
                 if split > 1:
                     # Add bottom pad
-                    for _ in range(padding[0]):
-                        for _ in range(input_size[2]):
-                            apb.write_byte(data_offs, 0)
-                            data_offs += 1
-                            if data_offs & ~3 == 0:
-                                data_offs += 4 * (in_expand - 1)
+                    pieces.append(np.zeros(padding[0] * input_size[2], dtype=np.int64))
+                    data_offs += len(pieces[-1])
+                write_bytes(apb, start, pieces)
             c += 1
         else:
             # HWC ("Little Data") - (Up to) four channels packed into a word
@@ -232,35 +246,29 @@ def load(
                 apb.output(f'// HWC {input_size[1]}x{input_size[2]}, '
                            f'channels {c} to {c+num_ch-1}\n')
 
+            # Always write multiple of four bytes even for last input, fill gaps with 0
+            vals = np.zeros((operands, input_size[1], input_size[2]), dtype=np.int64)
+            this_c = c
+            for i in range(4):
+                if instance_map & 2**i:
+                    if this_c < len(data) // operands:
+                        vals |= in_bytes[this_c::input_size[0]] << (i * 8)
+                    this_c += 1
+            vals = vals.transpose(1, 2, 0).reshape(-1)  # Operands of each pixel are adjacent
+
+            pixel, op = np.divmod(np.arange(len(vals)), operands)
+            addrs = data_offs + 4 * (pixel * in_expand * operands + op)
+            rows, cols = np.divmod(pixel, input_size[2])
+            apb.write_data_block(addrs, vals,
+                                 [(-1, this_c, row, col, val) for row, col, val
+                                  in zip(rows.tolist(), cols.tolist(), vals.tolist())],
+                                 write=not embedded_code)
+            apb.data_offs = int(addrs[-1])  # For mixed HWC/CHW operation
+
             if embedded_code:
-                offs = 0
-                code_buffer = np.zeros(operands * input_size[1] * input_size[2], dtype=np.int64)
+                code_buffer = vals
                 addr = data_offs
-
-            for row in range(input_size[1]):
-                for col in range(input_size[2]):
-                    for op in range(operands):
-                        # Always write multiple of four bytes even for last input
-                        # Handle gaps and fill with 0
-                        val = 0
-                        this_c = c
-                        for i in range(4):
-                            if instance_map & 2**i:
-                                if this_c < len(data) // operands:
-                                    val |= (s2u(data[this_c + op*input_size[0]][row][col])
-                                            & 0xff) << (i * 8)
-                                this_c += 1
-
-                        apb.check_overwrite(data_offs)
-                        out_map[data_offs >> 2] = (-1, this_c, row, col, val)
-                        if not embedded_code:
-                            apb.write_data(data_offs, val)
-                        else:
-                            code_buffer[offs] = val
-                            offs += 1
-                        apb.data_offs = data_offs  # For mixed HWC/CHW operation
-                        data_offs += 4
-                    data_offs += 4 * (in_expand - 1) * operands
+            data_offs += 4 * in_expand * operands * input_size[1] * input_size[2]
 
             if embedded_code:
                 proc = ch % tc.dev.MAX_PROC
@@ -273,11 +281,11 @@ def load(
                     buf = np.zeros((expand + 1) * operands * input_size[1] * input_size[2],
                                    dtype=np.int64)
 
-                    # Merge all buffers into big buffer
+                    # Merge all buffers into big buffer, the operands of each pass are adjacent
                     for i, e in enumerate(buffer_list[proc]):
                         apb.output(f'// HWC {input_size[1]}x{input_size[2]}, '
                                    f'channels {e[2]} to {e[3]}\n')
-                        buf[i::in_expand] = e[0]
+                        buf.reshape(-1, in_expand, operands)[:, i] = e[0].reshape(-1, operands)
 
                     if not fixed_input:
                         apb.output_define(buf, f'SAMPLE_INPUT_{proc}', '0x%08x', 8, weights=False)
@@ -287,8 +295,8 @@ def load(
                         apb.output(f'static const uint32_t input_{proc}[] = '
                                    f'SAMPLE_INPUT_{proc};\n\n')
 
-                    # Append information using first address, processor number, and total length
-                    input_list.append((buffer_list[proc][0][1], proc, offs * in_expand))
+                    # Append information using first address, processor number, and the words
+                    input_list.append((buffer_list[proc][0][1], proc, buf))
 
             c += num_ch
 
@@ -313,20 +321,26 @@ def load(
                                 return_type='void')
             apb.output('  // This function loads the sample data input -- '
                        'replace with actual data\n\n')
-            for _, (addr, ch, offs) in enumerate(input_list):
-                if not fixed_input:
-                    apb.output(f'  memcpy32((uint32_t *) 0x{apb.apb_base + addr:08x}, input_{ch}, '
-                               f'{offs});\n')
-                else:
-                    apb.output(f'  memcpy32_const((uint32_t *) 0x{apb.apb_base + addr:08x}, '
-                               f'{offs});\n')
+            if dma and not fixed_input:
+                apb.dma_table('input_dma', [(None, 0, apb.apb_base + addr, f'input_{ch}',
+                                             len(words)) for addr, ch, words in input_list],
+                              dest='wrapper')
+            else:
+                for _, (addr, ch, words) in enumerate(input_list):
+                    if not fixed_input:
+                        apb.output(f'  memcpy32((uint32_t *) 0x{apb.apb_base + addr:08x}, '
+                                   f'input_{ch}, {len(words)});\n')
+                    else:
+                        apb.output('  memcpy32_const((uint32_t *) '
+                                   f'0x{apb.apb_base + addr:08x}, {len(words)});\n')
         apb.function_footer(dest='wrapper', return_value='void')  # load_input()
     else:
         apb.output('  // End of data input\n\n')
 
-    return None
+    return input_list
 
 
+@tc.device_scope
 def loadfifo(
         embedded_code,
         apb,
@@ -364,33 +378,29 @@ def loadfifo(
             apb.output(f' total / {input_size[1]*input_size[2]} bytes per channel')
         apb.output('):\n')
 
-        if embedded_code:
-            code_buffer = np.zeros((input_size[0], (input_size[1] * input_size[2] + 3) // 4),
-                                   dtype=np.int64)
-
-        for row_col in range(0, input_size[1] * input_size[2], 4):
-            pmap = 0
-            for c in range(input_size[0]):
-                if pmap == 0:
-                    pmap = processor_map
-                    fifo = 0
-                while pmap & 1 == 0:
-                    pmap >>= 16
-                    fifo += 1
-                val = 0
-                for b in range(4):
-                    if row_col + b < input_size[1] * input_size[2]:
-                        row, col = divmod(row_col + b, input_size[2])
-                        val |= (s2u(data[c][row][col]) & 0xff) << b * 8
-                if not embedded_code:
-                    apb.write(0, val, '', fifo=fifo)
-                    for _ in range(slowdown):
-                        apb.output('  asm volatile("nop");\n')
-                else:
-                    code_buffer[fifo][row_col // 4] = val
-
+        # Each channel uses the next FIFO that is enabled in the processor map
+        fifo_map = []
+        pmap = 0
+        for c in range(input_size[0]):
+            if pmap == 0:
+                pmap = processor_map
+                fifo = 0
+            while pmap & 1 == 0:
                 pmap >>= 16
                 fifo += 1
+            fifo_map.append(fifo)
+            pmap >>= 16
+            fifo += 1
+
+        words = pack_words(np.reshape(data[:input_size[0]], (input_size[0], -1)))
+        if not embedded_code:
+            # Interleave the channels
+            apb.write_fifo_block(words.T.reshape(-1), np.tile(fifo_map, words.shape[1]),
+                                 slowdown)
+        else:
+            code_buffer = np.zeros_like(words)
+            for c, fifo in enumerate(fifo_map):
+                code_buffer[fifo] = words[c]
 
         if embedded_code:
             fifos = input_size[0]
@@ -403,33 +413,32 @@ def loadfifo(
             apb.output(f' total / {input_size[1]*input_size[2]} bytes per channel')
         apb.output('):\n')
 
-        if embedded_code:
-            code_buffer = np.zeros(((input_size[0] + 3) // 4, input_size[1] * input_size[2]),
-                                   dtype=np.int64)
-
-        for row in range(input_size[1]):
-            for col in range(input_size[2]):
-                pmap = 0
-                for c in range(0, input_size[0], 4):
-                    if pmap == 0:
-                        pmap = processor_map
-                        fifo = 0
-                    while pmap & 0x0f == 0:
-                        pmap >>= 16
-                        fifo += 1
-                    val = 0
-                    for b in range(4):
-                        if pmap & 1 != 0 and c + b < input_size[0]:
-                            val |= (s2u(data[c + b][row][col]) & 0xff) << b * 8
-                        pmap >>= 1
-                    if not embedded_code:
-                        apb.write(0, val, '', fifo=fifo)
-                        for _ in range(slowdown):
-                            apb.output('  asm volatile("nop");\n')
-                    else:
-                        code_buffer[fifo][row * input_size[2] + col] = val
-                    pmap >>= 12
-                    fifo += 1
+        # Each group of four channels uses the next FIFO that is enabled in the processor map
+        in_bytes = np.reshape(np.asarray(data, dtype=np.int64) & 0xff, (len(data), -1))
+        fifo_map = []
+        words = np.zeros(((input_size[0] + 3) // 4, in_bytes.shape[1]), dtype=np.int64)
+        pmap = 0
+        for c in range(0, input_size[0], 4):
+            if pmap == 0:
+                pmap = processor_map
+                fifo = 0
+            while pmap & 0x0f == 0:
+                pmap >>= 16
+                fifo += 1
+            for b in range(4):
+                if pmap & 2**b != 0 and c + b < input_size[0]:
+                    words[c // 4] |= in_bytes[c + b] << b * 8
+            fifo_map.append(fifo)
+            pmap >>= 16
+            fifo += 1
+
+        if not embedded_code:
+            apb.write_fifo_block(words.T.reshape(-1), np.tile(fifo_map, words.shape[1]),
+                                 slowdown)
+        else:
+            code_buffer = np.zeros_like(words)
+            for c, fifo in enumerate(fifo_map):
+                code_buffer[fifo] = words[c]
 
         if embedded_code:
             fifos = (input_size[0] + 3) // 4
@@ -477,6 +486,7 @@ def loadfifo(
         apb.output('  // End of data input\n\n')
 
 
+@tc.device_scope
 def loadcsv(
         embedded_code,
         apb,
@@ -487,13 +497,15 @@ def loadcsv(
         csv_file=None,
         camera_format=888,
         camera_retrace=0,
+        csv_frames=None,
         debug=False,  # pylint: disable=unused-argument
 ):
     """
     Create C code to load data into FIFO(s) from the camera interface.
     The code is target for simulation (`embedded_code` == `False`) or embedded hardware (`True`).
     Output is written to the `apb` object.
-    Additionally, the code creates a CSV file with input data for simulation.
+    Additionally, the code creates a CSV file with input data for simulation. The optional
+    `csv_frames` are sent before `data`, for a stream of several inferences.
     """
     assert operands == 1  # We don't support multiple operands here
     # FIXME: Support multiple operands
@@ -567,34 +579,9 @@ def loadcsv(
 
         apb.output('}\n\n')
 
+        # Any additional frames precede the sample data, so the final inference checks the
+        # sample data
+        if csv_frames is None:
+            csv_frames = []
         with open(csv_file, mode='w') as f:
-            camera.header(f)
-
-            if camera_format == 888:
-                for row in range(input_size[1]):
-                    for col in range(input_size[2]):
-                        for c in range(0, input_size[0]):
-                            camera.pixel(f, s2u(data[c][row][col]) & 0xff)
-                    camera.finish_row(f, retrace=camera_retrace)
-            elif camera_format == 555:
-                for row in range(input_size[1]):
-                    for col in range(input_size[2]):
-                        w = (s2u(data[0][row][col]) & 0xf8) << 7 \
-                            | (s2u(data[1][row][col]) & 0xf8) << 2 \
-                            | (s2u(data[2][row][col]) & 0xf8) >> 3
-                        camera.pixel(f, w >> 8 & 0xff)
-                        camera.pixel(f, w & 0xff)
-                    camera.finish_row(f, retrace=camera_retrace)
-            elif camera_format == 565:
-                for row in range(input_size[1]):
-                    for col in range(input_size[2]):
-                        w = (s2u(data[0][row][col]) & 0xf8) << 8 \
-                            | (s2u(data[1][row][col]) & 0xfc) << 3 \
-                            | (s2u(data[2][row][col]) & 0xf8) >> 3
-                        camera.pixel(f, w >> 8 & 0xff)
-                        camera.pixel(f, w & 0xff)
-                    camera.finish_row(f, retrace=camera_retrace)
-            else:
-                raise RuntimeError(f'Unknown camera format {camera_format}')
-
-            camera.finish_image(f)
+            camera.stimulus(f, list(csv_frames) + [data], camera_format, camera_retrace)
@@ -7,13 +7,17 @@
 """
 Backend for MAX7800X embedded code generation and RTL simulations
 """
+import contextvars
 import hashlib
+import io
+import json
 import os
 import sys
 
 import numpy as np
 
-from . import apbaccess, assets, compute, kbias, kernels, load, op, rtlsim, stats
+from . import (apbaccess, assets, check, compute, hostmodel, kbias, kernels, load, op, rtlsim,
+               stats, toplevel, unload)
 from . import tornadocnn as tc
 from .eprint import eprint, wprint
 from .simulate import (conv1d_layer, conv2d_layer, convtranspose2d_layer, eltwise_layer,
@@ -21,13 +25,14 @@ from .simulate import (conv1d_layer, conv2d_layer, convtranspose2d_layer, eltwis
 from .utils import ffs, fls, popcount
 
 
+@tc.device_scope
 def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-branches
         prefix,
         verbose,
         verbose_all,
         debug,
         debug_computation,
-        debug_latency,  # pylint: disable=unused-argument
+        debug_latency,
         no_error_stop,
         overwrite_ok,
         log,
@@ -119,6 +124,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         input_csv_period=None,
         input_csv_format=None,
         input_csv_retrace=None,
+        input_csv_frames=None,
         input_fifo=False,
         input_sync=False,
         sleep=False,
@@ -153,10 +159,43 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         result_output=False,
         weight_start=0,
         wfi=True,
+        fps_frames=0,
+        unload_channels=None,
+        unload_window=None,
+        top_k=0,
+        test_samples=None,
+        test_argmax=False,
         bypass=None,
+        energy_json=None,
+        check_only=False,
+        kernel_placement='greedy',
+        kernel_reserved=None,
+        bias_reserved=None,
+        kernel_deduplicate=False,
+        skip_zero_kernels=False,
+        dma=None,
+        host_model=False,
 ):
     """
-    Chain multiple CNN layers, create and save input and output
+    Chain multiple CNN layers, create and save input and output.
+    With `check_only`, only check the configuration and the resources it needs, and return the
+    estimated cycles and resource use as a dictionary. `kernel_placement` selects how the
+    kernels are placed in kernel memory (see `kernels.load()`). `kernel_reserved` and
+    `bias_reserved` list the kernel memory columns of each processor and the bias memory bytes
+    of each group that are used by other networks and must not be overwritten. With
+    `kernel_deduplicate`, layers with the same kernels as a prior layer share its kernel memory.
+    With `skip_zero_kernels`, all-zero kernels are not loaded into the cleared kernel memory.
+    The camera simulation sends the images `input_csv_frames` before `data`.
+    With `dma` set to `'poll'` or `'interrupt'`, the embedded code loads the kernels (with
+    `mexpress`) and the input using DMA, and waits for the transfers by polling or sleeping.
+    With `fps_frames`, the embedded code measures the throughput of `fps_frames` inferences.
+    `unload_channels` and `unload_window` (row_start, col_start, row_end, col_end) select the
+    part of the final output that is unloaded and checked.
+    With `top_k`, the embedded code returns the `top_k` largest outputs of that part.
+    With `test_samples` (NCHW), the embedded code runs a test loop that checks the simulated
+    outputs of these inputs, or only the index of the largest output with `test_argmax`.
+    With `host_model`, a model of the accelerator is added that builds and checks the embedded
+    code on a Linux host.
     """
     device = tc.dev.device
 
@@ -165,6 +204,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
     in_expand_thresh = [0] * layers
     out_expand_thresh = [0] * layers
     tram_max = [0] * layers
+    stream_regs = [None] * layers  # (stream_start, delta1, delta2) for streaming layers
 
     input_dim_str = [None] * layers
     output_dim_str = [None] * layers
@@ -184,6 +224,15 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
     if link_layer and not tc.dev.SUPPORT_LINK_LAYER:
         eprint("`--link-layer` is not supported on this device.")
 
+    if kernel_reserved is not None and len(kernel_reserved) != tc.dev.MAX_PROC:
+        eprint(f"`--kernel-reserved` must list {tc.dev.MAX_PROC} processors.")
+    if bias_reserved is not None and len(bias_reserved) != tc.dev.P_NUMGROUPS:
+        eprint(f"`--bias-reserved` must list {tc.dev.P_NUMGROUPS} groups.")
+    if (kernel_reserved is not None or bias_reserved is not None) and zero_sram:
+        eprint("`--zero-sram` clears the memory reserved for other networks.")
+    if skip_zero_kernels and not zero_sram:
+        eprint("`--skip-zero-kernels` requires `--zero-sram` to clear the kernel memory.")
+
     if rd_ahead and not tc.dev.SUPPORT_READ_AHEAD:
         eprint("`--read-ahead` is not supported on this device.")
 
@@ -210,6 +259,29 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
     if riscv_flash or riscv_exclusive:
         riscv = True
 
+    if dma and (not embedded_code or riscv):
+        eprint("`--dma` requires `--embedded-code` and is not supported with RISC-V code.")
+    if dma and not mexpress:
+        wprint("`--dma` loads the kernels using the CPU unless `--mexpress` is used.")
+    if fps_frames and (not embedded_code or riscv or timer is None or forever
+                       or input_csv is not None):
+        eprint("`--fps-frames` requires `--embedded-code` and `--timer`, and is not supported "
+               "with RISC-V code, `--forever` or `--input-csv`.")
+    if test_samples is not None and (not embedded_code or riscv or timer is None or forever
+                                     or fifo or input_csv is not None or fixed_input
+                                     or big_data[start_layer] and split > 1):
+        eprint("`--test-samples` requires `--embedded-code` and `--timer`, and is not supported "
+               "with RISC-V code, `--forever`, `--fifo`, `--input-csv`, `--fixed-input` or "
+               "split CHW input.")
+    if host_model and (not embedded_code or riscv or dma or mlator or fast_fifo or fast_fifo_quad
+                       or oneshot or stopstart or calcx4 or verify_kernels or forever
+                       or fixed_input or input_csv is not None or synthesize_input is not None
+                       or clock_trim is not None or big_data[start_layer] and split > 1):
+        eprint("`--host-model` requires `--embedded-code`, and is not supported with RISC-V "
+               "code, `--dma`, `--mlator`, `--fast-fifo`, `--one-shot`, `--stop-start`, "
+               "`--calcx4`, `--verify-kernels`, `--forever`, `--fixed-input`, `--input-csv`, "
+               "`--synthesize-input`, `--clock-trim` or split CHW input.")
+
     if result_output and (mlator or oneshot or stopstart):
         result_output = False
 
@@ -262,6 +334,27 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         wprint('--mlator should only be used with 4 or more 8-bit outputs per channel; ignoring.')
         mlator = False
 
+    if unload_channels is not None or unload_window is not None:
+        if mlator:
+            eprint('`--unload-channels` and `--unload-window` cannot be used with `--mlator`.')
+        if unload_channels is not None \
+           and not all(0 <= c < output_chan[final_layer] for c in unload_channels):
+            eprint(f'`--unload-channels` must be in the range 0-{output_chan[final_layer] - 1}.')
+        if unload_window is not None \
+           and not (0 <= unload_window[0] and unload_window[2] < output_dim[final_layer][0]
+                    and 0 <= unload_window[1] and unload_window[3] < output_dim[final_layer][1]):
+            eprint(f'`--unload-window` must be inside the {output_dim[final_layer][0]}x'
+                   f'{output_dim[final_layer][1]} output of layer {final_layer}.')
+
+    channels, window = unload.region(
+        (output_chan[final_layer], *output_dim[final_layer]),
+        unload_channels,
+        unload_window,
+    )
+    output_count = len(channels) * (window[2] - window[0] + 1) * (window[3] - window[1] + 1)
+    if top_k and (not embedded_code or not 0 < top_k <= output_count):
+        eprint(f'`--top-k` requires `--embedded-code` and must be in the range 1-{output_count}.')
+
     if fast_fifo and not riscv:
         eprint('--fast-fifo requires --riscv')
 
@@ -322,7 +415,9 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 min((in_expand_thresh[ll] + tc.dev.P_SHARED-1) & ~(tc.dev.P_SHARED-1),
                     tc.dev.MAX_PROC)
 
-        assert input_dim[ll][0] * input_dim[ll][1] * in_expand[ll] < tc.dev.FRAME_SIZE_MAX
+        if input_dim[ll][0] * input_dim[ll][1] * in_expand[ll] >= tc.dev.FRAME_SIZE_MAX:
+            eprint(f'Layer {ll}: {input_dim[ll][0]}x{input_dim[ll][1]} input with expansion '
+                   f'{in_expand[ll]}x exceeds the maximum frame size of {tc.dev.FRAME_SIZE_MAX}.')
 
         # Data memory size check - 4 channels share one instance unless CHW format
         in_size = input_dim[ll][0] * input_dim[ll][1] * in_expand[ll] * operands[ll] \
@@ -396,61 +491,6 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         if input_skip[ll] != 0 and not tc.dev.SUPPORT_MULTIPASS_STRIDE:
             eprint(f'Layer {ll}: `in_skip` must be 0 for this device.')
 
-    # Create comment of the form "k1_b0-1x32x32b_2x2s2p14-..."
-    test_name = prefix
-    if not embedded_code:
-        for ll in range(first_layer_used, layers):
-            test_name += f'-{input_chan[ll]}x{input_dim_str[ll]}' \
-                         f'{"b" if big_data[ll] else "l"}' \
-                         f'{"f" if flatten[ll] else ""}_' \
-                         + ("avg" if pool_average[ll]
-                            and (pool[ll][0] > 1 or pool[ll][1] > 1) else "") \
-                         + ("max" if not pool_average[ll]
-                            and (pool[ll][0] > 1 or pool[ll][1] > 1) else "") \
-                         + f'{pool_str[ll]}s{pool_stride[ll][0]}' \
-                         f'p{padding[ll][0]}' \
-                         f'm{output_chan[ll]}'
-            if activation[ll] == op.ACT_RELU:
-                test_name += "_relu"
-            elif activation[ll] == op.ACT_ABS:
-                test_name += "_abs"
-        if repeat_layers > 1:
-            test_name += f'_repeat{repeat_layers}'
-    MAX_PATH = 255
-    if len(test_name) + len(base_directory) > MAX_PATH - 10:
-        h = hashlib.md5(test_name.encode()).hexdigest()  # Immutable hash from test name
-        cutoff = MAX_PATH - len(test_name) - len(base_directory) - len(h) - 10
-        test_name = test_name[:cutoff] + '-' + h
-    print(f'{test_name}...')
-
-    try:
-        target_dir = os.path.join(base_directory, test_name)
-        os.makedirs(target_dir, exist_ok=False)
-    except OSError:
-        wprint(target_dir, 'exists')
-
-    # Redirect stdout?
-    if log:
-        sys.stdout = open(os.path.join(base_directory, test_name, log_filename), 'w')
-        print(f'{" ".join(str(x) for x in sys.argv)}')
-        print(f'{tc.dev.partnum}\n')
-        print(f'{test_name}')
-
-    if block_mode:
-        filename = input_filename + '.mem'
-    else:
-        filename = c_filename + ('_riscv' if riscv else '') + '.c'
-    if not block_mode and (embedded_code or compact_data):
-        sampledata_header = \
-            open(os.path.join(base_directory, test_name, sample_filename), mode='w')
-    else:
-        sampledata_header = None
-    if not block_mode and (embedded_code or mexpress or compact_weights):
-        weight_header = \
-            open(os.path.join(base_directory, test_name, weight_filename), mode='w')
-    else:
-        weight_header = None
-
     # Calculate the groups needed, and groups and processors used overall
     processors_used = 0
     group_map = [None] * layers
@@ -544,6 +584,186 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
     if 0 not in groups_used:
         eprint('Group 0 is not used, this currently does not work.')
 
+    # Stream processing start and delta values
+    for ll in range(first_layer_used, layers):
+        if ll == start_layer and fifo:
+            # Start: 1
+            if override_start is not None:
+                stream_start = override_start
+            elif streaming[ll]:
+                stream_start = (pool[ll][0] - 1) * input_dim[ll][1] + pool[ll][1]
+            else:
+                val = input_dim[start_layer][0] * input_dim[start_layer][1]
+                if big_data[start_layer]:
+                    val = (val + 3) // 4
+                stream_start = val
+            assert stream_start < 2**14
+
+            if streaming[ll]:
+                # Delta 1: This layer's pooling stride
+                if override_delta1 is not None:
+                    delta1 = override_delta1
+                else:
+                    delta1 = (pool_stride[ll][1] - 1) * operands[ll]
+                assert delta1 < 2**5
+                if override_delta2 is not None:
+                    delta2 = override_delta2
+                else:
+                    delta2 = (pool[ll][0] - 1) * input_dim[ll][1] * operands[ll]
+                assert delta2 < 2**12
+            else:
+                delta1 = 0
+                delta2 = 0
+            stream_regs[ll] = (stream_start, delta1, delta2)
+        elif ll > 0 and streaming[ll]:
+            # Start: Prior layer's padded pooled row width * prior layer's kernel
+            # height + prior layer's kernel width + prior layer's pad
+            stream_start = (pooled_dim[prev_sequence[ll]][1]
+                            + 2 * padding[prev_sequence[ll]][1]) \
+                * (kernel_size[prev_sequence[ll]][0] - 1 + pool[ll][0] - 1) \
+                + kernel_size[prev_sequence[ll]][1] - 1 + pool[ll][1] + increase_start
+            assert stream_start < 2**tc.dev.MAX_ISVAL_BITS
+
+            # Delta 1: This layer's pooling stride
+            delta1 = pool_stride[ll][1] * operands[ll] + increase_delta1
+            assert delta1 < 2**5
+            # Delta 2: (This layer's pooling - 1) * full prior layer's padded rows +
+            # prior layer's pad
+            delta2 = (pool_stride[ll][0] - 1) \
+                * (pooled_dim[prev_sequence[ll]][1] + 2 * padding[prev_sequence[ll]][1]) \
+                + pool[ll][1] * operands[ll] + increase_delta2
+            assert delta2 < 2**tc.dev.MAX_DSVAL2_BITS
+            stream_regs[ll] = (stream_start, delta1, delta2)
+
+    clock = tc.dev.PLL_SPEED if pll else tc.dev.APB_SPEED  # Accelerator clock in MHz
+    if fifo:
+        # Each FIFO word is written by the CPU; HWC uses one word per pixel and FIFO,
+        # CHW packs four pixels into each word
+        if big_data[start_layer]:
+            words = input_chan[start_layer] / 4
+        else:
+            words = (input_chan[start_layer] + 3) // 4
+        fifo_cycles = words * apbaccess.WRITE_TIME_NS * clock / 1000
+    else:
+        fifo_cycles = None
+    startup, lat = stats.calc_latency(
+        streaming[start_layer:],
+        layers - start_layer,
+        eltwise[start_layer:],
+        pool[start_layer:],
+        pooled_dim[start_layer:],
+        in_expand[start_layer:],
+        output_chan[start_layer:],
+        output_dim[start_layer:],
+        input_dim[start_layer:],
+        padding[start_layer:],
+        kernel_size[start_layer:],
+        operands=operands[start_layer:],
+        stream_regs=stream_regs[start_layer:],
+        fifo_cycles=fifo_cycles,
+    )
+    if check_only:
+        proc_kern_max = check.kernel_memory(
+            first_layer_used,
+            layers,
+            operator,
+            kernel,
+            kernel_size,
+            quantization,
+            processor_map,
+            output_processor_map,
+            input_chan,
+            output_chan,
+            out_expand,
+            in_expand,
+            conv_groups,
+            flatten,
+            quad=fast_fifo_quad,
+            legacy_kernels=legacy_kernels,
+            start_offs=weight_start,
+            bypass=bypass,
+            placement=kernel_placement,
+            reserved=kernel_reserved,
+            deduplicate=kernel_deduplicate,
+        )
+        group_bias_max = check.bias_memory(
+            first_layer_used,
+            layers,
+            bias,
+            group_map,
+            output_chan,
+            streaming,
+            conv_groups,
+            broadcast_mode,
+            processor_map,
+            output_processor_map,
+            out_expand,
+            reserved=bias_reserved,
+        )
+        cycles = startup + sum(c for c, _ in lat) * repeat_layers
+        return {
+            'cycles': cycles,
+            'time_us': cycles / clock,
+            'weight_bytes': sum(proc_kern_max) * 9,
+            'bias_bytes': sum(group_bias_max),
+            'groups': len(groups_used),
+        }
+
+    # Create comment of the form "k1_b0-1x32x32b_2x2s2p14-..."
+    test_name = prefix
+    if not embedded_code:
+        for ll in range(first_layer_used, layers):
+            test_name += f'-{input_chan[ll]}x{input_dim_str[ll]}' \
+                         f'{"b" if big_data[ll] else "l"}' \
+                         f'{"f" if flatten[ll] else ""}_' \
+                         + ("avg" if pool_average[ll]
+                            and (pool[ll][0] > 1 or pool[ll][1] > 1) else "") \
+                         + ("max" if not pool_average[ll]
+                            and (pool[ll][0] > 1 or pool[ll][1] > 1) else "") \
+                         + f'{pool_str[ll]}s{pool_stride[ll][0]}' \
+                         f'p{padding[ll][0]}' \
+                         f'm{output_chan[ll]}'
+            if activation[ll] == op.ACT_RELU:
+                test_name += "_relu"
+            elif activation[ll] == op.ACT_ABS:
+                test_name += "_abs"
+        if repeat_layers > 1:
+            test_name += f'_repeat{repeat_layers}'
+    MAX_PATH = 255
+    if len(test_name) + len(base_directory) > MAX_PATH - 10:
+        h = hashlib.md5(test_name.encode()).hexdigest()  # Immutable hash from test name
+        cutoff = MAX_PATH - len(test_name) - len(base_directory) - len(h) - 10
+        test_name = test_name[:cutoff] + '-' + h
+    print(f'{test_name}...')
+
+    try:
+        target_dir = os.path.join(base_directory, test_name)
+        os.makedirs(target_dir, exist_ok=False)
+    except OSError:
+        wprint(target_dir, 'exists')
+
+    # Redirect stdout?
+    if log:
+        sys.stdout = open(os.path.join(base_directory, test_name, log_filename), 'w')
+        print(f'{" ".join(str(x) for x in sys.argv)}')
+        print(f'{tc.dev.partnum}\n')
+        print(f'{test_name}')
+
+    if block_mode:
+        filename = input_filename + '.mem'
+    else:
+        filename = c_filename + ('_riscv' if riscv else '') + '.c'
+    if not block_mode and (embedded_code or compact_data):
+        sampledata_header = \
+            open(os.path.join(base_directory, test_name, sample_filename), mode='w')
+    else:
+        sampledata_header = None
+    if not block_mode and (embedded_code or mexpress or compact_weights):
+        weight_header = \
+            open(os.path.join(base_directory, test_name, weight_filename), mode='w')
+    else:
+        weight_header = None
+
     # Create ARM code wrapper if needed
     if riscv and not block_mode:
         with open(os.path.join(base_directory, test_name, c_filename + '.c'), mode='w') as f:
@@ -609,6 +829,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
             fast_fifo=fast_fifo,
             input_csv=input_csv,
             input_csv_format=input_csv_format,
+            input_csv_frames=1 + (len(input_csv_frames) if input_csv_frames is not None else 0),
             input_chan=input_chan[start_layer],
             sleep=sleep,
             mexpress=mexpress,
@@ -631,6 +852,9 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
             output_width=output_width[final_layer],
             bias=any(b is not None for b in bias),
             wfi=wfi,
+            dma=dma,
+            fps_frames=fps_frames,
+            top_k=top_k,
         )
 
         apb.copyright_header()
@@ -681,6 +905,8 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                        '    *dst++ = *src++;\n'
                        '  }\n', embedded_code)
             apb.function_footer(return_value='void')  # memcpy32()
+        if dma:
+            apb.dma_functions()
 
         if input_fifo:
             apb.output('#define USE_FIFO\n')
@@ -707,7 +933,9 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 csv_file=csv,
                 camera_format=input_csv_format,
                 camera_retrace=input_csv_retrace,
+                csv_frames=input_csv_frames,
                 fixed_input=fixed_input,
+                dma=dma is not None,
                 debug=debug,
             )
         if not block_mode and (embedded_code or mexpress or compact_weights):
@@ -743,6 +971,11 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 api=embedded_code,
                 start_offs=weight_start,
                 bypass=bypass,
+                placement=kernel_placement,
+                reserved=kernel_reserved,
+                deduplicate=kernel_deduplicate,
+                skip_zero=skip_zero_kernels,
+                dma=dma is not None,
             )
             bias_offs, bias_group, group_bias_max = kbias.load(
                 verbose,
@@ -760,6 +993,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 output_processor_map,
                 out_expand,
                 debug,
+                reserved=bias_reserved,
             )
 
         apb.function_header(function='init')
@@ -767,36 +1001,6 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         # Initialize CNN registers
 
         if verbose:
-            # startup, lat = stats.calc_latency(
-            #     streaming,
-            #     layers,
-            #     eltwise,
-            #     pool,
-            #     pooled_dim,
-            #     in_expand,
-            #     output_chan,
-            #     output_dim,
-            #     input_dim,
-            #     padding,
-            #     kernel_size,
-            # )
-            # print('\nEstimated latency:')
-            # print('------------------')
-            # if lat is None:
-            #     print('N/A')
-            # else:
-            #     total = startup
-            #     print(f'Startup{startup:14,}')
-            #     for k in range(first_layer_used, layers):
-            #         total += lat[k][0]
-            #         print(f'Layer {k:<3}{lat[k][0]:12,}', end='')
-            #         if debug_latency:
-            #             print('', lat[k][1])
-            #         else:
-            #             print('')
-            #     print('           ==========')
-            #     print(f'Total{total:16,} cycles')
-
             print('\nGlobal registers:')
             print('-----------------')
 
@@ -940,6 +1144,10 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 calcx4=calcx4,
                 start_offs=weight_start,
                 bypass=bypass,
+                placement=kernel_placement,
+                reserved=kernel_reserved,
+                deduplicate=kernel_deduplicate,
+                skip_zero=skip_zero_kernels,
             )
             bias_offs, bias_group, group_bias_max = kbias.load(
                 verbose,
@@ -957,8 +1165,17 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 output_processor_map,
                 out_expand,
                 debug,
+                reserved=bias_reserved,
             )
 
+        # Kernel and bias memory used, including the memory reserved for other networks
+        kern_top = list(kernel_reserved or [0] * tc.dev.MAX_PROC)
+        for ll in range(first_layer_used, layers):
+            for p in range(tc.dev.MAX_PROC):
+                if processor_map[ll] >> p & 1 and kern_len[ll] > 0:
+                    kern_top[p] = max(kern_top[p], kern_offs[ll] + kern_len[ll])
+        stats.get().memory = {'kernel': kern_top, 'bias': list(group_bias_max)}
+
         if verbose:
             print('\nGlobal configuration:')
             print('---------------------')
@@ -1543,59 +1760,14 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                                    verbose, comment=' // Mask and processor enables')
 
                     if ll == start_layer and fifo:
-                        # Start: 1
-                        if override_start is not None:
-                            stream_start = override_start
-                        elif streaming[ll]:
-                            stream_start = (pool[ll][0] - 1) * input_dim[ll][1] + pool[ll][1]
-                        else:
-                            val = input_dim[start_layer][0] * input_dim[start_layer][1]
-                            if big_data[start_layer]:
-                                val = (val + 3) // 4
-                            stream_start = val
-                        assert stream_start < 2**14
-
-                        if streaming[ll]:
-                            # Delta 1: This layer's pooling stride
-                            if override_delta1 is not None:
-                                delta1 = override_delta1
-                            else:
-                                delta1 = (pool_stride[ll][1] - 1) * operands[ll]
-                            assert delta1 < 2**5
-                            if override_delta2 is not None:
-                                delta2 = override_delta2
-                            else:
-                                delta2 = (pool[ll][0] - 1) * input_dim[ll][1] * operands[ll]
-                            assert delta2 < 2**12
-                        else:
-                            delta1 = 0
-                            delta2 = 0
-
+                        stream_start, delta1, delta2 = stream_regs[ll]
                         apb.write_lreg(group, r * layers + ll, tc.dev.LREG_STREAM1, stream_start,
                                        verbose, comment=' // Stream processing start')
                         val = delta2 << 16 | delta1 << 4
                         apb.write_lreg(group, r * layers + ll, tc.dev.LREG_STREAM2, val,
                                        verbose, comment=' // Stream processing delta')
                     elif ll > 0 and streaming[ll]:
-                        # Start: Prior layer's padded pooled row width * prior layer's kernel
-                        # height + prior layer's kernel width + prior layer's pad
-                        stream_start = (pooled_dim[prev_sequence[ll]][1]
-                                        + 2 * padding[prev_sequence[ll]][1]) \
-                            * (kernel_size[prev_sequence[ll]][0] - 1 + pool[ll][0] - 1) \
-                            + kernel_size[prev_sequence[ll]][1] - 1 + pool[ll][1] + increase_start
-                        assert stream_start < 2**tc.dev.MAX_ISVAL_BITS
-
-                        # Delta 1: This layer's pooling stride
-                        delta1 = pool_stride[ll][1] * operands[ll] + increase_delta1
-                        assert delta1 < 2**5
-                        # Delta 2: (This layer's pooling - 1) * full prior layer's padded rows +
-                        # prior layer's pad
-                        delta2 = (pool_stride[ll][0] - 1) \
-                            * (pooled_dim[prev_sequence[ll]][1]
-                               + 2 * padding[prev_sequence[ll]][1]) \
-                            + pool[ll][1] * operands[ll] + increase_delta2
-                        assert delta2 < 2**tc.dev.MAX_DSVAL2_BITS
-
+                        stream_start, delta1, delta2 = stream_regs[ll]
                         apb.write_lreg(group, r * layers + ll, tc.dev.LREG_STREAM1, stream_start,
                                        verbose, comment=' // Stream processing start')
                         # strm_invol[3:0]   Per stream invol offset - based on stream count
@@ -1846,16 +2018,33 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         # End of input
 
     in_map = apb.get_mem()
+    if fps_frames:
+        # Data memory words that are written before the final layer writes its output
+        busy_words = {i for i, e in enumerate(in_map) if e is not None}
 
     if verbose:
         print('')
+        print('Estimated latency:')
+        print('------------------')
+        total = startup
+        print(f'Startup{startup:14,}')
+        for k, (cycles, desc) in enumerate(lat):
+            total += cycles
+            print(f'Layer {k + start_layer:<3}{cycles:12,}', end='')
+            if debug_latency:
+                print('', desc)
+            else:
+                print('')
+        print('           ==========')
+        print(f'Total{total:16,} cycles\n')
 
     def run_eltwise(
             data,
             ll,
+            quiet=False,
     ):
         """
-        In-flight element-wise operations
+        In-flight element-wise operations (printing nothing with `quiet`)
         """
         if operator[ll] == op.NONE:
             # Let element-wise do 32-bit, else 8-bit only
@@ -1867,13 +2056,13 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         data, out_size = eltwise_layer(
             eltwise[ll],
             ll,
-            verbose,
-            verbose_all or ll == final_layer,
+            verbose and not quiet,
+            (verbose_all or ll == final_layer) and not quiet,
             data[0].shape,
             output_shift[ll],
             data,
             output_width=o_width,
-            debug=debug_computation,
+            debug=debug_computation and not quiet,
             operands=operands[ll],
         )
         assert out_size[0] == d_shape[1] \
@@ -1881,12 +2070,18 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
 
         return data
 
-    ll = start_layer
-    data_buf = [data]
-    # Compute layer-by-layer output and chain results into input
-    while ll < layers:
-        if debug_computation:
-            compute.debug_open(ll, base_directory, test_name, log_filename)
+    def run_layer(
+            ll,
+            data_buf,
+            quiet=False,
+    ):
+        """
+        Compute the output of layer `ll` from the outputs of the prior layers in `data_buf`
+        and return it and its shape. With `quiet`, nothing is printed or logged.
+        """
+        show = verbose and not quiet
+        show_all = (verbose_all or ll == final_layer) and not quiet
+        debug_layer = debug_computation and not quiet
 
         # Concatenate input data if needed
         if in_sequences[ll] is not None:
@@ -1926,11 +2121,11 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
 
         show_data(
             ll,
-            verbose,
-            verbose_all or ll == final_layer,
+            show,
+            show_all,
             data.shape,
             data,
-            debug=debug_computation,
+            debug=debug_layer,
             expand=in_expand[ll],
             expand_thresh=in_expand_thresh[ll],
             operation=operator[ll],
@@ -1939,7 +2134,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
 
         # Run in-flight element-wise operations first?
         if operands[ll] > 1 and not pool_first[ll]:
-            data = np.expand_dims(run_eltwise(data, ll), 0)
+            data = np.expand_dims(run_eltwise(data, ll, quiet), 0)
 
         # Allow 1D <-> 2D and 2D W/L conversions
         if operator[ll] == op.CONV1D:
@@ -1951,20 +2146,21 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         # In-flight pooling
         data, out_size = pooling_layer(
             ll,
-            verbose,
-            verbose_all or ll == final_layer,
+            show,
+            show_all,
             data[0].shape,
             pool[ll],
             pool_stride[ll],
             pool_average[ll],
             data,
-            debug=debug_computation,
+            debug=debug_layer,
             expand=in_expand[ll],
             expand_thresh=in_expand_thresh[ll],
             operation=operator[ll],
             operands=data.shape[0],
             rounding=avg_pool_rounding,
-            debug_data=None if not log_pooling else os.path.join(base_directory, test_name),
+            debug_data=os.path.join(base_directory, test_name)
+            if log_pooling and not quiet else None,
         )
 
         if operator[ll] == op.CONV1D:
@@ -1981,7 +2177,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                        f'got {out_size[0]}x{out_size[1]}x{out_size[2]}.')
 
         if operands[ll] > 1 and pool_first[ll]:
-            data = run_eltwise(data, ll)
+            data = run_eltwise(data, ll, quiet)
         else:
             data = np.squeeze(data, axis=0)
 
@@ -1990,9 +2186,9 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
             if flatten[ll]:
                 in_chan *= pooled_dim[ll][0] * pooled_dim[ll][1]
                 data = data.reshape(in_chan, 1, 1)
-                if verbose:
+                if show:
                     print_data(
-                        verbose,
+                        show,
                         f'FLATTEN TO {in_chan}x1x1',
                         data,
                         data.shape,
@@ -2016,8 +2212,8 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
 
             out_buf, out_size = conv2d_layer(
                 ll,
-                verbose,
-                verbose_all or ll == final_layer,
+                show,
+                show_all,
                 data.shape,
                 kernel_size[ll],
                 output_shift[ll],
@@ -2031,7 +2227,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 data,
                 output_width=output_width[ll],
                 groups=conv_groups[ll],
-                debug=debug_computation,
+                debug=debug_layer,
                 bypass=bypass[ll],
             )
         elif operator[ll] == op.CONVTRANSPOSE2D:
@@ -2051,8 +2247,8 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
 
             out_buf, out_size = convtranspose2d_layer(
                 ll,
-                verbose,
-                verbose_all or ll == final_layer,
+                show,
+                show_all,
                 data.shape,
                 kernel_size[ll],
                 output_shift[ll],
@@ -2067,7 +2263,7 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 data,
                 output_width=output_width[ll],
                 groups=conv_groups[ll],
-                debug=debug_computation,
+                debug=debug_layer,
                 bypass=bypass[ll],
             )
         elif operator[ll] == op.CONV1D:
@@ -2086,8 +2282,8 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
 
             out_buf, out_size = conv1d_layer(
                 ll,
-                verbose,
-                verbose_all or ll == final_layer,
+                show,
+                show_all,
                 data.shape,
                 kernel_size[ll][0],
                 output_shift[ll],
@@ -2101,17 +2297,17 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 data,
                 output_width=output_width[ll],
                 groups=conv_groups[ll],
-                debug=debug_computation,
+                debug=debug_layer,
                 bypass=bypass[ll],
             )
         elif operator[ll] == op.NONE:  # '0'D (pooling only or passthrough)
             out_buf, out_size = passthrough_layer(
                 ll,
-                verbose,
-                verbose_all or ll == final_layer,
+                show,
+                show_all,
                 data.shape,
                 data,
-                debug=debug_computation,
+                debug=debug_layer,
             )
         else:
             eprint(f'Unknown operator `{op.string(operator[ll])}`.')
@@ -2119,6 +2315,39 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         assert out_size[0] == output_chan[ll] \
             and out_size[1] == output_dim[ll][0] and out_size[2] == output_dim[ll][1]
 
+        return out_buf, out_size
+
+    def run_network(
+            data,
+    ):
+        """
+        Return the output of the final layer for the input `data`, without printing or
+        generating code. The statistics are not updated.
+        """
+        def run(data_buf):
+            stats.new()  # Count the operations in the copied context only
+            ll = start_layer
+            while ll < layers:
+                stats.begin_layer(ll)
+                out_buf, out_size = run_layer(ll, data_buf, quiet=True)
+                data_buf.append(out_buf.reshape(out_size))
+                if next_sequence[ll] == -1:
+                    break
+                ll = next_sequence[ll]
+            return data_buf[-1]
+
+        return contextvars.copy_context().run(run, [data])
+
+    ll = start_layer
+    data_buf = [data]
+    # Compute layer-by-layer output and chain results into input
+    while ll < layers:
+        stats.begin_layer(ll)
+        if debug_computation:
+            compute.debug_open(ll, base_directory, test_name, log_filename)
+
+        out_buf, out_size = run_layer(ll, data_buf)
+
         # Write .mem file for output or create the C check_output() function to verify the output
         out_map = [None] * tc.dev.C_GROUP_OFFS * tc.dev.P_NUMGROUPS
         if block_mode:
@@ -2223,6 +2452,8 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 max_count=max_count,
                 write_gap=write_gap[ll],
                 final_layer=final_layer,
+                channels=unload_channels if ll == final_layer else None,
+                window=unload_window if ll == final_layer else None,
             )
             apb.function_footer(dest='wrapper')  # check_output()
         finally:
@@ -2230,6 +2461,13 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                 memfile.close()
 
         data_buf.append(out_buf.reshape(out_size))
+        if fps_frames:
+            words = {i for i, e in enumerate(out_map) if e is not None}
+            if ll != final_layer:
+                busy_words |= words
+            elif not fifo and ll != start_layer and not words & busy_words:
+                # The result can be unloaded while the CNN processes the next frame
+                apb.unload_overlap = True
         if streaming[ll]:
             # When streaming, the output should not overwrite the input of prior layers since
             # these layers are still needed.
@@ -2260,6 +2498,20 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                     output_width[final_layer],
                     mlator=mlator,
                     write_gap=write_gap[final_layer],
+                    channels=unload_channels,
+                    window=unload_window,
+                )
+            if top_k:
+                apb.top_k_layer(
+                    output_processor_map[final_layer],
+                    out_size,
+                    out_offset[final_layer],
+                    out_expand[final_layer],
+                    out_expand_thresh[final_layer],
+                    output_width[final_layer],
+                    write_gap=write_gap[final_layer],
+                    channels=unload_channels,
+                    window=unload_window,
                 )
 
             if softmax:
@@ -2267,6 +2519,37 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
                     output_width=output_width[final_layer],
                 )
 
+            if test_samples is not None:
+                # Simulate the test samples, and pack their inputs the way load_input() does
+                inputs, outputs = [], []
+                for sample in test_samples:
+                    input_list = load.load(
+                        True,
+                        apbaccess.apbwriter(io.StringIO(), apb_base=0, master=False,
+                                            embedded_code=True, sampledata_header=io.StringIO()),
+                        big_data[start_layer],
+                        processor_map_0,
+                        in_offset[start_layer],
+                        [input_chan[start_layer], input_dim[start_layer][0],
+                         input_dim[start_layer][1]],
+                        in_expand[start_layer],
+                        operands[start_layer],
+                        in_expand_thresh[start_layer],
+                        sample,
+                        padding[start_layer],
+                        split=split,
+                    )
+                    inputs.append(np.concatenate([words for _, _, words in input_list]))
+                    out = run_network(sample)[channels][:, window[0]:window[2] + 1,
+                                                        window[1]:window[3] + 1].reshape(-1)
+                    outputs.append(np.argmax(out) if test_argmax else out)
+                apb.test_loop(
+                    [(addr, len(words)) for addr, _, words in input_list],
+                    np.array(inputs),
+                    np.array(outputs),
+                    argmax=test_argmax,
+                )
+
             summary_stats = '/*\n' + \
                             stats.summary(factor=repeat_layers, debug=debug, spaces=2,
                                           weights=kernel, w_size=quantization, bias=bias,
@@ -2292,6 +2575,8 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
             timeout = 10 * (apb.get_time() + rtlsim.GLOBAL_TIME_OFFSET)
             if zero_sram:
                 timeout += 16
+            if input_csv_frames is not None:
+                timeout *= 1 + len(input_csv_frames)
         rtlsim.create_runtest_sv(
             block_mode,
             base_directory,
@@ -2319,14 +2604,16 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
     elif block_mode:
         assets.copy('assets', 'blocklevel-ai' + str(device), base_directory, test_name)
     elif embedded_code:
-        output_count = output_chan[final_layer] \
-            * output_dim[final_layer][0] * output_dim[final_layer][1]
         insert = summary_stats + \
             '\n/* Number of outputs for this network */\n' \
             f'#define CNN_NUM_OUTPUTS {output_count}'
         if timer is not None:
             insert += '\n\n/* Use this timer to time the inference */\n' \
                       f'#define CNN_INFERENCE_TIMER MXC_TMR{timer}'
+        if dma:
+            insert += toplevel.DMA_HEADER
+        if top_k:
+            insert += toplevel.TOP_K_HEADER.format(top_k=top_k)
 
         if riscv:
             assets.from_template('assets', 'embedded-riscv-ai' + str(device), base_directory,
@@ -2341,8 +2628,44 @@ def create_net(  # pylint: disable=too-many-arguments,too-many-locals,too-many-b
         assets.from_template('assets', 'device-ai' + str(device), base_directory,
                              test_name, board_name, '', riscv=riscv)
 
+        if host_model:
+            hostmodel.write(os.path.join(base_directory, test_name, 'host'), apb)
+            assets.copy('assets', 'host-model', base_directory, os.path.join(test_name, 'host'))
+
+    # Estimate energy from the op counts, data memory traffic, and weight loading
+    layer_cycles, data_read, data_written = {}, {}, {}
+    for k, (cycles, _) in enumerate(lat):
+        ll = k + start_layer
+        layer_cycles[ll] = cycles
+        data_read[ll] = operands[ll] * input_chan[ll] * input_dim[ll][0] * input_dim[ll][1]
+        data_written[ll] = output_chan[ll] * output_dim[ll][0] * output_dim[ll][1] \
+            * (4 if output_width[ll] == 32 else 1)
+    # Each 72-bit kernel is written using four APB writes, or packed with --mexpress
+    kern_words = sum(kern_len[ll] * popcount(processor_map[ll]) for ll in range(layers)
+                     if ll not in stats.get().shared_kernels)
+    kern_words = (kern_words * 9 + 3) // 4 if mexpress else kern_words * 4
+    if group_bias_max is not None:
+        bias_words = sum(group_bias_max)  # One APB write per bias byte
+    else:
+        bias_words = sum(len(e) for e in bias if e is not None)
+    energy = stats.calc_energy(
+        layer_cycles,
+        data_read,
+        data_written,
+        kern_words + bias_words,
+        clock,
+        startup=startup,
+        pll=pll,
+        boost=boost is not None,
+        factor=repeat_layers,
+    )
+    if energy_json is not None:
+        with open(os.path.join(base_directory, test_name, energy_json), 'w') as f:
+            json.dump(energy, f, indent=2)
+            f.write('\n')
+
     print(stats.summary(factor=repeat_layers, debug=debug,
                         weights=kernel, w_size=quantization, bias=bias,
-                        group_bias_max=group_bias_max))
+                        group_bias_max=group_bias_max, per_layer=verbose, energy=True))
 
     return test_name
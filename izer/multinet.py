@@ -0,0 +1,357 @@
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Multiple networks that share the accelerator: their weights and bias values are loaded once, and
+switching between the networks only rewrites the configuration registers
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+from . import assets, commandline, izer, stats
+from . import tornadocnn as tc
+from .eprint import eprint
+
+# Functions that are generated for each network
+NETWORK_FUNCTIONS = ('cnn_init', 'cnn_configure', 'cnn_load_weights', 'cnn_verify_weights',
+                     'cnn_load_bias', 'cnn_start', 'cnn_unload', 'load_input', 'check_output',
+                     'softmax_layer')
+# Functions that load all networks at once
+LOAD_FUNCTIONS = ('cnn_load_weights', 'cnn_verify_weights', 'cnn_load_bias')
+
+_ARRAY = re.compile(r'^static (?:const )?\w+ (\w+)\[')
+_DEFINE = re.compile(r'^#define (\w+)')
+
+
+def split(
+        text,
+):
+    """
+    Split the C source `text` into the lines before the first function definition, and a list
+    of top-level items. Each item is a tuple of the function name (`None` for other lines) and
+    its lines. Comments directly above a function belong to the function.
+    """
+    lines = text.split('\n')
+    items = []
+    header = None
+    other = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line and line[0].isalpha() and line.endswith(')') and '(' in line \
+           and not line.startswith('static const') and i + 1 < len(lines) \
+           and lines[i + 1] == '{':
+            comment = []
+            while other and other[-1].startswith('//'):
+                comment.insert(0, other.pop())
+            if header is None:
+                header, other = other, []
+            elif other:
+                items.append((None, other))
+                other = []
+            end = lines.index('}', i)
+            name = re.search(r'(\w+)\(', line).group(1)
+            items.append((name, comment + lines[i:end + 1]))
+            i = end + 1
+        else:
+            other.append(line)
+            i += 1
+    if header is None:
+        header, other = other, []
+    if other:
+        items.append((None, other))
+    return header, items
+
+
+def rename(
+        text,
+        names,
+        suffix,
+):
+    """
+    Append `suffix` to all `names` in `text` (in upper case for upper case names).
+    """
+    if not names:
+        return text
+    pattern = re.compile(r'\b(' + '|'.join(sorted(names, key=len, reverse=True)) + r')\b')
+    return pattern.sub(lambda m: f'{m.group(1)}_{suffix.upper()}' if m.group(1).isupper()
+                       else f'{m.group(1)}_{suffix}', text)
+
+
+def _read(
+        directory,
+        name,
+):
+    """
+    Return the contents of the file `name` in `directory` (empty if it does not exist).
+    """
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        return ''
+    with open(path) as f:
+        return f.read()
+
+
+def _insert(
+        header,
+):
+    """
+    Return the network-specific part of the generated `cnn.h` text `header`.
+    """
+    start = header.index('#define CNN_OK 1\n') + len('#define CNN_OK 1\n')
+    end = header.index('/* Port pin actions')
+    return header[start:end].strip('\n')
+
+
+def combine(
+        names,
+        directories,
+        target,
+        prefix,
+        board_name,
+        command,
+):
+    """
+    Combine the projects generated for the networks `names` in `directories` into a single
+    project `prefix` in `target`. Shared functions are kept once, all other functions and data
+    are renamed with the network name. `command` is recorded in the generated files.
+    """
+    networks = []
+    for name, directory in zip(names, directories):
+        cnn_header, cnn_items = split(_read(directory, 'cnn.c'))
+        main_header, main_items = split(_read(directory, 'main.c'))
+        headers = {f: _read(directory, f) for f in sorted(os.listdir(directory))
+                   if f.endswith('.h') and f != 'cnn.h'}
+        networks.append({
+            'name': name,
+            'cnn_header': cnn_header,
+            'cnn': cnn_items,
+            'main_header': main_header,
+            'main': main_items,
+            'headers': headers,
+            'insert': _insert(_read(directory, 'cnn.h')),
+        })
+
+    # Functions that are the same for all networks are shared
+    shared = {}
+    for n in networks:
+        for fname, lines in n['cnn'] + n['main']:
+            if fname is not None and fname not in NETWORK_FUNCTIONS and fname != 'main':
+                shared.setdefault(fname, []).append(lines)
+    isr = shared.pop('CNN_ISR', None)
+    for fname in list(shared):
+        if any(lines != shared[fname][0] for lines in shared[fname]) \
+           or len(shared[fname]) != len(networks):
+            del shared[fname]
+
+    # Everything else is renamed
+    for n in networks:
+        local = set()
+        for fname, lines in n['cnn'] + n['main']:
+            if fname is None:
+                local.update(m.group(1) for m in map(_ARRAY.match, lines) if m)
+            elif fname not in shared and fname not in ('main', 'CNN_ISR'):
+                local.add(fname)
+        for text in n['headers'].values():
+            local.update(m.group(1) for m in map(_DEFINE.match, text.split('\n')) if m)
+        local.add('CNN_NUM_OUTPUTS')
+        n['local'] = local
+
+    def body(n, items):
+        """
+        Return the renamed lines of network `n` from `items`, without shared functions.
+        """
+        result = []
+        for fname, lines in items:
+            if fname in shared or fname in ('main', 'CNN_ISR'):
+                continue
+            result += rename('\n'.join(lines), n['local'], n['name']).split('\n')
+        return result
+
+    first = networks[0]
+    copyright_lines = first['cnn_header'][:first['cnn_header'].index(f'// {first["name"]}')]
+    description = [f'// {prefix}', f'// Created using {command}', '']
+    for n in networks:
+        description.append(f'// Network {n["name"]}:')
+        description += [line for line in n['cnn_header']
+                        if line.startswith(('// Configuring', '// Layer'))]
+        description.append('')
+
+    # cnn.c: shared functions first, then each network, then the functions loading all networks
+    out = copyright_lines + description + ['// DO NOT EDIT - regenerate this file instead!', '']
+    out += [line for line in first['cnn_header'] if line.startswith('#include')] + ['']
+    for fname, lines in first['cnn']:
+        if fname == 'CNN_ISR':
+            # Acknowledge the interrupt to all groups used by any network
+            ack = []
+            for variant in isr:
+                ack += [line for line in variant if line.startswith('  *((volatile')
+                        and line not in ack]
+            i = lines.index(next(line for line in lines if line.startswith('  *((volatile')))
+            lines = lines[:i] + ack + [line for line in lines[i:]
+                                       if not line.startswith('  *((volatile')]
+            out += lines + ['']
+        elif fname in shared:
+            out += lines + ['']
+    for n in networks:
+        out += [f'// Network {n["name"]}', ''] + body(n, n['cnn'])
+    for fname in LOAD_FUNCTIONS:
+        calls = [f'{fname}_{n["name"]}' for n in networks if f'{fname}_{n["name"]}' in
+                 {f'{f}_{n["name"]}' for f, _ in n['cnn'] if f is not None}]
+        if not calls:
+            continue
+        out += ['', f'int {fname}(void)', '{']
+        if fname == 'cnn_verify_weights':
+            out += [f'  if ({call}() != CNN_OK) return CNN_FAIL;' for call in calls]
+        else:
+            out += [f'  {call}();' for call in calls]
+        out += ['', '  return CNN_OK;', '}']
+    files = {'cnn.c': out}
+
+    # main.c: the sample data and checks of each network, and a test that runs all networks
+    out = copyright_lines + description
+    out += [line for line in first['main_header']
+            if not line.startswith('//') and line not in copyright_lines]
+    while out and out[-1] == '':
+        out.pop()
+    out.append('')
+    for fname, lines in first['main']:
+        if fname in shared:
+            out += lines + ['']
+    for n in networks:
+        out += [f'// Network {n["name"]}', ''] + body(n, n['main'])
+
+    main = next(lines for fname, lines in first['main'] if fname == 'main')
+    start = next(i for i, line in enumerate(main) if 'cnn_init()' in line)
+    done = next(i for i, line in enumerate(main) if '*** PASS ***' in line)
+    stop = next(i for i, line in enumerate(main) if 'cnn_disable()' in line)
+    out += [line for line in main[:start] if not re.match(r'^  int [\w, ]+;$', line)]
+    out += [f'  cnn_init_{first["name"]}(); // Bring state machine into consistent state',
+            '  cnn_load_weights(); // Load the kernels of all networks']
+    if any('cnn_load_bias()' in line and '//' not in line.split('cnn_load_bias')[0]
+           for n in networks for fname, lines in n['main'] if fname == 'main' for line in lines):
+        out.append('  cnn_load_bias(); // Load the bias values of all networks')
+    for n in networks:
+        lines = next(lines for fname, lines in n['main'] if fname == 'main')
+        i = next(i for i, line in enumerate(lines) if 'cnn_init()' in line)
+        j = next(i for i, line in enumerate(lines) if '*** PASS ***' in line)
+        out += ['', f'  // Network {n["name"]}']
+        out += [rename(line, n['local'], n['name']) for line in lines[i:j]
+                if not any(f'{f}(' in line for f in LOAD_FUNCTIONS)]
+    while out[-1] == '':
+        out.pop()
+    out += [''] + main[done:stop + 1] + ['', '  return 0;', '}', '']
+    files['main.c'] = out
+
+    # Header files
+    for fname in sorted({f for n in networks for f in n['headers']}):
+        files[fname] = []
+        for n in networks:
+            if fname in n['headers']:
+                files[fname] += rename(n['headers'][fname], n['local'], n['name']).split('\n')
+
+    os.makedirs(os.path.join(target, prefix), exist_ok=True)
+    for fname, lines in files.items():
+        with open(os.path.join(target, prefix, fname), 'w') as f:
+            f.write(re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).rstrip('\n') + '\n')
+
+    # cnn.h and the project files, with the network-specific definitions and functions
+    insert = []
+    for n in networks:
+        insert.append(f'/* Network {n["name"]} */')
+        insert.append(rename(n['insert'], n['local'], n['name']))
+        insert.append('')
+        insert.append(f'/* Switch to the {n["name"]} network: cnn_init_{n["name"]}(), then '
+                      f'cnn_configure_{n["name"]}() */')
+        for fname, lines in n['cnn']:
+            if fname in n['local']:
+                signature = next(line for line in lines if not line.startswith('//'))
+                if not signature.startswith('static'):
+                    insert.append(rename(signature, n['local'], n['name']) + ';')
+        insert.append('')
+    device = tc.dev.device
+    assets.from_template('assets', 'embedded-ai' + str(device), target, prefix, board_name)
+    assets.from_template('assets', 'eclipse', target, prefix, board_name)
+    assets.from_template('assets', 'device-all', target, prefix, board_name,
+                         '\n'.join(insert).rstrip('\n'))
+    assets.from_template('assets', 'device-ai' + str(device), target, prefix, board_name)
+
+    # The per-network functions replace the single-network prototypes
+    path = os.path.join(target, prefix, 'cnn.h')
+    with open(path) as f:
+        text = f.read()
+    for fname in set.union(*(n['local'] for n in networks)):
+        if fname not in LOAD_FUNCTIONS:
+            text = re.sub(r'/\*[^\n]*\*/\n\w+ ' + fname + r'\(.*\);\n\n', '', text)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def main(
+        argv=None,
+):
+    """
+    Command line wrapper. All arguments that are not used here are passed to the network loader
+    for each network.
+    """
+    parser = argparse.ArgumentParser(
+        description="MAX7800X CNN generator for multiple networks that share the accelerator. "
+                    "Arguments that are not listed here are passed to the network loader.",
+    )
+    parser.add_argument('--network', nargs='+', action='append', required=True,
+                        metavar=('NAME', 'CONFIG'),
+                        help="network name, YAML configuration file and optional checkpoint "
+                             "file (repeat for each network)")
+    multi_args, loader_argv = parser.parse_known_args(argv)
+
+    networks = []
+    for network in multi_args.network:
+        if len(network) not in (2, 3):
+            parser.error('`--network` takes a name, a configuration file and an optional '
+                         'checkpoint file')
+        if not re.match(r'^[A-Za-z_]\w*$', network[0]) \
+           or network[0] in (n[0] for n in networks):
+            parser.error(f'network name `{network[0]}` must be a unique C identifier')
+        networks.append(network)
+
+    args = commandline.get_parser(loader_argv + ['--config-file', networks[0][1]])
+    if not args.embedded_code or args.riscv or args.kernel_reserved or args.bias_reserved \
+       or args.forever or args.energy or args.deepsleep or args.zero_sram or args.dma \
+       or args.fps_frames or args.unload_channels is not None or args.unload_window is not None \
+       or args.top_k or args.test_samples is not None or args.host_model:
+        eprint('Networks sharing the accelerator require embedded code for the Arm core, '
+               'and do not support `--kernel-reserved`, `--bias-reserved`, `--forever`, '
+               '`--energy`, `--deepsleep`, `--zero-sram`, `--dma`, `--fps-frames`, '
+               '`--unload-channels`, `--unload-window`, `--top-k`, `--test-samples` or '
+               '`--host-model`.')
+
+    kernel_reserved = None
+    bias_reserved = None
+    with tempfile.TemporaryDirectory() as d:
+        for name, config_file, *checkpoint_file in networks:
+            print(f'Generating network {name}...')
+            network_argv = loader_argv + ['--prefix', name, '--config-file', config_file,
+                                          '--test-dir', d]
+            if checkpoint_file:
+                network_argv += ['--checkpoint-file', checkpoint_file[0]]
+            if kernel_reserved is not None:
+                network_argv += ['--kernel-reserved', ','.join(str(c) for c in kernel_reserved),
+                                 '--bias-reserved', ','.join(str(c) for c in bias_reserved)]
+            izer.generate(commandline.get_parser(network_argv))
+            memory = stats.get().memory
+            kernel_reserved, bias_reserved = memory['kernel'], memory['bias']
+
+        with tc.using(tc.get_device(args.device)):
+            combine([n[0] for n in networks], [os.path.join(d, n[0]) for n in networks],
+                    args.test_dir, args.prefix, args.board_name,
+                    ' '.join(os.path.basename(a) if i == 0 else a for i, a in enumerate(sys.argv)))
+            print(f'\nKernel memory used: {max(kernel_reserved)} of {tc.dev.MASK_WIDTH_LARGE} '
+                  f'columns, bias memory used: {", ".join(str(b) for b in bias_reserved)} of '
+                  f'{tc.dev.BIAS_SIZE} per group.')
+    print(f'Wrote {len(networks)} networks to {os.path.join(args.test_dir, args.prefix)}.')
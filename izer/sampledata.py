@@ -7,6 +7,8 @@
 """
 Contains hard coded sample inputs.
 """
+import os
+
 import numpy as np
 
 
@@ -23,3 +25,19 @@ def get(
     #         allow_pickle=False, fix_imports=False)
 
     return np.load(filename)
+
+
+def get_frames(
+        path,
+        ndim=3,
+):
+    """
+    Return a sequence of input images from the `path` of a .npy file with several images
+    (NCHW) or of a directory with one .npy file per image, in file name order. Each image
+    has `ndim` dimensions (2 for 1D data).
+    """
+    if os.path.isdir(path):
+        return np.stack([np.load(os.path.join(path, f)) for f in sorted(os.listdir(path))
+                         if f.endswith('.npy')])
+    data = np.load(path)
+    return data if data.ndim == ndim + 1 else np.expand_dims(data, axis=0)
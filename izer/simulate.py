@@ -58,7 +58,7 @@ def print_data(
 
 
 def conv2d_layer(
-        layer,  # pylint: disable=unused-argument
+        layer,
         verbose,
         verbose_data,
         input_size,
@@ -134,8 +134,11 @@ def conv2d_layer(
             print(out_buf)
         print('')
 
-    stats.macc += (input_size[0] // groups) * kernel_size[0] * kernel_size[1] * out_size[0] \
-        * out_size[1] * out_size[2]
+    stats.account(
+        layer,
+        macc=(input_size[0] // groups) * kernel_size[0] * kernel_size[1] * out_size[0]
+        * out_size[1] * out_size[2],
+    )
 
     if output_width != 32:
         out_buf = np.floor(0.5 + out_buf / (128 / 2.0**output_shift)).astype(np.int64). \
@@ -165,7 +168,7 @@ def conv2d_layer(
                 print(out_buf)
             print('')
 
-        stats.comp += out_size[0] * out_size[1] * out_size[2]
+        stats.account(layer, comp=out_size[0] * out_size[1] * out_size[2])
 
     if verbose and not verbose_data:
         print(f"{out_size[0]}x{out_size[1]}x{out_size[2]} OUTPUT"
@@ -175,7 +178,7 @@ def conv2d_layer(
 
 
 def convtranspose2d_layer(
-        layer,  # pylint: disable=unused-argument
+        layer,
         verbose,
         verbose_data,
         input_size,
@@ -254,8 +257,11 @@ def convtranspose2d_layer(
             print(out_buf)
         print('')
 
-    stats.macc += (input_size[0] // groups) * kernel_size[0] * kernel_size[1] * out_size[0] \
-        * out_size[1] * out_size[2]
+    stats.account(
+        layer,
+        macc=(input_size[0] // groups) * kernel_size[0] * kernel_size[1] * out_size[0]
+        * out_size[1] * out_size[2],
+    )
 
     if output_width != 32:
         out_buf = np.floor(0.5 + out_buf / (128 / 2.0**output_shift)).astype(np.int64). \
@@ -285,7 +291,7 @@ def convtranspose2d_layer(
                 print(out_buf)
             print('')
 
-        stats.comp += out_size[0] * out_size[1] * out_size[2]
+        stats.account(layer, comp=out_size[0] * out_size[1] * out_size[2])
 
     if verbose and not verbose_data:
         print(f"{out_size[0]}x{out_size[1]}x{out_size[2]} OUTPUT"
@@ -295,7 +301,7 @@ def convtranspose2d_layer(
 
 
 def conv1d_layer(
-        layer,  # pylint: disable=unused-argument
+        layer,
         verbose,
         verbose_data,
         input_size,
@@ -360,8 +366,10 @@ def conv1d_layer(
         print(out_buf.squeeze(axis=-1))
         print('')
 
-    stats.macc += (input_size[0] // groups) * kernel_size * out_size[0] \
-        * out_size[1]
+    stats.account(
+        layer,
+        macc=(input_size[0] // groups) * kernel_size * out_size[0] * out_size[1],
+    )
 
     if output_width != 32:
         out_buf = np.floor(0.5 + out_buf / (128 / 2.0**output_shift)).astype(np.int64). \
@@ -385,7 +393,7 @@ def conv1d_layer(
             print(out_buf.squeeze(axis=-1))
             print('')
 
-        stats.comp += out_size[0] * out_size[1]
+        stats.account(layer, comp=out_size[0] * out_size[1])
 
     if verbose and not verbose_data:
         print(f"{out_size[0]}x{out_size[1]} OUTPUT"
@@ -439,7 +447,7 @@ def linear_layer(
         print(out_buf)
         print('')
 
-    stats.sw_macc += in_features * out_features
+    stats.account(sw_macc=in_features * out_features)
 
     if activation is not None:
         if activation == op.ACT_RELU:
@@ -453,7 +461,7 @@ def linear_layer(
             print(out_buf)
             print('')
 
-        stats.sw_comp += out_features
+        stats.account(sw_comp=out_features)
 
     if verbose and not verbose_data:
         print(f"OUTPUT (size {out_features})"
@@ -479,7 +487,7 @@ def passthrough_layer(
 
 def eltwise_layer(
         operator,
-        layer,  # pylint: disable=unused-argument
+        layer,
         verbose,
         verbose_data,
         input_size,
@@ -514,11 +522,11 @@ def eltwise_layer(
         print('')
 
     if operator in [op.ELTWISE_ADD, op.ELTWISE_SUB]:
-        stats.add += (operands - 1) * out_buf.size
+        stats.account(layer, add=(operands - 1) * out_buf.size)
     elif operator == op.ELTWISE_MUL:
-        stats.mul += (operands - 1) * out_buf.size
+        stats.account(layer, mul=(operands - 1) * out_buf.size)
     elif operator in [op.ELTWISE_OR, op.ELTWISE_XOR]:
-        stats.bitwise += (operands - 1) * out_buf.size
+        stats.account(layer, bitwise=(operands - 1) * out_buf.size)
 
     if output_width != 32:
         if operator == op.ELTWISE_MUL:
@@ -609,9 +617,9 @@ def pooling_layer(
 
             st = pool[0] * pool[1] * pooled_size[0] * pooled_size[1] * pooled_size[2] * operands
             if pool_average:
-                stats.add += st
+                stats.account(layer, add=st)
             else:
-                stats.comp += st
+                stats.account(layer, comp=st)
         else:
             pooled = pool1d(
                 data[0],
@@ -633,9 +641,9 @@ def pooling_layer(
                 print('')
 
             if pool_average:
-                stats.add += pool[0] * pooled_size[0] * pooled_size[1]
+                stats.account(layer, add=pool[0] * pooled_size[0] * pooled_size[1])
             else:
-                stats.comp += pool[0] * pooled_size[0] * pooled_size[1]
+                stats.account(layer, comp=pool[0] * pooled_size[0] * pooled_size[1])
 
             pooled = np.expand_dims(pooled, axis=0)
 
@@ -7,38 +7,151 @@
 """
 Statistics for the pure Python computation modules
 """
+import contextvars
 import operator
 from functools import reduce
 
+import numpy as np
+
 from . import tornadocnn as tc
 
-macc = 0  # Hardware multiply-accumulates (Conv2D, etc.)
-comp = 0  # Comparisons (ReLU, MaxPool)
-add = 0  # Additions (EltwiseAdd, EltwiseSub, AvgPool)
-mul = 0  # Multiplications (EltwiseMul)
-bitwise = 0  # Bitwise OR/XOR (EltwiseXOR)
-# div = 0  # Divisions (BatchNorm, SoftMax)
-# exp = 0  # Exponentiations (SoftMax)
+COUNTERS = (
+    'macc',  # Hardware multiply-accumulates (Conv2D, etc.)
+    'comp',  # Comparisons (ReLU, MaxPool)
+    'add',  # Additions (EltwiseAdd, EltwiseSub, AvgPool)
+    'mul',  # Multiplications (EltwiseMul)
+    'bitwise',  # Bitwise OR/XOR (EltwiseXOR)
+    # 'div',  # Divisions (BatchNorm, SoftMax)
+    # 'exp',  # Exponentiations (SoftMax)
+    'sw_macc',  # Software multiply-accumulates (FC)
+    'sw_comp',  # Software comparisons (ReLU)
+    'true_macc',  # Actual MAC ops, ignoring padding
+    'true_sw_macc',
+)
+
+
+class Stats:
+    """
+    Op counters for one simulation run. Counts are accumulated in bulk, per layer.
+    """
+    def __init__(self):
+        self.layers = {}  # Per-layer counters, indexed by layer number
+        self.current = None  # Layer that receives counts without an explicit layer
+        self.energy = None  # Energy estimate, see calc_energy()
+        self.memory = None  # Kernel and bias memory used, see max7800x.create_net()
+        self.shared_kernels = {}  # Layers that use the kernels of a prior layer
+        for name in COUNTERS:
+            setattr(self, name, 0)
+
+    def begin_layer(
+            self,
+            layer,
+    ):
+        """
+        Attribute subsequent counts that do not specify a layer to `layer`.
+        """
+        self.current = layer
+
+    def account(
+            self,
+            layer=None,
+            **counts,
+    ):
+        """
+        Add `counts` (keyword arguments named after `COUNTERS`) to the totals and to `layer`
+        (default: the current layer).
+        """
+        if layer is None:
+            layer = self.current
+        lc = self.layers.setdefault(layer, dict.fromkeys(COUNTERS, 0))
+        for name, n in counts.items():
+            setattr(self, name, getattr(self, name) + n)
+            lc[name] += n
 
-sw_macc = 0  # Software multiply-accumulates (FC)
-sw_comp = 0  # Software comparisons (ReLU)
+    def ops(
+            self,
+            layer=None,
+    ):
+        """
+        Return number of hardware ops, in total or for `layer`.
+        """
+        c = self.layers.get(layer, {}) if layer is not None else self.__dict__
+        return sum(c.get(name, 0) for name in ('macc', 'comp', 'add', 'mul', 'bitwise'))
 
-true_macc = 0  # Actual MAC ops, ignoring padding
-true_sw_macc = 0
+    def sw_ops(
+            self,
+            layer=None,
+    ):
+        """
+        Return number of software ops (FC), in total or for `layer`.
+        """
+        c = self.layers.get(layer, {}) if layer is not None else self.__dict__
+        return c.get('sw_macc', 0) + c.get('sw_comp', 0)
+
+
+_context = contextvars.ContextVar('stats')
+
+
+def get():
+    """
+    Return the statistics object for the current context (thread or task), creating it
+    when needed.
+    """
+    try:
+        return _context.get()
+    except LookupError:
+        return new()
+
+
+def new():
+    """
+    Start a new run: install and return an empty statistics object for the current context.
+    """
+    st = Stats()
+    _context.set(st)
+    return st
+
+
+def account(
+        layer=None,
+        **counts,
+):
+    """
+    Add `counts` to `layer` in the current statistics object (see `Stats.account()`).
+    """
+    get().account(layer, **counts)
+
+
+def begin_layer(
+        layer,
+):
+    """
+    Attribute subsequent counts in the current statistics object to `layer`.
+    """
+    get().begin_layer(layer)
+
+
+def __getattr__(name):
+    """
+    Compatibility: read totals such as `stats.macc` from the current statistics object.
+    """
+    if name in COUNTERS:
+        return getattr(get(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def ops():
     """
     Return number of ops computed in the simulator.
     """
-    return macc + comp + add + mul + bitwise
+    return get().ops()
 
 
 def sw_ops():
     """
     Return number of software ops (FC) computed in the simulator.
     """
-    return sw_macc + sw_comp
+    return get().sw_ops()
 
 
 def summary(
@@ -49,26 +162,54 @@ def summary(
         w_size=None,
         bias=None,
         group_bias_max=None,
+        per_layer=False,
+        energy=False,
 ):
     """
-    Return ops summary and weight usage statistics.
+    Return ops summary and weight usage statistics. When `per_layer` is set, also list the
+    ops for each layer. When `energy` is set, include the energy estimate (if available).
     """
+    st = get()
     sp = ' ' * spaces
     rv = sp + "SUMMARY OF OPS\n"
 
-    rv += f'{sp}Hardware: {factor * ops():,} ops ({factor * macc:,} macc; {factor * comp:,} ' \
-          f'comp; {factor * add:,} add; ' \
-          f'{factor * mul:,} mul; {factor * bitwise:,} bitwise)\n'
+    rv += f'{sp}Hardware: {factor * st.ops():,} ops ({factor * st.macc:,} macc; ' \
+          f'{factor * st.comp:,} comp; {factor * st.add:,} add; ' \
+          f'{factor * st.mul:,} mul; {factor * st.bitwise:,} bitwise)\n'
     if debug:
-        rv += f'{sp}          True MACs: {factor * true_macc:,}\n'
-    if sw_macc:
-        rv += f'{sp}Software: {factor * sw_ops():,} ops ({factor * sw_macc:,} ' \
-              f'macc; {factor * sw_comp:,} comp)\n'
+        rv += f'{sp}          True MACs: {factor * st.true_macc:,}\n'
+    if st.sw_macc:
+        rv += f'{sp}Software: {factor * st.sw_ops():,} ops ({factor * st.sw_macc:,} ' \
+              f'macc; {factor * st.sw_comp:,} comp)\n'
+
+    if per_layer:
+        for ll in sorted(e for e in st.layers if e is not None):
+            c = st.layers[ll]
+            rv += f'{sp}  Layer {ll}: {factor * st.ops(ll):,} ops ' \
+                  f'({factor * c["macc"]:,} macc; {factor * c["comp"]:,} comp; ' \
+                  f'{factor * c["add"]:,} add; {factor * c["mul"]:,} mul; ' \
+                  f'{factor * c["bitwise"]:,} bitwise)'
+            if c['sw_macc']:
+                rv += f'; software: {factor * st.sw_ops(ll):,} ops'
+            rv += '\n'
+
+    if energy and st.energy is not None:
+        e = st.energy
+        rv += f"\n{sp}ENERGY ESTIMATE\n" \
+              f'{sp}Inference:   {e["inference_uj"]:,.2f} uJ ({e["time_us"]:,.1f} us at ' \
+              f'{e["clock_mhz"]} MHz, {e["voltage"]:.2f} V; {e["power_mw"]:,.2f} mW average)\n' \
+              f'{sp}Weight load: {e["weight_load_uj"]:,.2f} uJ ' \
+              f'({e["weight_words"]:,} APB writes)\n'
+        if per_layer:
+            for le in e['layers']:
+                rv += f'{sp}  Layer {le["layer"]}: {le["uj"]:,.3f} uJ ' \
+                      f'({le["cycles"]:,} cycles)\n'
 
     if weights is not None and hasattr(tc.dev, 'BIAS_SIZE'):
         kmem = sum(tc.dev.mask_width(proc) * 9 for proc in range(tc.dev.MAX_PROC))
         kmem_used = sum([reduce(operator.mul, e.shape) * abs(w_size[i]) // 8
-                         for i, e in enumerate(weights[:len(w_size)]) if e is not None])
+                         for i, e in enumerate(weights[:len(w_size)])
+                         if e is not None and i not in st.shared_kernels])
         rv += f"\n{sp}RESOURCE USAGE\n" \
               f'{sp}Weight memory: {kmem_used:,} bytes out of {kmem:,} bytes total ' \
               f'({kmem_used * 100.0 / kmem:.0f}%)\n'
@@ -82,10 +223,82 @@ def summary(
             bmem_used = 0
         rv += f'{sp}Bias memory:   {bmem_used:,} bytes out of {bmem:,} bytes total ' \
               f'({bmem_used * 100.0 / bmem:.0f}%)\n'
+        if per_layer and group_bias_max is not None:
+            for group, used in enumerate(group_bias_max):
+                rv += f'{sp}  Group {group}: {used:,} bytes out of {tc.dev.BIAS_SIZE:,} bytes ' \
+                      f'({used * 100.0 / tc.dev.BIAS_SIZE:.0f}%)\n'
 
     return rv
 
 
+def calc_energy(
+        cycles,
+        data_read,
+        data_written,
+        weight_words,
+        clock,
+        startup=0,
+        pll=False,
+        boost=False,
+        factor=1,
+):
+    """
+    Estimate the energy used by one inference and by loading the weights, using the per-layer
+    op counts in the current statistics object and the coefficients of the current device.
+    `cycles`, `data_read` and `data_written` are dictionaries indexed by layer that hold the
+    estimated cycles and the data memory bytes read and written. `weight_words` is the number
+    of 32-bit APB writes needed to load kernels and bias, `clock` is the accelerator clock in
+    MHz, and `startup` the startup cycles. `pll` adds the PLL power, and `boost` scales the
+    dynamic energy to the boosted core voltage. `factor` is the number of times the layers
+    are repeated.
+    The estimate is stored in the statistics object and returned as a dictionary (energy in
+    uJ, time in us, power in mW).
+    """
+    st = get()
+    dev = tc.dev
+    voltage = dev.V_BOOST if boost else dev.V_CORE
+    vscale = (voltage / dev.V_CORE) ** 2  # Dynamic energy scales with the square of voltage
+    power = dev.P_CNN + (dev.P_PLL if pll else 0.0)  # mW, i.e., nJ/us
+
+    layers = []
+    total_cycles = startup
+    inference = power * startup / clock / 1000.0
+    for ll in sorted(cycles):
+        c = st.layers.get(ll, dict.fromkeys(COUNTERS, 0))
+        macc = factor * c['macc']
+        other = factor * (c['comp'] + c['add'] + c['mul'] + c['bitwise'])
+        dynamic = vscale * (macc * dev.E_MACC + other * dev.E_OP
+                            + factor * data_read[ll] * dev.E_DATA_READ
+                            + factor * data_written[ll] * dev.E_DATA_WRITE) / 1e6
+        uj = dynamic + power * factor * cycles[ll] / clock / 1000.0
+        layers.append({
+            'layer': ll,
+            'cycles': factor * cycles[ll],
+            'macc': macc,
+            'ops': macc + other,
+            'data_read': factor * data_read[ll],
+            'data_written': factor * data_written[ll],
+            'uj': uj,
+        })
+        total_cycles += factor * cycles[ll]
+        inference += uj
+
+    time_us = total_cycles / clock
+    st.energy = {
+        'device': dev.partnum,
+        'clock_mhz': clock,
+        'voltage': voltage,
+        'cycles': total_cycles,
+        'time_us': time_us,
+        'inference_uj': inference,
+        'power_mw': inference * 1000.0 / time_us if time_us else 0.0,
+        'weight_words': weight_words,
+        'weight_load_uj': weight_words * dev.E_APB_WRITE / 1e6,
+        'layers': layers,
+    }
+    return st.energy
+
+
 def calc_latency(
         streaming,
         layers,
@@ -95,22 +308,30 @@ def calc_latency(
         in_expand,
         output_chan,
         output_dim,
-        input_dim,  # pylint: disable=unused-argument
+        input_dim,
         padding,
         kernel_size,  # pylint: disable=unused-argument
         debug=False,  # pylint: disable=unused-argument
+        operands=None,
+        stream_regs=None,
+        fifo_cycles=None,
 ):
     """
     Returns estimated latencies (in cycles) for startup and each layer for a given network setup.
     The return values are an integer (startup cycles) and a list of tuples
     (cycles [integer], detailed description [string]).
-    """
-
-    # No support for estimating streaming latency yet
-    if any(streaming):
-        return None, None
 
+    Streaming layers overlap with their predecessor. Each layer is modeled as a sequence of
+    pooled input positions processed at a fixed rate. A streaming layer starts a position once
+    its predecessor has produced the data that position depends on. The dependencies come
+    from the `stream_regs` (stream_start, delta1, delta2) tuples programmed for each streaming
+    layer. When the input is fed through the FIFOs, input pixels arrive every `fifo_cycles`
+    cycles. The cycles reported for a layer are what it adds to the end-to-end latency, so
+    startup plus the sum over all layers is the total.
+    """
     lat = []
+    prev_done = None  # Completion times of the prior layer's positions
+    prev_finish = 0
 
     for ll in range(layers):
         pad = tc.dev.C_PAD * 2 * (  # Pad cycles * (top + left) * 2 (for bottom + right)
@@ -133,6 +354,43 @@ def calc_latency(
             f'Output: {output_dim[ll][0]}x{output_dim[ll][1]}x{output_chan[ll]}=' \
             f'{output_dim[ll][0] * output_dim[ll][1] * output_chan[ll]}'
 
-        lat.append((lk, s))
+        rows, cols = pooled_dim[ll][0], pooled_dim[ll][1]
+        positions = rows * cols
+        rate = lk / positions  # Cycles per pooled input position
+
+        # Times at which the data for each position is available
+        if ll == 0 and fifo_cycles is not None:
+            arrival = np.arange(1, input_dim[ll][0] * input_dim[ll][1] + 1) * fifo_cycles
+            s += f'; FIFO input: {fifo_cycles:.1f} cycles/pixel'
+        else:
+            arrival = prev_done
+        if streaming[ll] and arrival is not None and stream_regs is not None \
+           and stream_regs[ll] is not None:
+            start, delta1, delta2 = stream_regs[ll]
+            ops = operands[ll] if operands is not None else 1
+            if ll == 0:  # The first layer's deltas do not include the current position
+                delta1 += ops
+                delta2 += pool[ll][1] * ops
+            # Inputs that must have arrived before processing each position (TRAM row buffer)
+            need = start + np.arange(rows)[:, np.newaxis] * (delta2 + (cols - 1) * delta1) \
+                + np.arange(cols)[np.newaxis, :] * delta1
+            need = np.minimum(need.reshape(-1) // ops, len(arrival)) - 1
+            ready = np.where(need >= 0, arrival[np.maximum(need, 0)], 0)
+            s += f'; Streaming: start {start}, delta1 {delta1}, delta2 {delta2}, ' \
+                 f'first position after {int(ready[0]):,} cycles'
+        elif arrival is not None:
+            ready = np.full(positions, max(prev_finish, arrival[-1]))
+        else:
+            ready = np.full(positions, prev_finish)
+
+        # Positions are processed in order, each taking `rate` cycles once its input is ready:
+        # done[i] = max(ready[i], done[i-1]) + rate
+        idx = np.arange(positions)
+        done = (idx + 1) * rate + np.maximum.accumulate(ready - idx * rate)
+        finish = max(int(np.ceil(round(done[-1], 6))), prev_finish)
+
+        lat.append((finish - prev_finish, s))
+        prev_finish = finish
+        prev_done = done
 
     return tc.dev.C_START, lat
@@ -46,6 +46,31 @@ COPYRIGHT = \
     '* ownership rights.\n' \
     '*******************************************************************************/\n\n'
 
+DMA_HEADER = \
+    '\n\n/* DMA channel used to load the weights and the input */\n' \
+    '#ifndef CNN_DMA_CH\n' \
+    '#define CNN_DMA_CH 0\n' \
+    '#define CNN_DMA_IRQn DMA0_IRQn\n' \
+    '#endif\n\n' \
+    '/* DMA transfer of n 32-bit words from src to dst, optionally after writing addr_val\n' \
+    '   to the byte address addr */\n' \
+    'typedef struct {\n' \
+    '  volatile uint8_t *addr;\n' \
+    '  uint8_t addr_val;\n' \
+    '  uint32_t *dst;\n' \
+    '  const uint32_t *src;\n' \
+    '  int n;\n' \
+    '} cnn_dma_t;\n\n' \
+    '/* Perform the n DMA transfers desc, one contiguous memory region each */\n' \
+    'int cnn_dma(const cnn_dma_t *desc, int n);'
+
+TOP_K_HEADER = \
+    '\n\n/* Number of results of cnn_top_k() */\n' \
+    '#define CNN_TOP_K {top_k}\n\n' \
+    '/* Return the CNN_TOP_K largest outputs in top_score, and their indices in top_class,\n' \
+    '   reading them directly from the accelerator */\n' \
+    'int cnn_top_k(int32_t *top_class, int32_t *top_score);'
+
 
 def copyright_header(
         memfile,
@@ -234,6 +259,86 @@ def function_footer(
     memfile.write('}\n\n')
 
 
+def dma_functions(
+        memfile,
+        interrupt=False,
+):
+    """
+    Write the DMA transfer functions to `memfile`. The CPU waits for each transfer by polling,
+    or, with `interrupt`, sleeps while the DMA interrupt starts the next transfer.
+    """
+    memfile.write('static const cnn_dma_t *dma_next, *dma_end;\n')
+    if interrupt:
+        memfile.write('static volatile int dma_busy;\n')
+    memfile.write('\n')
+
+    function_header(memfile, prefix='', function='dma_start', return_type='static void')
+    memfile.write('  const cnn_dma_t *d = dma_next++;\n\n'
+                  '  if (d->addr != NULL)\n'
+                  '    *d->addr = d->addr_val; // Set address\n'
+                  '  MXC_DMA->ch[CNN_DMA_CH].src = (uint32_t) d->src;\n'
+                  '  MXC_DMA->ch[CNN_DMA_CH].dst = (uint32_t) d->dst;\n'
+                  '  MXC_DMA->ch[CNN_DMA_CH].cnt = d->n * 4;\n'
+                  '  MXC_DMA->ch[CNN_DMA_CH].ctrl = MXC_S_DMA_CTRL_REQUEST_MEMTOMEM\n'
+                  '    | MXC_S_DMA_CTRL_SRCWD_WORD | MXC_F_DMA_CTRL_SRCINC\n'
+                  '    | MXC_S_DMA_CTRL_DSTWD_WORD | MXC_F_DMA_CTRL_DSTINC\n'
+                  '    | (31 << MXC_F_DMA_CTRL_BURST_SIZE_POS) | MXC_F_DMA_CTRL_CTZ_IE\n'
+                  '    | MXC_F_DMA_CTRL_EN;\n')
+    function_footer(memfile, return_value='void')  # dma_start()
+
+    if interrupt:
+        function_header(memfile, prefix='', function='dma_isr', return_type='static void')
+        memfile.write('  MXC_DMA->ch[CNN_DMA_CH].status = MXC_F_DMA_STATUS_CTZ_IF; '
+                      '// Acknowledge\n'
+                      '  if (dma_next != dma_end)\n'
+                      '    dma_start(); // Next region\n'
+                      '  else\n'
+                      '    dma_busy = 0;\n')
+        function_footer(memfile, return_value='void')  # dma_isr()
+
+    function_header(memfile, function='dma', arguments='const cnn_dma_t *desc, int n')
+    memfile.write('  MXC_SYS_ClockEnable(MXC_SYS_PERIPH_CLOCK_DMA);\n'
+                  '  dma_next = desc;\n'
+                  '  dma_end = desc + n;\n\n')
+    if interrupt:
+        memfile.write('  dma_busy = 1;\n'
+                      '  NVIC_SetVector(CNN_DMA_IRQn, dma_isr);\n'
+                      '  NVIC_EnableIRQ(CNN_DMA_IRQn);\n'
+                      '  MXC_DMA->inten |= 1 << CNN_DMA_CH;\n'
+                      '  dma_start();\n'
+                      '  while (dma_busy)\n'
+                      '    __WFI(); // Sleep while the DMA transfers the data\n'
+                      '  MXC_DMA->inten &= ~(1 << CNN_DMA_CH);\n')
+    else:
+        memfile.write('  while (dma_next != dma_end) {\n'
+                      '    dma_start();\n'
+                      '    while ((MXC_DMA->ch[CNN_DMA_CH].status\n'
+                      '            & MXC_F_DMA_STATUS_CTZ_IF) == 0) ; // Wait for DMA\n'
+                      '    MXC_DMA->ch[CNN_DMA_CH].status = MXC_F_DMA_STATUS_CTZ_IF; '
+                      '// Acknowledge\n'
+                      '  }\n')
+    function_footer(memfile)  # dma()
+
+
+def dma_table(
+        memfile,
+        name,
+        transfers,
+):
+    """
+    Write the static table `name` of DMA `transfers` and the call that performs them to
+    `memfile`. Each transfer is a tuple of the address register (or `None`) and its value,
+    the destination address, the source array and the number of 32-bit words.
+    """
+    memfile.write(f'  static const cnn_dma_t {name}[] = {{\n')
+    for addr, addr_val, dst, src, n in transfers:
+        addr = f'(volatile uint8_t *) 0x{addr:08x}' if addr is not None else 'NULL'
+        memfile.write(f'    {{ {addr}, 0x{addr_val:02x}, (uint32_t *) 0x{dst:08x}, '
+                      f'{src}, {n} }},\n')
+    memfile.write('  };\n\n'
+                  f'  cnn_dma({name}, {len(transfers)});\n')
+
+
 def write_ml_data(
         memfile,
         output_width,
@@ -263,6 +368,7 @@ def main(
         debugwait=1,
         camera=False,
         camera_format=None,
+        camera_frames=1,
         channels=None,
         sleep=False,
         output_width=8,
@@ -278,9 +384,20 @@ def main(
         verify_kernels=False,
         load_kernels=True,
         wfi=True,
+        fps_frames=0,
+        unload_overlap=False,
+        top_k=0,
+        test_samples=False,
 ):
     """
     Write the main function to `memfile`.
+    With a `camera`, the first `camera_frames - 1` images are processed before the one that
+    is checked.
+    With `fps_frames`, the checked inference is followed by `fps_frames` inferences that
+    measure the throughput. The next input is received while the CNN is busy, and with
+    `unload_overlap`, the result of the prior inference is also unloaded while the CNN is busy.
+    With `top_k`, `cnn_top_k()` replaces `cnn_unload()` and the top-k classes are printed.
+    With `test_samples`, the test loop (see `test_samples()`) runs after the checked inference.
     """
     mfile = apifile or memfile
 
@@ -293,7 +410,7 @@ def main(
     if softmax and output_width == 8:
         wprint('--softmax should only be used with `output_width: 32`.')
 
-    if unload and not softmax:
+    if unload and not softmax and not top_k:
         write_ml_data(memfile, output_width)
         memfile.write('\n')
 
@@ -311,17 +428,29 @@ def main(
                       '  MXC_PWRSEQ->lppwst  = 0xFFFFFFFF;\n')
         function_footer(memfile, return_value='void')  # _MXC_LP_ClearWakeStatus
 
+    if fps_frames:
+        memfile.write('// Receive the next input while the CNN is busy -- replace with camera\n'
+                      '// or sensor code. load_input() then copies the input to the CNN.\n')
+        function_header(memfile, prefix='', function='capture_input', return_type='void')
+        function_footer(memfile, return_value='void')  # capture_input()
+
     function_header(memfile, prefix='', function='main')
     if clock_trim is not None and not riscv:
         memfile.write('  uint32_t trim;\n')
-    if embedded_code and softmax or oneshot > 0 or measure_energy:
+    if embedded_code and (softmax or top_k) or oneshot > 0 or measure_energy \
+       or camera and camera_frames > 1 or fps_frames:
         memfile.write('  int i;\n')
+    if fps_frames:
+        memfile.write('  uint32_t fps_time, fps_cpu;\n')
     if embedded_code and not forever and softmax:
         memfile.write('  int digs, tens;\n')
         if output_width != 32:
             memfile.write(f'int{output_width}_t *ml_data = '
                           f'(int{output_width}_t *) ml_data32;\n')
-    if embedded_code and softmax or oneshot > 0:
+    if top_k:
+        memfile.write('  int32_t top_class[CNN_TOP_K], top_score[CNN_TOP_K];\n')
+    if embedded_code and (softmax or top_k) or oneshot > 0 or camera and camera_frames > 1 \
+       or fps_frames:
         memfile.write('\n')
 
     bbfc = 'BBFC' if not tc.dev.SUPPORT_GCFR else 'GCFR'
@@ -473,9 +602,15 @@ def main(
         else:
             mode = '8'  # Default
             comment = '888'
-        memfile.write(f'  // Enable {comment} format single image in external timing mode\n')
+        if camera_frames > 1:
+            read_mode = 'CONTINUOUS'
+            comment += ' format continuous images'
+        else:
+            read_mode = 'SINGLE_IMG'
+            comment += ' format single image'
+        memfile.write(f'  // Enable {comment} in external timing mode\n')
         if not tc.dev.MODERN_SIM:
-            memfile.write('  MXC_CAMERAIF0->ctrl = MXC_S_CAMERAIF_CTRL_READ_MODE_SINGLE_IMG +\n'
+            memfile.write(f'  MXC_CAMERAIF0->ctrl = MXC_S_CAMERAIF_CTRL_READ_MODE_{read_mode} +\n'
                           f'                        MXC_S_CAMERAIF_CTRL_DATA_WIDTH_{mode}BIT +\n'
                           '                        MXC_S_CAMERAIF_CTRL_DS_TIMING_EN_DIS +\n'
                           '                        MXC_S_CAMERAIF_CTRL_PCIF_SYS_EN_EN')
@@ -484,7 +619,7 @@ def main(
             else:
                 memfile.write(';\n\n')
         else:
-            memfile.write('  MXC_PCIF->ctrl = MXC_S_CAMERAIF_CTRL_READ_MODE_SINGLE_IMG +\n'
+            memfile.write(f'  MXC_PCIF->ctrl = MXC_S_CAMERAIF_CTRL_READ_MODE_{read_mode} +\n'
                           f'                   MXC_S_CAMERAIF_CTRL_DATA_WIDTH_{mode}BIT +\n'
                           '                   MXC_F_CAMERAIF_CTRL_PCIF_SYS')
             if channels == 3:
@@ -657,6 +792,23 @@ def main(
             memfile.write('  }\n'
                           '  CNN_COMPLETE;\n\n')
 
+        if camera and camera_frames > 1:
+            memfile.write(f'  for (i = 1; i < {camera_frames}; i++) {{ // Next camera image\n')
+            if embedded_code:
+                memfile.write('    cnn_start(); // Start CNN processing\n'
+                              '    load_input(); // Load data input via FIFO\n')
+            else:
+                memfile.write('    if (cnn_configure() != CNN_OK) { fail(); pass(); return 0; }\n')
+            if embedded_code or tc.dev.MODERN_SIM:
+                memfile.write('    while (cnn_time == 0)\n')
+                if not riscv:
+                    memfile.write('      __WFI(); // Wait for CNN\n')
+                else:
+                    memfile.write('      asm volatile("wfi"); // Wait for CNN\n')
+            else:
+                memfile.write('    cnn_wait();\n')
+            memfile.write('  }\n\n')
+
         if oneshot > 0:
             memfile.write(f'  for (i = 0; i < {oneshot}; i++) {{\n')
             memfile.write('    cnn_continue();\n')
@@ -697,7 +849,9 @@ def main(
         memfile.write('  if (check_output() != CNN_OK) fail();\n')
         if softmax:
             memfile.write('  softmax_layer();\n')
-        elif unload:
+        if top_k:
+            memfile.write('  cnn_top_k(top_class, top_score);\n')
+        elif unload and not softmax:
             memfile.write('  cnn_unload((uint32_t *) '
                           f'ml_data{"32" if output_width != 32 else ""});\n')
 
@@ -710,6 +864,58 @@ def main(
             if measure_energy:
                 memfile.write('  printf("See monitor display for inference energy.\\n\\n");\n\n')
 
+        if fps_frames:
+            unload_call = f'cnn_unload((uint32_t *) ml_data{"32" if output_width != 32 else ""});'
+            if top_k:
+                unload_call = 'cnn_top_k(top_class, top_score);'
+            memfile.write(f'  // Run {fps_frames} inferences back to back. While the CNN is busy, '
+                          'receive the next input')
+            if unload_overlap:
+                memfile.write('\n  // and unload the result of the prior inference.\n')
+            else:
+                memfile.write('.\n')
+            memfile.write('  printf("Measuring throughput...\\n");\n'
+                          '  fps_time = 0;\n'
+                          '  fps_cpu = 0;\n')
+            if not fifo:
+                memfile.write('  load_input(); // Load data input\n')
+            memfile.write(f'  for (i = 0; i < {fps_frames}; i++) {{\n'
+                          '    cnn_start(); // Start CNN processing\n')
+            if fifo:
+                memfile.write('    load_input(); // Load data input via FIFO\n')
+            if unload_overlap:
+                memfile.write(f'    if (i > 0)\n      {unload_call} // Unload the prior result\n')
+            memfile.write('    capture_input(); // Receive the next input\n'
+                          '    if (cnn_time != 0)\n'
+                          '      fps_cpu++; // The CNN was done before the CPU\n'
+                          '    while (cnn_time == 0)\n')
+            if wfi:
+                memfile.write('      __WFI(); // Wait for CNN\n')
+            else:
+                memfile.write('      ; // Spin wait\n')
+            memfile.write('    fps_time += cnn_time;\n'
+                          '    MXC_TMR_SW_Start(CNN_INFERENCE_TIMER); // Time the CNN idle time\n')
+            if not unload_overlap:
+                memfile.write(f'    {unload_call} // Unload the result\n')
+            if not fifo:
+                memfile.write('    load_input(); // Load the next input\n')
+            memfile.write('    fps_time += MXC_TMR_SW_Stop(CNN_INFERENCE_TIMER);\n'
+                          '  }\n')
+            if unload_overlap:
+                memfile.write(f'  {unload_call} // Unload the last result\n')
+            memfile.write('\n  printf("Frames per second: %u.%02u (%u us per frame)\\n",\n'
+                          f'         (uint32_t) ({fps_frames * 100000000}ULL / fps_time / 100),\n'
+                          f'         (uint32_t) ({fps_frames * 100000000}ULL / fps_time % 100), '
+                          f'fps_time / {fps_frames});\n'
+                          '  if (fps_cpu > 0)\n'
+                          '    printf("The CPU was busy after the CNN was done for %u frames. The '
+                          'frame rate\\n"\n'
+                          '           "is lower than shown.\\n", fps_cpu);\n'
+                          '  printf("\\n");\n\n')
+
+        if test_samples:
+            memfile.write('  run_test_samples();\n\n')
+
         if not forever:
             if embedded_code and apifile is not None:
                 memfile.write('  cnn_disable(); // Shut down CNN clock, disable peripheral\n\n')
@@ -737,6 +943,10 @@ def main(
                               '    printf("[%7d] -> Class %d: %d.%d%%\\n", ml_data[i], '
                               'i, digs, tens);\n'
                               '  }\n')
+            if top_k:
+                memfile.write('  printf("Top-%d results:\\n", CNN_TOP_K);\n'
+                              '  for (i = 0; i < CNN_TOP_K; i++)\n'
+                              '    printf("[%7d] -> Class %d\\n", top_score[i], top_class[i]);\n')
         else:
             memfile.write('  printf("Starting endless loop...\\n");\n\n  LED_On(1);\n\n'
                           '  while(1) {\n'
@@ -769,6 +979,108 @@ def main(
     function_footer(memfile, return_value='0')  # Exit main - don't change from 0
 
 
+def test_samples(
+        memfile,
+        layout,
+        num_samples,
+        output_width=8,
+        argmax=False,
+        top_k=0,
+        wfi=True,
+):
+    """
+    Write the test loop for `num_samples` sample inputs to `memfile`. The `TEST_INPUT` words
+    of each sample are copied to the data memory addresses in `layout` (a list of addresses
+    and word counts), and the outputs are compared to `TEST_OUTPUT` or, with `argmax`, the
+    index of the largest output is compared to `TEST_CLASS`. With `top_k`, the index comes from
+    `cnn_top_k()`.
+    """
+    words = sum(n for _, n in layout)
+    memfile.write(f'// {num_samples} test samples\n'
+                  f'#define TEST_SAMPLES {num_samples}\n'
+                  f'#define TEST_INPUT_WORDS {words}\n'
+                  'static const uint32_t test_input[TEST_SAMPLES * TEST_INPUT_WORDS] = '
+                  'TEST_INPUT;\n')
+    if argmax:
+        memfile.write('static const uint16_t test_class[TEST_SAMPLES] = TEST_CLASS;\n')
+    else:
+        memfile.write(f'static const int{output_width}_t '
+                      'test_output[TEST_SAMPLES * CNN_NUM_OUTPUTS] = TEST_OUTPUT;\n')
+    if not argmax or not top_k:
+        memfile.write('static int32_t test_data32[(CNN_NUM_OUTPUTS + '
+                      f'{32 // output_width - 1}) / {32 // output_width}];\n')
+    memfile.write('\n')
+
+    function_header(memfile, prefix='', function='load_test_input', arguments='int i',
+                    return_type='void')
+    memfile.write('  const uint32_t *in = &test_input[i * TEST_INPUT_WORDS];\n\n')
+    offs = 0
+    for addr, n in layout:
+        memfile.write(f'  memcpy32((uint32_t *) 0x{addr:08x}, in'
+                      f'{f" + {offs}" if offs else ""}, {n});\n')
+        offs += n
+    function_footer(memfile, return_value='void')  # load_test_input()
+
+    memfile.write('// Run the test samples, and report the mismatches, the number of samples that '
+                  'pass,\n// and the average inference time\n')
+    function_header(memfile, prefix='', function='run_test_samples', return_type='void')
+    memfile.write('  int i, j, pass = 0;\n')
+    if argmax and top_k:
+        memfile.write('  int32_t top_class[CNN_TOP_K], top_score[CNN_TOP_K];\n')
+    elif argmax:
+        memfile.write('  int best;\n')
+    else:
+        memfile.write('  int errors;\n')
+    if not argmax or not top_k:
+        memfile.write(f'  int{output_width}_t *test_data = (int{output_width}_t *) '
+                      'test_data32;\n')
+    memfile.write('  uint32_t test_time = 0;\n\n'
+                  '  printf("Running %d test samples...\\n", TEST_SAMPLES);\n'
+                  '  for (i = 0; i < TEST_SAMPLES; i++) {\n'
+                  '    load_test_input(i);\n'
+                  '    cnn_start(); // Start CNN processing\n'
+                  '    while (cnn_time == 0)\n')
+    if wfi:
+        memfile.write('      __WFI(); // Wait for CNN\n')
+    else:
+        memfile.write('      ; // Spin wait\n')
+    memfile.write('    test_time += cnn_time;\n')
+    if argmax:
+        if top_k:
+            memfile.write('    cnn_top_k(top_class, top_score);\n'
+                          '    j = top_class[0];\n')
+        else:
+            memfile.write('    cnn_unload((uint32_t *) test_data32);\n'
+                          '    best = 0;\n'
+                          '    for (j = 1; j < CNN_NUM_OUTPUTS; j++)\n'
+                          '      if (test_data[j] > test_data[best])\n'
+                          '        best = j;\n'
+                          '    j = best;\n')
+        memfile.write('    if (j == test_class[i])\n'
+                      '      pass++;\n'
+                      '    else\n'
+                      '      printf("Sample %d: class %d, expected %d\\n", i, j, '
+                      'test_class[i]);\n')
+    else:
+        memfile.write('    cnn_unload((uint32_t *) test_data32);\n'
+                      '    errors = 0;\n'
+                      '    for (j = 0; j < CNN_NUM_OUTPUTS; j++)\n'
+                      '      if (test_data[j] != test_output[i * CNN_NUM_OUTPUTS + j])\n'
+                      '        errors++;\n'
+                      '    if (errors == 0)\n'
+                      '      pass++;\n'
+                      '    else\n'
+                      '      printf("Sample %d: %d of %d outputs mismatch\\n", i, errors, '
+                      'CNN_NUM_OUTPUTS);\n')
+    memfile.write('  }\n'
+                  '  printf("Test samples passed: %d of %d\\n", pass, TEST_SAMPLES);\n'
+                  '  printf("Average inference time: %u us (%u CPU cycles)\\n\\n",\n'
+                  '         test_time / TEST_SAMPLES,\n'
+                  '         (uint32_t) ((uint64_t) test_time * (SystemCoreClock / 1000000) '
+                  '/ TEST_SAMPLES));\n')
+    function_footer(memfile, return_value='void')  # run_test_samples()
+
+
 def softmax_layer(
         memfile,
         output_width=8,
@@ -7,11 +7,15 @@
 """
 Tornado CNN hardware constants - AI85, AI87, CMSIS-NN
 """
+import contextlib
+import contextvars
+import functools
+import sys
+import types
+
 from . import devices
 from .eprint import eprint
 
-dev = None
-
 
 class Dev:
     """
@@ -48,6 +52,18 @@ class Dev:
     APB_SPEED = IPO_SPEED // 2
     PLL_SPEED = 0
 
+    # Energy model used by stats.calc_energy(). The coefficients are estimates that allow
+    # comparing network configurations; they are not measured values.
+    E_MACC = 0.0  # pJ per hardware multiply-accumulate
+    E_OP = 0.0  # pJ per other hardware op (comparison, addition, multiplication, bitwise)
+    E_DATA_READ = 0.0  # pJ per data memory byte read
+    E_DATA_WRITE = 0.0  # pJ per data memory byte written
+    E_APB_WRITE = 0.0  # pJ per 32-bit APB write by the CPU (weight and bias loading)
+    P_CNN = 0.0  # mW drawn by the running accelerator independent of activity (clocks, leakage)
+    P_PLL = 0.0  # mW drawn by the PLL when it clocks the accelerator
+    V_CORE = 1.0  # Nominal core voltage
+    V_BOOST = 1.0  # Core voltage when the supply is boosted (--boost)
+
     def mask_width(self, proc):
         """
         Returns the number of kernels (x9 bytes) for processor `proc`.
@@ -69,6 +85,21 @@ class Dev:
         addr %= self.INSTANCE_WIDTH * 4 // self.INSTANCE_COUNT
         return group, proc, mem, addr
 
+    def __setattr__(self, name, value):
+        raise AttributeError(f'Device {self} is immutable, use replace() to change `{name}`')
+
+    def replace(self, **changes):
+        """
+        Return a copy of the device with the constants in `changes` replaced.
+        """
+        for name in changes:
+            if not hasattr(self, name):
+                raise AttributeError(f'Device {self} has no constant `{name}`')
+        d = self.__class__.__new__(self.__class__)
+        d.__dict__.update(self.__dict__)
+        d.__dict__.update(changes)
+        return d
+
     def __str__(self):
         return self.__class__.__name__
 
@@ -218,6 +249,16 @@ class DevAI85(Dev):
     C_START = 4
     C_PAD = 2
 
+    # Energy model
+    E_MACC = 0.9
+    E_OP = 0.3
+    E_DATA_READ = 1.2
+    E_DATA_WRITE = 1.6
+    E_APB_WRITE = 3200.0
+    P_CNN = 4.0
+    V_CORE = 1.0
+    V_BOOST = 1.1
+
     def __str__(self):
         return self.__class__.__name__
 
@@ -377,6 +418,17 @@ class DevAI87(Dev):
     # PLL Speed in MHz
     PLL_SPEED = 240
 
+    # Energy model
+    E_MACC = 0.8
+    E_OP = 0.3
+    E_DATA_READ = 1.1
+    E_DATA_WRITE = 1.5
+    E_APB_WRITE = 2800.0
+    P_CNN = 9.0
+    P_PLL = 2.5
+    V_CORE = 1.0
+    V_BOOST = 1.1
+
     def __str__(self):
         return self.__class__.__name__
 
@@ -386,6 +438,7 @@ def lreg_addr(group, reg, layer=0):
     Return the address of a layer register given group `group`, register `reg`, and
     layer `layer`.
     """
+    dev = get()
     if hasattr(dev, 'LREG_OFFS'):
         if reg <= dev.MAX_LREG:
             addr = dev.C_GROUP_OFFS*group + dev.C_CNN_BASE \
@@ -404,6 +457,7 @@ def ctl_addr(group, reg):
     """
     Return the address of control register `reg` in group `group`.
     """
+    dev = get()
     return dev.C_GROUP_OFFS*group + dev.C_CNN_BASE + reg*4
 
 
@@ -426,3 +480,74 @@ def get_device(
     print('Configuring device:', d.partnum)
 
     return d
+
+
+_context = contextvars.ContextVar('device')
+_default = None  # Device for contexts that did not select one, set via `tc.dev = ...`
+
+
+def get():
+    """
+    Return the device for the current context (thread or task).
+    """
+    return _context.get(_default)
+
+
+def set_device(
+        d,
+):
+    """
+    Make `d` the device for the current context and the default for all other contexts.
+    """
+    global _default  # pylint: disable=global-statement
+    _default = d
+    _context.set(d)
+
+
+@contextlib.contextmanager
+def using(
+        d,
+):
+    """
+    Context manager that selects device `d` for the current context.
+    """
+    token = _context.set(d)
+    try:
+        yield d
+    finally:
+        _context.reset(token)
+
+
+def device_scope(
+        func,
+):
+    """
+    Decorator that lets `func` take the device as keyword argument `dev` and runs it with
+    that device selected. Without `dev`, `func` uses the device of the calling context.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, dev=None, **kwargs):
+        if dev is None:
+            return func(*args, **kwargs)
+        with using(dev):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class _Module(types.ModuleType):
+    """
+    Compatibility shim: `tc.dev` reads and sets the device of the current context.
+    """
+    @property
+    def dev(self):
+        """
+        The device for the current context.
+        """
+        return get()
+
+    @dev.setter
+    def dev(self, d):
+        set_device(d)
+
+
+sys.modules[__name__].__class__ = _Module
@@ -0,0 +1,238 @@
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Binary computation trace for --debug-computation, and a reader that converts traces to CSV
+"""
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+
+# Operations
+CONV2D = 0
+CONV1D = 1
+LINEAR = 2
+
+# Record kinds
+HEADER = 0
+MAC = 1
+BIAS = 2
+
+# One record per accumulation. `row` and `col` are the output position the record contributes
+# to. Other field use depends on the operation:
+#   Conv2d: k, c, x, y, weight, data, prod, cacc (per-pass accumulator), acc
+#   Conv1d: k, c, x, y (source offset), w (weight offset), weight, data, acc
+#   Linear: k (output feature), c (input feature), weight, data, acc
+# For BIAS records, `weight` holds the bias value and `acc` the result.
+RECORD = np.dtype([
+    ('op', 'u1'),
+    ('kind', 'u1'),
+    ('row', 'i4'),
+    ('col', 'i4'),
+    ('k', 'i4'),
+    ('c', 'i4'),
+    ('x', 'i4'),
+    ('y', 'i4'),
+    ('w', 'i4'),
+    ('weight', 'i8'),
+    ('data', 'i8'),
+    ('prod', 'i8'),
+    ('cacc', 'i8'),
+    ('acc', 'i8'),
+])
+
+CHUNK_SIZE = 65536  # Records buffered before a chunk is appended to the trace file
+
+
+def format_record(
+        r,
+):
+    """
+    Return the CSV log line for the trace record `r` (a tuple or structured array element
+    in `RECORD` order).
+    """
+    o, kind, _, col, k, c, x, y, w, weight, data, prod, cacc, acc = r
+    if o == CONV2D:
+        if kind == MAC:
+            return f'{k},{c},{x},{y},{weight},{data},{prod},{cacc},{acc}'
+        if kind == BIAS:
+            return f'     adding bias: {weight} -> result: {acc}'
+        return 'k,c,x,y,weight,data,prod,cacc,acc'
+    if o == CONV1D:
+        if kind == MAC:
+            return f'{k},{c},{x},{y},{w},{weight},{data},{acc}'
+        if kind == BIAS:
+            return f'+bias {weight} --> output[{k}][{col}] = {acc}'
+        return 'k,c,x,src_offs,wt_offs,weight,data,acc'
+    # LINEAR
+    if kind == MAC:
+        return f'w={k}, n={c}, weight={weight}, data={data} -> accumulator = {acc} '
+    return f'+bias {weight} --> output[{k}] = {acc}'
+
+
+class TraceWriter:
+    """
+    Buffer trace records and write them to directory `path` in chunks of `CHUNK_SIZE` records.
+    Each chunk is a compressed .npz file holding one array per `RECORD` field, so traces can
+    be written and read incrementally without holding the whole trace in memory.
+    """
+    def __init__(
+            self,
+            path,
+    ):
+        self.path = path
+        self.buf = []
+        self.chunk = 0
+        os.makedirs(path, exist_ok=True)
+        for f in glob.glob(os.path.join(path, 'chunk-*.npz')):
+            os.remove(f)
+
+    def append(
+            self,
+            r,
+    ):
+        """
+        Append record tuple `r`.
+        """
+        self.buf.append(r)
+        if len(self.buf) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered records as one chunk.
+        """
+        if self.buf:
+            a = np.array(self.buf, dtype=RECORD)
+            np.savez_compressed(os.path.join(self.path, f'chunk-{self.chunk:06d}.npz'),
+                                **{name: a[name] for name in RECORD.names})
+            self.chunk += 1
+            self.buf = []
+
+    def close(self):
+        """
+        Write any remaining records.
+        """
+        self.flush()
+
+
+def read(
+        path,
+):
+    """
+    Generator that yields the chunks stored in trace directory `path` as structured arrays.
+    """
+    for filename in sorted(glob.glob(os.path.join(path, 'chunk-*.npz'))):
+        with np.load(filename, allow_pickle=False) as columns:
+            chunk = np.empty(len(columns['op']), dtype=RECORD)
+            for name in RECORD.names:
+                chunk[name] = columns[name]
+        yield chunk
+
+
+def select(
+        chunk,
+        channels=None,
+        window=None,
+):
+    """
+    Return the records in `chunk` that belong to output channels `channels` (a collection of
+    integers, or None for all) and to output positions within `window` (row_start, col_start,
+    row_end, col_end; inclusive; or None for all). Header records are always kept.
+    """
+    keep = np.ones(len(chunk), dtype=bool)
+    if channels is not None:
+        keep &= np.isin(chunk['k'], list(channels))
+    if window is not None:
+        keep &= (chunk['row'] >= window[0]) & (chunk['col'] >= window[1]) \
+            & (chunk['row'] <= window[2]) & (chunk['col'] <= window[3])
+    keep |= chunk['kind'] == HEADER
+    return chunk[keep]
+
+
+def to_csv(
+        path,
+        out=None,
+        channels=None,
+        window=None,
+):
+    """
+    Reconstruct the CSV computation log from trace directory `path` and write it to `out`
+    (default: stdout), optionally restricted to `channels` and `window` (see `select()`).
+    """
+    if out is None:
+        out = sys.stdout
+    for chunk in read(path):
+        if channels is not None or window is not None:
+            chunk = select(chunk, channels, window)
+        for r in chunk:
+            print(format_record(r.item()), file=out)
+
+
+def parse_list(
+        s,
+):
+    """
+    Parse a comma-separated list of integers and integer ranges ('0,3-5') and return a set.
+    Returns None when `s` is None.
+    """
+    if s is None:
+        return None
+    result = set()
+    for e in s.split(','):
+        if '-' in e:
+            start, end = e.split('-')
+            result.update(range(int(start, 0), int(end, 0) + 1))
+        else:
+            result.add(int(e, 0))
+    return result
+
+
+def parse_window(
+        s,
+):
+    """
+    Parse a window specification 'row,col' or 'row,col,height,width' and return the inclusive
+    tuple (row_start, col_start, row_end, col_end). Returns None when `s` is None.
+    """
+    if s is None:
+        return None
+    w = [int(e, 0) for e in s.split(',')]
+    if len(w) == 2:
+        w += [1, 1]
+    if len(w) != 4 or w[2] < 1 or w[3] < 1:
+        raise ValueError('ERROR: Window must be specified as row,col[,height,width]')
+    return w[0], w[1], w[0] + w[2] - 1, w[1] + w[3] - 1
+
+
+def main():
+    """
+    Command line interface: convert a binary computation trace to CSV.
+    """
+    parser = argparse.ArgumentParser(description="Convert a binary computation trace to CSV")
+    parser.add_argument('trace', help="trace directory (compute-N.trace)")
+    parser.add_argument('-o', '--output', metavar='S',
+                        help="CSV output file name (default: stdout)")
+    parser.add_argument('--channels', metavar='LIST',
+                        help="comma-separated list of output channels or ranges (default: all)")
+    parser.add_argument('--window', metavar='LIST',
+                        help="output window as row,col[,height,width] (default: all)")
+    args = parser.parse_args()
+
+    channels = parse_list(args.channels)
+    window = parse_window(args.window)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            to_csv(args.trace, f, channels, window)
+    else:
+        to_csv(args.trace, None, channels, window)
+
+
+if __name__ == '__main__':
+    main()
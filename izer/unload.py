@@ -13,6 +13,223 @@ from .eprint import eprint, wprint
 from .utils import ffs, popcount
 
 
+def region(
+        input_shape,
+        channels=None,
+        window=None,
+):
+    """
+    Return the sorted list of output `channels` and the inclusive `window`
+    (row_start, col_start, row_end, col_end) of an output of shape `input_shape`, defaulting to
+    all channels and the full output.
+    """
+    if channels is None:
+        channels = range(input_shape[0])
+    if window is None:
+        window = (0, 0, input_shape[1] - 1, input_shape[2] - 1)
+    return sorted(channels), tuple(window)
+
+
+def channel_words(
+        processor_map,
+        input_shape,
+        out_offset,
+        out_expand,
+        out_expand_thresh,
+        output_width=8,
+        write_gap=0,
+):
+    """
+    Return a list with the data memory offset of pixel 0 and the byte within the word for each
+    of the `input_shape[0]` output channels, and the offset between two pixels. The layout is
+    the one that `verify()` checks.
+    """
+    coffs_start = ffs(processor_map) & ~(tc.dev.P_SHARED-1)
+    next_layer_map = processor_map >> coffs_start
+    out_size = output_width // 8
+    width = out_expand * out_size
+
+    words = []
+    c = 0
+    poffs = coffs_start
+    this_map = next_layer_map
+    while c < input_shape[0]:
+        if c % out_expand_thresh == 0:
+            poffs = coffs_start
+            this_map = next_layer_map
+
+        expand = c // out_expand_thresh
+        proc = poffs & ~(tc.dev.P_SHARED-1)
+        offs = tc.dev.C_SRAM_BASE + out_offset + \
+            (((proc % tc.dev.P_NUMPRO) * tc.dev.INSTANCE_SIZE |
+              (proc // tc.dev.P_NUMPRO) * tc.dev.C_GROUP_OFFS // 4) +
+             expand * out_size * (write_gap + 1)) * 4
+        k = 0
+        for shift in range(4):
+            if this_map & 1:
+                if c < input_shape[0]:
+                    # 32-bit outputs use one word per channel
+                    words.append((offs + 4 * k, 0) if out_size == 4 else (offs, shift))
+                k += 1
+                c += 1
+            this_map >>= 1
+        poffs += 4
+
+    return words, width * (write_gap + 1) * 4
+
+
+def region_reads(
+        processor_map,
+        input_shape,
+        out_offset,
+        out_expand,
+        out_expand_thresh,
+        output_width=8,
+        write_gap=0,
+        channels=None,
+        window=None,
+):
+    """
+    Return a dictionary that maps each data memory offset that holds outputs in the region
+    (see `region()`) to a list of the byte within the word and the CHW index in the region
+    of these outputs.
+    """
+    channels, window = region(input_shape, channels, window)
+    words, stride = channel_words(processor_map, input_shape, out_offset, out_expand,
+                                  out_expand_thresh, output_width, write_gap)
+    height = window[2] - window[0] + 1
+    width = window[3] - window[1] + 1
+
+    reads = {}
+    for k, c in enumerate(channels):
+        offs, shift = words[c]
+        for row in range(window[0], window[2] + 1):
+            for col in range(window[1], window[3] + 1):
+                target = (k * height + row - window[0]) * width + col - window[1]
+                addr = offs + (row * input_shape[2] + col) * stride
+                reads.setdefault(addr, []).append((shift, target))
+    return reads
+
+
+def unload_region(
+        memfile,
+        apb_base,
+        processor_map,
+        input_shape,
+        out_offset,
+        out_expand,
+        out_expand_thresh,
+        output_width=8,
+        write_gap=0,
+        channels=None,
+        window=None,
+):
+    """
+    Unload the output `channels` in the `window` (see `region()`) from hardware, writing C code
+    to the `memfile` handle. Only the data memory words that hold the selected outputs are read,
+    each of them once. The outputs are stored in CHW order of the region.
+    """
+    channels, window = region(input_shape, channels, window)
+    reads = region_reads(processor_map, input_shape, out_offset, out_expand, out_expand_thresh,
+                         output_width, write_gap, channels, window)
+    out_size = output_width // 8
+
+    memfile.write('// Custom unload for this network: '
+                  f'{output_width}-bit data, shape: {input_shape}, '
+                  f'channels: {len(channels)}, rows: {window[0]}-{window[2]}, '
+                  f'columns: {window[1]}-{window[3]}\n')
+    toplevel.function_header(memfile, function='unload',
+                             arguments=f'uint32_t *out_buf{"32" if output_width != 32 else ""}')
+    if output_width != 32:
+        memfile.write(f'  uint{output_width}_t *out_buf = (uint{output_width}_t *) out_buf32;\n'
+                      '  uint32_t val;\n\n')
+
+    for addr in sorted(reads):
+        source = f'*((volatile uint32_t *) 0x{apb_base + addr:08x})'
+        if out_size == 4:
+            for _, target in reads[addr]:
+                memfile.write(f'  out_buf[0x{target:04x}] = {source};\n')
+            continue
+        memfile.write(f'  val = {source};\n')
+        for shift, target in sorted(reads[addr]):
+            memfile.write(f'  out_buf[0x{target:04x}] = ')
+            memfile.write(f'(val >> {shift * 8})' if shift > 0 else 'val')
+            memfile.write(' & 0xff;\n' if out_size == 1 else ';\n')
+
+    toplevel.function_footer(memfile)  # unload()
+
+
+@tc.device_scope
+def top_k(
+        memfile,
+        apb_base,
+        processor_map,
+        input_shape,
+        out_offset,
+        out_expand,
+        out_expand_thresh,
+        output_width=8,
+        write_gap=0,
+        channels=None,
+        window=None,
+):
+    """
+    Write C code to the `memfile` handle that finds the `CNN_TOP_K` largest outputs in the
+    region (see `region()`) and their CHW indices in the region. The outputs are read directly
+    from the data memory, without unloading them to a buffer first. Ties go to the lower index.
+    """
+    channels, window = region(input_shape, channels, window)
+    reads = region_reads(processor_map, input_shape, out_offset, out_expand, out_expand_thresh,
+                         output_width, write_gap, channels, window)
+
+    memfile.write('// Insert the output `score` with index `c` into the sorted top-k lists\n'
+                  'static inline void top_k_insert(int32_t *top_class, int32_t *top_score, '
+                  'int32_t c, int32_t score)\n'
+                  '{\n'
+                  '  int i = CNN_TOP_K - 1;\n\n'
+                  '  if (score < top_score[i] || (score == top_score[i] && c > top_class[i]))\n'
+                  '    return;\n'
+                  '  while (i > 0 && (score > top_score[i - 1]\n'
+                  '                   || (score == top_score[i - 1] && c < top_class[i - 1]))) {\n'
+                  '    top_score[i] = top_score[i - 1];\n'
+                  '    top_class[i] = top_class[i - 1];\n'
+                  '    i--;\n'
+                  '  }\n'
+                  '  top_score[i] = score;\n'
+                  '  top_class[i] = c;\n'
+                  '}\n\n')
+
+    memfile.write('// Fused unload and top-k for this network: '
+                  f'{output_width}-bit data, shape: {input_shape}, '
+                  f'channels: {len(channels)}, rows: {window[0]}-{window[2]}, '
+                  f'columns: {window[1]}-{window[3]}\n')
+    toplevel.function_header(memfile, function='top_k',
+                             arguments='int32_t *top_class, int32_t *top_score')
+    memfile.write('  int i;\n')
+    if output_width != 32:
+        memfile.write('  uint32_t val;\n')
+    memfile.write('\n  for (i = 0; i < CNN_TOP_K; i++) {\n'
+                  '    top_class[i] = CNN_NUM_OUTPUTS;\n'
+                  '    top_score[i] = INT32_MIN;\n'
+                  '  }\n\n')
+
+    for addr in sorted(reads):
+        source = f'*((volatile uint32_t *) 0x{apb_base + addr:08x})'
+        if output_width == 32:
+            for _, target in reads[addr]:
+                memfile.write(f'  top_k_insert(top_class, top_score, {target}, '
+                              f'(int32_t) {source});\n')
+            continue
+        memfile.write(f'  val = {source};\n')
+        for shift, target in sorted(reads[addr]):
+            memfile.write(f'  top_k_insert(top_class, top_score, {target}, '
+                          f'(int{output_width}_t) ')
+            memfile.write(f'(val >> {shift * 8}));\n' if shift > 0 else 'val);\n')
+
+    toplevel.function_footer(memfile)  # top_k()
+
+
+@tc.device_scope
 def unload(
         memfile,
         apb_base,
@@ -24,6 +241,9 @@ def unload(
         output_width=8,
         mlator=False,
         blocklevel=False,
+        write_gap=0,
+        channels=None,
+        window=None,
 ):
     """
     Unload HWC memory from hardware, writing C code to the `memfile` handle.
@@ -33,8 +253,15 @@ def unload(
     the array does not matter (flattened or not flattened) as long as the size is correct.
     When `mlator` is set, use the hardware mechanism to rearrange 4-channel data into single
     channels.
+    When `channels` or `window` select part of the output, only that region is unloaded (see
+    `unload_region()`).
     """
     assert not blocklevel or not mlator
+    if channels is not None or window is not None:
+        assert not mlator
+        unload_region(memfile, apb_base, processor_map, input_shape, out_offset, out_expand,
+                      out_expand_thresh, output_width, write_gap, channels, window)
+        return
 
     memfile.write('// Custom unload for this network: '
                   f'{output_width}-bit data, shape: {input_shape}\n')
@@ -195,6 +422,7 @@ def unload(
     toplevel.function_footer(memfile)  # unload()
 
 
+@tc.device_scope
 def verify(
         verify_fn,
         ll,
@@ -215,6 +443,8 @@ def verify(
         max_count=None,
         write_gap=0,
         final_layer=0,
+        channels=None,
+        window=None,
 ):
     """
     Verify HWC memory from AI8X, writing C or mem code using the `verify_fn` function.
@@ -226,8 +456,13 @@ def verify(
     (controlled by `overwrite_ok` and `no_error_stop`).
     When `mlator` is set, use the hardware mechanism to rearrange 4-channel data into single
     channels.
+    When `channels` or `window` select part of the output (see `region()`), only that region
+    is verified.
     """
     count = 0
+    partial = channels is not None or window is not None
+    channels, window = region(input_shape, channels, window)
+    channels = set(channels)
 
     def check_overwrite(
             p,
@@ -285,14 +520,17 @@ def verify(
 
                 # Get four bytes or words either from output or zeros and construct HWC word
                 no_data = True
+                mask = 0
                 if out_size == 1:
                     val = 0
-                    for _ in range(4):
+                    for i in range(4):
                         val >>= 8
                         if this_map & 1:
                             no_data = False
                             if c < input_shape[0]:
                                 val |= (out_buf[c][row][col] & 0xff) << 24
+                                if c in channels:
+                                    mask |= 0xff << i * 8
                             c += 1
                         this_map >>= 1
                 else:
@@ -311,6 +549,7 @@ def verify(
                       (proc // tc.dev.P_NUMPRO) * tc.dev.C_GROUP_OFFS // 4) +
                      (doffs * width + expand * out_size) * (write_gap + 1)) * 4
 
+                inside = window[0] <= row <= window[2] and window[1] <= col <= window[3]
                 if not no_data:
                     num_bytes = min(c - this_c, input_shape[0] - this_c)
                     if out_size == 1:
@@ -325,14 +564,16 @@ def verify(
                         )
                         if out_map is not None:
                             out_map[offs >> 2] = (ll, this_c, row, col, val)
-                        if max_count is None or count < max_count:
+                        if (not partial or inside and mask != 0) \
+                           and (max_count is None or count < max_count):
                             verify_fn(
                                 offs,
                                 val,
+                                mask=mask if partial else None,  # Selected channels only
                                 rv=False,
                                 comment=f' // {row},{col},{this_c}-{this_c+num_bytes-1}',
                                 num_bytes=num_bytes,
-                                first_proc=ffs(processor_map >> proc) % 4,
+                                first_proc=ffs(processor_map >> proc) % 4 if not partial else 0,
                                 data=ll == final_layer,
                             )
                     else:
@@ -348,7 +589,8 @@ def verify(
                             )
                             if out_map is not None:
                                 out_map[offs >> 2] = (ll, this_c, row, col, val[i])
-                            if max_count is None or count < max_count:
+                            if (not partial or inside and this_c + i in channels) \
+                               and (max_count is None or count < max_count):
                                 verify_fn(
                                     offs,
                                     val[i],
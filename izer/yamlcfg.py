@@ -75,8 +75,9 @@ def parse(config_file):
         eprint(f'Configuration file {config_file} does not contain '
                f'`layers`, `arch`, or `dataset`.')
 
-    # These are initialized with 'None'. Use this to see whether a layer was configured,
-    # will be auto-initialized to previous layer's value or a default.
+    configured = [False] * tc.dev.MAX_LAYERS  # Layers present in the configuration file
+    # These are initialized with 'None'. Use this to see whether a value was configured,
+    # will be auto-initialized to previous layer's value, a default, or allocated.
     processor_map = [None] * tc.dev.MAX_LAYERS
     output_map = [None] * tc.dev.MAX_LAYERS
     input_offset = [None] * tc.dev.MAX_LAYERS
@@ -94,7 +95,7 @@ def parse(config_file):
     quantization = [None] * tc.dev.MAX_LAYERS
     bias_quantization = [8] * tc.dev.MAX_LAYERS
     output_shift = [None] * tc.dev.MAX_LAYERS
-    output_offset = [0] * tc.dev.MAX_LAYERS
+    output_offset = [None] * tc.dev.MAX_LAYERS
     activation = [None] * tc.dev.MAX_LAYERS
     big_data = [False] * tc.dev.MAX_LAYERS
     output_width = [8] * tc.dev.MAX_LAYERS
@@ -132,8 +133,9 @@ def parse(config_file):
         if sequence >= tc.dev.MAX_LAYERS:
             error_exit(f'This device supports up to {tc.dev.MAX_LAYERS} layers', sequence)
 
-        if processor_map[sequence]:
+        if configured[sequence]:
             error_exit('Layer was already specified', sequence)
+        configured[sequence] = True
 
         if tc.dev.device != devices.CMSISNN:
             pmap = ll['processors'] if 'processors' in ll else None
@@ -142,9 +144,9 @@ def parse(config_file):
                     pmap = int(pmap.replace('.', ''), 16)
                 except ValueError:
                     pass
-            if pmap is None:
-                error_exit('`processors` must not be zero or missing', sequence)
-            if not isinstance(pmap, int) or pmap < 1 or pmap >= 2**tc.dev.MAX_PROC:
+            # When `processors` is missing, the map is allocated automatically
+            if pmap is not None and (not isinstance(pmap, int) or pmap < 1
+                                     or pmap >= 2**tc.dev.MAX_PROC):
                 error_exit('`processors` must be an int from 1 to '
                            f'2**{tc.dev.MAX_PROC}-1', sequence)
             processor_map[sequence] = pmap
@@ -217,9 +219,6 @@ def parse(config_file):
             output_chan[sequence] = ll['out_channels']
         if 'out_offset' in ll:
             output_offset[sequence] = ll['out_offset']
-        else:
-            wprint('Defaulting to `out_offset = 0` for '
-                   f'layer sequence {sequence} in YAML configuration.')
 
         if 'activate' in ll or 'activation' in ll:
             key = 'activate' if 'activate' in ll else 'activation'
@@ -424,7 +423,8 @@ def parse(config_file):
 
     # Sequence specification may have holes. Contract to the used layers.
     for ll in range(tc.dev.MAX_LAYERS-1, -1, -1):
-        if processor_map[ll] is None:
+        if not configured[ll]:
+            del configured[ll]
             del processor_map[ll]
             del padding[ll]
             del pool[ll]
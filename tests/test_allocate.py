@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the automatic processor map allocation.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.allocate as allocate  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.op as op  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.yamlcfg as yamlcfg  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+CONFIG = """
+arch: test
+dataset: test
+layers:
+- out_offset: 0x2000
+  processors: 0x0000000000000007
+  data_format: HWC
+  op: conv2d
+- out_offset: 0x0000
+  op: conv2d
+- out_offset: 0x2000
+  op: conv2d
+- out_offset: 0x0000
+  op: passthrough
+- out_offset: 0x2000
+  in_sequences: [2, 3]
+  op: conv2d
+"""
+
+
+def allocate_maps(output_chan, streaming=None, concat=False):
+    """Allocate maps for 3x3 convolutions with 3 input channels, chained unless `concat`"""
+    layers = len(output_chan)
+    input_chan = [3] + output_chan[:-1]
+    sources = [[]] + [[ll - 1] for ll in range(1, layers)]
+    operator = [op.CONV2D] * layers
+    if concat:
+        # Two layers read the output of layer 0, and the last layer concatenates their outputs
+        sources = [[], [0], [0], [1, 2]]
+        input_chan = [3, output_chan[0], output_chan[0], output_chan[1] + output_chan[2]]
+    return allocate.processors(
+        layers,
+        list(range(layers)),
+        sources,
+        [False] * (layers - 1) + [concat],
+        [None] * layers,
+        [None] * (layers - 1) + [2**output_chan[-1] - 1],
+        input_chan,
+        output_chan,
+        operator,
+        [1] * layers,
+        [False] * layers,
+        [[3, 3]] * layers,
+        [8] * layers,
+        [False] * layers,
+        [None] * layers,
+        [False] * layers,
+        streaming or [False] * layers,
+        list(range(1, layers)) + [-1],
+    )
+
+
+def test_allocate():
+    """Main program to test the allocator."""
+    with tc.using(tc.DevAI85()):
+        pmap, omap = allocate_maps([16, 32, 100, 10])
+        assert pmap == [0x7, 0xffff, 0xffffffff, 2**52 - 1]
+        # Each layer writes its output where the next layer reads it
+        assert omap[:3] == pmap[1:]
+
+        # While streaming, outputs avoid the groups holding the inputs of streaming layers
+        pmap, omap = allocate_maps([16, 16, 8], streaming=[True, True, False])
+        assert pmap[1] == 0xffff << 16 and pmap[2] == 0xffff << 32
+
+        # Concatenated inputs are written next to each other
+        pmap, omap = allocate_maps([4, 8, 8, 10], concat=True)
+        assert pmap[1] == pmap[2] == omap[0] == 0xf0  # Next to the kernels of layer 0
+        assert pmap[3] == 0xffff and omap[1] == 0xff and omap[2] == 0xff00
+
+        # Layers move to other processors when kernel memory runs out
+        pmap, _ = allocate_maps([32] * 25 + [10])
+        assert pmap[1] == 0xffffffff and pmap[-1] == 0xffffffff << 32
+
+        # Processors are optional in the configuration, and saved maps can be parsed
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, 'in.yaml'), 'w') as f:
+                f.write(CONFIG)
+            cfg, layers, params = yamlcfg.parse(os.path.join(d, 'in.yaml'))
+            assert layers == 5 and params['processor_map'][:2] == [0x7, None]
+
+            pmap = [0x7, 0xf0, 0xf0, 0xf0, 0xff]
+            omap = [0xf0, 0xf0, 0x0f, 0xf0, 0xff]
+            allocate.save(cfg, os.path.join(d, 'out.yaml'), pmap, omap)
+            with open(os.path.join(d, 'out.yaml')) as f:
+                saved = f.read()
+            assert 'processors: 0x00000000000000f0\n  output_processors: 0x000000000000000f' \
+                in saved and 'in_sequences: [2, 3]' in saved
+            _, _, params = yamlcfg.parse(os.path.join(d, 'out.yaml'))
+            assert params['processor_map'] == pmap and params['output_processor_map'] == omap
+
+
+def plan_offsets(output_offset, streaming=None, planner=allocate.offsets):
+    """Plan offsets for a chain of 3x3 convolutions on 16x16 data with 16 channels"""
+    layers = len(output_offset)
+    return planner(
+        layers,
+        list(range(layers)),
+        [[-1]] + [[ll - 1] for ll in range(1, layers)],
+        [False] * layers,
+        [0xffff] * layers,
+        [0xffff] * layers,
+        [None] * layers,
+        output_offset,
+        [16] * layers,
+        [16] * layers,
+        [[16, 16]] * layers,
+        [[16, 16]] * layers,
+        [[16, 16]] * layers,
+        [[3, 3]] * layers,
+        [[1, 1]] * layers,
+        [[1, 1]] * layers,
+        [[1, 1]] * layers,
+        [[1, 1]] * layers,
+        [False] * layers,
+        [1] * layers,
+        [8] * layers,
+        [0] * layers,
+        streaming or [False] * layers,
+    )
+
+
+def test_offsets():
+    """Main program to test the data memory offset planner."""
+    with tc.using(tc.DevAI85()):
+        # A chain of layers ping-pongs between two buffers of 16*16*4 bytes
+        out_offs, in_offs = plan_offsets([None] * 3)
+        assert out_offs == [0x400, 0, 0x400] and in_offs == [0, 0x400, 0]
+
+        # Configured offsets are kept
+        out_offs, in_offs = plan_offsets([0x2000, None, None])
+        assert out_offs == [0x2000, 0, 0x400] and in_offs == [0, None, 0]
+
+        # The inputs of streaming layers stay live until the streaming layers have finished
+        out_offs, in_offs = plan_offsets([None] * 3, streaming=[True, True, False])
+        assert sorted([in_offs[0]] + out_offs[:2]) == [0, 0x400, 0x800]
+
+        # Configured outputs that overwrite data that is still needed are reported
+        assert not plan_offsets([0x400, 0, 0x400], planner=allocate.overlaps)
+        conflicts = plan_offsets([0x400, 0x400, 0], planner=allocate.overlaps)
+        assert len(conflicts) == 1 and conflicts[0][0]['base'] == conflicts[0][1]['base'] == 0x400
+
+
+if __name__ == '__main__':
+    test_allocate()
+    test_offsets()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the simulated camera data.
+"""
+import io
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.camera as camera  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def reference(data, camera_format):
+    """Write the image `data` one pixel at a time"""
+    f = io.StringIO()
+    for row in range(data.shape[1]):
+        for col in range(data.shape[2]):
+            r, g, b = [data[c][row][col] & 0xff for c in range(3)]
+            if camera_format == 888:
+                for val in (r, g, b):
+                    camera.pixel(f, val)
+                continue
+            if camera_format == 555:
+                w = (r & 0xf8) << 7 | (g & 0xf8) << 2 | (b & 0xf8) >> 3
+            else:
+                w = (r & 0xf8) << 8 | (g & 0xfc) << 3 | (b & 0xf8) >> 3
+            camera.pixel(f, w >> 8 & 0xff)
+            camera.pixel(f, w & 0xff)
+        camera.finish_row(f, retrace=3)
+    return f.getvalue()
+
+
+def test_camera():
+    """Main program to test the camera data"""
+    data = np.random.default_rng(0).integers(-128, 128, size=(3, 5, 7))
+    for camera_format in (888, 555, 565):
+        assert camera.lines(camera.frame, data, camera_format, retrace=3) \
+            == reference(data, camera_format)
+
+    # Every image starts with a VSYNC pulse
+    stream = camera.lines(camera.stimulus, [data, -data, data], 565, retrace=3)
+    single = camera.lines(camera.stimulus, [data], 565, retrace=3)
+    assert stream.count('1,0,0,00\n') == 3 * single.count('1,0,0,00\n')
+    assert stream.endswith(single[single.index(reference(data, 565)):])
+
+
+if __name__ == '__main__':
+    test_camera()
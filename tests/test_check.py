@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the static configuration checks.
+"""
+import contextvars
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.check as check  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.eprint as eprint  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.op as op  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def check_kernels(layers, deduplicate=False):
+    """Check the kernels of `layers` 3x3 convolutions with 64 input and output channels"""
+    return check.kernel_memory(
+        0,
+        layers,
+        [op.CONV2D] * layers,
+        [np.zeros((64 * 64, 3, 3))] * layers,
+        [[3, 3]] * layers,
+        [8] * layers,
+        [2**64 - 1] * layers,
+        [2**64 - 1] * layers,
+        [64] * layers,
+        [64] * layers,
+        [1] * layers,
+        [1] * layers,
+        [1] * layers,
+        [False] * layers,
+        deduplicate=deduplicate,
+    )
+
+
+def check_bias(layers):
+    """Check the bias values of `layers` layers with 64 output channels"""
+    return check.bias_memory(
+        0,
+        layers,
+        [np.ones(64)] * layers,
+        [list(range(tc.dev.P_NUMGROUPS))] * layers,
+        [64] * layers,
+        [False] * layers,
+        [1] * layers,
+        [False] * layers,
+        [2**64 - 1] * layers,
+        [2**64 - 1] * layers,
+        [1] * layers,
+    )
+
+
+def collect_errors():
+    """Run the static checks, collecting the errors"""
+    with tc.using(tc.DevAI85()):
+        errors = eprint.collect()
+
+        # Each layer uses 64 words of kernel memory in every processor
+        assert check_kernels(12) == [768] * 64 and not errors
+        # The kernels of all layers are the same
+        assert check_kernels(14, deduplicate=True) == [64] * 64 and not errors
+        check_kernels(14)
+        assert len(errors) == 2 and errors[0].startswith('Layer 12: Kernel memory exceeded')
+
+        # Bias values spread over the groups
+        del errors[:]
+        assert check_bias(32) == [512] * 4 and not errors
+        check_bias(33)
+        assert len(errors) == 1 and errors[0].startswith('Layer 32: bias memory capacity')
+
+
+def test_check():
+    """Main program to test the static checks."""
+    contextvars.copy_context().run(collect_errors)
+    # Outside the context, errors exit again
+    assert eprint._errors.get() is None  # pylint: disable=protected-access
+
+
+if __name__ == '__main__':
+    test_check()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the CMSIS-NN memory arena planner, weight reordering, and host routines.
+"""
+import ctypes
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from izer import cmsisnn  # noqa: E402 pylint: disable=wrong-import-position, import-error
+from izer import simulate  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+HOST_DIR = os.path.join(os.path.dirname(__file__), '..', 'assets', 'cmsis-nn', 'host')
+
+
+def test_arena_plan():
+    """Live tensors never overlap, and dead tensors are reused"""
+    # A residual block: 0 is read by 1 and 3, 1 -> 2 -> 3 (concatenation)
+    tensors = [(100, 0, 3), (60, 1, 2), (50, 2, 3), (148, 3, 4), (6, 1, 1)]
+    offsets, arena_size = cmsisnn.arena_plan(tensors)
+    for i, (size, first, last) in enumerate(tensors):
+        assert offsets[i] % 4 == 0 and offsets[i] + size <= arena_size
+        for j, (size2, first2, last2) in enumerate(tensors[:i]):
+            if first <= last2 and first2 <= last:
+                assert offsets[i] + size <= offsets[j] or offsets[j] + size2 <= offsets[i]
+    assert arena_size == 100 + 50 + 148  # Peak in step 3
+
+    # A chain of layers ping-pongs between two tensors
+    offsets, arena_size = cmsisnn.arena_plan([(10, 0, 1), (10, 1, 2), (10, 2, 3), (10, 3, 4)])
+    assert offsets == [0, 12, 0, 12] and arena_size == 22
+
+
+def fully_connected_opt(v, wopt, rows):
+    """Multiply like the reference code of `arm_fully_connected_q7_opt()`"""
+    cols = len(v)
+    out = []
+    w = iter(wopt)
+    for _ in range(rows // 4):
+        acc = [0] * 4
+        for c in range(0, cols - cols % 4, 4):
+            for a in (v[c], v[c + 2]), (v[c + 1], v[c + 3]):
+                for r in (0, 2):
+                    b1, b3, b2, b4 = next(w), next(w), next(w), next(w)
+                    acc[r] += a[0] * b1 + a[1] * b2
+                    acc[r + 1] += a[0] * b3 + a[1] * b4
+        for c in range(cols - cols % 4, cols):
+            for r in range(4):
+                acc[r] += v[c] * next(w)
+        out += acc
+    for _ in range(rows % 4):
+        out.append(sum(v[c] * next(w) for c in range(cols)))
+    return out
+
+
+def test_fully_connected_opt_weights():
+    """Reordered weights give the same result as the matrix product"""
+    rng = np.random.default_rng(0)
+    for rows, cols in ((4, 4), (10, 128), (7, 9), (3, 5)):
+        w = rng.integers(-128, 128, size=(rows, cols))
+        v = rng.integers(-128, 128, size=cols)
+        wopt = cmsisnn.fully_connected_opt_weights(w)
+        assert sorted(wopt.tolist()) == sorted(w.flatten().tolist())
+        assert fully_connected_opt(v.tolist(), wopt.tolist(), rows) == (w @ v).tolist()
+
+
+def q7(a):
+    """Return `a` as a contiguous int8 array and its C pointer"""
+    a = np.ascontiguousarray(a, dtype=np.int8)
+    return a, a.ctypes.data_as(ctypes.c_void_p)
+
+
+def test_host_routines():
+    """The host routines compute the same results as the simulator"""
+    cc = shutil.which('cc')
+    if cc is None:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        lib = os.path.join(tmp, 'libarmnn.so')
+        subprocess.run([cc, '-shared', '-fPIC', '-O2', '-I', HOST_DIR, '-o', lib,
+                        os.path.join(HOST_DIR, 'arm_nnfunctions.c')], check=True)
+        armnn = ctypes.CDLL(lib)
+
+    rng = np.random.default_rng(0)
+    # Input channels, input size, output channels, kernel size, padding, stride, groups
+    for in_chan, in_dim, out_chan, k, pad, stride, groups in (
+            (5, [6, 9], 6, [3, 3], [1, 0], [1, 1], 1),
+            (8, [5, 5], 8, [3, 3], [1, 1], [1, 1], 8),
+            (10, [1, 1], 7, [1, 1], [0, 0], [1, 1], 1),
+    ):
+        data = rng.integers(-128, 128, size=[in_chan] + in_dim)
+        kernel = rng.integers(-128, 128, size=(out_chan, in_chan // groups, k[0], k[1]))
+        bias = rng.integers(-128, 128, size=out_chan)
+        with tc.using(tc.DevCMSISNN()):
+            expected, out_size = simulate.conv2d_layer(0, False, False, data.shape, k, 0,
+                                                       out_chan, pad, [1, 1], stride, None,
+                                                       kernel, bias, data, groups=groups)
+        out, out_ptr = q7(np.zeros(out_chan * out_size[1] * out_size[2]))
+        inp, in_ptr = q7(data.transpose((1, 2, 0)))  # CHW -> HWC
+        b, b_ptr = q7(bias)
+        if groups > 1:
+            w, w_ptr = q7(kernel.reshape(out_chan, k[0], k[1]).transpose((1, 2, 0)))
+            fn = armnn.arm_depthwise_separable_conv_HWC_q7_nonsquare
+        elif in_dim == [1, 1]:
+            w, w_ptr = q7(cmsisnn.fully_connected_opt_weights(kernel.reshape(out_chan, -1)))
+            assert armnn.arm_fully_connected_q7_opt(in_ptr, w_ptr, in_chan, out_chan, 7, 7,
+                                                    b_ptr, out_ptr, None) == 0
+        else:
+            w, w_ptr = q7(kernel.transpose((0, 2, 3, 1)))
+            fn = armnn.arm_convolve_HWC_q7_basic_nonsquare
+        if in_dim != [1, 1]:
+            assert fn(in_ptr, in_dim[1], in_dim[0], in_chan, w_ptr, out_chan, k[1], k[0],
+                      pad[1], pad[0], stride[1], stride[0], b_ptr, 7, 7, out_ptr,
+                      out_size[2], out_size[1], None, None) == 0
+        assert out.tolist() == expected.reshape(out_size).transpose((1, 2, 0)).flatten().tolist()
+        del inp, w, b
+
+
+if __name__ == '__main__':
+    test_arena_plan()
+    test_fully_connected_opt_weights()
+    test_host_routines()
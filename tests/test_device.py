@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the immutable, context-local device selection.
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+@tc.device_scope
+def describe():
+    """Return properties of the current device"""
+    return tc.dev.device, tc.dev.MAX_PROC, tc.lreg_addr(1, 0, 3)
+
+
+def test_device():
+    """Main program to test the device context."""
+    ai85 = tc.DevAI85()
+    ai87 = tc.DevAI87()
+
+    try:
+        ai85.MAX_PROC = 4
+        assert False, 'Device constants must be immutable'
+    except AttributeError:
+        pass
+
+    small = ai85.replace(MAX_PROC=4, P_NUMPRO=4, P_NUMGROUPS=1)
+    assert small.MAX_PROC == 4 and ai85.MAX_PROC == 64
+    assert small.mask_width(4) == ai85.MASK_WIDTH_LARGE
+
+    # Compatibility shim
+    tc.dev = ai85
+    assert tc.dev is ai85 and describe()[0] == 85
+
+    results = {}
+
+    def worker(name, d):
+        results[name] = describe(dev=d)
+
+    threads = [threading.Thread(target=worker, args=(n, d))
+               for n, d in (('ai87', ai87), ('small', small))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results['ai87'][0] == 87
+    assert results['small'][:2] == (85, 4)
+    assert results['ai87'][2] != describe()[2]
+    assert tc.dev is ai85
+
+
+if __name__ == '__main__':
+    test_device()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the DMA transfer code.
+"""
+import io
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from izer import apbaccess  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.kernels as kernels  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.load as load  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.op as op  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.toplevel as toplevel  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+APB_BASE = 0x50000000
+
+
+def dma_entries(code):
+    """Return the address register, its value, the destination, the source array and the
+    word count of each entry of the DMA tables in `code`"""
+    return [(int(addr, 16) if addr != 'NULL' else None, int(val, 16), int(dst, 16), src, int(n))
+            for addr, val, dst, src, n in re.findall(
+                r'{ (?:\(volatile uint8_t \*\) )?(0x[0-9a-f]+|NULL), (0x[0-9a-f]+), '
+                r'\(uint32_t \*\) (0x[0-9a-f]+), (\w+), (\d+) },', code)]
+
+
+def defines(header):
+    """Return the words of each `#define NAME { ... }` in `header`"""
+    return {name: [int(e, 16) for e in re.findall(r'0x[0-9a-f]+', words)]
+            for name, words in re.findall(r'#define (\w+) {([^}]*)}', header)}
+
+
+def arrays(code):
+    """Return the define used by each `static const uint32_t name[]` in `code`"""
+    return dict(re.findall(r'static const uint32_t (\w+)\[\] = (\w+);', code))
+
+
+def dma_input(chw, processor_map, data, in_expand=1, in_expand_thresh=64):
+    """Return the data memory words (by address) written by the DMA table of `load_input()`,
+    and the ones written directly by the simulation"""
+    shape = list(data.shape)
+    with tc.using(tc.DevAI85()):
+        code, header = io.StringIO(), io.StringIO()
+        apb = apbaccess.apbwriter(code, apb_base=APB_BASE, master=False, embedded_code=True,
+                                  sampledata_header=header, dma='poll')
+        load.load(True, apb, chw, processor_map, 0, shape, in_expand, 1, in_expand_thresh,
+                  data, [1, 1], dma=True)
+
+        direct = io.StringIO()
+        sim = apbaccess.apbwriter(direct, apb_base=0, master=False, embedded_code=False)
+        load.load(False, sim, chw, processor_map, 0, shape, in_expand, 1, in_expand_thresh,
+                  data, [1, 1])
+        expected = {int(addr, 16): int(val, 16) for addr, val in re.findall(
+            r'\*\(\(volatile uint32_t \*\) (0x[0-9a-f]+)\) = (0x[0-9a-f]+);', direct.getvalue())}
+
+    entries = dma_entries(code.getvalue())
+    words = defines(header.getvalue())
+    source = arrays(code.getvalue())
+    memory = {}
+    for addr, val, dst, src, n in entries:
+        assert addr is None and val == 0  # No address register for data memory
+        assert len(words[source[src]]) == n
+        for i, e in enumerate(words[source[src]]):
+            memory[dst - APB_BASE + 4 * i] = e
+    return entries, memory, expected
+
+
+def test_dma_table():
+    """One table entry per contiguous region, optionally setting the kernel address first"""
+    f = io.StringIO()
+    toplevel.dma_table(f, 'kernels_dma', [(0x50180001, 0x01, 0x50180000, 'kernels_0', 3),
+                                          (None, 0, 0x50400000, 'input_0', 1024)])
+    assert f.getvalue() == \
+        '  static const cnn_dma_t kernels_dma[] = {\n' \
+        '    { (volatile uint8_t *) 0x50180001, 0x01, (uint32_t *) 0x50180000, kernels_0, 3 },\n' \
+        '    { NULL, 0x00, (uint32_t *) 0x50400000, input_0, 1024 },\n' \
+        '  };\n\n' \
+        '  cnn_dma(kernels_dma, 2);\n'
+
+
+def test_dma_functions():
+    """Polling waits in `cnn_dma()`, the interrupt handler chains the transfers"""
+    poll, interrupt = io.StringIO(), io.StringIO()
+    toplevel.dma_functions(poll)
+    toplevel.dma_functions(interrupt, interrupt=True)
+    assert 'dma_isr' not in poll.getvalue() and '__WFI()' not in poll.getvalue()
+    assert 'NVIC_SetVector(CNN_DMA_IRQn, dma_isr);' in interrupt.getvalue()
+    assert 'int cnn_dma(const cnn_dma_t *desc, int n)\n' in interrupt.getvalue()
+
+
+def test_dma_input():
+    """The input DMA table copies each buffer to the data memory the layer reads"""
+    data = (np.arange(8 * 4 * 4) % 251 - 125).reshape(8, 4, 4)
+    with tc.using(tc.DevAI85()):
+        group = tc.dev.C_GROUP_OFFS
+        quad = tc.dev.INSTANCE_SIZE * 16
+        sram = tc.dev.C_SRAM_BASE
+
+    # CHW: one transfer per channel, to the memory of its processor (processors 0, 4, ... 28)
+    entries, memory, expected = dma_input(True, 0x11111111, data)
+    assert [(dst, n) for _, _, dst, _, n in entries] == \
+        [(APB_BASE + sram + (c // 4) * group + (c % 4) * quad, 4) for c in range(8)]
+    assert len(expected) == 32 and memory == expected
+
+    # HWC: one transfer per memory instance, with the channels of four processors in each word
+    entries, memory, expected = dma_input(False, 0xff, data)
+    assert [(dst, n) for _, _, dst, _, n in entries] == \
+        [(APB_BASE + sram, 16), (APB_BASE + sram + quad, 16)]
+    assert len(expected) == 32 and memory == expected
+
+    # HWC with two passes: one transfer per memory instance, both passes in the same buffer
+    entries, memory, expected = dma_input(False, 0xf, data, in_expand=2, in_expand_thresh=4)
+    assert [(dst, n) for _, _, dst, _, n in entries] == [(APB_BASE + sram, 32)]
+    assert len(expected) == 32 and memory == expected
+
+
+def test_dma_kernels():
+    """The kernel DMA table sets the kernel address and copies the packed kernels of each
+    processor to its kernel memory"""
+    rng = np.random.default_rng(2)
+    kernel = list(rng.integers(-128, 128, (2, 8 * 4, 3, 3)))
+    with tc.using(tc.DevAI85()):
+        code, header = io.StringIO(), io.StringIO()
+        apb = apbaccess.apbwriter(code, apb_base=APB_BASE, master=False, embedded_code=True,
+                                  mexpress=True, weight_header=header, apifile=code,
+                                  sampledata_header=io.StringIO(), dma='poll')
+        kern_offs, kern_len, _, _ = kernels.load(
+            False, True, apb, 0, 2, [op.CONV2D] * 2, kernel, [[3, 3]] * 2, [8] * 2,
+            [0xff, 0xf], [0xf, 0xff], [8, 4], [4, 8], [1] * 2, [4, 8], [1] * 2, [8, 4], [1] * 2,
+            flatten=[False] * 2, mexpress=True, api=True, bypass=[False] * 2, dma=True,
+        )
+        used, data = apb.kernel_image
+        mram = [tc.dev.C_GROUP_OFFS * (p // tc.dev.P_NUMPRO) + tc.dev.C_MRAM_BASE
+                + (p % tc.dev.P_NUMPRO) * tc.dev.MASK_OFFS * 16 for p in range(tc.dev.MAX_PROC)]
+    assert kern_offs == [0, 4] and kern_len == [4, 8]
+
+    entries = dma_entries(code.getvalue())
+    words = defines(header.getvalue())
+    source = arrays(code.getvalue())
+    assert len(entries) == 8  # Processors 0-7
+    for p, (addr, val, dst, src, n) in enumerate(entries):
+        cols = np.flatnonzero(used[p])
+        first, last = cols[0], cols[-1]
+        assert dst == APB_BASE + mram[p]
+        assert (addr, val) == (dst + first * 4 | 0x01, 0x01)
+        assert n == ((last + 1 - first) * 9 + 3) // 4 == len(words[source[src]])
+
+        # The words are the 9-byte kernels of the used columns, big endian
+        b = np.array(words[source[src]], dtype='>u4').view(np.uint8)
+        kern = b[:(last + 1 - first) * 9].reshape(-1, 9)
+        assert np.array_equal(kern.astype(np.int8), data[p, first:last + 1])
+
+
+if __name__ == '__main__':
+    test_dma_table()
+    test_dma_functions()
+    test_dma_input()
+    test_dma_kernels()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the energy estimate.
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.stats as stats  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def estimate(pll=False, boost=False):
+    """Estimate the energy of a two-layer network"""
+    stats.new()
+    stats.account(0, macc=1000000, comp=10000)
+    stats.account(1, macc=200000, add=500)
+    return stats.calc_energy(
+        {0: 20000, 1: 5000},
+        {0: 3072, 1: 8192},
+        {0: 8192, 1: 1024},
+        1000,
+        tc.dev.PLL_SPEED if pll else tc.dev.APB_SPEED,
+        startup=tc.dev.C_START,
+        pll=pll,
+        boost=boost,
+    )
+
+
+def test_energy():
+    """Main program to test the energy estimate."""
+    with tc.using(tc.DevAI85()):
+        e = estimate()
+        dev = tc.dev
+        dynamic = (1000000 * dev.E_MACC + 10000 * dev.E_OP + 3072 * dev.E_DATA_READ
+                   + 8192 * dev.E_DATA_WRITE) / 1e6
+        assert abs(e['layers'][0]['uj'] - (dynamic + dev.P_CNN * 20000 / 50 / 1000)) < 1e-9
+        assert e['cycles'] == 25004 and e['weight_load_uj'] == 1000 * dev.E_APB_WRITE / 1e6
+        assert abs(sum(le['uj'] for le in e['layers'])
+                   + dev.P_CNN * dev.C_START / 50 / 1000 - e['inference_uj']) < 1e-9
+
+        # Boosting the supply raises the dynamic energy only
+        boosted = estimate(boost=True)
+        assert boosted['inference_uj'] > e['inference_uj']
+        assert boosted['weight_load_uj'] == e['weight_load_uj']
+
+        summary = stats.summary(per_layer=True, energy=True)
+        assert 'ENERGY ESTIMATE' in summary and 'Layer 1:' in summary
+        assert 'ENERGY ESTIMATE' not in stats.summary()
+        json.dumps(stats.get().energy)
+
+    with tc.using(tc.DevAI87()):
+        # The PLL runs the same cycles faster, but adds its own power
+        e, fast = estimate(), estimate(pll=True)
+        assert fast['time_us'] < e['time_us'] and fast['power_mw'] > e['power_mw']
+
+
+if __name__ == '__main__':
+    test_energy()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the design-space explorer.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.explore as explore  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.yamlcfg as yamlcfg  # noqa: E402 pylint: disable=wrong-import-position, import-error
+from izer import commandline  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+CONFIG = os.path.join(os.path.dirname(__file__), 'test-fifostream-32-hwc.yaml')
+
+
+def test_explore():
+    """Main program to test the explorer."""
+    # Dominated and repeated scores are dropped
+    assert explore.pareto([(1, 2), (2, 1), (2, 2), (1, 2)]) == [0, 1]
+
+    with tempfile.TemporaryDirectory() as d:
+        argv = ['--device', 'MAX78000', '--rtl', '--prefix', 'test', '--test-dir', d,
+                '--config-file', CONFIG, '--fifo']
+        with tc.using(tc.DevAI85()):
+            cfg, _, params = yamlcfg.parse(CONFIG)
+            candidates = explore.variants(cfg, params, commandline.get_parser(argv),
+                                          vary=['streaming', 'offsets'], max_streaming=2)
+        assert [settings['streaming'] for settings, _, _ in candidates] == [0, 1, 2] * 2
+        settings, c, extra = candidates[-1]
+        assert settings['offsets'] == 'planned' and not extra
+        assert 'out_offset' not in c['layers'][0] and c['layers'][1]['streaming'] \
+            and 'streaming' not in c['layers'][2]
+
+        filenames = explore.main(['--jobs', '1', '--vary', 'streaming', '--max-streaming', '2']
+                                 + argv)
+        assert filenames and all(os.path.exists(f) for f in filenames)
+        with tc.using(tc.DevAI85()):
+            _, _, params = yamlcfg.parse(filenames[0])
+        assert None not in params['processor_map'][:3]
+
+
+if __name__ == '__main__':
+    test_explore()
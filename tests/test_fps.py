@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the throughput measurement (`--fps-frames`) in main().
+"""
+import io
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.toplevel as toplevel  # noqa: E402 pylint: disable=wrong-import-position, import-error
+from izer import commandline  # noqa: E402 pylint: disable=wrong-import-position, import-error
+from izer import izer  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+CONFIG = os.path.join(os.path.dirname(__file__), 'test-mnist-chw-extrasmallnet.yaml')
+CHECKPOINT = os.path.join(os.path.dirname(__file__), 'test-mnist-extrasmallnet.pth.tar')
+
+CALLS = r'\b(cnn_start|load_input|cnn_unload|capture_input|__WFI|MXC_TMR_SW_Start|' \
+    r'MXC_TMR_SW_Stop)\('
+
+
+def fps_loop(main):
+    """Return the calls before, inside and after the throughput loop in `main`, and the number
+    of frames of the loop"""
+    start = main.index('printf("Measuring throughput...\\n");')
+    head, loop = main[start:].split('  for (i = 0; i < ', 1)
+    frames, loop = loop.split('; i++) {\n', 1)
+    loop, tail = loop.split('\n  }\n', 1)
+    tail = tail[:tail.index('printf("Frames per second')]
+    return re.findall(CALLS, head), re.findall(CALLS, loop), re.findall(CALLS, tail), int(frames)
+
+
+def write_main(**kwargs):
+    """Return the main() of an embedded network with an inference timer"""
+    with tc.using(tc.DevAI85()):
+        memfile = io.StringIO()
+        toplevel.main(memfile, None, unload=True, embedded_code=True, groups=[0], **kwargs)
+    return memfile.getvalue()
+
+
+def test_fps_main():
+    """The next input is loaded after the CNN is done, the result is unloaded during the next
+    inference only when its memory is not overwritten"""
+    main = write_main(fps_frames=5)
+    assert 'void capture_input(void)\n{\n}\n' in main
+    assert fps_loop(main) == (
+        ['load_input'],
+        ['cnn_start', 'capture_input', '__WFI', 'MXC_TMR_SW_Start', 'cnn_unload', 'load_input',
+         'MXC_TMR_SW_Stop'],
+        [], 5)
+    assert '(uint32_t) (500000000ULL / fps_time / 100)' in main and 'fps_time / 5);' in main
+
+    # Overlap: unload the prior result while the CNN is busy, and the last one after the loop
+    main = write_main(fps_frames=5, unload_overlap=True)
+    assert fps_loop(main) == (
+        ['load_input'],
+        ['cnn_start', 'cnn_unload', 'capture_input', '__WFI', 'MXC_TMR_SW_Start', 'load_input',
+         'MXC_TMR_SW_Stop'],
+        ['cnn_unload'], 5)
+    assert '    if (i > 0)\n      cnn_unload((uint32_t *) ml_data32); // Unload the prior' in main
+
+    # FIFO: the input is loaded during the inference, once per frame
+    main = write_main(fps_frames=2, fifo=True, wfi=False)
+    assert fps_loop(main) == (
+        [],
+        ['cnn_start', 'load_input', 'capture_input', 'MXC_TMR_SW_Start', 'cnn_unload',
+         'MXC_TMR_SW_Stop'],
+        [], 2)
+    assert '    while (cnn_time == 0)\n      ; // Spin wait\n' in main
+
+
+def test_fps_softmax():
+    """With --softmax, the loop runs after the checked result and before the CNN is shut down,
+    and unloads to the 32-bit buffer"""
+    for output_width, buffer in ((32, 'ml_data'), (8, 'ml_data32')):
+        main = write_main(fps_frames=3, softmax=True, output_width=output_width)
+        assert main.index('softmax_layer();') < main.index('Measuring throughput') \
+            < main.index('MXC_SYS_ClockDisable(MXC_SYS_PERIPH_CLOCK_CNN)')
+        assert fps_loop(main)[1].count('cnn_unload') == 1
+        assert f'    cnn_unload((uint32_t *) {buffer}); // Unload the result\n' in main
+        assert '  int i;\n  uint32_t fps_time, fps_cpu;\n  int digs, tens;\n' in main
+
+
+def test_fps_overlap():
+    """Overlap unloading only when no other layer and no input use the final layer's output
+    memory"""
+    with open(CONFIG) as f:
+        config = f.read()
+    with tempfile.TemporaryDirectory() as d:
+        mains = []
+        # The final layer writes to layer 0's output memory at 0x2000, or to unused memory
+        for offset in ('0x2000', '0x4000'):
+            filename = os.path.join(d, f'net-{offset}.yaml')
+            with open(filename, mode='w') as f:
+                f.write(f'out_offset: {offset}'.join(config.rsplit('out_offset: 0x2000', 1)))
+            izer.generate(commandline.get_parser(
+                ['--device', 'MAX78000', '--embedded-code', '--timer', '0', '--fps-frames', '4',
+                 '--checkpoint-file', CHECKPOINT, '--config-file', filename, '--test-dir', d,
+                 '--prefix', offset]))
+            with open(os.path.join(d, offset, 'main.c')) as f:
+                mains.append(f.read())
+
+    assert fps_loop(mains[0]) == (
+        ['load_input'],
+        ['cnn_start', 'capture_input', '__WFI', 'MXC_TMR_SW_Start', 'cnn_unload', 'load_input',
+         'MXC_TMR_SW_Stop'],
+        [], 4)
+    assert fps_loop(mains[1]) == (
+        ['load_input'],
+        ['cnn_start', 'cnn_unload', 'capture_input', '__WFI', 'MXC_TMR_SW_Start', 'load_input',
+         'MXC_TMR_SW_Stop'],
+        ['cnn_unload'], 4)
+
+
+if __name__ == '__main__':
+    test_fps_main()
+    test_fps_softmax()
+    test_fps_overlap()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the device description and the expected configuration for the host model.
+"""
+import io
+import os
+import re
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+from izer import hostmodel  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def test_constants():
+    """The layer register addresses the model computes match the device's"""
+    for dev in (tc.DevAI85(), tc.DevAI87()):
+        with tc.using(dev):
+            c = dict(hostmodel.constants(tc.dev))
+            for name in hostmodel.LAYER_REGISTERS:
+                reg = c[f'LREG_{name}']
+                assert reg == getattr(tc.dev, f'LREG_{name}', hostmodel.NO_REGISTER)
+                if reg == hostmodel.NO_REGISTER:
+                    continue
+                step = c['LREG_LAYER_STEP'] if reg <= c['MAX_LREG'] else 4
+                for group, layer in ((0, 0), (1, 3), (3, tc.dev.MAX_LAYERS - 1)):
+                    assert group * c['GROUP_OFFS'] + c['LREG_BASE'] \
+                        + reg * c['LREG_REG_STEP'] + layer * step \
+                        == tc.lreg_addr(group, reg, layer)
+            assert c['NUM_GROUPS'] * c['NUM_PROCS'] == tc.dev.MAX_PROC
+
+    with tc.using(tc.DevAI85()):
+        c = dict(hostmodel.constants(tc.dev))
+        assert c['LREG_NXTLYR'] == c['CNT_DIFF_OFFS'] == hostmodel.NO_REGISTER
+        assert c['LREG_MCNT1'] == hostmodel.NO_REGISTER and c['STREAM_BIAS_SKIP'] == 1
+
+
+def test_c_array():
+    """Scalars and structures, with a fixed number of values per line"""
+    f = io.StringIO()
+    hostmodel.c_array(f, 'uint8_t', 'a', np.array([[1, 2], [3, 4]]), '0x{:02x}', 3)
+    assert f.getvalue() == 'static const uint8_t a[] = {\n  0x01, 0x02, 0x03,\n  0x04,\n};\n\n'
+
+    f = io.StringIO()
+    hostmodel.c_array(f, 'model_reg_t', 'r', [(0x10, 5), (0x14, 6)], '0x{:x}')
+    assert f.getvalue() == 'static const model_reg_t r[] = {\n  {0x10, 0x5}, {0x14, 0x6},\n};\n\n'
+
+
+def test_write():
+    """`model.h` describes the device, `expected.h` lists the configuration ai8xize expects"""
+    used = np.zeros((64, 4), dtype=bool)
+    used[5, 2] = True
+    kernel_data = np.zeros((64, 4, 9), dtype=np.int64)
+    kernel_data[5, 2] = np.arange(-4, 5)
+    apb = SimpleNamespace(layer_regs={0x100104: 0x12, 0x100100: 0xffffffff},
+                          kernel_image=(used, kernel_data), bias_image={0x108000: 0x7f})
+
+    with tempfile.TemporaryDirectory() as d, tc.using(tc.DevAI85()):
+        hostmodel.write(d, apb)
+        with open(os.path.join(d, 'model.h')) as f:
+            model = f.read()
+        with open(os.path.join(d, 'expected.h')) as f:
+            expected = f.read()
+
+    defines = dict(re.findall(r'#define MODEL_(\w+) (\S+)\n', model))
+    assert defines['APB_BASE'] == '0x50000000' and defines['LREG_NXTLYR'] == '(-1)'
+    assert defines['MAX_LAYERS'] == '0x20'
+    assert 'static const model_reg_t model_regs[] = {\n' \
+        '  {0x00100100, 0xffffffff}, {0x00100104, 0x00000012},\n};\n\n' \
+        '#define MODEL_REGS 2\n' in expected
+    assert 'model_kernel_cols[] = {\n  0x050002,\n};' in expected
+    assert 'model_kernel_data[] = {\n  0xfc, 0xfd, 0xfe, 0xff, 0x00, 0x01, 0x02, 0x03, ' \
+        '0x04,\n};' in expected
+    assert '#define MODEL_KERNELS 1\n' in expected
+    assert '{0x00108000, 0x0000007f},\n};\n\n#define MODEL_BIAS 1\n' in expected
+
+    # Without kernels or bias values, the arrays hold one unused element
+    apb = SimpleNamespace(layer_regs={}, kernel_image=None, bias_image=None)
+    with tempfile.TemporaryDirectory() as d, tc.using(tc.DevAI85()):
+        hostmodel.write(d, apb)
+        with open(os.path.join(d, 'expected.h')) as f:
+            expected = f.read()
+    assert '#define MODEL_REGS 0\n' in expected and '#define MODEL_KERNELS 0\n' in expected
+    assert '#define MODEL_BIAS 0\n' in expected
+
+
+if __name__ == '__main__':
+    test_constants()
+    test_c_array()
+    test_write()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the bias memory packing.
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.kbias as kbias  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def plan(output_chan, group_map):
+    """Plan the bias memory for layers with `output_chan` channels and the given groups"""
+    layers = len(output_chan)
+    return kbias.plan(
+        0,
+        layers,
+        [np.ones(c, dtype=np.int64) for c in output_chan],
+        group_map,
+        output_chan,
+        [False] * layers,
+        [1] * layers,
+        [False] * layers,
+        [1] * layers,
+        [1] * layers,
+        [1] * layers,
+    )
+
+
+def test_kbias():
+    """Main program to test the bias packing."""
+    with tc.using(tc.DevAI85()):
+        # Fits in layer order, using the least used group
+        order, groups = plan([64, 64, 64], [[0, 1]] * 3)
+        assert order == [0, 1, 2] and groups == [0, 1, 0]
+
+        # In layer order, layers 1 and 2 both use group 1
+        order, groups = plan([200, 300, 300], [[0, 1], [0, 1], [1]])
+        assert order == [2, 1, 0] and groups == [0, 0, 1]
+
+        # First-fit decreasing does not fit, the search does
+        sizes = dict(enumerate([256, 224, 256, 128, 64, 96]))
+        assert kbias.pack(sizes, {ll: [0, 1] for ll in sizes}, [0] * 4, max_steps=0) is None
+        groups = kbias.pack(sizes, {ll: [0, 1] for ll in sizes}, [0] * 4)
+        assert sum(sizes[ll] for ll, g in groups.items() if g == 0) == tc.dev.BIAS_SIZE
+
+        # Memory already used by depth-wise layers is respected
+        assert kbias.pack({0: 64}, {0: [0, 1]}, [500, 448, 0, 0]) == {0: 1}
+        assert kbias.pack({0: 64}, {0: [0, 1]}, [500, 449, 0, 0]) is None
+
+
+if __name__ == '__main__':
+    test_kbias()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the kernel memory placement and loading.
+"""
+import io
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from izer import apbaccess  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.kernels as kernels  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.op as op  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def footprint(first_proc, last_proc, length):
+    """Return the kernel memory used by processors `first_proc` to `last_proc`"""
+    used = np.zeros((tc.dev.MAX_PROC, tc.dev.MASK_WIDTH_LARGE), dtype=bool)
+    used[first_proc:last_proc + 1, :length] = True
+    return used
+
+
+def test_place():
+    """Main program to test the kernel placement."""
+    with tc.using(tc.DevAI85()):
+        # Layer 2 fits into the hole next to layer 0 instead of on top of layer 1
+        fp = {0: footprint(0, 31, 40), 1: footprint(0, 63, 40), 2: footprint(32, 63, 40)}
+        assert kernels.place(fp) == {0: 0, 1: 40, 2: 0}
+        used = np.zeros((tc.dev.MAX_PROC, tc.dev.MASK_WIDTH_LARGE), dtype=bool)
+        used[:32, :80] = used[32:, 40:120] = True
+        top, frag = kernels.fragmentation(used)
+        assert top == 120 and abs(frag - 40 / 200) < 1e-9
+
+        # Offsets are aligned
+        assert kernels.place({0: footprint(0, 3, 5)}, start_offs=1) == {0: 4}
+
+        # Nothing fits
+        assert kernels.place({0: footprint(0, 0, 700), 1: footprint(0, 0, 100)}) is None
+
+
+def test_load_runs():
+    """Test splitting the kernels to load into runs."""
+    needed = np.zeros(32, dtype=bool)
+    needed[[2, 3, 5, 12, 13]] = True
+    assert kernels.load_runs(needed) == [(2, 13)]
+    assert kernels.load_runs(needed, min_gap=4) == [(2, 5), (12, 13)]
+    assert kernels.load_runs(needed, legacy_kernels=True, min_gap=1) == [(0, 3), (5, 5), (12, 13)]
+    assert not kernels.load_runs(np.zeros(8, dtype=bool), min_gap=4)
+
+
+def load_kernels(kernel, deduplicate):
+    """Load the 3x3 `kernel` of each layer (four input and output channels), return the
+    offsets, the weight header, the loader and the kernel memory image"""
+    n = len(kernel)
+    weight_header, api = io.StringIO(), io.StringIO()
+    with tc.using(tc.DevAI85()):
+        apb = apbaccess.apbwriter(io.StringIO(), apb_base=0, master=False, embedded_code=True,
+                                  mexpress=True, weight_header=weight_header, apifile=api,
+                                  sampledata_header=io.StringIO())
+        kern_offs, kern_len, _, _ = kernels.load(
+            False, True, apb, 0, n, [op.CONV2D] * n, kernel, [[3, 3]] * n, [8] * n,
+            [0xf] * n, [0xf] * n, [4] * n, [4] * n, [1] * n, [4] * n, [1] * n, [4] * n, [1] * n,
+            flatten=[False] * n, mexpress=True, api=True, bypass=[False] * n,
+            deduplicate=deduplicate,
+        )
+    return kern_offs, kern_len, weight_header.getvalue(), api.getvalue(), apb.kernel_image
+
+
+def test_load_deduplicate():
+    """Layers with identical kernels share the kernel memory of the first one"""
+    rng = np.random.default_rng(1)
+    first, second = rng.integers(-128, 128, (2, 16, 3, 3))
+    kernel = [first, second, first.copy()]
+
+    offs, length, header, loader, (_, data) = load_kernels(kernel, False)
+    assert offs == [0, 4, 8] and length == [4, 4, 4]
+    dedup_offs, dedup_length, dedup_header, dedup_loader, (dedup_used, dedup_data) = \
+        load_kernels(kernel, True)
+
+    # Layer 2 uses the kernels of layer 0, and its copy is neither stored nor loaded
+    assert dedup_offs == [0, 4, 0] and dedup_length == length
+    assert dedup_loader.count('memcpy32(') == loader.count('memcpy32(') == 4
+    assert re.findall(r'kernels_\d+, (\d+)\);', loader) == ['27'] * 4  # 12 kernels per proc
+    assert re.findall(r'kernels_\d+, (\d+)\);', dedup_loader) == ['18'] * 4  # 8 kernels
+    assert dedup_header.count('0x') == header.count('0x') * 2 // 3
+    assert np.sum(dedup_used) == 4 * 8
+
+    # Every layer reads the same kernels from its kernel memory as without sharing
+    for ll in range(3):
+        assert np.array_equal(dedup_data[:4, dedup_offs[ll]:dedup_offs[ll] + length[ll]],
+                              data[:4, offs[ll]:offs[ll] + length[ll]])
+
+
+if __name__ == '__main__':
+    test_place()
+    test_load_runs()
+    test_load_deduplicate()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the latency estimate for streaming and non-streaming networks.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.stats as stats  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def latency(streaming, stream_regs=None, fifo_cycles=None):
+    """Estimate a three-layer 3x3 convolution network on 16x16 input"""
+    layers = 3
+    return stats.calc_latency(
+        streaming,
+        layers,
+        [0] * layers,
+        [[1, 1]] * layers,
+        [[16, 16]] * layers,
+        [1] * layers,
+        [16, 32, 8],
+        [[16, 16]] * layers,
+        [[16, 16]] * layers,
+        [[1, 1]] * layers,
+        [[3, 3]] * layers,
+        operands=[1] * layers,
+        stream_regs=stream_regs,
+        fifo_cycles=fifo_cycles,
+    )
+
+
+def test_latency():
+    """Main program to test the latency estimate."""
+    with tc.using(tc.DevAI85()):
+        startup, lat = latency([False] * 3)
+        assert startup == tc.dev.C_START
+        # Non-streaming layers run back to back: per-layer input + pad + output cycles
+        pad = tc.dev.C_PAD * 2 * (1 * (2 + 16) + 16)
+        expected = [256 + pad + 256 * (chan + tc.dev.C_PAD) for chan in [16, 32, 8]]
+        assert [cycles for cycles, _ in lat] == expected
+        sequential = sum(expected)
+
+        # Streaming layers overlap with their predecessor, bounded below by the slowest layer
+        regs = [None, (2 * 18 + 2, 1, 2), (2 * 18 + 2, 1, 2)]
+        _, lat = latency([False, True, True], regs)
+        total = sum(cycles for cycles, _ in lat)
+        assert max(expected) <= total < sequential
+        assert lat[0][0] == expected[0]
+
+        # A slow FIFO dominates the first layer
+        _, lat = latency([True, True, True], [(2 * 16 + 2, 0, 0)] + regs[1:], fifo_cycles=100)
+        assert lat[0][0] >= 256 * 100
+        assert 'FIFO input' in lat[0][1]
+
+
+if __name__ == '__main__':
+    test_latency()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the data input word packing.
+"""
+import io
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from izer import apbaccess  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.load as load  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def test_pack_words():
+    """Pack bytes into little endian words"""
+    assert load.pack_words([1, 2, 3, 4, -1]).tolist() == [0x04030201, 0xff]
+    assert load.pack_words([[1, 2, 3, 4], [5, 6, 7, -128]]).tolist() == [[0x04030201],
+                                                                         [0x80070605]]
+
+
+def test_load_hwc():
+    """Load three HWC channels with two pixels per memory instance (in_expand)"""
+    data = np.arange(-6, 6).reshape(3, 2, 2)
+    with tc.using(tc.DevAI85()):
+        memfile = io.StringIO()
+        apb = apbaccess.apbwriter(memfile, apb_base=0, master=False, embedded_code=False)
+        load.load(False, apb, False, 0x7, 0, [3, 2, 2], 2, 1, 64, data, [1, 1])
+        words = [(offs << 2, e) for offs, e in enumerate(apb.get_mem()) if e is not None]
+        base = tc.dev.C_SRAM_BASE
+    assert words == [(base + 8 * i, (-1, 3, i // 2, i % 2,
+                                     (-6 + i) & 0xff | ((-2 + i) & 0xff) << 8 | (2 + i) << 16))
+                     for i in range(4)]
+    assert memfile.getvalue().count('0x') == 8  # Four writes, address and data
+
+
+def test_load_embedded():
+    """Return the words that the embedded code copies to data memory"""
+    data = np.arange(-6, 6).reshape(3, 2, 2)
+    with tc.using(tc.DevAI85()):
+        apb = apbaccess.apbwriter(io.StringIO(), apb_base=0, master=False, embedded_code=True,
+                                  sampledata_header=io.StringIO())
+        input_list = load.load(True, apb, False, 0x7, 0, [3, 2, 2], 1, 1, 64, data, [1, 1])
+        base = tc.dev.C_SRAM_BASE
+    assert [(addr, ch, words.tolist()) for addr, ch, words in input_list] == \
+        [(base, 0, [(-6 + i) & 0xff | ((-2 + i) & 0xff) << 8 | (2 + i) << 16
+                    for i in range(4)])]
+
+
+def baseline_chw(data, processor_map, in_expand, in_expand_thresh, split, pad):
+    """Return the data memory words (by address) of the byte-by-byte CHW loop that
+    `load.load()` used before it packed the words with NumPy"""
+    mem = {}
+
+    def write_byte(offs, val):
+        mem[offs & ~3] = mem.get(offs & ~3, 0) | (val & 0xff) << 8 * (offs & 3)
+        offs += 1
+        if offs & ~3 == 0:  # Only true below address 4, so the data is never strided
+            offs += 4 * (in_expand - 1)
+        return offs
+
+    c = 0
+    for ch in range(tc.dev.MAX_PROC):
+        if not (processor_map >> ch) & 1:
+            continue
+        data_offs = tc.dev.C_SRAM_BASE + tc.dev.C_GROUP_OFFS * (ch // tc.dev.P_NUMPRO) \
+            + tc.dev.INSTANCE_SIZE * 16 * ((ch % tc.dev.P_NUMPRO) // tc.dev.P_SHARED) \
+            + (c // in_expand_thresh) * 4
+
+        chunk = data.shape[1] // split
+        if split > 1:
+            for _ in range(pad * data.shape[2]):
+                data_offs = write_byte(data_offs, 0)
+        row = 0
+        for s in range(split):
+            overlap = pad if split > 1 and s + 1 < split else 0
+            while row < (s + 1) * chunk + overlap:
+                for col in range(data.shape[2]):
+                    data_offs = write_byte(data_offs, data[c][row][col])
+                row += 1
+            row -= 2*overlap
+            if split > 1 and s + 1 < split:
+                data_offs = ((data_offs + tc.dev.INSTANCE_SIZE - 1) //
+                             tc.dev.INSTANCE_SIZE) * tc.dev.INSTANCE_SIZE
+        if split > 1:
+            for _ in range(pad * data.shape[2]):
+                data_offs = write_byte(data_offs, 0)
+        c += 1
+        if c >= data.shape[0]:
+            break
+    return mem
+
+
+def test_load_chw_multipass():
+    """Multi-pass CHW input is stored exactly like the byte-by-byte loop stored it"""
+    rng = np.random.default_rng(3)
+    for shape, split, pad in (([8, 4, 6], 1, 0), ([8, 12, 5], 3, 1)):
+        data = rng.integers(-128, 128, shape)
+        with tc.using(tc.DevAI85()):
+            memfile = io.StringIO()
+            apb = apbaccess.apbwriter(memfile, apb_base=0, master=False, embedded_code=False)
+            load.load(False, apb, True, 0x11111111, 0, shape, 2, 1, 4, data, [pad, pad],
+                      split=split)
+            expected = baseline_chw(data, 0x11111111, 2, 4, split, pad)
+        words = {int(addr, 16): int(val, 16) for addr, val in re.findall(
+            r'\*\(\(volatile uint32_t \*\) (0x[0-9a-f]+)\) = (0x[0-9a-f]+);', memfile.getvalue())}
+        assert len(words) == len(expected) and words == expected
+
+
+if __name__ == '__main__':
+    test_pack_words()
+    test_load_hwc()
+    test_load_embedded()
+    test_load_chw_multipass()
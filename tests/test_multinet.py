@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test networks that share the accelerator.
+"""
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.multinet as multinet  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+CONFIG = os.path.join(os.path.dirname(__file__), 'test-mnist-chw-extrasmallnet.yaml')
+CHECKPOINT = os.path.join(os.path.dirname(__file__), 'test-mnist-extrasmallnet.pth.tar')
+
+
+def test_multinet():
+    """Main program to test networks that share the accelerator."""
+    header, items = multinet.split('#include "cnn.h"\n\n// Comment\nint f(void)\n{\n}\nint x;')
+    assert header == ['#include "cnn.h"', ''] \
+        and items == [('f', ['// Comment', 'int f(void)', '{', '}']), (None, ['int x;'])]
+    assert multinet.rename('cnn_init(); KERNELS_0; cnn_init_x;', {'cnn_init', 'KERNELS_0'}, 'a') \
+        == 'cnn_init_a(); KERNELS_0_A; cnn_init_x;'
+
+    with tempfile.TemporaryDirectory() as d:
+        multinet.main(['--network', 'a', CONFIG, CHECKPOINT, '--network', 'b', CONFIG, CHECKPOINT,
+                       '--device', 'MAX78000', '--test-dir', d, '--prefix', 'multi',
+                       '--autogen', 'None'])
+        with open(os.path.join(d, 'multi', 'cnn.c')) as f:
+            cnn = f.read()
+        with open(os.path.join(d, 'multi', 'main.c')) as f:
+            main = f.read()
+
+    # Shared functions appear once, the others once per network
+    assert cnn.count('int cnn_enable(') == 1 and cnn.count('void CNN_ISR(') == 1
+    assert 'int cnn_configure_a(void)' in cnn and 'int cnn_configure_b(void)' in cnn
+    assert 'int cnn_configure(void)' not in cnn
+    assert main.count('cnn_load_weights();') == 1 and 'cnn_configure_b();' in main
+
+    # The kernels of network b are placed above the kernels of network a
+    offs = [int(m, 16) for m in re.findall(r'memcpy_96to128\(\(uint32_t \*\) (0x[0-9a-f]+), '
+                                           r'kernels_0_[ab]', cnn)]
+    assert len(offs) == 2 and offs[1] > offs[0]
+
+
+if __name__ == '__main__':
+    test_multinet()
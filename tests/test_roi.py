@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the partial (region of interest) unload.
+"""
+import io
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.tornadocnn as tc  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.unload as unload  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def test_channel_words():
+    """Every output byte is found where verify() places it"""
+    shape = (6, 3, 4)
+    data = np.arange(-36, 36).reshape(shape)
+    with tc.using(tc.DevAI85()):
+        mem = {}
+
+        def verify_fn(offs, val, mask=None, **_):
+            assert mask is None
+            mem[offs] = val
+
+        unload.verify(verify_fn, 0, None, None, data, 0x3f0, shape, 0x1000, 2, 4,
+                      overwrite_ok=True)
+        words, stride = unload.channel_words(0x3f0, shape, 0x1000, 2, 4)
+    assert stride == 8
+    for c in range(shape[0]):
+        offs, shift = words[c]
+        for row in range(shape[1]):
+            for col in range(shape[2]):
+                val = mem[offs + (row * shape[2] + col) * stride] >> shift * 8
+                assert val & 0xff == data[c][row][col] & 0xff
+
+
+def test_unload_region():
+    """Unload two channels in a window and check only those"""
+    shape = (6, 3, 4)
+    data = np.arange(-36, 36).reshape(shape)
+    with tc.using(tc.DevAI85()):
+        checks = []
+
+        def verify_fn(offs, val, mask=None, **_):
+            checks.append((offs, val & mask, mask))
+
+        unload.verify(verify_fn, 0, None, None, data, 0x3f0, shape, 0x1000, 2, 4,
+                      overwrite_ok=True, channels=[1, 5], window=(1, 2, 2, 3))
+        memfile = io.StringIO()
+        unload.unload(memfile, 0, 0x3f0, shape, 0x1000, 2, 4, channels=[5, 1],
+                      window=(1, 2, 2, 3))
+    # Two channels, four pixels, in separate words
+    assert len(checks) == 8
+    assert all(mask == 0xff00 for _, _, mask in checks)
+    code = memfile.getvalue()
+    assert 'channels: 2, rows: 1-2, columns: 2-3' in code
+    assert code.count('val = *') == 8 and code.count('out_buf[0x') == 8
+    assert 'out_buf[0x0007] = ' in code and 'out_buf[0x0008] = ' not in code
+
+
+def test_top_k():
+    """The fused unload compares every output in the region once, with its CHW index"""
+    shape = (6, 3, 4)
+    data = np.random.default_rng(0).integers(-8, 8, size=shape)
+    with tc.using(tc.DevAI85()):
+        mem = {}
+
+        def verify_fn(offs, val, **_):
+            mem[offs] = val
+
+        unload.verify(verify_fn, 0, None, None, data, 0x3f0, shape, 0x1000, 2, 4,
+                      overwrite_ok=True)
+        memfile = io.StringIO()
+        unload.top_k(memfile, 0, 0x3f0, shape, 0x1000, 2, 4, channels=[1, 4, 5],
+                     window=(0, 1, 2, 2))
+
+    # Evaluate the generated reads and insertions
+    scores = {}
+    val = None
+    for line in memfile.getvalue().split('\n'):
+        m = re.match(r'  val = \*\(\(volatile uint32_t \*\) 0x([0-9a-f]+)\);$', line)
+        if m:
+            val = mem[int(m.group(1), 16)]
+        m = re.match(r'  top_k_insert\(top_class, top_score, (\d+), \(int8_t\) '
+                     r'(?:\(val >> (\d+)\)|val)\);$', line)
+        if m:
+            score = val >> int(m.group(2) or 0) & 0xff
+            scores[int(m.group(1))] = score - 256 if score >= 128 else score
+    expected = data[[1, 4, 5], 0:3, 1:3].flatten()
+    assert [scores[i] for i in range(len(expected))] == expected.tolist()
+    assert memfile.getvalue().count('top_k_insert(top_class') == len(expected)
+
+
+if __name__ == '__main__':
+    test_channel_words()
+    test_unload_region()
+    test_top_k()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the run-scoped op statistics.
+"""
+import os
+import sys
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.compute as compute  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.stats as stats  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def run(layers, result):
+    """Account ops for `layers` in a fresh statistics context and store it in `result`"""
+    st = stats.new()
+    for ll in range(layers):
+        stats.begin_layer(ll)
+        stats.account(ll, macc=10 * (ll + 1), comp=ll)
+        compute.linear(np.ones(4, dtype=np.int64), np.ones((3, 4), dtype=np.int64), None, 4, 3)
+    result.append(st)
+
+
+def test_stats():
+    """Main program to test the statistics context."""
+    results = [[], []]
+    threads = [threading.Thread(target=run, args=(n + 2, results[n])) for n in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    st = results[0][0]
+    assert st.macc == 10 + 20 and st.comp == 1
+    assert st.layers[1]['macc'] == 20 and st.ops(1) == 21
+    assert st.true_sw_macc == 2 * 12 and st.layers[0]['true_sw_macc'] == 12
+
+    st = results[1][0]
+    assert st.macc == 10 + 20 + 30 and st.comp == 3
+    assert st.true_sw_macc == 3 * 12
+
+    # The module-level view refers to the current context only
+    st = stats.new()
+    stats.account(5, macc=7)
+    assert stats.macc == 7 and stats.ops() == 7
+    assert 'Layer 5: 7 ops' in stats.summary(per_layer=True)
+
+
+if __name__ == '__main__':
+    test_stats()
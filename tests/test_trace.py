@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+###################################################################################################
+# Copyright (C) Maxim Integrated Products, Inc. All Rights Reserved.
+#
+# Maxim Integrated Products, Inc. Default Copyright Notice:
+# https://www.maximintegrated.com/en/aboutus/legal/copyrights.html
+###################################################################################################
+"""
+Test the binary computation trace and its CSV reader.
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import izer.compute as compute  # noqa: E402 pylint: disable=wrong-import-position, import-error
+import izer.trace as trace  # noqa: E402 pylint: disable=wrong-import-position, import-error
+
+
+def run_conv2d(fmt, directory, channels=None, window=None, layers=None):
+    """Run a debug conv2d, log in format `fmt` to `directory`, return the output"""
+    data = np.arange(3 * 5 * 5, dtype=np.int64).reshape(3, 5, 5) % 7 - 3
+    weight = np.arange(4 * 3 * 3 * 3, dtype=np.int64).reshape(4, 3, 3, 3) % 5 - 2
+    bias = np.array([1, -2, 3, -4], dtype=np.int64)
+
+    compute.debug_configure(fmt, layers, channels, window)
+    compute.debug_open(0, directory, '', None)
+    output = compute.conv2d(
+        data,
+        weight,
+        bias,
+        [3, 5, 5],
+        [4, 5, 5],
+        kernel_size=[3, 3],
+        stride=[1, 1],
+        pad=[1, 1],
+        dilation=[1, 1],
+        fractional_stride=[1, 1],
+        output_pad=[0, 0],
+        groups=1,
+        debug=True,
+    )
+    compute.debug_close()
+    compute.debug_configure()
+    return output
+
+
+def test_trace():
+    """Main program to test the computation trace."""
+    with tempfile.TemporaryDirectory() as d:
+        output = run_conv2d('csv', d)
+        with open(os.path.join(d, 'compute-0.csv')) as f:
+            csv = f.read()
+
+        binary_output = run_conv2d('binary', d)
+        assert np.array_equal(output, binary_output)
+
+        out = io.StringIO()
+        trace.to_csv(os.path.join(d, 'compute-0.trace'), out)
+        assert out.getvalue() == csv
+
+        # Filtering while tracing must match filtering when reading
+        window = trace.parse_window('1,2,2,2')
+        run_conv2d('csv', d, channels={1, 3}, window=window)
+        with open(os.path.join(d, 'compute-0.csv')) as f:
+            filtered = f.read()
+
+        out = io.StringIO()
+        trace.to_csv(os.path.join(d, 'compute-0.trace'), out, channels={1, 3}, window=window)
+        assert out.getvalue() == filtered
+        assert filtered.count('adding bias') == 2 * 2 * 2
+
+
+def test_trace_excluded_layer():
+    """A layer that is not traced writes nothing, not even to stdout"""
+    with tempfile.TemporaryDirectory() as d:
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            run_conv2d('csv', d, layers={1})
+        assert stdout.getvalue() == ''
+        assert os.listdir(d) == []
+
+
+if __name__ == '__main__':
+    test_trace()
+    test_trace_excluded_layer()